@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+复权计算
+
+日线统一以不复权（原始）价格存储，每只股票另存一份后复权因子序列：
+    data/adj_factors/<代码>.csv，列为 trade_time（因子生效日期）、factor（累计后复权因子）
+只记录因子发生变化的日期，某日因子取不晚于该日的最近一条记录。
+
+读取时按需计算：
+    none: 原始价格
+    hfq:  原始价格 * 当日因子
+    qfq:  原始价格 * 当日因子 / 最新因子
+分红送转只会改变因子文件，不会使已缓存的日线失效。
+"""
+
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from atomic_file import write_atomic
+
+# 支持的复权方式
+ADJUST_MODES = ('qfq', 'hfq', 'none')
+# 默认复权方式（与之前远程数据的前复权保持一致）
+DEFAULT_ADJUST = 'qfq'
+# 需要复权的价格列
+PRICE_COLUMNS = ['open', 'high', 'low', 'close']
+
+# 因子缓存：{文件路径: (mtime, DataFrame)}
+FACTOR_CACHE = {}
+
+
+def normalize_adjust(value):
+    """解析复权参数，无效值返回默认值；'' 视为不复权（与 akshare 一致）"""
+    if value is None:
+        return DEFAULT_ADJUST
+    value = str(value).strip().lower()
+    if value == '':
+        return 'none'
+    return value if value in ADJUST_MODES else DEFAULT_ADJUST
+
+
+def factor_file_path(factor_dir, stock_code):
+    return os.path.join(factor_dir, f"{stock_code}.csv")
+
+
+def factors_from_prices(raw_df, hfq_df):
+    """
+    由同一区间的不复权和后复权日线推算后复权因子，只保留因子变化的日期
+    返回 DataFrame(trade_time, factor)，无法计算时返回 None
+    """
+    if raw_df is None or hfq_df is None or raw_df.empty or hfq_df.empty:
+        return None
+    merged = pd.merge(
+        raw_df[['trade_time', 'close']],
+        hfq_df[['trade_time', 'close']],
+        on='trade_time', suffixes=('_raw', '_hfq')
+    )
+    merged = merged[merged['close_raw'] > 0].sort_values('trade_time')
+    if merged.empty:
+        return None
+    factor = (merged['close_hfq'] / merged['close_raw']).to_numpy()
+    keep = _factor_changes(factor)
+    return pd.DataFrame({
+        'trade_time': pd.to_datetime(merged['trade_time'].to_numpy()[keep]),
+        'factor': np.round(factor[keep], 6),
+    })
+
+
+def _factor_changes(factor):
+    """因子发生变化的位置（布尔数组）；价格只有两位小数，比值存在舍入噪声：相对变化小于 0.1% 视为同一因子"""
+    keep = np.ones(len(factor), dtype=bool)
+    current = factor[0]
+    for i in range(1, len(factor)):
+        if abs(factor[i] / current - 1) < 1e-3:
+            keep[i] = False
+        else:
+            current = factor[i]
+    return keep
+
+
+def merge_factors(existing, recent):
+    """
+    把从某日起重新推算的因子（后复权因子以上市首日为基准，历史值不变）接到已有因子之后：
+    该日之前保留已有记录，该日及之后用新记录，再去掉与前一条相同的因子
+    """
+    if existing is None or existing.empty:
+        return recent
+    if recent is None or recent.empty:
+        return existing
+    start = recent['trade_time'].iloc[0]
+    merged = pd.concat([existing[existing['trade_time'] < start], recent[['trade_time', 'factor']]],
+                       ignore_index=True)
+    return merged[_factor_changes(merged['factor'].to_numpy(dtype=float))].reset_index(drop=True)
+
+
+def load_adjust_factors(factor_dir, stock_code):
+    """读取因子文件（按 mtime 缓存），不存在返回 None"""
+    path = factor_file_path(factor_dir, stock_code)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    cached = FACTOR_CACHE.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    df = pd.read_csv(path, parse_dates=['trade_time'])
+    df = df.sort_values('trade_time').reset_index(drop=True)
+    FACTOR_CACHE[path] = (mtime, df)
+    return df
+
+
+def save_adjust_factors(factor_dir, stock_code, factors):
+    """原子写入因子文件"""
+    os.makedirs(factor_dir, exist_ok=True)
+    path = factor_file_path(factor_dir, stock_code)
+    out = factors[['trade_time', 'factor']].copy()
+    out['trade_time'] = pd.to_datetime(out['trade_time']).dt.strftime('%Y-%m-%d')
+    write_atomic(path, lambda f: out.to_csv(f, index=False), binary=False, prefix='.factor_', suffix='.csv')
+
+
+def factor_file_date(factor_dir, stock_code):
+    """因子文件最后更新的日期（YYYY-MM-DD），不存在返回 None"""
+    try:
+        mtime = os.path.getmtime(factor_file_path(factor_dir, stock_code))
+    except OSError:
+        return None
+    return datetime.fromtimestamp(mtime).strftime('%Y-%m-%d')
+
+
+def bar_factors(dates, factors, mode):
+    """
+    每根 K 线的复权系数（dates 为 datetime64 数组）
+    取不晚于当日的最近一个因子，早于第一条记录的取第一条；qfq 再除以最新因子
+    """
+    factor_dates = factors['trade_time'].to_numpy(dtype='datetime64[ns]')
+    factor_values = factors['factor'].to_numpy(dtype=float)
+    pos = np.searchsorted(factor_dates, dates.astype('datetime64[ns]'), side='right') - 1
+    per_bar = factor_values[np.clip(pos, 0, len(factor_values) - 1)]
+    if mode == 'qfq':
+        per_bar = per_bar / factor_values[-1]
+    return per_bar
+
+
+def apply_adjustment(df, factors, mode):
+    """
+    对不复权日线应用复权，返回新的 DataFrame（df 需已按 trade_time 排序，trade_time 为 datetime）
+    mode 为 none 或没有因子时原样返回
+    """
+    if mode == 'none' or factors is None or factors.empty or df.empty:
+        return df
+    per_bar = bar_factors(df['trade_time'].to_numpy(dtype='datetime64[ns]'), factors, mode)
+
+    df = df.copy()
+    columns = [c for c in PRICE_COLUMNS if c in df.columns]
+    df[columns] = (df[columns].to_numpy(dtype=float) * per_bar[:, None]).round(4)
+    return df
+
+
+def adjust_bars(bars, factors, mode):
+    """对不复权的 Bars 应用复权，返回新的 Bars（成交量/额不变）"""
+    if mode == 'none' or factors is None or factors.empty or len(bars) == 0:
+        return bars
+    per_bar = bar_factors(bars.dates(), factors, mode)
+    return bars.with_prices(*(bars.price_values(name) * per_bar for name in PRICE_COLUMNS))
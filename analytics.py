@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+"""
+跨股票分析：相关系数矩阵、相对指数的 beta、相对强度排名
+
+输入为按交易日对齐的 日期×股票 收盘价矩阵（前复权），来源：
+- 内存映射面板（panel.py）：直接切片，不逐个读文件
+- 没有面板时由调用方提供每只股票的 Bars，按交易日并集对齐
+停牌日的收益为 NaN，复牌日的收益相对停牌前最后一个收盘价计算；
+相关系数和 beta 只使用两只股票都有收益的交易日（pairwise），全部用矩阵乘法计算。
+
+结果按 (股票池, 窗口, 截止日期, 其他参数, 数据版本) 缓存在 ResultCache 中。
+"""
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+import metrics
+from bars import days_from_datetimes
+
+# 一年的交易日数（年化用）
+TRADING_DAYS = 250
+
+
+class AlignedCloses:
+    """对齐后的行情：days 为 int32 天数（升序），close/amount 为 交易日×股票 的 float64 矩阵"""
+    __slots__ = ('days', 'codes', 'close', 'amount')
+
+    def __init__(self, days, codes, close, amount):
+        self.days = days
+        self.codes = codes
+        self.close = close
+        self.amount = amount
+
+    def __len__(self):
+        return len(self.days)
+
+    def select(self, columns):
+        columns = np.asarray(columns, dtype=np.int64)
+        return AlignedCloses(self.days, [self.codes[i] for i in columns], self.close[:, columns], self.amount[:, columns])
+
+    def dates(self):
+        return np.datetime_as_string(self.days.astype('datetime64[D]'), unit='D').tolist()
+
+
+def end_day(end):
+    """截止日期 -> int32 天数，None 表示不限"""
+    return None if end is None else int(days_from_datetimes([end])[0])
+
+
+def closes_from_panel(panel, codes, end=None, rows=TRADING_DAYS):
+    """从面板截取截止日期前最近 rows 个交易日的前复权收盘价和成交额，面板中没有的代码被忽略"""
+    hi = panel.row_range(None, end).stop
+    lo = max(0, hi - rows)
+    cols = panel.columns(codes)
+    close = panel.field('close')[lo:hi][:, cols].astype(np.float64)
+    factor = panel.field('factor')
+    if panel.rows:
+        close *= factor[lo:hi][:, cols] / factor[-1, cols]
+    amount = panel.field('amount')[lo:hi][:, cols].astype(np.float64)
+    return AlignedCloses(
+        panel.calendar[lo:hi].astype(np.int32), [panel.symbols[i] for i in cols], close, amount)
+
+
+def closes_from_bars(bars_by_code, end=None, rows=TRADING_DAYS):
+    """
+    由 {代码: Bars（已复权）} 对齐：日历取各股票截止日期前最近 rows 个交易日的并集，再保留最后 rows 天
+    """
+    limit = end_day(end)
+    tails = {}
+    for code, bars in bars_by_code.items():
+        if bars is None or len(bars) == 0:
+            continue
+        hi = len(bars) if limit is None else int(np.searchsorted(bars.days, limit, side='right'))
+        if hi:
+            tails[code] = bars.take(slice(max(0, hi - rows), hi))
+    codes = list(tails)
+    if not codes:
+        return AlignedCloses(np.empty(0, dtype=np.int32), [], np.empty((0, 0)), np.empty((0, 0)))
+
+    days = np.unique(np.concatenate([b.days for b in tails.values()]))[-rows:]
+    close = np.full((len(days), len(codes)), np.nan)
+    amount = np.full((len(days), len(codes)), np.nan)
+    for j, code in enumerate(codes):
+        bars = tails[code]
+        pos = np.searchsorted(days, bars.days)
+        valid = (pos < len(days)) & (days[np.minimum(pos, len(days) - 1)] == bars.days)
+        close[pos[valid], j] = bars.close[valid]
+        amount[pos[valid], j] = bars.amount_values()[valid]
+    return AlignedCloses(days.astype(np.int32), codes, close, amount)
+
+
+def closes_on_days(bars, days):
+    """某只股票（如基准指数）在给定交易日上的收盘价，没有数据的日期为 NaN"""
+    out = np.full(len(days), np.nan)
+    if bars is None or len(bars) == 0 or len(days) == 0:
+        return out
+    pos = np.minimum(np.searchsorted(bars.days, days), len(bars) - 1)
+    matched = bars.days[pos] == days
+    out[matched] = bars.close[pos[matched]]
+    return out
+
+
+def top_by_amount(aligned, limit):
+    """按窗口内平均成交额保留前 limit 只股票（股票池过大时限制矩阵规模）"""
+    if limit is None or len(aligned.codes) <= limit:
+        return aligned
+    with np.errstate(invalid='ignore'):
+        avg = np.nan_to_num(np.nanmean(aligned.amount, axis=0), nan=-1.0) if len(aligned) else np.zeros(len(aligned.codes))
+    keep = np.sort(np.argsort(-avg, kind='stable')[:limit])
+    return aligned.select(keep)
+
+
+def simple_returns(close):
+    """
+    日收益矩阵（比价格少一行）：停牌日为 NaN，复牌日相对停牌前最后一个收盘价
+    """
+    close = np.asarray(close, dtype=np.float64)
+    if len(close) < 2:
+        return np.empty((0,) + close.shape[1:])
+    # 逐列前向填充：记录每个位置最近一次有效值的行号
+    valid = ~np.isnan(close)
+    idx = np.where(valid, np.arange(len(close))[:, None], 0)
+    np.maximum.accumulate(idx, axis=0, out=idx)
+    filled = np.take_along_axis(close, idx, axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns = filled[1:] / filled[:-1] - 1
+    returns[~valid[1:]] = np.nan
+    returns[~np.isfinite(returns)] = np.nan
+    return returns
+
+
+def pairwise_correlation(returns, min_periods=20):
+    """
+    相关系数矩阵（只使用两列都非 NaN 的行），共同样本少于 min_periods 的位置为 NaN
+    返回 (相关系数矩阵, 共同样本数矩阵)
+    """
+    mask = (~np.isnan(returns)).astype(np.float64)
+    x = np.nan_to_num(returns)
+    n = mask.T @ mask
+    sx = x.T @ mask          # sx[i, j] = 在 i、j 共同有效的行上 x_i 之和
+    sxx = (x * x).T @ mask
+    sxy = x.T @ x
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cov = sxy - sx * sx.T / n
+        var_i = sxx - sx * sx / n
+        corr = cov / np.sqrt(var_i * var_i.T)
+    corr[(n < min_periods) | ~np.isfinite(corr)] = np.nan
+    np.clip(corr, -1.0, 1.0, out=corr)
+    np.fill_diagonal(corr, np.where(np.diag(n) >= min_periods, 1.0, np.nan))
+    return corr, n.astype(np.int64)
+
+
+def beta_stats(returns, market, min_periods=20):
+    """
+    各股票相对基准收益的 beta、相关系数和年化 alpha（只使用两者都有收益的交易日）
+    returns: T×N，market: 长度 T
+    """
+    market = np.asarray(market, dtype=np.float64)
+    mask = ~np.isnan(returns) & ~np.isnan(market)[:, None]
+    m = np.where(mask, market[:, None], 0.0)
+    x = np.where(mask, returns, 0.0)
+    n = mask.sum(axis=0).astype(np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_m = m.sum(axis=0) / n
+        mean_x = x.sum(axis=0) / n
+        cov = (x * m).sum(axis=0) / n - mean_x * mean_m
+        var_m = (m * m).sum(axis=0) / n - mean_m ** 2
+        var_x = (x * x).sum(axis=0) / n - mean_x ** 2
+        beta = cov / var_m
+        corr = cov / np.sqrt(var_m * var_x)
+        alpha = (mean_x - beta * mean_m) * TRADING_DAYS
+    invalid = n < min_periods
+    for values in (beta, corr, alpha):
+        values[invalid | ~np.isfinite(values)] = np.nan
+    return {'beta': beta, 'correlation': corr, 'alpha': alpha, 'observations': n.astype(np.int64)}
+
+
+def rolling_pair_correlation(x, y, window, min_periods=None):
+    """两条收益序列的滚动相关系数（窗口内两者都有效的行），用累计和一次算出所有窗口"""
+    min_periods = window if min_periods is None else min_periods
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    mask = ~np.isnan(x) & ~np.isnan(y)
+    x0 = np.where(mask, x, 0.0)
+    y0 = np.where(mask, y, 0.0)
+
+    def window_sum(values):
+        csum = np.concatenate([[0.0], np.cumsum(values)])
+        out = np.full(len(values), np.nan)
+        if len(values) >= window:
+            out[window - 1:] = csum[window:] - csum[:-window]
+        return out
+
+    n = window_sum(mask.astype(np.float64))
+    sx, sy = window_sum(x0), window_sum(y0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cov = window_sum(x0 * y0) - sx * sy / n
+        var_x = window_sum(x0 * x0) - sx * sx / n
+        var_y = window_sum(y0 * y0) - sy * sy / n
+        corr = cov / np.sqrt(var_x * var_y)
+    corr[~(n >= min_periods) | ~np.isfinite(corr)] = np.nan
+    return np.clip(corr, -1.0, 1.0)
+
+
+def period_return(close, lookback):
+    """每只股票最近 lookback 个交易日的累计收益（以区间内首尾有效收盘价计算）"""
+    window = close[-(lookback + 1):]
+    valid = ~np.isnan(window)
+    has = valid.any(axis=0)
+    first = np.argmax(valid, axis=0)
+    last = len(window) - 1 - np.argmax(valid[::-1], axis=0)
+    cols = np.arange(window.shape[1])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ret = window[last, cols] / window[first, cols] - 1
+    # 区间内只有一个有效价格或最新价格过旧（超过半个窗口未交易）视为无效
+    ret[~has | (last == first) | (last < len(window) - 1 - lookback // 2)] = np.nan
+    return ret
+
+
+def percentile_rank(values):
+    """百分位排名（0-100，越大越强），NaN 保持 NaN"""
+    ranks = np.full(len(values), np.nan)
+    valid = ~np.isnan(values)
+    count = int(valid.sum())
+    if count == 1:
+        ranks[valid] = 100.0
+    elif count > 1:
+        order = np.argsort(np.argsort(values[valid], kind='stable'), kind='stable')
+        ranks[valid] = order / (count - 1) * 100
+    return ranks
+
+
+def relative_strength(close, lookbacks=(20, 60, 120), weights=None, benchmark=None):
+    """
+    相对强度：各回看期累计收益的百分位排名加权平均（默认等权）
+    benchmark 为基准收盘价序列时，同时返回各回看期相对基准的超额收益
+    返回 {'score', 'returns': {回看期: 数组}, 'excess': {回看期: 数组}}
+    """
+    weights = np.ones(len(lookbacks)) if weights is None else np.asarray(weights, dtype=np.float64)
+    returns = {lb: period_return(close, lb) for lb in lookbacks}
+    ranks = np.vstack([percentile_rank(returns[lb]) for lb in lookbacks])
+    present = ~np.isnan(ranks)
+    with np.errstate(invalid='ignore'):
+        score = np.nansum(ranks * weights[:, None], axis=0) / (present * weights[:, None]).sum(axis=0)
+    score[~present.any(axis=0)] = np.nan
+    excess = {}
+    if benchmark is not None:
+        for lb in lookbacks:
+            bench = period_return(np.asarray(benchmark, dtype=np.float64)[:, None], lb)[0]
+            excess[lb] = returns[lb] - bench
+    return {'score': score, 'returns': returns, 'excess': excess}
+
+
+def to_json_values(values, decimals=4):
+    """numpy 数组 -> 列表（NaN 转为 None，便于 JSON 序列化）"""
+    values = np.round(np.asarray(values, dtype=np.float64), decimals)
+    out = values.astype(object)
+    out[np.isnan(values)] = None
+    return out.tolist()
+
+
+class ResultCache:
+    """分析结果的 LRU 缓存，键由调用方组装（股票池、窗口、截止日期、参数、数据版本）"""
+
+    def __init__(self, max_entries=64, name='analytics'):
+        self.max_entries = max_entries
+        self.name = name
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key, compute):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                metrics.record_cache(self.name, True)
+                return self._entries[key]
+        metrics.record_cache(self.name, False)
+        value = compute()
+        with self._lock:
+            self._entries[key] = value
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+ANALYTICS_CACHE = ResultCache()
@@ -1,18 +1,47 @@
-from flask import Flask, render_template, jsonify, request
+import time
+# 模块开始导入的时间，用于统计冷启动耗时（导入 + 预热）
+IMPORT_STARTED_AT = time.perf_counter()
+
+from flask import Flask, render_template, jsonify, request, Response, stream_with_context
 import os
+import numpy as np
 import pandas as pd
 from datetime import datetime
 import glob
 import sys
-import requests
 import json
-from pypinyin import lazy_pinyin, Style
-try:
-    import akshare as ak
-except ImportError:
-    ak = None
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import metrics
+from bars import Bars, load_bars, BAR_CACHE
+from favorites_store import FavoritesStore
+from panel import PANEL_STALE_CHECK_TTL, open_panel, list_sources, stale_codes
+from quote_stream import QuoteHub, format_sse
+from resilience import upstream_status
+import stock_list_sync
+import query_engine
+import bulk_export
+import incremental_signals
+import analytics
+import bar_archive
+from adjustment import (
+    DEFAULT_ADJUST,
+    adjust_bars,
+    factor_file_date,
+    load_adjust_factors,
+    merge_factors,
+    normalize_adjust,
+    save_adjust_factors,
+)
+from data_source import (
+    get_data_source,
+    DataSourceUnavailable,
+    UnsupportedSymbolError,
+)
 
 app = Flask(__name__)
+metrics.init_app(app)
 
 # 数据目录
 DATA_DIR = 'data'
@@ -20,10 +49,14 @@ DATA_DIR = 'data'
 REMOTE_CACHE_DIR = os.path.join(DATA_DIR, 'remote_cache')
 # 远程数据拉取记录文件
 REMOTE_LOG_FILE = os.path.join(REMOTE_CACHE_DIR, 'fetch_log.json')
+# 后复权因子目录（日线统一存不复权价格，读取时按因子计算前/后复权）
+ADJ_FACTOR_DIR = os.path.join(DATA_DIR, 'adj_factors')
 # 股票列表文件
 STOCK_LIST_FILE = 'stock_list.csv'
 # 自选股票文件
 FAVORITE_STOCKS_FILE = 'favorite_stocks.json'
+# 自选股票存储（内存索引 + 原子写入）
+FAVORITES = FavoritesStore(FAVORITE_STOCKS_FILE)
 
 def aggregate_data(df, period='day'):
     """
@@ -48,7 +81,7 @@ def aggregate_data(df, period='day'):
         })
     elif period == 'month':
         # 按月聚合
-        aggregated = df_indexed.resample('M').agg({
+        aggregated = df_indexed.resample('ME').agg({
             'open': 'first',
             'high': 'max',
             'low': 'min',
@@ -81,30 +114,26 @@ def find_stock_file(stock_code, year=None):
         filename_sz = f"{stock_code}.csv"
         filename_sh = None
     
+    index = load_stock_file_index()
+    
     # 如果指定了年份，只在该年份目录查找
     if year:
         years = [f"{year}_by_day"]
     else:
-        # 查找所有日级年份目录，按降序排列
-        if not os.path.exists(DATA_DIR):
-            years = []
-        else:
-            years = sorted([d for d in os.listdir(DATA_DIR) 
-                           if os.path.isdir(os.path.join(DATA_DIR, d)) and d.endswith('_by_day')], 
-                          reverse=True)
+        # 所有日级年份目录，按降序排列
+        years = list(reversed(index['years']))
     
     # 遍历年份目录查找文件
     for y_dir in years:
-        year_dir = os.path.join(DATA_DIR, y_dir)
         y = y_dir.replace('_by_day', '') # 提取纯年份
-        if filename_sh:
-            file_path = os.path.join(year_dir, filename_sh)
-            if os.path.exists(file_path):
-                return file_path, y
+        names = index['files'].get(y_dir)
+        if names is None:
+            continue
+        if filename_sh and filename_sh in names:
+            return names[filename_sh], y
         
-        file_path = os.path.join(year_dir, filename_sz)
-        if os.path.exists(file_path):
-            return file_path, y
+        if filename_sz in names:
+            return names[filename_sz], y
     
     return None, None
 
@@ -124,87 +153,80 @@ def find_all_stock_files(stock_code, year=None):
         filename_sh = None
     
     files = []
+    # 使用目录索引代替逐个 os.path.exists
+    index = load_stock_file_index()
     
     # 确定要查找的年份列表
     if year:
         years = [f"{year}_by_day"]
     else:
-        # 查找所有日级年份目录，按升序排列（从早到晚）
-        if not os.path.exists(DATA_DIR):
-            years = []
-        else:
-            years = sorted([d for d in os.listdir(DATA_DIR) 
-                           if os.path.isdir(os.path.join(DATA_DIR, d)) and d.endswith('_by_day')])
+        # 所有日级年份目录，按升序排列（从早到晚）
+        years = index['years']
     
     # 遍历所有年份目录查找文件
     for y_dir in years:
-        year_dir = os.path.join(DATA_DIR, y_dir)
         y = y_dir.replace('_by_day', '') # 提取纯年份
-        if filename_sh:
-            file_path = os.path.join(year_dir, filename_sh)
-            if os.path.exists(file_path):
-                files.append((file_path, y))
+        names = index['files'].get(y_dir)
+        if names is None:
+            continue
+        if filename_sh and filename_sh in names:
+            files.append((names[filename_sh], y))
         
-        file_path = os.path.join(year_dir, filename_sz)
-        if os.path.exists(file_path):
-            files.append((file_path, y))
+        if filename_sz in names:
+            files.append((names[filename_sz], y))
     
     return files
 
+# 数据目录索引缓存：{年份目录: {文件名: 路径}}（散文件或归档成员），按目录和归档的 mtime 失效
+STOCK_FILE_INDEX_CACHE = {
+    'signature': None,
+    'years': [],
+    'files': {}
+}
 
-def normalize_stock_code_with_market(stock_code):
-    """
-    标准化股票代码，返回 eastmoney 所需的 secid
-    secid 规则：
-      - 深市: 0.代码
-      - 沪市: 1.代码
-      - 港股: 116.代码
-      - 美股: 代码 (通常已包含市场前缀如 105.AAPL)
-    """
-    code = stock_code.upper()
-    if '.' in code:
-        parts = code.split('.')
-        base = parts[0]
-        suffix = parts[-1]
-    else:
-        base, suffix = code, ''
-
-    if suffix == 'SZ':
-        return f"0.{base}"
-    elif suffix == 'SH':
-        return f"1.{base}"
-    elif suffix == 'HK':
-        return f"116.{base}"
-    elif suffix == 'US':
-        # 美股代码在 stock_list.json 中存为 "105.AAPL.US"
-        # 实际 API 需要 "105.AAPL"
-        if len(parts) >= 3:
-            return ".".join(parts[:-1])
-        return base # 兜底
-    else:
-        # 未提供后缀时，根据首位数字简单判断
-        if len(base) <= 5 and base.isdigit():
-            return f"116.{base}"
-        return f"1.{base}" if base.startswith('6') else f"0.{base}"
+def _stock_file_index_signature():
+    """返回数据目录及各日级年份目录、年份归档（bar_archive）的 (名称, mtime) 签名"""
+    if not os.path.isdir(DATA_DIR):
+        return ()
+    signature = []
+    with os.scandir(DATA_DIR) as it:
+        for entry in it:
+            if (entry.is_dir() and entry.name.endswith('_by_day')) or \
+                    (entry.is_file() and entry.name.endswith('_by_day' + bar_archive.ARCHIVE_SUFFIX)):
+                signature.append((entry.name, entry.stat().st_mtime))
+    return tuple(sorted(signature))
 
-def fetch_latest_stock_data_from_ak(stock_code, start_date="20250329", end_date=None):
+def load_stock_file_index():
     """
-    使用 akshare 抓取特定的股票数据，支持 A 股、港股和美股
+    加载数据目录索引，避免每次请求对每个年份目录做 os.path.exists
+    年份目录新增/删除文件时目录 mtime 变化，索引自动重建
     """
-    if ak is None:
-        print("未安装 akshare，无法抓取最新数据")
-        return None
-        
-    # 提取代码和后缀
-    parts = stock_code.split('.')
-    suffix = parts[-1].upper()
+    signature = _stock_file_index_signature()
+    cache_hit = STOCK_FILE_INDEX_CACHE['signature'] == signature
+    metrics.record_cache('stock_file_index', cache_hit)
+    if cache_hit:
+        return STOCK_FILE_INDEX_CACHE
     
-    # 基础代码（去掉 .US, .SZ, .SH 等）
-    if suffix in ['US', 'SZ', 'SH', 'HK']:
-        code = ".".join(parts[:-1])
-    else:
-        code = stock_code
+    years = sorted({name[:-len(bar_archive.ARCHIVE_SUFFIX)] if name.endswith(bar_archive.ARCHIVE_SUFFIX) else name
+                    for name, _ in signature})
+    files = {}
+    for y_dir in years:
+        try:
+            files[y_dir] = {name: path for name, path, _ in bar_archive.list_year(os.path.join(DATA_DIR, y_dir))}
+        except OSError:
+            files[y_dir] = {}
     
+    STOCK_FILE_INDEX_CACHE['files'] = files
+    STOCK_FILE_INDEX_CACHE['years'] = years
+    STOCK_FILE_INDEX_CACHE['signature'] = signature
+    return STOCK_FILE_INDEX_CACHE
+
+
+def fetch_latest_stock_data_from_ak(stock_code, start_date="20250329", end_date=None, adjust=""):
+    """
+    通过数据源（默认 akshare）抓取特定的股票日线数据，支持 A 股、港股和美股
+    默认抓取不复权价格，复权在读取时由因子计算
+    """
     try:
         formatted_start = start_date.replace('-', '').replace('/', '')
         if not end_date:
@@ -213,93 +235,169 @@ def fetch_latest_stock_data_from_ak(stock_code, start_date="20250329", end_date=
         
         print(f"正在从 akshare 抓取 {stock_code} 的数据，从 {formatted_start} 到 {formatted_end}")
         
-        if suffix == 'HK':
-            df = ak.stock_hk_hist(symbol=code, period="daily", start_date=formatted_start, end_date=formatted_end, adjust="qfq")
-        elif suffix == 'US':
-            # 美股接口 symbol 需要带市场标识，如 105.AAPL
-            df = ak.stock_us_hist(symbol=code, period="daily", start_date=formatted_start, end_date=formatted_end, adjust="qfq")
-        else:
-            # A 股
-            # A 股接口 symbol 只需要 6 位代码
-            pure_code = code.split('.')[0]
-            df = ak.stock_zh_a_hist(symbol=pure_code, period="daily", start_date=formatted_start, end_date=formatted_end, adjust="qfq")
+        with metrics.upstream('akshare'):
+            df = get_data_source().daily_bars(stock_code, formatted_start, formatted_end, adjust=adjust)
         
         if df is None or df.empty:
             print(f"未获取到 {stock_code} 在该时间段的数据")
             return None
         
-        # 重命名列以匹配本地格式
-        df = df.rename(columns={
-            '日期': 'trade_time',
-            '开盘': 'open',
-            '收盘': 'close',
-            '最高': 'high',
-            '最低': 'low',
-            '成交量': 'vol',
-            '成交额': 'amount'
-        })
-        
-        df['trade_time'] = pd.to_datetime(df['trade_time'])
-        cols = ['trade_time', 'open', 'close', 'high', 'low', 'vol', 'amount']
-        df = df[cols]
-        
         return df
+    except DataSourceUnavailable as e:
+        print(f"{e}，无法抓取最新数据")
+        return None
     except Exception as e:
         print(f"抓取最新数据失败: {e}")
         return None
 
+LOCAL_COVER_RATIO = 0.9  # 本地日线数 / 工作日数 达到该比例即视为区间已覆盖（工作日包含节假日）
+
+
+def local_day_set(parts):
+    days = [p.days for p in parts if p is not None and len(p)]
+    return np.unique(np.concatenate(days)) if days else np.empty(0, dtype=np.int32)
+
+
+def local_bars_cover(parts, start, end, min_ratio=LOCAL_COVER_RATIO):
+    """本地日线是否已覆盖 [start, end] 区间（按工作日数估算）"""
+    days = local_day_set(parts)
+    start_day = np.datetime64(start, 'D')
+    end_day = np.datetime64(end, 'D')
+    expected = np.busday_count(start_day, end_day + 1)
+    if expected == 0:
+        return True
+    present = np.count_nonzero((days >= start_day.astype(np.int64)) & (days <= end_day.astype(np.int64)))
+    return present >= expected * min_ratio
+
+
+def latest_fetch_start(parts, floor):
+    """
+    最新数据的抓取起点：本地最后一个交易日的次日（不早于 floor）
+    本地已包含最近一个工作日时返回 None
+    """
+    days = local_day_set(parts)
+    start = np.datetime64(floor, 'D')
+    if len(days):
+        start = max(start, np.datetime64(int(days[-1]) + 1, 'D'))
+    last_business_day = np.busday_offset(np.datetime64(datetime.now().date(), 'D'), 0, roll='backward')
+    if start > last_business_day:
+        return None
+    return str(start)
+
+# 当天已尝试更新因子的股票（含失败和没有新数据的），当天不再重复拉取
+FACTOR_FETCH_ATTEMPTS = {'date': None, 'codes': set()}
+FACTOR_FETCH_LOCK = threading.Lock()
+
+
+def get_adjust_factors(stock_code, allow_fetch=False):
+    """
+    获取股票的后复权因子
+    本地因子文件当天已更新时直接使用；allow_fetch 为 True 且文件缺失或过期时从数据源拉取
+    （已有因子文件时只拉取文件上次更新日起的日线，接在已有因子之后），每只股票每天最多尝试一次，
+    拉取失败回退使用旧文件。没有因子时返回 None
+    """
+    today = datetime.now().strftime('%Y-%m-%d')
+    updated = factor_file_date(ADJ_FACTOR_DIR, stock_code)
+    fetch = False
+    with FACTOR_FETCH_LOCK:
+        if FACTOR_FETCH_ATTEMPTS['date'] != today:
+            FACTOR_FETCH_ATTEMPTS.update(date=today, codes=set())
+        fresh = updated == today or stock_code in FACTOR_FETCH_ATTEMPTS['codes']
+        if allow_fetch and not fresh:
+            FACTOR_FETCH_ATTEMPTS['codes'].add(stock_code)
+            fetch = True
+    metrics.record_cache('adjust_factors', fresh)
+    if fetch:
+        try:
+            existing = load_adjust_factors(ADJ_FACTOR_DIR, stock_code)
+            # 文件上次更新时因子已确认到当天，只需从该日起重新推算
+            start_date = updated.replace('-', '') if existing is not None and not existing.empty else None
+            with metrics.upstream('akshare'):
+                factors = get_data_source().adjust_factors(stock_code, start_date)
+            factors = merge_factors(existing, factors)
+            if factors is not None and not factors.empty:
+                # 没有新的因子变化也重写文件，记录当天已更新
+                save_adjust_factors(ADJ_FACTOR_DIR, stock_code, factors)
+        except DataSourceUnavailable as e:
+            print(f"{e}，无法更新复权因子")
+        except Exception as e:
+            print(f"更新复权因子失败: {stock_code}, {e}")
+    return load_adjust_factors(ADJ_FACTOR_DIR, stock_code)
+
 @app.route('/')
 def index():
     """主页面"""
     return render_template('index.html')
 
-@app.route('/api/stock/<stock_code>')
-def get_stock_data(stock_code):
+def parse_stock_data_args(args):
     """
-    获取股票数据API
-    参数:
-    - stock_code: 股票代码，如 "000001.SZ" 或 "000001"
-    - year: 可选，年份，如 "2025"
-    - period: 可选，时间周期，如 "day", "week", "month"，默认为 "day"
-    - fetch_latest: 可选，是否抓取最新数据 (2025-03-29之后)
+    解析 /api/stock/<stock_code> 的查询参数（Flask 与 ASGI 版本共用）
+    返回: (year, period, fill_missing_data, remote_data, adjust)
     """
-    year = request.args.get('year', None)
+    year = args.get('year', None)
     if year:
         try:
             year = int(year)
         except:
             year = None
     
-    period = request.args.get('period', 'day')
+    period = args.get('period', 'day')
     if period not in ['day', 'week', 'month']:
         period = 'day'
     
-    fill_missing_data = request.args.get('fill_missing_data', 'false').lower() == 'true'
-    remote_data = request.args.get('remote_data', 'false').lower() == 'true'
-    
+    fill_missing_data = args.get('fill_missing_data', 'false').lower() == 'true'
+    remote_data = args.get('remote_data', 'false').lower() == 'true'
+    adjust = normalize_adjust(args.get('adjust'))
+    return year, period, fill_missing_data, remote_data, adjust
+
+@app.route('/api/stock/<stock_code>')
+def get_stock_data(stock_code):
+    """
+    获取股票数据API
+    参数:
+    - stock_code: 股票代码，如 "000001.SZ" 或 "000001"
+    - year: 可选，年份，如 "2025"
+    - period: 可选，时间周期，如 "day", "week", "month"，默认为 "day"
+    - fetch_latest: 可选，是否抓取最新数据 (2025-03-29之后)
+    - adjust: 可选，复权方式 "qfq"（前复权，默认）、"hfq"（后复权）、"none"（不复权）
+    """
+    payload, status = build_stock_data_payload(stock_code, *parse_stock_data_args(request.args))
+    with metrics.stage('json_encode'):
+        response = jsonify(payload)
+    return response, status
+
+def build_stock_data_payload(stock_code, year=None, period='day', fill_missing_data=False, remote_data=False,
+                             adjust=DEFAULT_ADJUST):
+    """
+    读取（必要时远程抓取）股票数据并聚合，返回 (响应字典, HTTP状态码)
+    本地日线与远程缓存均为不复权价格，合并后按 adjust 统一复权；没有因子时返回不复权数据
+    远程抓取为阻塞调用，ASGI 版本会将其放入有界线程池执行
+    """
     # 查找所有年份的文件
-    files = [] if remote_data else find_all_stock_files(stock_code, year)
+    with metrics.stage('index_lookup'):
+        files = [] if remote_data else find_all_stock_files(stock_code, year)
     
     if not files and not fill_missing_data and not remote_data:
-        return jsonify({
+        return {
             'success': False,
             'error': f'未找到股票代码 {stock_code} 的数据'
-        }), 404
+        }, 404
     
     try:
-        # 读取所有文件并合并数据
-        dfs = []
+        # 读取所有文件并合并数据（Bars 紧凑格式，按文件缓存在内存中）
+        parts = []
         years_found = []
         
         if not remote_data:
-            for file_path, file_year in files:
-                df_year = pd.read_csv(file_path)
-                dfs.append(df_year)
-                years_found.append(file_year)
+            with metrics.stage('file_read'):
+                for file_path, file_year in files:
+                    parts.append(load_bars(file_path))
+                    years_found.append(file_year)
         else:
             # 远程数据缓存逻辑
             today = datetime.now().strftime('%Y-%m-%d')
-            cache_file = os.path.join(REMOTE_CACHE_DIR, f"{stock_code}_remote.csv")
+            # 缓存不复权价格（旧版 _remote.csv 为前复权，不再使用）
+            cache_file = os.path.join(REMOTE_CACHE_DIR, f"{stock_code}_raw.csv")
             
             # 检查是否有缓存记录
             fetch_log = {}
@@ -312,10 +410,12 @@ def get_stock_data(stock_code):
             
             # 判断是否需要重新拉取
             last_fetch_date = fetch_log.get(stock_code)
-            if last_fetch_date == today and os.path.exists(cache_file):
+            cache_hit = last_fetch_date == today and os.path.exists(cache_file)
+            metrics.record_cache('remote_data', cache_hit)
+            if cache_hit:
                 print(f"远程数据日期未变 ({today})，直接从本地缓存读取: {stock_code}")
-                df_remote = pd.read_csv(cache_file)
-                dfs.append(df_remote)
+                with metrics.stage('file_read'):
+                    parts.append(load_bars(cache_file))
                 years_found.append("2018_now_remote_cached")
             else:
                 print(f"尝试从远程抓取 2018 至今的数据: {stock_code}")
@@ -333,78 +433,85 @@ def get_stock_data(stock_code):
                     with open(REMOTE_LOG_FILE, 'w') as f:
                         json.dump(fetch_log, f)
                     
-                    dfs.append(df_remote)
+                    parts.append(Bars.from_frame(df_remote))
                     years_found.append("2018_now_remote")
                 else:
                     print(f"抓取远程数据失败或为空: {stock_code}")
                     # 如果抓取失败但本地有旧缓存，则先用旧缓存
                     if os.path.exists(cache_file):
                         print(f"远程抓取失败，回退使用旧缓存数据: {stock_code}")
-                        df_remote = pd.read_csv(cache_file)
-                        dfs.append(df_remote)
+                        with metrics.stage('file_read'):
+                            parts.append(load_bars(cache_file))
                         years_found.append("2018_now_remote_cached_fallback")
         
-        # 如果需要补齐缺失数据
+        # 如果需要补齐缺失数据（本地已覆盖的区间不再请求，可先用 data_integrity.py --repair 批量补齐）
         if fill_missing_data and not remote_data:
             # 1. 尝试补齐 2024 年数据 (2024-06-29至2024-12-31)
-            print(f"尝试补齐 2024 年数据: {stock_code}")
-            df_2024 = fetch_latest_stock_data_from_ak(stock_code, start_date="20240629", end_date="20241231")
-            if df_2024 is not None and not df_2024.empty:
-                print(f"成功补齐 2024 年数据，共 {len(df_2024)} 条")
-                dfs.append(df_2024)
-                years_found.append("2024_fill")
+            if local_bars_cover(parts, '2024-06-29', '2024-12-31'):
+                print(f"本地已覆盖 2024 年下半年数据，跳过补齐: {stock_code}")
+            else:
+                print(f"尝试补齐 2024 年数据: {stock_code}")
+                df_2024 = fetch_latest_stock_data_from_ak(stock_code, start_date="20240629", end_date="20241231")
+                if df_2024 is not None and not df_2024.empty:
+                    print(f"成功补齐 2024 年数据，共 {len(df_2024)} 条")
+                    parts.append(Bars.from_frame(df_2024))
+                    years_found.append("2024_fill")
             
-            # 2. 尝试抓取 2025 年至今的数据
-            print(f"尝试抓取最新数据: {stock_code}")
-            df_latest = fetch_latest_stock_data_from_ak(stock_code, "2025-03-29")
-            if df_latest is not None and not df_latest.empty:
-                print(f"成功抓取到最新数据，共 {len(df_latest)} 条，最新日期: {df_latest['trade_time'].max()}")
-                dfs.append(df_latest)
-                years_found.append("2025+")
+            # 2. 尝试抓取 2025 年至今的数据（只抓本地最后一个交易日之后的部分）
+            latest_start = latest_fetch_start(parts, '2025-03-29')
+            if latest_start is None:
+                print(f"本地数据已是最新，跳过抓取: {stock_code}")
+            else:
+                print(f"尝试抓取最新数据: {stock_code}")
+                df_latest = fetch_latest_stock_data_from_ak(stock_code, latest_start)
+                if df_latest is not None and not df_latest.empty:
+                    print(f"成功抓取到最新数据，共 {len(df_latest)} 条，最新日期: {df_latest['trade_time'].max()}")
+                    parts.append(Bars.from_frame(df_latest))
+                    years_found.append("2025+")
         
-        if not dfs:
-            return jsonify({
+        if not any(len(p) for p in parts if p is not None):
+            return {
                 'success': False,
                 'error': f'未找到股票代码 {stock_code} 的数据'
-            }), 404
+            }, 404
             
-        # 合并所有数据
-        df = pd.concat(dfs, ignore_index=True)
-        
-        # 确保trade_time是datetime类型
-        df['trade_time'] = pd.to_datetime(df['trade_time'])
+        with metrics.stage('concat_sort'):
+            # 合并、按时间排序并去重（防止补齐数据与本地数据重叠，保留先出现的一条）
+            bars = Bars.concat(parts)
         
-        # 按时间排序
-        df = df.sort_values('trade_time')
-        
-        # 去重（防止补齐数据与本地数据重叠）
-        df = df.drop_duplicates(subset=['trade_time'], keep='first')
+        # 统一复权（只在需要远程数据时才会联网更新因子）
+        with metrics.stage('adjust'):
+            factors = None
+            if adjust != 'none':
+                factors = get_adjust_factors(stock_code, allow_fetch=remote_data or fill_missing_data)
+            applied = adjust if factors is not None and not factors.empty else 'none'
+            bars = adjust_bars(bars, factors, applied)
         
         # 根据周期聚合数据
-        df = aggregate_data(df, period)
-        
-        # 确保trade_time格式化为字符串
-        df['trade_time'] = df['trade_time'].dt.strftime('%Y-%m-%d %H:%M:%S')
+        with metrics.stage('aggregate'):
+            bars = bars.aggregate(period)
         
-        # 转换为列表格式，方便前端使用
-        data = {
-            'success': True,
-            'stock_code': stock_code,
-            'year': ','.join(sorted(set(years_found))),  # 所有找到的年份
-            'period': period,
-            'data': df.to_dict('records'),
-            'count': len(df)
-        }
+        with metrics.stage('serialize'):
+            # 转换为列表格式，方便前端使用
+            data = {
+                'success': True,
+                'stock_code': stock_code,
+                'year': ','.join(sorted(set(years_found))),  # 所有找到的年份
+                'period': period,
+                'adjust': applied,
+                'data': bars.to_records(),
+                'count': len(bars)
+            }
         
-        return jsonify(data)
+        return data, 200
     
     except Exception as e:
         import traceback
         traceback.print_exc()
-        return jsonify({
+        return {
             'success': False,
             'error': f'读取数据时出错: {str(e)}'
-        }), 500
+        }, 500
 
 @app.route('/api/years')
 def get_available_years():
@@ -418,134 +525,143 @@ def get_available_years():
     })
 
 
-@app.route('/api/stock_info/<stock_code>')
-def get_stock_info(stock_code):
+def parse_stock_info(stock_code, data):
     """
-    通过东财接口获取股票基础信息（公司名称、总市值、市盈率、市净率）
+    将东财接口返回的 data 字段解析为基础信息字典
     """
     suffix = stock_code.split('.')[-1].upper()
-    secid = normalize_stock_code_with_market(stock_code)
-    url = 'https://push2.eastmoney.com/api/qt/stock/get'
-    params = {
-        'secid': secid,
-        'fields': 'f43,f57,f58,f59,f116,f162,f163,f164,f167'  # f43最新价, f59价格精度, f57代码, f58名称, f116总市值, f162市盈率(TTM-A股), f163市盈率(静), f164市盈率(TTM-港美股), f167是市净率(PB)
+
+    # 东财接口返回的价格通常需要根据 f59 字段的精度进行除法转换
+    # 市盈率和市净率通常固定除以 100
+    def safe_div_precision(val, precision):
+        if val is None or val == '-' or val == '':
+            return None
+        try:
+            f_val = float(val)
+            if f_val == 0 and val == '-':
+                return None
+            return f_val / (10 ** precision)
+        except (ValueError, TypeError):
+            return None
+
+    def safe_div_100(val):
+        return safe_div_precision(val, 2)
+
+    def safe_float(val):
+        if val is None or val == '-':
+            return None
+        try:
+            return float(val)
+        except (ValueError, TypeError):
+            return None
+    
+    # 获取价格精度，默认为 2
+    price_precision = data.get('f59', 2)
+    
+    # 针对不同市场选择 PE-TTM 字段
+    # A股通常用 f162, 港美股通常用 f164
+    pe_ttm_val = data.get('f162')
+    if suffix in ['HK', 'US'] or (safe_float(pe_ttm_val) or 0) < 0.1:
+        # 如果是港美股，或者 f162 异常小（接近0），则尝试使用 f164
+        alt_pe = data.get('f164')
+        if alt_pe and alt_pe != '-':
+            pe_ttm_val = alt_pe
+
+    return {
+        'success': True,
+        'stock_code': data.get('f57') or stock_code,
+        'name': data.get('f58'),
+        'price': safe_div_precision(data.get('f43'), price_precision),
+        'prev_close': safe_div_precision(data.get('f60'), price_precision),  # 昨收
+        'change_percent': safe_div_100(data.get('f170')),  # 涨跌幅（%）
+        'market_cap': safe_float(data.get('f116')),  # 总市值（元）
+        'pe_ttm': safe_div_100(pe_ttm_val),
+        'pe_static': safe_div_100(data.get('f163')),
+        'pb': safe_div_100(data.get('f167')),
     }
 
+@app.route('/api/stock_info/<stock_code>')
+def get_stock_info(stock_code):
+    """
+    通过东财接口获取股票基础信息（公司名称、总市值、市盈率、市净率）
+    上游失败或熔断时返回行情缓存中的旧数据（stale 为 true）
+    """
     try:
-        resp = requests.get(url, params=params, timeout=8)
-        resp.raise_for_status()
-        payload = resp.json()
-        data = payload.get('data')
+        with metrics.upstream('eastmoney'):
+            data = get_data_source().quote(stock_code)
         if not data:
             return jsonify({'success': False, 'error': '未获取到基础信息'}), 404
-
-        # 东财接口返回的价格通常需要根据 f59 字段的精度进行除法转换
-        # 市盈率和市净率通常固定除以 100
-        def safe_div_precision(val, precision):
-            if val is None or val == '-' or val == '':
-                return None
-            try:
-                f_val = float(val)
-                if f_val == 0 and val == '-':
-                    return None
-                return f_val / (10 ** precision)
-            except (ValueError, TypeError):
-                return None
-
-        def safe_div_100(val):
-            return safe_div_precision(val, 2)
-
-        def safe_float(val):
-            if val is None or val == '-':
-                return None
-            try:
-                return float(val)
-            except (ValueError, TypeError):
-                return None
-        
-        # 获取价格精度，默认为 2
-        price_precision = data.get('f59', 2)
-        
-        # 针对不同市场选择 PE-TTM 字段
-        # A股通常用 f162, 港美股通常用 f164
-        pe_ttm_val = data.get('f162')
-        if suffix in ['HK', 'US'] or (safe_float(pe_ttm_val) or 0) < 0.1:
-            # 如果是港美股，或者 f162 异常小（接近0），则尝试使用 f164
-            alt_pe = data.get('f164')
-            if alt_pe and alt_pe != '-':
-                pe_ttm_val = alt_pe
-
-        result = {
-            'success': True,
-            'stock_code': data.get('f57') or stock_code,
-            'name': data.get('f58'),
-            'price': safe_div_precision(data.get('f43'), price_precision),
-            'market_cap': safe_float(data.get('f116')),  # 总市值（元）
-            'pe_ttm': safe_div_100(pe_ttm_val),
-            'pe_static': safe_div_100(data.get('f163')),
-            'pb': safe_div_100(data.get('f167')),
-        }
-        return jsonify(result)
+        info = parse_stock_info(stock_code, data)
+        QUOTE_CACHE[stock_code] = (time.monotonic(), info)
+        return jsonify(info)
     except Exception as e:
+        stale = stale_quote_payload(stock_code, e)
+        if stale is not None:
+            return jsonify(stale)
         return jsonify({'success': False, 'error': f'获取基础信息失败: {str(e)}'}), 500
 
+def stale_quote_payload(stock_code, error):
+    """上游失败时从行情缓存取旧数据，附带缓存时长和失败原因；没有缓存时返回 None"""
+    cached = QUOTE_CACHE.get(stock_code)
+    metrics.record_cache('quote_fallback', cached is not None)
+    if cached is None:
+        return None
+    return dict(cached[1], stale=True, age=round(time.monotonic() - cached[0], 1), upstream_error=str(error))
+
 @app.route('/api/stock_pe/<stock_code>')
 def get_stock_pe_history(stock_code):
     """
     获取股票历史市盈率 PE-TTM 数据，支持 A 股、港股和美股
     """
-    if ak is None:
-        return jsonify({'success': False, 'error': '未安装 akshare'}), 500
-    
-    # 提取代码和后缀
-    parts = stock_code.split('.')
-    suffix = parts[-1].upper()
-    
-    if suffix == 'US':
-        # 美股代码格式可能是 "105.AAPL.US"，API 只需要 "AAPL"
-        if len(parts) >= 3:
-            code = parts[1]
-        else:
-            code = parts[0]
-    elif suffix in ['SZ', 'SH', 'HK']:
-        code = ".".join(parts[:-1])
-    else:
-        code = stock_code
-    
+    payload, status = fetch_stock_pe_history(stock_code)
+    return jsonify(payload), status
+
+# 历史 PE 缓存：上游失败或熔断时返回最近一次成功的结果（按最近使用保留 PE_CACHE_MAX 只股票）
+PE_CACHE = OrderedDict()
+PE_CACHE_MAX = 256
+PE_CACHE_LOCK = threading.Lock()
+
+def fetch_stock_pe_history(stock_code):
+    """
+    通过数据源（默认 akshare）获取历史 PE-TTM，返回 (响应字典, HTTP状态码)
+    上游失败或熔断时返回缓存的旧数据（stale 为 true）
+    """
     try:
         print(f"正在从 akshare 抓取 {stock_code} 的历史 PE-TTM 数据")
         
-        if suffix == 'HK':
-            # 港股历史估值接口
-            df = ak.stock_hk_valuation_baidu(symbol=code, indicator="市盈率(TTM)", period="全部")
-        elif suffix == 'US':
-            # 美股通常通过历史行情计算或使用特定接口
-            # 百度估值接口可能不支持美股，尝试美股估值接口
-            try:
-                # 尝试通过百度估值接口（部分美股支持）
-                df = ak.stock_us_valuation_baidu(symbol=code, indicator="市盈率(TTM)", period="全部")
-            except:
-                return jsonify({'success': False, 'error': '暂不支持该美股的 PE 数据'}), 404
-        else:
-            # A 股历史估值接口
-            pure_code = code.split('.')[0]
-            df = ak.stock_zh_valuation_baidu(symbol=pure_code, indicator="市盈率(TTM)", period="全部")
+        with metrics.upstream('akshare'):
+            df = get_data_source().pe_history(stock_code)
         
         if df is None or df.empty:
-            return jsonify({'success': False, 'error': '未获取到历史 PE 数据'}), 404
+            return {'success': False, 'error': '未获取到历史 PE 数据'}, 404
         
         df['date'] = pd.to_datetime(df['date']).dt.strftime('%Y-%m-%d')
         data_list = df.to_dict('records')
         
-        return jsonify({
+        payload = {
             'success': True,
             'stock_code': stock_code,
             'data': data_list,
             'count': len(data_list)
-        })
+        }
+        with PE_CACHE_LOCK:
+            PE_CACHE[stock_code] = (time.monotonic(), payload)
+            PE_CACHE.move_to_end(stock_code)
+            while len(PE_CACHE) > PE_CACHE_MAX:
+                PE_CACHE.popitem(last=False)
+        return payload, 200
+    except DataSourceUnavailable:
+        return {'success': False, 'error': '未安装 akshare'}, 500
+    except UnsupportedSymbolError:
+        return {'success': False, 'error': '暂不支持该美股的 PE 数据'}, 404
     except Exception as e:
         print(f"获取历史 PE 失败: {e}")
-        return jsonify({'success': False, 'error': f'获取历史 PE 失败: {str(e)}'}), 500
+        with PE_CACHE_LOCK:
+            cached = PE_CACHE.get(stock_code)
+        metrics.record_cache('pe_fallback', cached is not None)
+        if cached is not None:
+            return dict(cached[1], stale=True, age=round(time.monotonic() - cached[0], 1), upstream_error=str(e)), 200
+        return {'success': False, 'error': f'获取历史 PE 失败: {str(e)}'}, 500
 
 @app.route('/api/stocks/<year>')
 def get_stocks_by_year(year):
@@ -571,9 +687,11 @@ def get_stocks_by_year(year):
 def get_pinyin(text):
     """
     获取中文文本的拼音（不带声调）
+    pypinyin 加载词典约需 0.3 秒，股票列表 CSV 已预计算拼音，只在缺少拼音列时才按需导入
     """
     if not text or pd.isna(text):
         return ''
+    from pypinyin import lazy_pinyin, Style
     return ''.join(lazy_pinyin(str(text), style=Style.NORMAL))
 
 def get_pinyin_initial(text):
@@ -582,11 +700,14 @@ def get_pinyin_initial(text):
     """
     if not text or pd.isna(text):
         return ''
+    from pypinyin import lazy_pinyin, Style
     return ''.join([p[0].upper() for p in lazy_pinyin(str(text), style=Style.FIRST_LETTER)])
 
 STOCK_LIST_PINYIN_CACHE = {
     'mtime': None,
-    'stocks': None
+    'stocks': None,
+    # 搜索索引：[(代码大写, 去空格名称, 拼音, 首字母, 返回结果), ...]
+    'search_index': None
 }
 
 def load_stock_list_with_pinyin():
@@ -596,7 +717,9 @@ def load_stock_list_with_pinyin():
     if not os.path.exists(STOCK_LIST_FILE):
         return []
     mtime = os.path.getmtime(STOCK_LIST_FILE)
-    if STOCK_LIST_PINYIN_CACHE['stocks'] is not None and STOCK_LIST_PINYIN_CACHE['mtime'] == mtime:
+    cache_hit = STOCK_LIST_PINYIN_CACHE['stocks'] is not None and STOCK_LIST_PINYIN_CACHE['mtime'] == mtime
+    metrics.record_cache('stock_list', cache_hit)
+    if cache_hit:
         return STOCK_LIST_PINYIN_CACHE['stocks']
 
     try:
@@ -620,6 +743,11 @@ def load_stock_list_with_pinyin():
         }, axis=1).tolist()
 
         STOCK_LIST_PINYIN_CACHE['stocks'] = stocks
+        STOCK_LIST_PINYIN_CACHE['search_index'] = [
+            (s['code'].upper(), s['name'].replace(' ', ''), s['pinyin'], s['pinyin_initials'],
+             {'code': s['code'], 'name': s['name']})
+            for s in stocks
+        ]
         STOCK_LIST_PINYIN_CACHE['mtime'] = mtime
         return stocks
     except Exception as e:
@@ -630,11 +758,13 @@ def load_stock_list_with_pinyin():
 def get_stock_list():
     """
     获取股票列表（包含拼音字段，供前端联想搜索）
+    前端优先使用 /api/stock_list/packed 和 /api/stock_list/delta，本接口保留给旧版前端
     """
     try:
         stocks = load_stock_list_with_pinyin()
         return jsonify({
             'success': True,
+            'version': get_stock_list_sync_state()['version'],
             'results': stocks,
             'count': len(stocks)
         })
@@ -644,6 +774,112 @@ def get_stock_list():
             'error': f'获取股票列表失败: {str(e)}'
         }), 500
 
+# 股票列表同步状态：按 CSV、JSON、变更日志的修改时间缓存版本号、分片编码和变更日志
+STOCK_LIST_SYNC_CACHE = {
+    'key': None,
+    'state': None
+}
+STOCK_LIST_SYNC_LOCK = threading.Lock()
+
+def _mtime_or_none(path):
+    return os.path.getmtime(path) if os.path.exists(path) else None
+
+def get_stock_list_sync_state():
+    """
+    返回 {'version', 'shards': {市场: 紧凑编码}, 'counts': {市场: 数量}, 'journal'}
+    版本号取 stock_list.json 的 update_time，没有 JSON 时取 CSV 的修改时间
+    """
+    key = (_mtime_or_none(STOCK_LIST_FILE), _mtime_or_none(stock_list_sync.STOCK_LIST_JSON),
+           _mtime_or_none(stock_list_sync.CHANGES_FILE))
+    with STOCK_LIST_SYNC_LOCK:
+        hit = STOCK_LIST_SYNC_CACHE['key'] == key
+        metrics.record_cache('stock_list_sync', hit)
+        if hit:
+            return STOCK_LIST_SYNC_CACHE['state']
+        try:
+            version, _ = stock_list_sync.read_stock_list_json()
+        except (OSError, ValueError) as e:
+            print(f"读取 {stock_list_sync.STOCK_LIST_JSON} 失败: {e}")
+            version = None
+        if not version and key[0] is not None:
+            version = datetime.fromtimestamp(key[0]).strftime('%Y-%m-%d %H:%M:%S')
+        shards = stock_list_sync.shard_rows(load_stock_list_with_pinyin())
+        state = {
+            'version': version,
+            'shards': {market: stock_list_sync.pack_rows(rows, market) for market, rows in shards.items()},
+            'counts': {market: len(rows) for market, rows in shards.items()},
+            'journal': stock_list_sync.load_journal(),
+        }
+        STOCK_LIST_SYNC_CACHE['key'] = key
+        STOCK_LIST_SYNC_CACHE['state'] = state
+        return state
+
+def parse_markets_param(value, available):
+    """解析 market 参数（逗号分隔，如 SZ,SH），为空时返回全部市场"""
+    if not value:
+        return list(available)
+    markets = [m.strip().upper() for m in value.split(',') if m.strip()]
+    unknown = [m for m in markets if m not in available]
+    if unknown:
+        raise ValueError(f"未知市场: {','.join(unknown)}")
+    return markets
+
+@app.route('/api/stock_list/manifest')
+def get_stock_list_manifest():
+    """股票列表的当前版本和各市场分片的股票数（前端据此决定下载哪些分片）"""
+    state = get_stock_list_sync_state()
+    return jsonify({
+        'success': True,
+        'version': state['version'],
+        'markets': state['counts'],
+        'fields': list(stock_list_sync.PACKED_FIELDS),
+    })
+
+@app.route('/api/stock_list/packed')
+def get_stock_list_packed():
+    """
+    紧凑编码的股票列表（首次加载用）
+    参数: market - 逗号分隔的市场（SZ、SH、HK、US、OTHER），默认全部
+    每个分片为一个字符串：每行一只股票，字段以制表符分隔（代码、名称、拼音、首字母），代码省略市场后缀
+    支持 ETag / If-None-Match
+    """
+    state = get_stock_list_sync_state()
+    try:
+        markets = parse_markets_param(request.args.get('market'), stock_list_sync.MARKETS + ('OTHER',))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    etag = f'"{state["version"]}|{",".join(sorted(markets))}"'
+    if request.headers.get('If-None-Match') == etag:
+        return '', 304, {'ETag': etag}
+    # 中文不转义为 \uXXXX，体积约为转义后的一半
+    body = json.dumps({
+        'success': True,
+        'version': state['version'],
+        'fields': list(stock_list_sync.PACKED_FIELDS),
+        'shards': {market: state['shards'].get(market, '') for market in markets},
+        'count': sum(state['counts'].get(market, 0) for market in markets),
+    }, ensure_ascii=False)
+    return app.response_class(body, mimetype='application/json', headers={'ETag': etag})
+
+@app.route('/api/stock_list/delta')
+def get_stock_list_delta():
+    """
+    股票列表增量
+    参数: since - 前端保存的版本号；market - 逗号分隔的市场，只返回这些市场的变更
+    返回 added / renamed（完整行：代码、名称、拼音、首字母）和 removed（代码）；
+    reset 为 true 时变更日志中没有 since 版本，前端需重新下载 /api/stock_list/packed
+    """
+    since = request.args.get('since')
+    if not since:
+        return jsonify({'success': False, 'error': '缺少 since 参数'}), 400
+    state = get_stock_list_sync_state()
+    try:
+        markets = parse_markets_param(request.args.get('market'), stock_list_sync.MARKETS + ('OTHER',))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    delta = stock_list_sync.compute_delta(state['journal'], since, state['version'], set(markets))
+    return jsonify(dict(delta, success=True, since=since, version=state['version']))
+
 @app.route('/api/search_stocks')
 def search_stocks():
     """
@@ -664,30 +900,22 @@ def search_stocks():
     
     try:
         # 优先从缓存的列表中搜索，避免重复读取 CSV 和计算
-        all_stocks = load_stock_list_with_pinyin()
-        if not all_stocks:
+        if not load_stock_list_with_pinyin():
             return jsonify({'success': True, 'results': [], 'count': 0})
+        search_index = STOCK_LIST_PINYIN_CACHE['search_index']
 
         query_lower = query.lower().replace(' ', '')
         query_upper = query.upper().replace(' ', '')
         query_no_space = query.replace(' ', '')
         
         results = []
-        for stock in all_stocks:
-            code = stock['code']
-            name = stock['name'].replace(' ', '')
-            pinyin = stock['pinyin']
-            initials = stock['pinyin_initials']
-            
+        for code, name, pinyin, initials, item in search_index:
             # 匹配逻辑：代码包含、名称包含、拼音包含、首字母包含
-            if (query_upper in code.upper() or 
+            if (query_upper in code or 
                 query_no_space in name or 
                 query_lower in pinyin or 
                 query_upper in initials):
-                results.append({
-                    'code': stock['code'],
-                    'name': stock['name']
-                })
+                results.append(dict(item))
                 if len(results) >= limit:
                     break
         
@@ -706,24 +934,32 @@ def search_stocks():
 
 def load_favorite_stocks():
     """加载自选股票列表"""
-    if os.path.exists(FAVORITE_STOCKS_FILE):
-        try:
-            with open(FAVORITE_STOCKS_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except:
-            return []
-    return []
+    return FAVORITES.list()
 
 def save_favorite_stocks(stocks):
-    """保存自选股票列表"""
+    """保存自选股票列表（整体替换）"""
     try:
-        with open(FAVORITE_STOCKS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(stocks, f, ensure_ascii=False, indent=2)
+        FAVORITES.replace_all(stocks)
         return True
     except Exception as e:
         print(f"保存自选股票失败: {e}")
         return False
 
+def parse_codes_param(value):
+    """解析逗号分隔或列表形式的股票代码参数，去重并保持顺序"""
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(',')
+    codes = []
+    seen = set()
+    for code in value:
+        code = str(code).strip()
+        if code and code not in seen:
+            seen.add(code)
+            codes.append(code)
+    return codes
+
 @app.route('/api/favorites', methods=['GET'])
 def get_favorites():
     """获取所有自选股票"""
@@ -753,32 +989,17 @@ def add_favorite():
                 'error': '股票代码不能为空'
             }), 400
         
-        stocks = load_favorite_stocks()
-        
-        # 检查是否已存在
-        if any(s.get('code') == stock_code for s in stocks):
+        # 检查和添加在同一把锁内完成，并发添加不会丢失
+        if not FAVORITES.add(stock_code, stock_name):
             return jsonify({
                 'success': False,
                 'error': '该股票已在自选列表中'
             }), 400
         
-        # 添加新股票
-        stocks.append({
-            'code': stock_code,
-            'name': stock_name,
-            'added_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        return jsonify({
+            'success': True,
+            'message': '添加成功'
         })
-        
-        if save_favorite_stocks(stocks):
-            return jsonify({
-                'success': True,
-                'message': '添加成功'
-            })
-        else:
-            return jsonify({
-                'success': False,
-                'error': '保存失败'
-            }), 500
             
     except Exception as e:
         return jsonify({
@@ -798,19 +1019,11 @@ def remove_favorite():
                 'error': '股票代码不能为空'
             }), 400
         
-        stocks = load_favorite_stocks()
-        stocks = [s for s in stocks if s.get('code') != stock_code]
-        
-        if save_favorite_stocks(stocks):
-            return jsonify({
-                'success': True,
-                'message': '删除成功'
-            })
-        else:
-            return jsonify({
-                'success': False,
-                'error': '保存失败'
-            }), 500
+        FAVORITES.remove(stock_code)
+        return jsonify({
+            'success': True,
+            'message': '删除成功'
+        })
             
     except Exception as e:
         return jsonify({
@@ -818,6 +1031,42 @@ def remove_favorite():
             'error': f'删除自选股票失败: {str(e)}'
         }), 500
 
+@app.route('/api/favorites/bulk', methods=['POST'])
+def bulk_update_favorites():
+    """
+    批量添加/删除自选股票
+    请求体: {"add": [{"stock_code": "...", "stock_name": "..."}, ...], "remove": ["代码", ...]}
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        add_items = []
+        for item in data.get('add') or []:
+            if isinstance(item, dict):
+                add_items.append((item.get('stock_code') or item.get('code'), item.get('stock_name') or item.get('name', '')))
+            else:
+                add_items.append((str(item), ''))
+        remove_codes = parse_codes_param(data.get('remove'))
+
+        if not add_items and not remove_codes:
+            return jsonify({
+                'success': False,
+                'error': '请提供 add 或 remove'
+            }), 400
+
+        added = FAVORITES.add_many(add_items) if add_items else []
+        removed = FAVORITES.remove_many(remove_codes) if remove_codes else []
+        return jsonify({
+            'success': True,
+            'added': added,
+            'removed': removed
+        })
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f'批量更新自选股票失败: {str(e)}'
+        }), 500
+
 @app.route('/api/favorites/check', methods=['GET'])
 def check_favorite():
     """检查股票是否在自选列表中"""
@@ -830,12 +1079,9 @@ def check_favorite():
                 'is_favorite': False
             })
         
-        stocks = load_favorite_stocks()
-        is_favorite = any(s.get('code') == stock_code for s in stocks)
-        
         return jsonify({
             'success': True,
-            'is_favorite': is_favorite
+            'is_favorite': FAVORITES.contains(stock_code)
         })
             
     except Exception as e:
@@ -844,6 +1090,877 @@ def check_favorite():
             'error': f'检查失败: {str(e)}'
         }), 500
 
+@app.route('/api/favorites/check_bulk', methods=['GET', 'POST'])
+def check_favorites_bulk():
+    """
+    批量检查股票是否在自选列表中
+    GET: ?codes=000001.SZ,600000.SH  POST: {"codes": [...]}
+    返回 {代码: 是否自选}
+    """
+    try:
+        if request.method == 'POST':
+            codes = parse_codes_param((request.get_json(silent=True) or {}).get('codes'))
+        else:
+            codes = parse_codes_param(request.args.get('codes'))
+
+        return jsonify({
+            'success': True,
+            'results': FAVORITES.check_many(codes)
+        })
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f'检查失败: {str(e)}'
+        }), 500
+
+# 自选快照：行情缓存有效期（秒）
+QUOTE_CACHE_TTL = float(os.environ.get('QUOTE_CACHE_TTL', 15))
+# 自选快照后台刷新间隔（秒）
+SNAPSHOT_REFRESH_INTERVAL = float(os.environ.get('SNAPSHOT_REFRESH_INTERVAL', 15))
+# 快照中每只股票返回的最近收盘价数量（迷你走势图）：默认值和上限，快照按上限预先计算，按请求截取
+SNAPSHOT_CLOSES = 30
+SNAPSHOT_MAX_CLOSES = 250
+# 超过该时长（秒）没有快照请求时后台刷新线程退出，下次请求时重新启动
+SNAPSHOT_IDLE_TIMEOUT = float(os.environ.get('SNAPSHOT_IDLE_TIMEOUT', 300))
+# 组装快照的并发数
+SNAPSHOT_WORKERS = int(os.environ.get('SNAPSHOT_WORKERS', 8))
+
+# 行情缓存：{代码: (获取时间, 基础信息字典)}
+QUOTE_CACHE = {}
+# 最近一次构建的快照
+FAVORITES_SNAPSHOT = {
+    'key': None,
+    'built_at': 0.0,
+    'payload': None
+}
+SNAPSHOT_LOCK = threading.Lock()
+# 后台刷新线程和线程池按进程创建（fork 之后的 worker 中重新创建），last_request 为最近一次快照请求的时间
+SNAPSHOT_STATE = {
+    'pid': None,
+    'executor': None,
+    'thread': None,
+    'last_request': 0.0
+}
+SNAPSHOT_STATE_LOCK = threading.Lock()
+
+def fetch_quote_batch(codes):
+    """批量行情（推送轮询线程和自选快照调用），一次上游请求计一次 eastmoney 调用"""
+    with metrics.upstream('eastmoney'):
+        return get_data_source().batch_quotes(codes)
+
+def get_cached_quotes(stock_codes):
+    """
+    批量获取股票基础信息，返回 {代码: 基础信息}：QUOTE_CACHE_TTL 秒内复用缓存，其余股票一次批量请求
+    上游失败或未返回的股票使用过期缓存，没有缓存的不在结果中
+    """
+    now = time.monotonic()
+    result = {}
+    missing = []
+    for code in stock_codes:
+        cached = QUOTE_CACHE.get(code)
+        fresh = cached is not None and now - cached[0] < QUOTE_CACHE_TTL
+        metrics.record_cache('quote', fresh)
+        if fresh:
+            result[code] = cached[1]
+        else:
+            missing.append(code)
+    if not missing:
+        return result
+    try:
+        fetched = fetch_quote_batch(missing)
+    except Exception as e:
+        print(f"批量获取 {len(missing)} 只股票行情失败: {e}")
+        fetched = {}
+    for code in missing:
+        data = fetched.get(code)
+        if data:
+            info = parse_stock_info(code, data)
+            QUOTE_CACHE[code] = (now, info)
+            result[code] = info
+        elif code in QUOTE_CACHE:
+            result[code] = QUOTE_CACHE[code][1]
+    return result
+
+def load_recent_closes(stock_code, count=SNAPSHOT_CLOSES):
+    """从本地日线读取最近 count 个交易日的 (日期, 收盘价)，只读取最近的年份文件（经 Bars 缓存）"""
+    files = find_all_stock_files(stock_code)
+    parts = []
+    rows = 0
+    # 从最新年份往前读，够数即停
+    for path, _ in reversed(files):
+        bars = load_bars(path)
+        if bars is None:
+            continue
+        parts.append(bars)
+        rows += len(bars)
+        if rows >= count:
+            break
+    bars = Bars.concat(parts[::-1]).tail(count)
+    return [(r['trade_time'], r['close']) for r in bars.to_records(time_format='%Y-%m-%d')]
+
+def build_favorite_snapshot_item(stock, quote=None, count=SNAPSHOT_MAX_CLOSES):
+    """组装单只自选股票的快照：最新行情（quote，批量获取）、最近收盘价、日涨跌幅和 PE-TTM"""
+    code = stock.get('code')
+    closes = load_recent_closes(code, count)
+    quote = quote or {}
+
+    price = quote.get('price')
+    prev_close = quote.get('prev_close')
+    change_percent = quote.get('change_percent')
+    # 行情缺失时用本地日线兜底
+    if price is None and closes:
+        price = closes[-1][1]
+        prev_close = closes[-2][1] if len(closes) > 1 else None
+        change_percent = None
+    if change_percent is None and price is not None and prev_close:
+        change_percent = round((price / prev_close - 1) * 100, 2)
+
+    return {
+        'code': code,
+        'name': stock.get('name') or quote.get('name') or '',
+        'price': price,
+        'prev_close': prev_close,
+        'change_percent': change_percent,
+        'pe_ttm': quote.get('pe_ttm'),
+        'market_cap': quote.get('market_cap'),
+        'quote_available': bool(quote),
+        'closes': [c for _, c in closes],
+        'close_dates': [d for d, _ in closes],
+    }
+
+def _snapshot_executor():
+    """返回当前进程的线程池（fork 后重新创建），调用方持有 SNAPSHOT_STATE_LOCK"""
+    if SNAPSHOT_STATE['pid'] != os.getpid():
+        SNAPSHOT_STATE['pid'] = os.getpid()
+        SNAPSHOT_STATE['executor'] = ThreadPoolExecutor(max_workers=SNAPSHOT_WORKERS, thread_name_prefix='snapshot')
+        SNAPSHOT_STATE['thread'] = None
+    return SNAPSHOT_STATE['executor']
+
+def build_favorites_snapshot():
+    """
+    组装所有自选股票的快照并保存到 FAVORITES_SNAPSHOT：行情一次批量获取，收盘价按 SNAPSHOT_MAX_CLOSES 并发读取本地日线
+    """
+    stocks = FAVORITES.list()
+    key = tuple(s.get('code') for s in stocks)
+    with SNAPSHOT_STATE_LOCK:
+        executor = _snapshot_executor()
+    with metrics.stage('favorites_snapshot'):
+        quotes = get_cached_quotes(key)
+        items = list(executor.map(lambda s: build_favorite_snapshot_item(s, quotes.get(s.get('code'))), stocks))
+    payload = {
+        'success': True,
+        'stocks': items,
+        'count': len(items),
+        'generated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    }
+    with SNAPSHOT_LOCK:
+        FAVORITES_SNAPSHOT['key'] = key
+        FAVORITES_SNAPSHOT['built_at'] = time.monotonic()
+        FAVORITES_SNAPSHOT['payload'] = payload
+    return key, payload
+
+def _snapshot_refresh_loop():
+    while True:
+        time.sleep(SNAPSHOT_REFRESH_INTERVAL)
+        with SNAPSHOT_STATE_LOCK:
+            if time.monotonic() - SNAPSHOT_STATE['last_request'] > SNAPSHOT_IDLE_TIMEOUT:
+                SNAPSHOT_STATE['thread'] = None
+                return
+        try:
+            build_favorites_snapshot()
+        except Exception as e:
+            print(f"刷新自选快照失败: {e}")
+
+def ensure_snapshot_refresher():
+    """记录请求时间；当前进程的后台刷新线程未运行时启动（空闲超过 SNAPSHOT_IDLE_TIMEOUT 秒后自行退出）"""
+    with SNAPSHOT_STATE_LOCK:
+        _snapshot_executor()
+        SNAPSHOT_STATE['last_request'] = time.monotonic()
+        if SNAPSHOT_STATE['thread'] is None and SNAPSHOT_REFRESH_INTERVAL > 0:
+            thread = threading.Thread(target=_snapshot_refresh_loop, name='favorites-snapshot', daemon=True)
+            SNAPSHOT_STATE['thread'] = thread
+            thread.start()
+
+def slice_snapshot(payload, count):
+    """快照按 SNAPSHOT_MAX_CLOSES 预先计算，返回只保留最近 count 个收盘价的副本"""
+    stocks = [dict(item, closes=item['closes'][-count:], close_dates=item['close_dates'][-count:])
+              for item in payload['stocks']]
+    return dict(payload, stocks=stocks)
+
+@app.route('/api/favorites/snapshot', methods=['GET'])
+def get_favorites_snapshot():
+    """
+    一次返回所有自选股票的最新行情、最近收盘价、日涨跌幅和 PE-TTM
+    快照由后台线程定期预先计算（按最大收盘价数量，请求时截取）；自选列表变化或快照过期时同步重建
+    参数: closes - 最近收盘价数量（默认 30，最多 250）
+    """
+    try:
+        count = max(1, min(int(request.args.get('closes', SNAPSHOT_CLOSES)), SNAPSHOT_MAX_CLOSES))
+        ensure_snapshot_refresher()
+
+        codes = tuple(s.get('code') for s in FAVORITES.list())
+        with SNAPSHOT_LOCK:
+            key = FAVORITES_SNAPSHOT['key']
+            age = time.monotonic() - FAVORITES_SNAPSHOT['built_at']
+            payload = FAVORITES_SNAPSHOT['payload']
+        fresh = payload is not None and key == codes and age < max(SNAPSHOT_REFRESH_INTERVAL * 2, 1)
+        metrics.record_cache('favorites_snapshot', fresh)
+        if not fresh:
+            _, payload = build_favorites_snapshot()
+            age = 0.0
+        return jsonify(dict(slice_snapshot(payload, count), age=round(age, 3)))
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f'获取自选快照失败: {str(e)}'
+        }), 500
+
+# 行情推送：单个连接最多订阅的股票数；无变化时发送心跳的间隔（秒），防止代理断开空闲连接
+QUOTE_STREAM_MAX_CODES = 200
+QUOTE_STREAM_HEARTBEAT = float(os.environ.get('QUOTE_STREAM_HEARTBEAT', 15))
+# 同步（gthread）worker 中每个推送连接一直占用一个线程：每个 worker 最多同时保持的连接数（默认线程数的一半，
+# 其余线程留给普通接口），超出时返回 503；连接保持 QUOTE_STREAM_MAX_SECONDS 秒后由服务端结束，
+# 浏览器按 retry 间隔自动重连，线程轮流释放。asgi.py 的推送只占协程，不受此限制
+QUOTE_STREAM_MAX_CONNECTIONS = int(os.environ.get('QUOTE_STREAM_MAX_CONNECTIONS',
+                                                  max(1, int(os.environ.get('WEB_THREADS', 4)) // 2)))
+QUOTE_STREAM_MAX_SECONDS = float(os.environ.get('QUOTE_STREAM_MAX_SECONDS', 300))
+QUOTE_STREAM_SLOTS = threading.BoundedSemaphore(QUOTE_STREAM_MAX_CONNECTIONS)
+
+def store_stream_quote(code, info):
+    """推送轮询取到的行情同时写入行情缓存，自选快照可直接复用"""
+    QUOTE_CACHE[code] = (time.monotonic(), dict(info, success=True))
+
+# 进程内共享的行情轮询：上游请求数只与订阅的不同股票数有关，与连接数无关
+QUOTE_HUB = QuoteHub(fetch_quote_batch, parse_stock_info, on_quote=store_stream_quote)
+
+def parse_stream_codes(args):
+    """解析推送订阅的股票代码，返回 (代码列表, 错误信息)"""
+    codes = parse_codes_param(args.get('codes'))
+    if not codes:
+        return None, '缺少 codes 参数'
+    if len(codes) > QUOTE_STREAM_MAX_CODES:
+        return None, f'单个连接最多订阅 {QUOTE_STREAM_MAX_CODES} 只股票'
+    return codes, None
+
+def quote_stream_events(sub, heartbeat=QUOTE_STREAM_HEARTBEAT, max_seconds=None):
+    """
+    SSE 消息生成器：先推送已有行情，之后只推送变化的字段；连接断开时取消订阅
+    max_seconds 不为 None 时连接保持该时长后结束（客户端自动重连）
+    """
+    deadline = time.monotonic() + max_seconds if max_seconds else None
+    try:
+        yield 'retry: 3000\n\n'
+        while deadline is None or time.monotonic() < deadline:
+            wait = heartbeat if deadline is None else max(0.0, min(heartbeat, deadline - time.monotonic()))
+            changes = sub.wait(wait)
+            if changes:
+                yield format_sse(json.dumps(changes, ensure_ascii=False), 'quote')
+            else:
+                yield ': ping\n\n'
+    finally:
+        sub.close()
+
+@app.route('/api/stream/quotes', methods=['GET'])
+def stream_quotes():
+    """
+    实时行情推送（Server-Sent Events）
+    参数: codes - 逗号分隔的股票代码
+    每条 quote 事件为 {代码: {变化的字段}}，字段与 /api/stock_info 相同；首次推送包含全部字段
+    """
+    codes, error = parse_stream_codes(request.args)
+    if error:
+        return jsonify({'success': False, 'error': error}), 400
+    if not QUOTE_STREAM_SLOTS.acquire(blocking=False):
+        return jsonify({
+            'success': False,
+            'error': f'推送连接已满（每个 worker 最多 {QUOTE_STREAM_MAX_CONNECTIONS} 个），请稍后重试或使用 /api/stock_info',
+        }), 503, {'Retry-After': '30'}
+    sub = QUOTE_HUB.subscribe(codes)
+    released = []
+
+    def release():
+        # 生成器未开始迭代时 finally 不会执行，这里保证取消订阅并归还名额（只归还一次）
+        sub.close()
+        if not released:
+            released.append(True)
+            QUOTE_STREAM_SLOTS.release()
+
+    response = Response(stream_with_context(quote_stream_events(sub, max_seconds=QUOTE_STREAM_MAX_SECONDS)),
+                        mimetype='text/event-stream', headers={
+                            'Cache-Control': 'no-cache',
+                            'X-Accel-Buffering': 'no',
+                        })
+    response.call_on_close(release)
+    return response
+
+@app.route('/api/upstream/status', methods=['GET'])
+def get_upstream_status():
+    """上游保护状态：各上游的熔断器状态、连续失败次数、限流速率和各操作当前的超时"""
+    return jsonify({'success': True, 'pid': os.getpid(), 'upstreams': upstream_status()})
+
+@app.route('/api/stream/status', methods=['GET'])
+def get_stream_status():
+    """行情推送状态：连接数、订阅股票数、上游请求次数"""
+    return jsonify(dict(QUOTE_HUB.status(), success=True, pid=os.getpid(),
+                        max_connections=QUOTE_STREAM_MAX_CONNECTIONS))
+
+# 跨股票分析：可选的市场股票池（按代码后缀）
+ANALYTICS_MARKETS = ('SZ', 'SH', 'HK', 'US')
+# 单次分析的股票数上限；市场股票池超出时按窗口内平均成交额取前 limit 只
+ANALYTICS_MAX_SYMBOLS = 1000
+ANALYTICS_DEFAULT_LIMIT = 500
+# beta 默认基准（沪深300），本地没有该指数日线时使用股票池等权收益
+ANALYTICS_BENCHMARK = os.environ.get('ANALYTICS_BENCHMARK', '000300.SH')
+PANEL_DIR = os.path.join(DATA_DIR, 'panel')
+
+def normalize_universe_code(code):
+    """股票池代码标准化：6 位数字代码按首位补 .SH / .SZ"""
+    code = str(code).strip().upper()
+    if '.' not in code and code.isdigit() and len(code) == 6:
+        return f"{code}.SH" if code.startswith('6') else f"{code}.SZ"
+    return code
+
+def list_local_codes():
+    """本地有日线的全部股票代码（有面板时取面板的股票列表）"""
+    panel = open_panel(PANEL_DIR)
+    if panel is not None:
+        return list(panel.symbols)
+    return sorted({code for code, _, _ in list_sources(DATA_DIR)})
+
+def resolve_universe(args):
+    """
+    解析股票池参数，返回 (股票池名称, 代码列表)
+    codes=逗号分隔的代码 优先；否则 universe=favorites（默认）/ SZ / SH / HK / US / all
+    """
+    codes = parse_codes_param(args.get('codes'))
+    if codes:
+        return 'custom', list(dict.fromkeys(normalize_universe_code(c) for c in codes))
+    universe = (args.get('universe') or 'favorites').strip()
+    key = universe.upper().lstrip('.')
+    if key == 'FAVORITES':
+        return 'favorites', [normalize_universe_code(s.get('code')) for s in FAVORITES.list() if s.get('code')]
+    if key == 'ALL':
+        return 'all', list_local_codes()
+    if key in ANALYTICS_MARKETS:
+        return key, [c for c in list_local_codes() if c.upper().endswith('.' + key)]
+    raise ValueError(f'不支持的股票池: {universe}（可选 favorites、all、{"、".join(ANALYTICS_MARKETS)}）')
+
+def load_adjusted_bars(stock_code, adjust=DEFAULT_ADJUST):
+    """本地日线 + 远程缓存合并后的复权 Bars（不拉取远程数据和因子）"""
+    parts = [load_bars(path) for path, _ in find_all_stock_files(stock_code)]
+    parts.append(load_bars(os.path.join(REMOTE_CACHE_DIR, f"{stock_code}_raw.csv")))
+    bars = Bars.concat(parts)
+    if len(bars) == 0:
+        return None
+    return adjust_bars(bars, get_adjust_factors(stock_code), adjust)
+
+def load_aligned_closes(codes, end=None, rows=analytics.TRADING_DAYS):
+    """
+    股票池的对齐行情，返回 (AlignedCloses, 数据来源)
+    面板包含全部代码且这些股票的文件在面板更新后没有变化时直接切片，否则逐只读取日线（经 Bars 缓存）
+    """
+    panel = open_panel(PANEL_DIR)
+    if (panel is not None and all(c in panel.column_of for c in codes)
+            and not stale_codes(panel, DATA_DIR, PANEL_STALE_CHECK_TTL) & set(codes)):
+        return analytics.closes_from_panel(panel, codes, end, rows), 'panel'
+    with metrics.stage('file_read'):
+        bars_by_code = {code: load_adjusted_bars(code) for code in codes}
+    return analytics.closes_from_bars(bars_by_code, end, rows), 'files'
+
+def analytics_data_version():
+    """缓存键中的数据版本：面板 meta、数据目录索引和当天日期（远程缓存按天更新）"""
+    panel = open_panel(PANEL_DIR)
+    return (
+        panel.meta.get('updated_at') if panel is not None else None,
+        panel.rows if panel is not None else None,
+        _stock_file_index_signature(),
+        datetime.now().strftime('%Y-%m-%d'),
+    )
+
+def stock_name_map():
+    """代码 -> 名称（股票列表 + 自选）"""
+    names = {s['code']: s['name'] for s in load_stock_list_with_pinyin()}
+    names.update({s.get('code'): s.get('name') for s in FAVORITES.list()})
+    return names
+
+def parse_analytics_args(args, default_window):
+    """解析分析接口的公共参数，返回 (股票池名称, 代码, window, end, limit)"""
+    universe, codes = resolve_universe(args)
+    window = max(5, min(int(args.get('window', default_window)), 2500))
+    end = args.get('end') or None
+    if end is not None:
+        end = pd.to_datetime(end).strftime('%Y-%m-%d')
+    limit = max(2, min(int(args.get('limit', ANALYTICS_DEFAULT_LIMIT)), ANALYTICS_MAX_SYMBOLS))
+    if not codes:
+        raise ValueError('股票池为空')
+    return universe, codes, window, end, limit
+
+def analytics_error(prefix, e):
+    status = 400 if isinstance(e, ValueError) else 500
+    return jsonify({'success': False, 'error': f'{prefix}: {str(e)}'}), status
+
+@app.route('/api/analytics/correlation', methods=['GET'])
+def get_correlation_matrix():
+    """
+    股票池收益率相关系数矩阵
+    参数: universe - favorites（默认）/ SZ / SH / HK / US / all；codes - 逗号分隔的代码（优先于 universe）
+          window - 收益率天数（默认 60）；end - 截止日期（默认最新）；limit - 最多股票数（默认 500，按成交额）
+          min_periods - 两只股票最少共同交易日（默认 window 的一半）
+    """
+    try:
+        universe, codes, window, end, limit = parse_analytics_args(request.args, 60)
+        min_periods = max(2, int(request.args.get('min_periods', window // 2)))
+        key = ('correlation', universe, tuple(codes), window, end, limit, min_periods, analytics_data_version())
+
+        def compute():
+            aligned, source = load_aligned_closes(codes, end, window + 1)
+            aligned = analytics.top_by_amount(aligned, limit)
+            with metrics.stage('analytics'):
+                returns = analytics.simple_returns(aligned.close)
+                corr, _ = analytics.pairwise_correlation(returns, min_periods)
+            names = stock_name_map()
+            dates = aligned.dates()
+            loaded = set(aligned.codes)
+            # 500 只股票的矩阵序列化后约 2MB，缓存序列化结果而不是字典
+            return app.json.dumps({
+                'success': True,
+                'universe': universe,
+                'window': window,
+                'start': dates[1] if len(dates) > 1 else None,
+                'end': dates[-1] if dates else None,
+                'source': source,
+                'codes': aligned.codes,
+                'names': [names.get(c, '') for c in aligned.codes],
+                'missing': [c for c in codes if c not in loaded][:100],
+                'matrix': analytics.to_json_values(corr),
+            })
+
+        body = analytics.ANALYTICS_CACHE.get_or_compute(key, compute)
+        return app.response_class(body, mimetype='application/json')
+    except Exception as e:
+        return analytics_error('计算相关系数失败', e)
+
+@app.route('/api/analytics/beta', methods=['GET'])
+def get_beta():
+    """
+    股票池相对基准指数的 beta、相关系数和年化 alpha
+    参数: universe / codes / end / limit 同相关系数接口；window - 收益率天数（默认 250）
+          benchmark - 基准代码（默认 ANALYTICS_BENCHMARK），本地没有其日线时使用股票池等权收益
+    """
+    try:
+        universe, codes, window, end, limit = parse_analytics_args(request.args, 250)
+        benchmark = normalize_universe_code(request.args.get('benchmark', ANALYTICS_BENCHMARK))
+        key = ('beta', universe, tuple(codes), window, end, limit, benchmark, analytics_data_version())
+
+        def compute():
+            aligned, source = load_aligned_closes(codes, end, window + 1)
+            aligned = analytics.top_by_amount(aligned, limit)
+            returns = analytics.simple_returns(aligned.close)
+            bench_close = analytics.closes_on_days(load_adjusted_bars(benchmark), aligned.days)
+            if not np.isnan(bench_close).all():
+                market = analytics.simple_returns(bench_close[:, None])[:, 0]
+                benchmark_label = benchmark
+            else:
+                with np.errstate(invalid='ignore'):
+                    market = np.nanmean(returns, axis=1) if returns.size else np.empty(0)
+                benchmark_label = 'equal_weight'
+            with metrics.stage('analytics'):
+                stats = analytics.beta_stats(returns, market, max(2, window // 2))
+            names = stock_name_map()
+            dates = aligned.dates()
+            results = [
+                {
+                    'code': code,
+                    'name': names.get(code, ''),
+                    'beta': beta,
+                    'correlation': corr,
+                    'alpha': alpha,
+                    'observations': int(n),
+                }
+                for code, beta, corr, alpha, n in zip(
+                    aligned.codes,
+                    analytics.to_json_values(stats['beta']),
+                    analytics.to_json_values(stats['correlation']),
+                    analytics.to_json_values(stats['alpha']),
+                    stats['observations'],
+                )
+            ]
+            return {
+                'success': True,
+                'universe': universe,
+                'benchmark': benchmark_label,
+                'window': window,
+                'start': dates[1] if len(dates) > 1 else None,
+                'end': dates[-1] if dates else None,
+                'source': source,
+                'results': results,
+            }
+
+        return jsonify(analytics.ANALYTICS_CACHE.get_or_compute(key, compute))
+    except Exception as e:
+        return analytics_error('计算 beta 失败', e)
+
+@app.route('/api/analytics/relative_strength', methods=['GET'])
+def get_relative_strength():
+    """
+    相对强度排名：各回看期累计收益的百分位排名加权平均（0-100）
+    参数: universe / codes / end / limit 同相关系数接口；lookbacks - 回看天数（默认 20,60,120）
+          weights - 各回看期权重（默认等权）；top - 返回前 N 名（默认全部）；benchmark - 计算超额收益的基准
+    """
+    try:
+        universe, codes, _, end, limit = parse_analytics_args(request.args, 60)
+        lookbacks = tuple(sorted({max(1, int(x)) for x in parse_codes_param(request.args.get('lookbacks', '20,60,120'))}))
+        weights = [float(x) for x in parse_codes_param(request.args.get('weights'))] or None
+        if weights is not None and len(weights) != len(lookbacks):
+            raise ValueError('weights 数量需与 lookbacks 一致')
+        top = request.args.get('top', type=int)
+        benchmark = normalize_universe_code(request.args.get('benchmark', ANALYTICS_BENCHMARK))
+        key = ('relative_strength', universe, tuple(codes), lookbacks, tuple(weights or ()), end, limit, benchmark,
+               analytics_data_version())
+
+        def compute():
+            rows = max(lookbacks) + 1
+            aligned, source = load_aligned_closes(codes, end, rows)
+            aligned = analytics.top_by_amount(aligned, limit)
+            bench_close = analytics.closes_on_days(load_adjusted_bars(benchmark), aligned.days)
+            if np.isnan(bench_close).all():
+                bench_close = None
+            with metrics.stage('analytics'):
+                rs = analytics.relative_strength(aligned.close, lookbacks, weights, bench_close)
+            names = stock_name_map()
+            scores = analytics.to_json_values(rs['score'], 2)
+            returns = {lb: analytics.to_json_values(v) for lb, v in rs['returns'].items()}
+            excess = {lb: analytics.to_json_values(v) for lb, v in rs['excess'].items()}
+            results = []
+            for i, code in enumerate(aligned.codes):
+                results.append({
+                    'code': code,
+                    'name': names.get(code, ''),
+                    'score': scores[i],
+                    'returns': {str(lb): returns[lb][i] for lb in lookbacks},
+                    'excess': {str(lb): excess[lb][i] for lb in excess},
+                })
+            results.sort(key=lambda r: -1 if r['score'] is None else r['score'], reverse=True)
+            for rank, item in enumerate(results, 1):
+                item['rank'] = rank
+            dates = aligned.dates()
+            return {
+                'success': True,
+                'universe': universe,
+                'lookbacks': list(lookbacks),
+                'benchmark': benchmark if bench_close is not None else None,
+                'end': dates[-1] if dates else None,
+                'source': source,
+                'results': results,
+            }
+
+        payload = analytics.ANALYTICS_CACHE.get_or_compute(key, compute)
+        if top:
+            payload = dict(payload, results=payload['results'][:max(1, top)])
+        return jsonify(payload)
+    except Exception as e:
+        return analytics_error('计算相对强度失败', e)
+
+@app.route('/api/analytics/rolling_correlation', methods=['GET'])
+def get_rolling_correlation():
+    """
+    两只股票（或股票与指数）收益率的滚动相关系数序列
+    参数: a、b - 股票代码；window - 滚动窗口（默认 60）；lookback - 序列长度（交易日，默认 250）；end - 截止日期
+    """
+    try:
+        a = normalize_universe_code(request.args.get('a', ''))
+        b = normalize_universe_code(request.args.get('b', ANALYTICS_BENCHMARK))
+        if not a or not b:
+            raise ValueError('需要参数 a 和 b')
+        window = max(5, min(int(request.args.get('window', 60)), 1000))
+        lookback = max(1, min(int(request.args.get('lookback', 250)), 5000))
+        end = request.args.get('end') or None
+        if end is not None:
+            end = pd.to_datetime(end).strftime('%Y-%m-%d')
+        key = ('rolling_correlation', a, b, window, lookback, end, analytics_data_version())
+
+        def compute():
+            aligned, source = load_aligned_closes([a, b], end, lookback + window)
+            if len(aligned.codes) < 2:
+                raise ValueError(f'没有找到日线数据: {", ".join(c for c in (a, b) if c not in aligned.codes)}')
+            with metrics.stage('analytics'):
+                returns = analytics.simple_returns(aligned.close)
+                corr = analytics.rolling_pair_correlation(returns[:, 0], returns[:, 1], window, max(2, window // 2))
+            dates = aligned.dates()[1:]
+            return {
+                'success': True,
+                'a': aligned.codes[0],
+                'b': aligned.codes[1],
+                'window': window,
+                'source': source,
+                'dates': dates[-lookback:],
+                'values': analytics.to_json_values(corr[-lookback:]),
+            }
+
+        return jsonify(analytics.ANALYTICS_CACHE.get_or_compute(key, compute))
+    except Exception as e:
+        return analytics_error('计算滚动相关系数失败', e)
+
+# SQL 查询：同时执行的查询数上限（超出时返回 429，避免大查询占满 CPU 和内存）
+QUERY_MAX_CONCURRENCY = int(os.environ.get('QUERY_MAX_CONCURRENCY', 2))
+QUERY_SEMAPHORE = threading.BoundedSemaphore(QUERY_MAX_CONCURRENCY)
+
+@app.route('/api/query', methods=['GET', 'POST'])
+def run_sql_query():
+    """
+    日线数据的只读 SQL 查询（需要安装 duckdb，视图说明见 query_engine.py）
+    参数（GET 查询参数或 POST JSON）: sql - 单条 SELECT；max_rows - 最多返回行数
+    """
+    payload = (request.get_json(silent=True) or {}) if request.method == 'POST' else request.args
+    sql = payload.get('sql', '')
+    try:
+        max_rows = max(1, min(int(payload.get('max_rows', query_engine.QUERY_MAX_ROWS)), query_engine.QUERY_MAX_ROWS))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'max_rows 必须是整数'}), 400
+    if not QUERY_SEMAPHORE.acquire(blocking=False):
+        return jsonify({'success': False, 'error': '查询繁忙，请稍后重试'}), 429
+    try:
+        with metrics.stage('query'):
+            result = query_engine.get_engine().run(sql, max_rows=max_rows, timeout=query_engine.QUERY_TIMEOUT)
+    except query_engine.QueryEngineUnavailable as e:
+        return jsonify({'success': False, 'error': str(e)}), 503
+    except query_engine.QueryTimeout as e:
+        return jsonify({'success': False, 'error': str(e)}), 408
+    except query_engine.QueryRejected as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': f'查询失败: {str(e)}'}), 500
+    finally:
+        QUERY_SEMAPHORE.release()
+    body = json.dumps(dict(result, success=True), ensure_ascii=False)
+    return app.response_class(body, mimetype='application/json')
+
+@app.route('/api/query/tables', methods=['GET'])
+def get_query_tables():
+    """SQL 查询可用的视图、数据来源（parquet / csv）和列"""
+    try:
+        return jsonify({'success': True, 'tables': query_engine.get_engine().tables()})
+    except query_engine.QueryEngineUnavailable as e:
+        return jsonify({'success': False, 'error': str(e)}), 503
+    except Exception as e:
+        return jsonify({'success': False, 'error': f'获取视图失败: {str(e)}'}), 500
+
+@app.route('/api/export', methods=['GET'])
+def export_bars():
+    """
+    多只股票日线批量导出（流式响应，见 bulk_export.py）
+    参数: codes 或 universe（favorites / SZ / SH / HK / US / all）；start、end；
+          format - arrow（默认）/ parquet / csv；adjust - none（默认）/ qfq / hfq
+    """
+    fmt = (request.args.get('format') or 'arrow').strip().lower()
+    try:
+        bulk_export.check_format(fmt)
+        universe, codes = resolve_universe(request.args)
+        start = request.args.get('start') or None
+        end = request.args.get('end') or None
+        for value in (start, end):
+            if value is not None:
+                pd.to_datetime(value)
+        adjust = normalize_adjust(request.args.get('adjust', 'none'))
+        source, chunks = bulk_export.iter_chunks(codes, start, end, adjust, DATA_DIR, PANEL_DIR)
+    except bulk_export.ExportUnavailable as e:
+        return jsonify({'success': False, 'error': str(e)}), 503
+    except Exception as e:
+        return jsonify({'success': False, 'error': f'导出失败: {str(e)}'}), 400
+    filename = bulk_export.export_filename(universe, start, end, fmt)
+    return Response(stream_with_context(bulk_export.iter_export(chunks, fmt)),
+                    mimetype=bulk_export.EXPORT_FORMATS[fmt][0],
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"',
+                             'X-Export-Source': source, 'X-Export-Symbols': str(len(codes))})
+
+SIGNAL_ENGINE = incremental_signals.SignalEngine(DATA_DIR, os.path.join(DATA_DIR, 'signal_state.npz'))
+
+@app.route('/api/signals', methods=['GET'])
+def get_incremental_signals():
+    """
+    股票池最新交易日的策略信号（增量状态，见 incremental_signals.py）
+    参数: codes 或 universe（favorites 默认 / SZ / SH / HK / US / all）；rules - 逗号分隔的规则（默认全部）
+    """
+    try:
+        universe, codes = resolve_universe(request.args)
+        rule_ids = [r.strip() for r in (request.args.get('rules') or '').split(',') if r.strip()] or None
+        for rule_id in rule_ids or []:
+            if rule_id not in incremental_signals.ALERT_RULES:
+                raise ValueError(f'未知规则: {rule_id}（可选 {"、".join(incremental_signals.ALERT_RULES)}）')
+    except Exception as e:
+        return jsonify({'success': False, 'error': f'参数错误: {str(e)}'}), 400
+    try:
+        stats = SIGNAL_ENGINE.refresh()
+        signals = SIGNAL_ENGINE.signals(rule_ids, codes)
+        return jsonify({
+            'success': True,
+            'universe': universe,
+            'signals': signals,
+            'update': {k: round(v, 4) if isinstance(v, float) else v for k, v in stats.items()},
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': f'计算信号失败: {str(e)}'}), 500
+
+# 启动预热阶段（按顺序执行）
+WARMUP_PHASES = ('stock_list', 'file_index', 'hot_symbols', 'bars')
+
+# 预热状态：/api/ready 据此返回就绪情况和进度
+WARMUP_STATE = {
+    'ready': False,
+    'running': False,
+    'phase': None,
+    # 当前阶段进度（已完成 / 总数）
+    'done': 0,
+    'total': 0,
+    # 各阶段耗时（秒）
+    'phases': {},
+    'runs': 0,
+    'error': None,
+    # 模块导入耗时、最近一次预热耗时、从开始导入到首次就绪的耗时（冷启动）
+    'import_seconds': None,
+    'warmup_seconds': None,
+    'cold_start_seconds': None,
+}
+WARMUP_LOCK = threading.Lock()
+
+
+def _set_warmup_state(**fields):
+    with WARMUP_LOCK:
+        WARMUP_STATE.update(fields)
+
+
+def get_hot_symbols():
+    """
+    预热的热门股票：自选股票 + 环境变量 HOT_SYMBOLS（逗号分隔，如指数 000300.SH）
+    """
+    codes = [s.get('code') for s in FAVORITES.list() if s.get('code')]
+    codes += parse_codes_param(os.environ.get('HOT_SYMBOLS', ''))
+    return list(dict.fromkeys(codes))
+
+
+def warm_up_caches(preload_bars=None):
+    """
+    预热进程内缓存，依次执行：
+      stock_list  - 股票列表（含搜索索引）
+      file_index  - 数据目录索引
+      hot_symbols - 热门股票（自选 + HOT_SYMBOLS）的日线载入 Bars 缓存
+      bars        - preload_bars 为 True（或环境变量 PRELOAD_BARS=1）时载入全部日线
+    生产模式下在 fork 之前由主进程调用，worker 以写时复制方式共享这些内存页
+    完成后 WARMUP_STATE['ready'] 置为 True（重复调用时保持就绪，只刷新缓存和耗时）
+    """
+    if preload_bars is None:
+        preload_bars = os.environ.get('PRELOAD_BARS', '0') == '1'
+    start = time.perf_counter()
+    with WARMUP_LOCK:
+        WARMUP_STATE['running'] = True
+        WARMUP_STATE['error'] = None
+        WARMUP_STATE['phases'] = {}
+
+    def begin_phase(name, total=1):
+        _set_warmup_state(phase=name, done=0, total=total)
+        return time.perf_counter()
+
+    def finish_phase(name, phase_start):
+        elapsed = time.perf_counter() - phase_start
+        with WARMUP_LOCK:
+            WARMUP_STATE['phases'][name] = round(elapsed, 4)
+            WARMUP_STATE['done'] = WARMUP_STATE['total']
+        metrics.record_startup(f'warmup_{name}', elapsed)
+
+    def load_bar_files(name, paths):
+        phase_start = begin_phase(name, len(paths))
+        for i, path in enumerate(paths, 1):
+            load_bars(path)
+            if i % 100 == 0:
+                _set_warmup_state(done=i)
+        finish_phase(name, phase_start)
+
+    try:
+        phase_start = begin_phase('stock_list')
+        stocks = load_stock_list_with_pinyin()
+        finish_phase('stock_list', phase_start)
+
+        phase_start = begin_phase('file_index')
+        index = load_stock_file_index()
+        finish_phase('file_index', phase_start)
+        file_count = sum(len(names) for names in index['files'].values())
+
+        hot_paths = [path for code in get_hot_symbols() for path, _ in find_all_stock_files(code)]
+        load_bar_files('hot_symbols', hot_paths)
+
+        all_paths = []
+        if preload_bars:
+            all_paths = [
+                path
+                for y_dir in index['years']
+                for name, path in index['files'].get(y_dir, {}).items()
+                if name.endswith('.csv')
+            ]
+        load_bar_files('bars', all_paths)
+    except Exception as e:
+        _set_warmup_state(running=False, phase=None, error=str(e))
+        print(f"缓存预热失败: {e}")
+        raise
+
+    bar_stats = BAR_CACHE.stats()
+    now = time.perf_counter()
+    elapsed = now - start
+    with WARMUP_LOCK:
+        WARMUP_STATE.update(ready=True, running=False, phase=None, warmup_seconds=round(elapsed, 4))
+        WARMUP_STATE['runs'] += 1
+        if WARMUP_STATE['cold_start_seconds'] is None:
+            WARMUP_STATE['cold_start_seconds'] = round(now - IMPORT_STARTED_AT, 4)
+            metrics.record_startup('cold_start', now - IMPORT_STARTED_AT)
+        import_seconds = WARMUP_STATE['import_seconds']
+    metrics.record_startup('warmup', elapsed)
+    print(f"缓存预热完成: 股票列表 {len(stocks)} 条, 年份目录 {len(index['years'])} 个, "
+          f"数据文件 {file_count} 个, 热门股票日线 {len(hot_paths)} 个, 日线缓存 {bar_stats['entries']} 个 "
+          f"({bar_stats['bytes'] / 1024 / 1024:.1f}MB), 导入 {import_seconds:.2f}s, 预热 {elapsed:.2f}s")
+    return {
+        'stocks': len(stocks),
+        'years': len(index['years']),
+        'files': file_count,
+        'hot_files': len(hot_paths),
+        'bar_cache': bar_stats,
+        'import_seconds': import_seconds,
+        'elapsed': elapsed
+    }
+
+
+def start_warm_up_in_background(preload_bars=None):
+    """在后台线程预热，服务立即开始监听，预热完成前 /api/ready 返回 503"""
+    def run():
+        try:
+            warm_up_caches(preload_bars)
+        except Exception:
+            pass
+
+    thread = threading.Thread(target=run, name='warm-up', daemon=True)
+    thread.start()
+    return thread
+
+
+@app.route('/api/ready', methods=['GET'])
+def get_readiness():
+    """
+    就绪检查：预热完成返回 200，否则返回 503 和当前阶段进度
+    同时返回模块导入、预热和冷启动耗时（秒）
+    """
+    with WARMUP_LOCK:
+        state = dict(WARMUP_STATE, phases=dict(WARMUP_STATE['phases']))
+    state['success'] = True
+    state['phase_order'] = list(WARMUP_PHASES)
+    state['pid'] = os.getpid()
+    state['uptime_seconds'] = round(time.perf_counter() - IMPORT_STARTED_AT, 4)
+    if state['total']:
+        state['progress'] = round(state['done'] / state['total'], 4)
+    return jsonify(state), 200 if state['ready'] else 503
+
+# 模块导入耗时（不含预热）
+WARMUP_STATE['import_seconds'] = round(time.perf_counter() - IMPORT_STARTED_AT, 4)
+metrics.record_startup('import', WARMUP_STATE['import_seconds'])
+
 if __name__ == '__main__':
     import socket
     
@@ -873,5 +1990,8 @@ if __name__ == '__main__':
     print(f"本地访问: http://localhost:{port}")
     print(f"局域网访问: http://{local_ip}:{port}")
     print(f"="*50 + "\n")
-    
+
+    # debug 模式下 werkzeug 的重载监控进程也会执行这里，只在实际服务的子进程中预热
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_warm_up_in_background()
     app.run(debug=True, host='0.0.0.0', port=port)
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+上游接口密集型 API 的异步（ASGI）版本
+
+/api/stock_info、/api/stock_pe 以及 /api/stock 的远程数据路径几乎全部时间都在等待
+东财/akshare 返回。本模块用异步方式提供这些接口：
+- 东财接口使用 httpx.AsyncClient 异步请求（经由 data_source 的 aquote）
+- akshare 为同步库，调用放入有界线程池执行
+- 每个上游都有独立的并发上限（asyncio.Semaphore），超出的请求排队等待而不占用线程
+
+其余路由原样转发给 Flask 应用（WSGI -> ASGI 适配）。
+
+用法:
+    uvicorn asgi:app --port 8080 --workers 4
+    python3 serve.py 8080 --asgi
+"""
+
+import asyncio
+import contextvars
+import functools
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+import httpx
+from asgiref.wsgi import WsgiToAsgi
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Mount, Route
+
+import app as flask_app_module
+import metrics
+from app import (
+    QUOTE_CACHE,
+    QUOTE_HUB,
+    QUOTE_STREAM_HEARTBEAT,
+    build_stock_data_payload,
+    fetch_stock_pe_history,
+    parse_stock_data_args,
+    parse_stock_info,
+    parse_stream_codes,
+    stale_quote_payload,
+)
+from quote_stream import format_sse
+from data_source import EASTMONEY_TIMEOUT, get_data_source
+
+# 每个上游的并发上限：东财为纯异步 IO，可以放开；akshare 受线程池大小约束
+EASTMONEY_MAX_CONCURRENCY = int(os.environ.get('EASTMONEY_MAX_CONCURRENCY', 200))
+AKSHARE_MAX_CONCURRENCY = int(os.environ.get('AKSHARE_MAX_CONCURRENCY', 16))
+# akshare 线程池大小，与并发上限一致，排队的请求只占协程不占线程
+AKSHARE_MAX_WORKERS = int(os.environ.get('AKSHARE_MAX_WORKERS', AKSHARE_MAX_CONCURRENCY))
+
+UPSTREAM_LIMITS = {
+    'eastmoney': asyncio.Semaphore(EASTMONEY_MAX_CONCURRENCY),
+    'akshare': asyncio.Semaphore(AKSHARE_MAX_CONCURRENCY),
+}
+
+akshare_executor = ThreadPoolExecutor(max_workers=AKSHARE_MAX_WORKERS, thread_name_prefix='akshare')
+
+# 共享的异步 HTTP 客户端，在 lifespan 中创建（需绑定到 worker 的事件循环）
+http_client = None
+
+
+def json_response(payload, status=200):
+    """使用 Flask 的 JSON 序列化，保证与同步版本输出一致（包括 NaN、日期等）"""
+    with metrics.stage('json_encode'):
+        body = flask_app_module.app.json.dumps(payload)
+    return Response(body, status_code=status, media_type='application/json')
+
+
+def timed_route(route):
+    """为异步路由记录延迟指标，按需附加 Server-Timing 头（与 Flask 版本的钩子一致）"""
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(request):
+            started, token = metrics.begin_request()
+            status = 500
+            try:
+                response = await handler(request)
+                status = response.status_code
+            finally:
+                timings = metrics.end_request(started, token, route, request.method, status)
+            if metrics.server_timing_requested(request.query_params):
+                response.headers['Server-Timing'] = metrics.format_server_timing(
+                    timings, time.perf_counter() - started)
+            return response
+        return wrapper
+    return decorator
+
+
+async def run_akshare(func, *args):
+    """在有界线程池中执行 akshare 相关的阻塞调用，受 akshare 并发上限约束"""
+    async with UPSTREAM_LIMITS['akshare']:
+        loop = asyncio.get_running_loop()
+        # 复制上下文，使线程内的阶段耗时计入当前请求
+        ctx = contextvars.copy_context()
+        return await loop.run_in_executor(akshare_executor, functools.partial(ctx.run, func, *args))
+
+
+@timed_route('/api/stock_info/<stock_code>')
+async def get_stock_info(request):
+    """异步版 /api/stock_info/<stock_code>"""
+    stock_code = request.path_params['stock_code']
+    try:
+        async with UPSTREAM_LIMITS['eastmoney']:
+            with metrics.upstream('eastmoney'):
+                data = await get_data_source().aquote(stock_code, http_client)
+        if not data:
+            return json_response({'success': False, 'error': '未获取到基础信息'}, 404)
+        info = parse_stock_info(stock_code, data)
+        QUOTE_CACHE[stock_code] = (time.monotonic(), info)
+        return json_response(info)
+    except Exception as e:
+        stale = stale_quote_payload(stock_code, e)
+        if stale is not None:
+            return json_response(stale)
+        return json_response({'success': False, 'error': f'获取基础信息失败: {str(e)}'}, 500)
+
+
+@timed_route('/api/stock_pe/<stock_code>')
+async def get_stock_pe_history(request):
+    """异步版 /api/stock_pe/<stock_code>"""
+    stock_code = request.path_params['stock_code']
+    payload, status = await run_akshare(fetch_stock_pe_history, stock_code)
+    return json_response(payload, status)
+
+
+@timed_route('/api/stock/<stock_code>')
+async def get_stock_data(request):
+    """
+    异步版 /api/stock/<stock_code>
+    需要远程抓取（remote_data / fill_missing_data）时走 akshare 线程池，否则走普通线程池读本地文件
+    """
+    stock_code = request.path_params['stock_code']
+    year, period, fill_missing_data, remote_data, adjust = parse_stock_data_args(request.query_params)
+    args = (stock_code, year, period, fill_missing_data, remote_data, adjust)
+    if remote_data or fill_missing_data:
+        payload, status = await run_akshare(build_stock_data_payload, *args)
+    else:
+        payload, status = await run_in_threadpool(build_stock_data_payload, *args)
+    return json_response(payload, status)
+
+
+async def quote_stream_events(sub, heartbeat=QUOTE_STREAM_HEARTBEAT):
+    """异步版推送生成器：等待期间不占用线程，由轮询线程通过 call_soon_threadsafe 唤醒"""
+    loop = asyncio.get_running_loop()
+    ready = asyncio.Event()
+    sub.set_waker(lambda: loop.call_soon_threadsafe(ready.set))
+    try:
+        yield 'retry: 3000\n\n'
+        while True:
+            changes = sub.take()
+            if not changes:
+                try:
+                    await asyncio.wait_for(ready.wait(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield ': ping\n\n'
+                    continue
+                ready.clear()
+                changes = sub.take()
+            if changes:
+                yield format_sse(json.dumps(changes, ensure_ascii=False), 'quote')
+    finally:
+        sub.close()
+
+
+async def stream_quotes(request):
+    """异步版 /api/stream/quotes（Server-Sent Events），每个连接只占一个协程"""
+    codes, error = parse_stream_codes(request.query_params)
+    if error:
+        return json_response({'success': False, 'error': error}, 400)
+    sub = QUOTE_HUB.subscribe(codes)
+    return StreamingResponse(quote_stream_events(sub), media_type='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+
+
+@asynccontextmanager
+async def lifespan(_app):
+    global http_client
+    # serve.py 在主进程 fork 之前已预热（worker 继承就绪状态）；直接由 uvicorn 启动时各 worker 自行后台预热，
+    # 预热完成前 /api/ready 返回 503
+    with flask_app_module.WARMUP_LOCK:
+        warmed = flask_app_module.WARMUP_STATE['ready'] or flask_app_module.WARMUP_STATE['running']
+    if not warmed:
+        flask_app_module.start_warm_up_in_background()
+    http_client = httpx.AsyncClient(
+        timeout=EASTMONEY_TIMEOUT,
+        limits=httpx.Limits(max_connections=EASTMONEY_MAX_CONCURRENCY, max_keepalive_connections=50)
+    )
+    try:
+        yield
+    finally:
+        await http_client.aclose()
+
+
+app = Starlette(
+    routes=[
+        Route('/api/stock_info/{stock_code}', get_stock_info),
+        Route('/api/stock_pe/{stock_code}', get_stock_pe_history),
+        Route('/api/stock/{stock_code}', get_stock_data),
+        Route('/api/stream/quotes', stream_quotes),
+        # 其余接口由 Flask 应用处理
+        Mount('/', app=WsgiToAsgi(flask_app_module.app)),
+    ],
+    lifespan=lifespan,
+)
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+"""
+原子写入文件：在目标目录写临时文件后 rename，读者永远看不到写了一半的文件
+
+mkstemp 创建的临时文件权限为 0600，rename 后会保留下来，其他用户（如以不同用户运行的 web 服务）
+无法读取；替换前统一改为 0644，与直接 open 写出的文件一致。
+"""
+
+import os
+import tempfile
+
+FILE_MODE = 0o644
+
+
+def write_atomic(path, write, binary=True, prefix='.tmp_', suffix='', fsync=False):
+    """
+    原子写入 path：write(f) 向临时文件写入内容（binary 为 False 时为 UTF-8 文本文件）
+    fsync 为 True 时替换前先落盘；失败时删除临时文件，原文件不变
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=prefix, suffix=suffix, dir=directory)
+    try:
+        with (os.fdopen(fd, 'wb') if binary else os.fdopen(fd, 'w', encoding='utf-8', newline='')) as f:
+            write(f)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.chmod(tmp_path, FILE_MODE)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
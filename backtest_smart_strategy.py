@@ -5,15 +5,23 @@ import os
 import glob
 from datetime import datetime
 
-def load_stock_data(stock_code):
+import bar_archive
+import kernels
+from result_cache import ResultCache, fingerprint
+
+# 买入信号窗口与卖出窗口（卖出窗口内没有卖出信号时在最后一天卖出）
+BUY_WINDOW = ('2021-01-01', '2022-12-31')
+SELL_WINDOW = ('2023-01-01', '2023-12-31')
+
+def stock_data_files(stock_code):
+    """回测读取的日线文件（2021-2023），也是结果缓存的数据版本范围"""
     data_dir = 'data'
     years = ['2021', '2022', '2023']
-    dfs = []
-    for year in years:
-        file_path = os.path.join(data_dir, f"{year}_by_day", f"{stock_code}.csv")
-        if os.path.exists(file_path):
-            df = pd.read_csv(file_path)
-            dfs.append(df)
+    paths = [bar_archive.resolve(os.path.join(data_dir, f"{year}_by_day", f"{stock_code}.csv")) for year in years]
+    return [p for p in paths if p]
+
+def load_stock_data(stock_code):
+    dfs = [bar_archive.read_csv(file_path) for file_path in stock_data_files(stock_code)]
     
     if not dfs:
         return None
@@ -23,51 +31,52 @@ def load_stock_data(stock_code):
     df = df.sort_values('trade_time')
     return df
 
-def backtest_strategy(df, buy_rule, sell_rule, initial_capital=1000000):
-    buy_start = pd.to_datetime('2021-01-01')
-    buy_end = pd.to_datetime('2022-12-31')
-    sell_start = pd.to_datetime('2023-01-01')
-    sell_end = pd.to_datetime('2023-12-31')
-    
-    # Calculate indicators
-    df['ma60'] = df['close'].rolling(window=60).mean()
-    df['ma20'] = df['close'].rolling(window=20).mean()
+def add_indicators(data):
+    """
+    计算规则使用的指标（ma20、ma60、rsi），原地写入 data
+    data 可以是单只股票的 DataFrame，也可以是 {字段: 日期×股票 宽表} 的字典（组合回测）
+    """
+    close = data['close']
+    data['ma60'] = close.rolling(window=60).mean()
+    data['ma20'] = close.rolling(window=20).mean()
     
     # RSI calculation
-    delta = df['close'].diff()
+    delta = close.diff()
     gain = (delta.where(delta > 0, 0)).rolling(window=14).mean()
     loss = (-delta.where(delta < 0, 0)).rolling(window=14).mean()
     rs = gain / loss
-    df['rsi'] = 100 - (100 / (1 + rs))
-    
-    # Buy signals in 2021-2022
-    buy_mask = (df['trade_time'] >= buy_start) & (df['trade_time'] <= buy_end)
-    buy_signals = df[buy_mask & buy_rule(df)]
+    data['rsi'] = 100 - (100 / (1 + rs))
+    return data
+
+def row_window(times, window):
+    """日期区间 [开始, 结束]（含两端）在按日期排序的 times 中的行号区间 [lo, hi)"""
+    start, end = pd.to_datetime(window[0]), pd.to_datetime(window[1])
+    return int(np.searchsorted(times, start.to_datetime64(), 'left')), int(np.searchsorted(times, end.to_datetime64(), 'right'))
+
+def backtest_strategy(df, buy_rule, sell_rule, initial_capital=1000000):
+    add_indicators(df)
+    times = df['trade_time'].to_numpy(dtype='datetime64[ns]')
+    buy_window = row_window(times, BUY_WINDOW)
+    sell_window = row_window(times, SELL_WINDOW)
     
-    if buy_signals.empty:
+    # Buy signals in 2021-2022: take the first one, then the first sell signal in 2023 after it
+    entry, exit_ = kernels.first_entry_exit(np.asarray(buy_rule(df), dtype=bool), np.asarray(sell_rule(df), dtype=bool),
+                                            1, buy_window, sell_window)
+    if entry < 0:
         return 0, None, None
     
-    # Take the first buy signal
-    buy_signal = buy_signals.iloc[0]
-    buy_price = buy_signal['close']
-    buy_date = buy_signal['trade_time']
-    
-    # Sell signals in 2023
-    sell_mask = (df['trade_time'] >= sell_start) & (df['trade_time'] <= sell_end)
-    sell_signals = df[sell_mask & sell_rule(df)]
+    close = df['close'].to_numpy()
+    buy_price = close[entry]
+    buy_date = df['trade_time'].iloc[entry]
     
-    if sell_signals.empty:
+    if exit_ < 0:
         # If no sell signal, sell at the end of 2023
-        sell_signals = df[sell_mask]
-        if sell_signals.empty:
+        if sell_window[1] <= max(sell_window[0], entry + 1):
             return 0, buy_date, None
-        sell_signal = sell_signals.iloc[-1]
-    else:
-        # Take the first sell signal
-        sell_signal = sell_signals.iloc[0]
+        exit_ = sell_window[1] - 1
         
-    sell_price = sell_signal['close']
-    sell_date = sell_signal['trade_time']
+    sell_price = close[exit_]
+    sell_date = df['trade_time'].iloc[exit_]
     
     return (sell_price - buy_price) / buy_price * 100, buy_date, sell_date
 
@@ -94,31 +103,55 @@ rules = [
 ]
 
 stocks_to_test = ['000001.SZ', '000002.SZ', '000725.SZ', '600036.SH', '600519.SH']
-# Filter stocks that actually exist in the data
-existing_stocks = []
-for s in stocks_to_test:
-    if os.path.exists(os.path.join('data', '2021_by_day', f"{s}.csv")):
-        existing_stocks.append(s)
-
-results = []
-for rule in rules:
-    stock_returns = []
-    for stock in existing_stocks:
-        df = load_stock_data(stock)
-        if df is not None:
-            ret, bd, sd = backtest_strategy(df, rule['buy'], rule['sell'])
-            if bd is not None:
-                stock_returns.append(ret)
-    
-    avg_return = np.mean(stock_returns) if stock_returns else -100
-    results.append({
-        'name': rule['name'],
-        'avg_return': avg_return,
-        'desc': rule['desc']
-    })
-
-results.sort(key=lambda x: x['avg_return'], reverse=True)
-
-print("Backtest Results:")
-for r in results:
-    print(f"Strategy: {r['name']}, Avg Return: {r['avg_return']:.2f}%, Desc: {r['desc']}")
+
+def run_backtest(stocks, rules=rules, cache=None):
+    """
+    对每条规则在给定股票上回测，返回按平均收益率降序排列的结果
+    cache 为 ResultCache 时，规则和数据都没有变化的 (规则, 股票) 直接使用上次的结果
+    """
+    results = []
+    versions = {stock: cache.data_version(stock_data_files(stock)) for stock in stocks} if cache else {}
+    for rule in rules:
+        # 回测函数和指标计算的源码也计入指纹，修改回测逻辑后自动失效
+        key = fingerprint(rule['buy'], rule['sell'], backtest_strategy, add_indicators, BUY_WINDOW, SELL_WINDOW) if cache else None
+        stock_returns = []
+        for stock in stocks:
+            hit, outcome = cache.get(key, stock, versions[stock]) if cache else (False, None)
+            if not hit:
+                df = load_stock_data(stock)
+                outcome = backtest_strategy(df, rule['buy'], rule['sell']) if df is not None else None
+                if cache:
+                    cache.put(key, stock, versions[stock], outcome)
+            if outcome is not None:
+                ret, bd, sd = outcome
+                if bd is not None:
+                    stock_returns.append(ret)
+        
+        avg_return = np.mean(stock_returns) if stock_returns else -100
+        results.append({
+            'name': rule['name'],
+            'avg_return': avg_return,
+            'desc': rule['desc']
+        })
+
+    results.sort(key=lambda x: x['avg_return'], reverse=True)
+    return results
+
+def main():
+    # Filter stocks that actually exist in the data
+    existing_stocks = []
+    for s in stocks_to_test:
+        if bar_archive.resolve(os.path.join('data', '2021_by_day', f"{s}.csv")):
+            existing_stocks.append(s)
+
+    cache = ResultCache()
+    results = run_backtest(existing_stocks, cache=cache)
+    cache.save()
+    print(cache.summary())
+
+    print("Backtest Results:")
+    for r in results:
+        print(f"Strategy: {r['name']}, Avg Return: {r['avg_return']:.2f}%, Desc: {r['desc']}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+按年份打包的日线归档：把 data/<年份>_by_day/ 下成千上万个小 CSV 合并为一个 data/<年份>_by_day.pack
+
+文件结构:
+    MAGIC(8 字节) | 各股票 CSV 原始字节（按文件名排序依次存放） | 索引 JSON | 尾部(索引偏移, 索引长度, MAGIC)
+    索引: {"version": 1, "packed_at": ..., "files": [[文件名, 偏移, 长度], ...]}
+
+- 归档以内存映射打开，读取一只股票只是对映射切片，不再逐个 open/stat/read；全市场扫描按文件名顺序读取，是对一个大文件的顺序读
+- 归档内的文件用路径 data/<年份>_by_day.pack/<代码>.csv 表示，open_binary / read_csv / file_signature 等函数同时支持散文件和归档成员，
+  各加载函数（面板、增量信号、回测、接口）通过它们读取，不关心数据在哪种存储中
+- 年份目录中的散文件优先于归档中的同名文件：补数、完整性修复等写入的新文件直接生效，再次 pack 时合并进归档
+- SQL 视图（query_engine.py）建立连接时把归档成员解析进内存表 packed_bars，打包前后查询结果相同
+
+用法:
+    python3 bar_archive.py pack [--years 2021,2022] [--keep-files]
+    python3 bar_archive.py unpack [--years 2021] [--keep-archive]
+    python3 bar_archive.py info
+"""
+
+import argparse
+import io
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+from datetime import datetime
+
+import pandas as pd
+
+from atomic_file import write_atomic
+
+DATA_DIR = 'data'
+ARCHIVE_SUFFIX = '.pack'
+ARCHIVE_VERSION = 1
+MAGIC = b'BARPACK1'
+# 尾部：索引偏移、索引长度（uint64）+ MAGIC
+FOOTER = struct.Struct('<QQ8s')
+
+
+class ArchiveError(Exception):
+    """归档文件损坏或版本不符"""
+
+
+class BarArchive:
+    """内存映射的归档，read(文件名) 返回该文件的字节"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            st = os.fstat(f.fileno())
+            self.signature = (st.st_mtime_ns, st.st_size, st.st_ino)
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if len(self._mm) < len(MAGIC) + FOOTER.size or self._mm[:len(MAGIC)] != MAGIC:
+                raise ArchiveError(f"不是日线归档: {path}")
+            index_offset, index_length, magic = FOOTER.unpack_from(self._mm, len(self._mm) - FOOTER.size)
+            if magic != MAGIC:
+                raise ArchiveError(f"归档不完整: {path}")
+            meta = json.loads(self._mm[index_offset:index_offset + index_length].decode('utf-8'))
+            if meta.get('version') != ARCHIVE_VERSION:
+                raise ArchiveError(f"归档版本不符: {path}")
+        except BaseException:
+            self._mm.close()
+            raise
+        self.meta = meta
+        self.index = {name: (offset, length) for name, offset, length in meta['files']}
+        self.names = [name for name, _, _ in meta['files']]
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def read(self, name):
+        offset, length = self.index[name]
+        return self._mm[offset:offset + length]
+
+    def size_of(self, name):
+        return self.index[name][1]
+
+
+# 已打开的归档：{路径: BarArchive}，文件被替换（重新打包）后重新打开
+_OPEN_ARCHIVES = {}
+_OPEN_LOCK = threading.Lock()
+
+
+def open_archive(path):
+    """打开（并缓存）归档，不存在或损坏时返回 None"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    signature = (st.st_mtime_ns, st.st_size, st.st_ino)
+    with _OPEN_LOCK:
+        cached = _OPEN_ARCHIVES.get(path)
+        if cached is not None and cached.signature == signature:
+            return cached
+    try:
+        archive = BarArchive(path)
+    except (OSError, ValueError, ArchiveError) as e:
+        print(f"打开归档失败 {path}: {e}")
+        return None
+    with _OPEN_LOCK:
+        _OPEN_ARCHIVES[path] = archive
+    return archive
+
+
+# ---------------------------------------------------------------- 路径：散文件与归档成员
+
+def archive_path(year_dir):
+    """年份目录对应的归档文件"""
+    return year_dir.rstrip('/\\') + ARCHIVE_SUFFIX
+
+
+def is_member(path):
+    return os.path.dirname(path).endswith(ARCHIVE_SUFFIX)
+
+
+def loose_path(path):
+    """归档成员对应的散文件路径（散文件原样返回）"""
+    if not is_member(path):
+        return path
+    return os.path.join(os.path.dirname(path)[:-len(ARCHIVE_SUFFIX)], os.path.basename(path))
+
+
+def _member(path):
+    """归档成员路径 -> (BarArchive, 文件名)，不存在时 (None, 文件名)"""
+    name = os.path.basename(path)
+    archive = open_archive(os.path.dirname(path))
+    if archive is None or name not in archive:
+        return None, name
+    return archive, name
+
+
+def resolve(path):
+    """
+    年份目录下的文件路径 -> 实际读取的路径：散文件存在时返回原路径，否则返回归档成员路径，都不存在返回 None
+    """
+    if os.path.exists(path):
+        return path
+    member = os.path.join(archive_path(os.path.dirname(path)), os.path.basename(path))
+    archive, _ = _member(member)
+    return member if archive is not None else None
+
+
+def exists(path):
+    if is_member(path):
+        return _member(path)[0] is not None
+    return os.path.exists(path)
+
+
+def file_signature(path):
+    """(mtime_ns, 字节数)；归档成员的 mtime 为归档文件的 mtime。不存在时返回 None"""
+    if is_member(path):
+        archive, name = _member(path)
+        if archive is None:
+            return None
+        return archive.signature[0], archive.size_of(name)
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def read_bytes(path):
+    if is_member(path):
+        archive, name = _member(path)
+        if archive is None:
+            raise FileNotFoundError(path)
+        return archive.read(name)
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def open_binary(path):
+    """以二进制方式打开散文件或归档成员（成员为内存中的 BytesIO）"""
+    if is_member(path):
+        return io.BytesIO(read_bytes(path))
+    return open(path, 'rb')
+
+
+def read_csv(path, **kwargs):
+    """pd.read_csv，支持归档成员"""
+    if is_member(path):
+        return pd.read_csv(io.BytesIO(read_bytes(path)), **kwargs)
+    return pd.read_csv(path, **kwargs)
+
+
+def year_dirs(data_dir=DATA_DIR):
+    """所有日级年份（目录或归档），返回升序的 '<年份>_by_day' 列表"""
+    if not os.path.isdir(data_dir):
+        return []
+    names = set()
+    with os.scandir(data_dir) as it:
+        for entry in it:
+            if entry.name.endswith('_by_day') and entry.is_dir():
+                names.add(entry.name)
+            elif entry.name.endswith('_by_day' + ARCHIVE_SUFFIX) and entry.is_file():
+                names.add(entry.name[:-len(ARCHIVE_SUFFIX)])
+    return sorted(names)
+
+
+def list_year(year_dir):
+    """
+    年份中的日线文件，返回按文件名排序的 [(文件名, 路径, mtime_ns), ...]
+    散文件优先于归档中的同名文件
+    """
+    files = {}
+    archive = open_archive(archive_path(year_dir))
+    if archive is not None:
+        member_dir = archive.path
+        mtime_ns = archive.signature[0]
+        files = {name: (name, os.path.join(member_dir, name), mtime_ns) for name in archive.names}
+    if os.path.isdir(year_dir):
+        with os.scandir(year_dir) as it:
+            for entry in it:
+                if entry.name.endswith('.csv'):
+                    files[entry.name] = (entry.name, entry.path, entry.stat().st_mtime_ns)
+    return [files[name] for name in sorted(files)]
+
+
+# ---------------------------------------------------------------- 打包 / 解包
+
+def pack_year(data_dir, y_dir, keep_files=False):
+    """
+    把年份目录（和已有的归档）合并写成新的归档；默认删除已打包且打包期间未被修改的散文件
+    """
+    start = time.perf_counter()
+    year_dir = os.path.join(data_dir, y_dir)
+    target = archive_path(year_dir)
+    entries = list_year(year_dir)
+    packed_loose = []
+    index = []
+
+    def write(f):
+        f.write(MAGIC)
+        for name, path, _ in entries:
+            before = None if is_member(path) else file_signature(path)
+            data = read_bytes(path)
+            index.append([name, f.tell(), len(data)])
+            f.write(data)
+            if before is not None:
+                packed_loose.append((path, before))
+        meta = json.dumps({
+            'version': ARCHIVE_VERSION,
+            'packed_at': datetime.now().isoformat(timespec='seconds'),
+            'files': index,
+        }, ensure_ascii=False).encode('utf-8')
+        index_offset = f.tell()
+        f.write(meta)
+        f.write(FOOTER.pack(index_offset, len(meta), MAGIC))
+
+    write_atomic(target, write)
+    removed = 0
+    if not keep_files:
+        for path, before in packed_loose:
+            # 打包期间被改写的文件保留（散文件优先，下次打包时合并）
+            if file_signature(path) == before:
+                os.remove(path)
+                removed += 1
+        try:
+            os.rmdir(year_dir)
+        except OSError:
+            pass
+    return {
+        'year': y_dir,
+        'files': len(index),
+        'size_mb': round(os.path.getsize(target) / 1024 / 1024, 1),
+        'removed_files': removed,
+        'elapsed': round(time.perf_counter() - start, 3),
+    }
+
+
+def unpack_year(data_dir, y_dir, keep_archive=False):
+    """把归档中的文件写回年份目录（已存在的散文件不覆盖），默认删除归档"""
+    start = time.perf_counter()
+    year_dir = os.path.join(data_dir, y_dir)
+    target = archive_path(year_dir)
+    archive = open_archive(target)
+    if archive is None:
+        return {'year': y_dir, 'files': 0, 'written': 0, 'elapsed': 0.0}
+    os.makedirs(year_dir, exist_ok=True)
+    written = 0
+    for name in archive.names:
+        path = os.path.join(year_dir, name)
+        if os.path.exists(path):
+            continue
+        data = archive.read(name)
+        write_atomic(path, lambda f: f.write(data))
+        written += 1
+    if not keep_archive:
+        os.remove(target)
+    return {
+        'year': y_dir,
+        'files': len(archive),
+        'written': written,
+        'elapsed': round(time.perf_counter() - start, 3),
+    }
+
+
+def archive_info(data_dir=DATA_DIR):
+    info = []
+    for y_dir in year_dirs(data_dir):
+        year_dir = os.path.join(data_dir, y_dir)
+        archive = open_archive(archive_path(year_dir))
+        loose = sum(1 for name, path, _ in list_year(year_dir) if not is_member(path))
+        info.append({
+            'year': y_dir,
+            'archived_files': len(archive) if archive is not None else 0,
+            'loose_files': loose,
+            'size_mb': round(os.path.getsize(archive.path) / 1024 / 1024, 1) if archive is not None else None,
+            'packed_at': archive.meta.get('packed_at') if archive is not None else None,
+        })
+    return info
+
+
+def main():
+    parser = argparse.ArgumentParser(description='按年份打包的日线归档')
+    parser.add_argument('command', choices=['pack', 'unpack', 'info'])
+    parser.add_argument('--data-dir', default=DATA_DIR)
+    parser.add_argument('--years', default=None, help='逗号分隔的年份（默认全部）')
+    parser.add_argument('--keep-files', action='store_true', help='pack 后保留散文件（散文件优先读取）')
+    parser.add_argument('--keep-archive', action='store_true', help='unpack 后保留归档')
+    args = parser.parse_args()
+
+    if args.command == 'info':
+        print(json.dumps(archive_info(args.data_dir), ensure_ascii=False, indent=2))
+        return 0
+
+    selected = year_dirs(args.data_dir)
+    if args.years:
+        wanted = {f"{y.strip()}_by_day" for y in args.years.split(',') if y.strip()}
+        selected = [y for y in selected if y in wanted]
+    if not selected:
+        print("没有可处理的年份")
+        return 1
+    for y_dir in selected:
+        if args.command == 'pack':
+            stats = pack_year(args.data_dir, y_dir, args.keep_files)
+        else:
+            stats = unpack_year(args.data_dir, y_dir, args.keep_archive)
+        print(json.dumps(stats, ensure_ascii=False))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,345 @@
+# -*- coding: utf-8 -*-
+"""
+紧凑的日线容器
+
+pandas 默认每列 float64/datetime64（每根 K 线约 56 字节，外加索引和对象开销），
+缓存大量股票时内存占用很高。Bars 用 numpy 数组按列存储：
+- days:   int32，自 1970-01-01 起的天数
+- open/high/low/close: float32，记录源数据的小数位数（price_decimals，最多 4 位），序列化时按该位数舍入，
+  去掉 float32 的误差；float32 不能精确还原的大价格（价格 * 10 ** 小数位 >= 2 ** 23）改用 float64
+- vol/amount: 定点整数，实际值 = 存储值 * 10 ** scale，scale 保留源数据的小数位（最多两位，即精确到分），
+  存储值超出 uint32 时用 uint64
+每根 K 线 28~32 字节，5000 只股票 x 20 年日线约 800MB 以内。
+
+同时提供：
+- BarCache：按文件 (路径, mtime, 大小) 缓存、按字节数 LRU 淘汰
+- aggregate：周/月聚合（与 app.aggregate_data 的 resample 结果一致）
+- to_records：序列化为接口使用的字典列表
+- moving_average / rsi：直接在数组上计算指标
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import bar_archive
+import metrics
+
+PRICE_FIELDS = ('open', 'high', 'low', 'close')
+SCALED_FIELDS = ('vol', 'amount')
+UINT32_MAX = np.iinfo(np.uint32).max
+# 价格最多保留的小数位数（复权价格按此舍入）；float32 能精确还原的上限：价格 * 10 ** 小数位 < 2 ** 23
+PRICE_DECIMALS = 4
+FLOAT32_EXACT = 2 ** 23
+
+# 默认缓存上限（字节），可用环境变量 BAR_CACHE_MB 调整
+BAR_CACHE_MAX_BYTES = int(float(os.environ.get('BAR_CACHE_MB', 1024)) * 1024 * 1024)
+
+
+def decimal_places(values, max_decimals):
+    """数值（float64）实际使用的小数位数：乘以 10 ** d 后都是整数的最小 d，最多 max_decimals"""
+    for decimals in range(max_decimals):
+        scaled = values * 10.0 ** decimals
+        # 容差随数值增大，吸收十进制小数转二进制的误差
+        if np.all(np.abs(scaled - np.round(scaled)) <= np.maximum(1e-6, np.abs(scaled) * 1e-14)):
+            return decimals
+    return max_decimals
+
+
+def encode_scaled(values, max_decimals=2):
+    """
+    将非负数值编码为定点整数，返回 (数组, scale)，实际值 = 存储值 * 10 ** scale
+    scale 保留源数据的小数位（最多 max_decimals 位）；存储值超出 uint32 时用 uint64
+    """
+    values = np.nan_to_num(np.asarray(values, dtype=np.float64), nan=0.0)
+    values = np.clip(values, 0, None)
+    decimals = decimal_places(values, max_decimals)
+    stored = np.round(values * 10.0 ** decimals)
+    dtype = np.uint32 if not len(stored) or stored.max() <= UINT32_MAX else np.uint64
+    return stored.astype(dtype), -decimals
+
+
+def decode_scaled(stored, scale):
+    """定点整数 -> float64；小数位用除法还原（乘 0.01 会引入误差）"""
+    values = stored.astype(np.float64)
+    return values / 10.0 ** -scale if scale < 0 else values * 10.0 ** scale
+
+
+def encode_prices(columns, decimals=None):
+    """
+    价格列按小数位舍入后选择存储类型，返回 (各列数组, 小数位数)
+    decimals 为 None 时按数据检测（复权等计算结果为 PRICE_DECIMALS 位）
+    """
+    columns = [np.asarray(c, dtype=np.float64) for c in columns]
+    if decimals is None:
+        decimals = max((decimal_places(c[np.isfinite(c)], PRICE_DECIMALS) for c in columns), default=0)
+    columns = [np.round(c, decimals) for c in columns]
+    peak = max((float(np.nanmax(np.abs(c))) for c in columns if len(c) and not np.all(np.isnan(c))), default=0.0)
+    dtype = np.float32 if peak * 10 ** decimals < FLOAT32_EXACT else np.float64
+    return [c.astype(dtype) for c in columns], decimals
+
+
+def days_from_datetimes(values):
+    """datetime 序列 -> int32 天数"""
+    return pd.to_datetime(values).to_numpy(dtype='datetime64[D]').astype(np.int32)
+
+
+class Bars:
+    """单只股票的日线，按日期升序"""
+    __slots__ = ('days', 'open', 'high', 'low', 'close', 'vol', 'amount', 'vol_scale', 'amount_scale',
+                 'price_decimals')
+
+    def __init__(self, days, open_, high, low, close, vol, amount, vol_scale=0, amount_scale=0,
+                 price_decimals=PRICE_DECIMALS):
+        self.days = days
+        self.open = open_
+        self.high = high
+        self.low = low
+        self.close = close
+        self.vol = vol
+        self.amount = amount
+        self.vol_scale = vol_scale
+        self.amount_scale = amount_scale
+        self.price_decimals = price_decimals
+
+    @classmethod
+    def from_arrays(cls, days, open_, high, low, close, vol, amount, price_decimals=None):
+        """
+        由任意 dtype 的数组构造（会复制并转换类型）
+        price_decimals 为 None 时按数据检测价格小数位；由已有 Bars 计算时传入原来的位数
+        """
+        vol_values, vol_scale = encode_scaled(vol)
+        amount_values, amount_scale = encode_scaled(amount)
+        prices, price_decimals = encode_prices((open_, high, low, close), price_decimals)
+        return cls(
+            np.asarray(days, dtype=np.int32), *prices,
+            vol_values, amount_values, vol_scale, amount_scale, price_decimals,
+        )
+
+    @classmethod
+    def from_frame(cls, df):
+        """由 trade_time,open,high,low,close,vol,amount 的 DataFrame 构造，按日期稳定排序"""
+        days = days_from_datetimes(df['trade_time'])
+        order = np.argsort(days, kind='stable')
+        column = lambda name: df[name].to_numpy(dtype=np.float64)[order] if name in df else np.zeros(len(df))
+        return cls.from_arrays(
+            days[order], column('open'), column('high'), column('low'), column('close'),
+            column('vol'), column('amount'),
+        )
+
+    @classmethod
+    def from_csv(cls, path):
+        return cls.from_frame(bar_archive.read_csv(path))
+
+    @classmethod
+    def empty(cls):
+        return cls.from_arrays(*([np.empty(0)] * 7))
+
+    def __len__(self):
+        return len(self.days)
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in ('days',) + PRICE_FIELDS + SCALED_FIELDS)
+
+    def price_values(self, name):
+        """价格列的 float64 值（按 price_decimals 舍入，不含 float32 误差）"""
+        return np.round(getattr(self, name).astype(np.float64), self.price_decimals)
+
+    def vol_values(self):
+        return decode_scaled(self.vol, self.vol_scale)
+
+    def amount_values(self):
+        return decode_scaled(self.amount, self.amount_scale)
+
+    def dates(self):
+        return self.days.astype('datetime64[D]')
+
+    def take(self, index):
+        """按下标/切片/布尔掩码取子集"""
+        return Bars(
+            self.days[index], self.open[index], self.high[index], self.low[index], self.close[index],
+            self.vol[index], self.amount[index], self.vol_scale, self.amount_scale, self.price_decimals,
+        )
+
+    def tail(self, n):
+        return self.take(slice(max(0, len(self) - n), None))
+
+    def between(self, start=None, end=None):
+        """按日期区间（含两端）截取，参数为可被 pandas 解析的日期"""
+        lo = 0 if start is None else np.searchsorted(self.days, days_from_datetimes([start])[0], side='left')
+        hi = len(self) if end is None else np.searchsorted(self.days, days_from_datetimes([end])[0], side='right')
+        return self.take(slice(lo, hi))
+
+    def with_prices(self, open_, high, low, close, price_decimals=None):
+        """
+        返回替换价格列后的新对象（复权等场景），成交量/额共享
+        价格应在 float64 上计算（用 price_values 取值），这里按 price_decimals（默认检测，最多 4 位）舍入后存储
+        """
+        prices, price_decimals = encode_prices((open_, high, low, close), price_decimals)
+        return Bars(self.days, *prices, self.vol, self.amount, self.vol_scale, self.amount_scale, price_decimals)
+
+    @staticmethod
+    def concat(parts):
+        """
+        合并多段日线并按日期排序，同一日期保留先出现的一条
+        （与 pd.concat + sort_values + drop_duplicates(keep='first') 一致）
+        """
+        parts = [p for p in parts if p is not None and len(p)]
+        if not parts:
+            return Bars.empty()
+        if len(parts) == 1:
+            return parts[0]
+        days = np.concatenate([p.days for p in parts])
+        order = np.argsort(days, kind='stable')
+        days = days[order]
+        keep = np.ones(len(days), dtype=bool)
+        keep[1:] = days[1:] != days[:-1]
+        index = order[keep]
+        column = lambda name: np.concatenate([p.price_values(name) for p in parts])[index]
+        scaled = lambda name: np.concatenate([getattr(p, f'{name}_values')() for p in parts])[index]
+        return Bars.from_arrays(
+            days[keep], column('open'), column('high'), column('low'), column('close'),
+            scaled('vol'), scaled('amount'), max(p.price_decimals for p in parts),
+        )
+
+    def period_labels(self, period):
+        """每根 K 线所属周期的标签日（周：当周周日；月：当月最后一天）"""
+        if period == 'week':
+            # 1970-01-01 是周四，weekday: 周一 = 0
+            weekday = (self.days + 3) % 7
+            return self.days + (6 - weekday)
+        if period == 'month':
+            month_end = (self.dates().astype('datetime64[M]') + 1).astype('datetime64[D]') - 1
+            return month_end.astype(np.int32)
+        return self.days
+
+    def aggregate(self, period='day'):
+        """聚合为周/月 K 线：开盘取首个、收盘取最后、高低取极值、量额求和"""
+        if period not in ('week', 'month') or len(self) == 0:
+            return self
+        labels = self.period_labels(period)
+        starts = np.flatnonzero(np.concatenate([[True], labels[1:] != labels[:-1]]))
+        ends = np.concatenate([starts[1:], [len(labels)]]) - 1
+        return Bars.from_arrays(
+            labels[starts],
+            self.price_values('open')[starts],
+            np.maximum.reduceat(self.price_values('high'), starts),
+            np.minimum.reduceat(self.price_values('low'), starts),
+            self.price_values('close')[ends],
+            np.add.reduceat(self.vol_values(), starts),
+            np.add.reduceat(self.amount_values(), starts),
+            self.price_decimals,
+        )
+
+    def to_frame(self):
+        """转换回 pandas DataFrame（回测等仍使用 pandas 的场景）"""
+        return pd.DataFrame({
+            'trade_time': pd.to_datetime(self.dates()),
+            'open': self.price_values('open'),
+            'high': self.price_values('high'),
+            'low': self.price_values('low'),
+            'close': self.price_values('close'),
+            'vol': self.vol_values(),
+            'amount': self.amount_values(),
+        })
+
+    def to_records(self, time_format='%Y-%m-%d %H:%M:%S'):
+        """序列化为 [{'trade_time', 'open', ...}, ...]，价格按源数据的小数位、成交额精确到分"""
+        if len(self) == 0:
+            return []
+        dates = np.datetime_as_string(self.dates(), unit='D')
+        if time_format == '%Y-%m-%d %H:%M:%S':
+            times = np.char.add(dates, ' 00:00:00').tolist()
+        elif time_format == '%Y-%m-%d':
+            times = dates.tolist()
+        else:
+            times = pd.to_datetime(dates).strftime(time_format).tolist()
+        prices = [self.price_values(name).tolist() for name in PRICE_FIELDS]
+        vol = self.vol_values()
+        vol = vol.astype(np.int64).tolist() if self.vol_scale >= 0 else np.round(vol, 2).tolist()
+        amount = np.round(self.amount_values(), 2).tolist()
+        return [
+            {'trade_time': t, 'open': o, 'high': h, 'low': l, 'close': c, 'vol': v, 'amount': a}
+            for t, o, h, l, c, v, a in zip(times, *prices, vol, amount)
+        ]
+
+
+class BarCache:
+    """按文件缓存 Bars：文件 mtime 或大小变化时失效，超过 max_bytes 时淘汰最久未使用的条目"""
+
+    def __init__(self, max_bytes=BAR_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path):
+        """返回文件（或归档成员）对应的 Bars，文件不存在时返回 None"""
+        signature = bar_archive.file_signature(path)
+        if signature is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == signature:
+                self._entries.move_to_end(path)
+                metrics.record_cache('bars', True)
+                return entry[1]
+        metrics.record_cache('bars', False)
+
+        bars = Bars.from_csv(path)
+        with self._lock:
+            old = self._entries.pop(path, None)
+            if old is not None:
+                self.nbytes -= old[1].nbytes
+            self._entries[path] = (signature, bars)
+            self.nbytes += bars.nbytes
+            while self.nbytes > self.max_bytes and len(self._entries) > 1:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+        return bars
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self.nbytes, 'max_bytes': self.max_bytes}
+
+
+BAR_CACHE = BarCache()
+
+
+def load_bars(path, cache=BAR_CACHE):
+    """读取（并缓存）一个日线 CSV 文件"""
+    return cache.get(path)
+
+
+def moving_average(values, window):
+    """简单移动平均，前 window-1 个值为 NaN；窗口内有 NaN 时结果为 NaN（与 pandas rolling 一致）"""
+    values = np.asarray(values, dtype=np.float64)
+    out = np.full(len(values), np.nan)
+    if window <= 0 or len(values) < window:
+        return out
+    filled = np.nan_to_num(values)
+    csum = np.concatenate([[0.0], np.cumsum(filled)])
+    nan_count = np.concatenate([[0], np.cumsum(np.isnan(values))])
+    sums = csum[window:] - csum[:-window]
+    valid = (nan_count[window:] - nan_count[:-window]) == 0
+    out[window - 1:] = np.where(valid, sums / window, np.nan)
+    return out
+
+
+def rsi(values, window=14):
+    """RSI（涨跌幅的简单移动平均，与 backtest_smart_strategy.add_indicators 一致）"""
+    values = np.asarray(values, dtype=np.float64)
+    delta = np.diff(values, prepend=np.nan)
+    gain = moving_average(np.where(delta > 0, delta, 0.0), window)
+    loss = moving_average(np.where(delta < 0, -delta, 0.0), window)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return 100 - 100 / (1 + gain / loss)
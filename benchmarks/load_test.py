@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+远程路径压测：使用本地上游模拟器，在不访问网络的情况下以较高并发驱动 Flask 应用
+
+默认在进程内启动多线程服务器并将数据源替换为 SimulatedDataSource；
+也可用 --url 压测已启动的服务（需以 STOCK_DATA_SOURCE=simulator 启动）。
+
+用法:
+    python3 benchmarks/load_test.py [--concurrency 32] [--duration 10] [--symbols 50]
+                                    [--latency-ms 80] [--error-rate 0.02] [--rate-limit 0]
+                                    [--mix info,pe,remote] [--url http://127.0.0.1:8080]
+
+输出吞吐量、延迟分位数、状态码分布，以及模拟器实际收到的上游调用次数
+（可据此衡量请求合并、缓存和重试的效果）。
+"""
+
+import argparse
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from synthetic_data import make_symbols  # noqa: E402
+
+# 各类请求的路径模板
+REQUEST_KINDS = {
+    'info': '/api/stock_info/{code}',
+    'pe': '/api/stock_pe/{code}',
+    'remote': '/api/stock/{code}?remote_data=true',
+    'local': '/api/stock/{code}',
+}
+
+
+def start_local_server(source):
+    """在后台线程启动使用模拟数据源的多线程服务器，返回 (base_url, server)"""
+    from werkzeug.serving import make_server
+
+    from data_source import set_data_source
+
+    set_data_source(source)
+    import app
+
+    # 关闭逐请求的访问日志，避免日志输出成为瓶颈
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}", server
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run_load(base_url, paths, concurrency, duration, timeout):
+    """并发请求直到 duration 秒，返回 [(类型, 状态码, 耗时秒), ...]"""
+    results = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(seed):
+        rng = random.Random(seed)
+        session = requests.Session()
+        local = []
+        while time.perf_counter() < deadline:
+            kind, path = rng.choice(paths)
+            start = time.perf_counter()
+            try:
+                status = session.get(base_url + path, timeout=timeout).status_code
+            except requests.RequestException:
+                status = 'error'
+            local.append((kind, status, time.perf_counter() - start))
+        with lock:
+            results.extend(local)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def report(results, duration):
+    print(f"\n总请求数: {len(results)}, 吞吐量: {len(results) / duration:.1f} req/s")
+    by_kind = {}
+    for kind, status, elapsed in results:
+        by_kind.setdefault(kind, []).append((status, elapsed))
+    for kind, items in sorted(by_kind.items()):
+        latencies = sorted(e for _, e in items)
+        statuses = Counter(str(s) for s, _ in items)
+        print(f"{kind:8s} n={len(items):6d}  p50={percentile(latencies, 50) * 1000:8.1f}ms  "
+              f"p95={percentile(latencies, 95) * 1000:8.1f}ms  p99={percentile(latencies, 99) * 1000:8.1f}ms  "
+              f"mean={statistics.mean(latencies) * 1000:8.1f}ms  状态: {dict(statuses)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='远程路径离线压测')
+    parser.add_argument('--url', default=None, help='压测已启动的服务，不指定则在进程内启动')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--symbols', type=int, default=50, help='请求涉及的股票数量（越少越容易命中缓存/合并）')
+    parser.add_argument('--mix', default='info,pe,remote', help=f"请求类型，可选 {','.join(REQUEST_KINDS)}")
+    parser.add_argument('--latency-ms', type=float, default=80)
+    parser.add_argument('--jitter-ms', type=float, default=20)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--rate-limit', type=float, default=0, help='模拟器每秒允许的调用次数（0 不限流）')
+    parser.add_argument('--timeout', type=float, default=30)
+    args = parser.parse_args()
+
+    codes = make_symbols(args.symbols)
+    kinds = [k.strip() for k in args.mix.split(',') if k.strip() in REQUEST_KINDS]
+    paths = [(kind, REQUEST_KINDS[kind].format(code=code)) for kind in kinds for code in codes]
+
+    source = None
+    original_cwd = os.getcwd()
+    if args.url:
+        base_url = args.url.rstrip('/')
+    else:
+        from data_source import SimulatedDataSource
+
+        source = SimulatedDataSource(
+            latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+            error_rate=args.error_rate, rate_limit=args.rate_limit
+        )
+        # 远程数据缓存写在 data/remote_cache 下，使用临时目录避免污染项目数据
+        os.chdir(tempfile.mkdtemp(prefix='stock_load_'))
+        base_url, _ = start_local_server(source)
+
+    print(f"压测 {base_url}: 并发 {args.concurrency}, 时长 {args.duration}s, 股票 {len(codes)} 只, 请求类型 {kinds}")
+    try:
+        results = run_load(base_url, paths, args.concurrency, args.duration, args.timeout)
+    finally:
+        os.chdir(original_cwd)
+    report(results, args.duration)
+
+    if source is not None:
+        print(f"\n模拟上游调用次数: {source.calls}（请求数 {len(results)}，"
+              f"每请求 {source.calls / max(1, len(results)):.2f} 次上游调用）")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
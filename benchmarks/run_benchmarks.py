@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+离线基准测试：在合成数据上测量核心路径的耗时
+
+覆盖 find_all_stock_files、Bars.aggregate、search_stocks、load_stock_list_with_pinyin、
+回测（backtest_smart_strategy、portfolio_backtest）和 /api/stock 的 JSON 序列化，全程不访问网络。
+
+用法:
+    python3 benchmarks/run_benchmarks.py [--symbols 1000] [--years 5] [--workdir DIR]
+                                         [--save results.json] [--compare baseline.json]
+
+- 不指定 --workdir 时在临时目录生成数据，结束后删除；指定时复用已有数据（不存在则生成）
+- --compare 与之前保存的结果对比，任一基准的中位数慢于基线 --threshold 倍（默认 1.25）时返回非零退出码
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from synthetic_data import generate_dataset, make_symbols  # noqa: E402
+
+# 单个样本的最短耗时（秒），过快的函数会在一个样本内重复多次
+MIN_SAMPLE_TIME = 0.02
+
+
+def timeit(func, repeat=7, setup=None):
+    """
+    asv 风格计时：自动确定每个样本的调用次数，返回每次调用耗时（秒）的统计
+    setup 在每个样本前调用（例如清空缓存），不计入耗时
+    """
+    number = 1
+    while True:
+        if setup:
+            setup()
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= MIN_SAMPLE_TIME or setup is not None or number >= 1_000_000:
+            break
+        number *= 10
+
+    samples = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        samples.append((time.perf_counter() - start) / number)
+    return {
+        'min': min(samples),
+        'median': statistics.median(samples),
+        'max': max(samples),
+        'number': number,
+        'repeat': repeat,
+    }
+
+
+def build_benchmarks(sample_symbols):
+    """导入应用模块（需已切换到数据目录），返回 [(名称, 函数, setup)] 列表"""
+    import app
+    import backtest_smart_strategy as bt
+    import analytics
+    import bars as bars_module
+    import panel as panel_module
+    import portfolio_backtest as pb
+
+    codes = sample_symbols
+    bare_codes = [c.split('.')[0] for c in codes]
+    first = codes[0]
+
+    def reset_file_index():
+        app.STOCK_FILE_INDEX_CACHE['signature'] = None
+
+    def reset_bar_cache():
+        bars_module.BAR_CACHE.clear()
+
+    def reset_stock_list():
+        app.STOCK_LIST_PINYIN_CACHE['stocks'] = None
+        app.STOCK_LIST_PINYIN_CACHE['mtime'] = None
+
+    def find_files():
+        for code in codes:
+            app.find_all_stock_files(code)
+
+    def find_files_bare():
+        for code in bare_codes:
+            app.find_all_stock_files(code)
+
+    payload, _ = app.build_stock_data_payload(first)
+
+    def search(query):
+        def run():
+            with app.app.test_request_context(f'/api/search_stocks?q={query}&limit=10'):
+                app.search_stocks()
+        return run
+
+    def stock_payload(period):
+        def run():
+            data, _ = app.build_stock_data_payload(first, period=period)
+            app.app.json.dumps(data)
+        return run
+
+    history = bars_module.Bars.concat([bars_module.load_bars(path) for path, _ in app.find_all_stock_files(first)])
+
+    def json_only():
+        app.app.json.dumps(payload)
+
+    frames = {code: bt.load_stock_data(code) for code in codes}
+
+    def backtest_rules():
+        for rule in bt.rules:
+            for code in codes:
+                df = frames[code]
+                if df is not None:
+                    bt.backtest_strategy(df.copy(), rule['buy'], rule['sell'])
+
+    panel = pb.load_panel(codes, use_panel=False)
+    signals = pb.compute_signals(panel, bt.rules[0]) if not panel['close'].empty else None
+
+    # 面板基于当前数据目录重建一次，测量打开与切片
+    panel_module.build_panel()
+
+    def panel_open():
+        panel_module.Panel.open().field('close')
+
+    def panel_frames():
+        panel_module.open_panel().frames(pb.PANEL_FIELDS, codes, '2021-01-01', '2023-12-31')
+
+    def correlation_matrix():
+        panel_obj = panel_module.open_panel()
+        aligned = analytics.top_by_amount(analytics.closes_from_panel(panel_obj, panel_obj.symbols, rows=121), 500)
+        analytics.pairwise_correlation(analytics.simple_returns(aligned.close), 60)
+
+    def portfolio_simulate():
+        if signals is not None:
+            pb.simulate(panel, *signals)
+
+    return [
+        ('find_all_stock_files.cold_index', find_files, reset_file_index),
+        ('find_all_stock_files.warm', find_files, None),
+        ('find_all_stock_files.bare_code', find_files_bare, None),
+        ('load_stock_list_with_pinyin.cold', app.load_stock_list_with_pinyin, reset_stock_list),
+        ('load_stock_list_with_pinyin.warm', app.load_stock_list_with_pinyin, None),
+        ('search_stocks.code', search(bare_codes[-1]), None),
+        ('search_stocks.pinyin', search('pingan'), None),
+        ('search_stocks.no_match', search('zzzzzz'), None),
+        ('stock_payload.day', stock_payload('day'), None),
+        ('stock_payload.week', stock_payload('week'), None),
+        ('stock_payload.cold_bar_cache', stock_payload('day'), reset_bar_cache),
+        ('bars.aggregate_week', lambda: history.aggregate('week'), None),
+        ('bars.aggregate_month', lambda: history.aggregate('month'), None),
+        ('bars.to_records', history.to_records, None),
+        ('json_serialize.day', json_only, None),
+        ('backtest.rules_x_symbols', backtest_rules, None),
+        ('portfolio_backtest.load_panel', lambda: pb.load_panel(codes, use_panel=False), None),
+        ('panel.open', panel_open, None),
+        ('panel.frames', panel_frames, None),
+        ('analytics.correlation_panel', correlation_matrix, None),
+        ('portfolio_backtest.simulate', portfolio_simulate, None),
+    ]
+
+
+def compare_results(results, baseline, threshold):
+    """对比基线，返回变慢超过阈值的基准列表"""
+    regressions = []
+    for name, stats in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        ratio = stats['median'] / base['median'] if base['median'] else 0
+        marker = ''
+        if ratio > threshold:
+            regressions.append(name)
+            marker = '  <-- 变慢'
+        elif ratio < 1 / threshold:
+            marker = '  (变快)'
+        print(f"{name:40s} {base['median'] * 1000:10.3f}ms -> {stats['median'] * 1000:10.3f}ms  x{ratio:.2f}{marker}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='离线基准测试')
+    parser.add_argument('--symbols', type=int, default=1000, help='股票列表规模（1000-30000）')
+    parser.add_argument('--years', type=int, default=5, help='年份数量（1-20），回测需覆盖 2021-2023')
+    parser.add_argument('--end-year', type=int, default=2025)
+    parser.add_argument('--bar-symbols', type=int, default=200, help='生成日线的股票数量')
+    parser.add_argument('--sample', type=int, default=20, help='参与逐只测试的股票数量')
+    parser.add_argument('--repeat', type=int, default=7)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--workdir', default=None, help='数据目录（复用已生成的数据）')
+    parser.add_argument('--filter', default=None, help='只运行名称包含该字符串的基准')
+    parser.add_argument('--save', default=None, help='将结果保存为 JSON')
+    parser.add_argument('--compare', default=None, help='与之前保存的 JSON 结果对比')
+    parser.add_argument('--threshold', type=float, default=1.25)
+    args = parser.parse_args()
+
+    cleanup = args.workdir is None
+    workdir = args.workdir or tempfile.mkdtemp(prefix='stock_bench_')
+    workdir = os.path.abspath(workdir)
+    if not os.path.exists(os.path.join(workdir, 'stock_list.csv')):
+        print(f"生成合成数据: {args.symbols} 只股票, {args.years} 年, 日线 {args.bar_symbols} 只 -> {workdir}")
+        start = time.perf_counter()
+        generate_dataset(workdir, args.symbols, args.years, args.end_year, args.seed, args.bar_symbols)
+        print(f"数据生成耗时 {time.perf_counter() - start:.1f}s")
+
+    # app 使用相对路径（data/、stock_list.csv），切换到数据目录后再导入
+    original_cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        sample_symbols = make_symbols(args.symbols)[:min(args.sample, args.bar_symbols)]
+        benchmarks = build_benchmarks(sample_symbols)
+
+        results = {}
+        for name, func, setup in benchmarks:
+            if args.filter and args.filter not in name:
+                continue
+            stats = timeit(func, repeat=args.repeat, setup=setup)
+            results[name] = stats
+            print(f"{name:40s} median {stats['median'] * 1000:10.3f}ms  min {stats['min'] * 1000:10.3f}ms  (x{stats['number']})")
+    finally:
+        os.chdir(original_cwd)
+        if cleanup:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump({
+                'params': vars(args),
+                'machine': {'python': platform.python_version(), 'platform': platform.platform()},
+                'results': results,
+            }, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存到 {args.save}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+        print("\n与基线对比:")
+        regressions = compare_results(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} 项基准变慢超过 {args.threshold} 倍: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
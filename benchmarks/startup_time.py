@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+冷启动 / 重启耗时测量
+
+每轮在新的子进程中：
+  1. import app            —— 模块导入耗时（重型依赖是否被按需导入）
+  2. warm_up_caches()      —— 预热各阶段耗时
+并可选以 serve.py 启动服务（--serve），测量从进程启动到端口可连接、到 /api/ready 返回 200 的时间。
+
+用法:
+    python3 benchmarks/startup_time.py --workdir /tmp/bench_data [--runs 5] [--preload-bars] [--serve]
+
+--workdir 为数据目录（可由 synthetic_data.py 生成），在该目录下运行以使用其中的 data/ 和 stock_list.csv。
+"""
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+
+# 子进程中执行的测量脚本，结果以 JSON 输出到最后一行
+PROBE = r'''
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+stats = app.warm_up_caches(preload_bars=PRELOAD)
+done = time.perf_counter()
+heavy = sorted(m for m in ('akshare', 'pypinyin', 'requests', 'pyarrow', 'duckdb') if m in sys.modules)
+print(json.dumps({
+    'import': imported - start,
+    'warmup': done - imported,
+    'total': done - start,
+    'phases': app.WARMUP_STATE['phases'],
+    'heavy_modules': heavy,
+    'bar_cache_mb': stats['bar_cache']['bytes'] / 1024 / 1024,
+}))
+'''
+
+
+def child_env():
+    env = dict(os.environ)
+    env['PYTHONPATH'] = ROOT_DIR + os.pathsep + env.get('PYTHONPATH', '')
+    return env
+
+
+def measure_import(workdir, preload_bars):
+    """在新进程中导入并预热，返回测量结果与进程总耗时（含解释器启动）"""
+    code = PROBE.replace('PRELOAD', 'True' if preload_bars else 'False')
+    start = time.perf_counter()
+    out = subprocess.run([sys.executable, '-c', code], cwd=workdir, env=child_env(),
+                         capture_output=True, text=True, check=True)
+    result = json.loads(out.stdout.strip().splitlines()[-1])
+    result['process'] = time.perf_counter() - start
+    return result
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def measure_serve(workdir, timeout=120):
+    """以 serve.py 启动服务，返回 (端口可连接耗时, /api/ready 就绪耗时, 就绪响应)"""
+    port = free_port()
+    url = f"http://127.0.0.1:{port}/api/ready"
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, os.path.join(ROOT_DIR, 'serve.py'), str(port), '--workers', '1'],
+                            cwd=workdir, env=child_env(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    listening = None
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                resp = requests.get(url, timeout=1)
+            except requests.RequestException:
+                time.sleep(0.02)
+                continue
+            if listening is None:
+                listening = time.perf_counter() - start
+            if resp.status_code == 200:
+                return listening, time.perf_counter() - start, resp.json()
+            time.sleep(0.02)
+        raise TimeoutError(f'服务在 {timeout}s 内未就绪')
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+
+def summarize(values):
+    return f"中位数 {statistics.median(values) * 1000:8.1f}ms  最小 {min(values) * 1000:8.1f}ms  最大 {max(values) * 1000:8.1f}ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='冷启动耗时测量')
+    parser.add_argument('--workdir', default='.', help='数据目录')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--preload-bars', action='store_true', help='预热时载入全部日线')
+    parser.add_argument('--serve', action='store_true', help='同时测量 serve.py 启动到就绪的时间')
+    args = parser.parse_args()
+
+    workdir = os.path.abspath(args.workdir)
+    results = [measure_import(workdir, args.preload_bars) for _ in range(args.runs)]
+    print(f"冷启动（{args.runs} 次，{'含' if args.preload_bars else '不含'}全部日线预载）")
+    for key, label in (('process', '进程总耗时'), ('import', '导入 app'), ('warmup', '预热'), ('total', '导入+预热')):
+        print(f"  {label:<8} {summarize([r[key] for r in results])}")
+    for phase in results[0]['phases']:
+        print(f"  预热/{phase:<12} {summarize([r['phases'][phase] for r in results])}")
+    print(f"  已导入的重型依赖: {', '.join(results[0]['heavy_modules']) or '无'}")
+    print(f"  日线缓存: {results[0]['bar_cache_mb']:.1f}MB")
+
+    if args.serve:
+        samples = [measure_serve(workdir) for _ in range(args.runs)]
+        print("serve.py 启动")
+        print(f"  端口可连接 {summarize([s[0] for s in samples])}")
+        print(f"  就绪       {summarize([s[1] for s in samples])}")
+        print(f"  服务端报告: 导入 {samples[-1][2]['import_seconds']:.3f}s, 冷启动 {samples[-1][2]['cold_start_seconds']:.3f}s")
+
+
+if __name__ == '__main__':
+    main()
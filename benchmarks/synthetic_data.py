@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+生成合成行情数据，用于离线基准测试
+
+生成内容与真实目录结构一致：
+- <输出目录>/stock_list.csv：code,name,pinyin,pinyin_initials
+- <输出目录>/data/<年份>_by_day/<代码>.csv：trade_time,open,high,low,close,vol,amount
+
+价格为带漂移的几何随机游走，给定随机种子时输出完全可复现。
+
+用法:
+    python3 benchmarks/synthetic_data.py <输出目录> [--symbols 1000] [--years 3] [--end-year 2025] [--seed 42]
+"""
+
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+# 名称用字，拼音取首字母即可满足搜索测试
+NAME_CHARS = [
+    ('平', 'ping'), ('安', 'an'), ('银', 'yin'), ('行', 'hang'), ('万', 'wan'), ('科', 'ke'),
+    ('国', 'guo'), ('华', 'hua'), ('中', 'zhong'), ('信', 'xin'), ('电', 'dian'), ('子', 'zi'),
+    ('能', 'neng'), ('源', 'yuan'), ('医', 'yi'), ('药', 'yao'), ('金', 'jin'), ('融', 'rong'),
+    ('光', 'guang'), ('伏', 'fu'), ('汽', 'qi'), ('车', 'che'), ('股', 'gu'), ('份', 'fen'),
+]
+
+
+def make_symbols(n_symbols):
+    """生成 n 个股票代码，按 A 股规则交替分布在深市和沪市"""
+    symbols = []
+    for i in range(n_symbols):
+        if i % 2 == 0:
+            symbols.append(f"{i // 2:06d}.SZ")
+        else:
+            symbols.append(f"{600000 + i // 2:06d}.SH")
+    return symbols
+
+
+def generate_stock_list(path, symbols, seed=42):
+    """生成带拼音列的股票列表 CSV"""
+    rng = np.random.default_rng(seed)
+    rows = []
+    for code in symbols:
+        picks = rng.integers(0, len(NAME_CHARS), size=4)
+        chars = [NAME_CHARS[p] for p in picks]
+        rows.append({
+            'code': code,
+            'name': ''.join(c for c, _ in chars),
+            'pinyin': ''.join(p for _, p in chars),
+            'pinyin_initials': ''.join(p[0].upper() for _, p in chars),
+        })
+    df = pd.DataFrame(rows)
+    df.to_csv(path, index=False, encoding='utf-8')
+    return df
+
+
+def trading_days(year):
+    """简化的交易日历：该年所有工作日"""
+    return pd.bdate_range(f"{year}-01-01", f"{year}-12-31")
+
+
+def generate_bars(days, rng, start_price):
+    """生成一段日线：几何随机游走的收盘价，开高低围绕收盘价波动"""
+    n = len(days)
+    returns = rng.normal(0.0003, 0.02, size=n)
+    close = start_price * np.exp(np.cumsum(returns))
+    open_ = close * np.exp(rng.normal(0, 0.005, size=n))
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.01, size=n)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.01, size=n)))
+    vol = rng.integers(10_000, 2_000_000, size=n)
+    amount = vol * close * 100
+    return pd.DataFrame({
+        'trade_time': days.strftime('%Y-%m-%d'),
+        'open': open_.round(2),
+        'high': high.round(2),
+        'low': low.round(2),
+        'close': close.round(2),
+        'vol': vol,
+        'amount': amount.round(2),
+    })
+
+
+def generate_bar_tree(data_dir, symbols, years, seed=42):
+    """
+    生成 data/<年份>_by_day/<代码>.csv 目录树
+    每只股票跨年份的价格连续，返回写入的文件数
+    """
+    rng = np.random.default_rng(seed)
+    start_prices = rng.uniform(3, 200, size=len(symbols))
+    last_close = dict(zip(symbols, start_prices))
+    count = 0
+    for year in years:
+        days = trading_days(year)
+        year_dir = os.path.join(data_dir, f"{year}_by_day")
+        os.makedirs(year_dir, exist_ok=True)
+        for code in symbols:
+            df = generate_bars(days, rng, last_close[code])
+            last_close[code] = float(df['close'].iloc[-1])
+            df.to_csv(os.path.join(year_dir, f"{code}.csv"), index=False)
+            count += 1
+    return count
+
+
+def generate_dataset(root, n_symbols=1000, n_years=3, end_year=2025, seed=42, bar_symbols=None):
+    """
+    在 root 下生成完整数据集
+    bar_symbols: 生成日线文件的股票数量，默认与股票列表相同（大规模股票列表可只为部分股票生成日线）
+    """
+    os.makedirs(root, exist_ok=True)
+    symbols = make_symbols(n_symbols)
+    generate_stock_list(os.path.join(root, 'stock_list.csv'), symbols, seed)
+    years = list(range(end_year - n_years + 1, end_year + 1))
+    bar_symbols = symbols if bar_symbols is None else symbols[:bar_symbols]
+    files = generate_bar_tree(os.path.join(root, 'data'), bar_symbols, years, seed)
+    return {
+        'symbols': symbols,
+        'bar_symbols': bar_symbols,
+        'years': years,
+        'files': files,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='生成合成行情数据')
+    parser.add_argument('output', help='输出目录')
+    parser.add_argument('--symbols', type=int, default=1000, help='股票数量（1000-30000）')
+    parser.add_argument('--years', type=int, default=3, help='年份数量（1-20）')
+    parser.add_argument('--end-year', type=int, default=2025)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--bar-symbols', type=int, default=None, help='只为前 N 只股票生成日线')
+    args = parser.parse_args()
+
+    info = generate_dataset(args.output, args.symbols, args.years, args.end_year, args.seed, args.bar_symbols)
+    print(f"已生成 {len(info['symbols'])} 只股票、{len(info['years'])} 个年份、{info['files']} 个日线文件 -> {args.output}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多只股票日线的批量导出（Arrow IPC 流 / Parquet / CSV）
+
+研究时逐只请求 /api/stock/<代码> 再解析 JSON 很慢。这里直接从存储层读取，不经过 JSON：
+- 已构建面板（panel.py）且包含全部代码时，按列块切片内存映射矩阵
+- 否则按代码分块批量读取日线文件（本地年份目录在前、远程缓存在后，同一日期以本地为准）
+每块 EXPORT_CHUNK_SYMBOLS 只股票转成一个 RecordBatch 后立即写出，内存只与块大小有关，与导出总量无关。
+
+输出为长表，按股票分组、组内日期升序：
+    code(string), trade_time(date32), open, high, low, close, vol, amount(float64)
+arrow / parquet 需要 pyarrow（可选依赖），csv 不需要。
+
+用法:
+    python3 bulk_export.py -o all.parquet --universe all
+    python3 bulk_export.py -o sh.arrow --universe SH --start 2020-01-01 --end 2024-06-28 --adjust qfq
+    python3 bulk_export.py -o fav.csv --codes 000001.SZ,600036.SH
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from adjustment import ADJUST_MODES, PRICE_COLUMNS, bar_factors, load_adjust_factors
+from bars import days_from_datetimes
+from panel import BAR_FIELDS, DATA_DIR, PANEL_DIR, list_sources, open_panel, read_sources, stale_codes
+
+# 每块的股票数（一块约 股票数 × 交易日数 行）
+EXPORT_CHUNK_SYMBOLS = int(os.environ.get('EXPORT_CHUNK_SYMBOLS', 500))
+FAVORITE_STOCKS_FILE = 'favorite_stocks.json'
+MARKETS = ('SZ', 'SH', 'HK', 'US')
+
+# 格式 -> (MIME 类型, 文件扩展名)
+EXPORT_FORMATS = {
+    'arrow': ('application/vnd.apache.arrow.stream', '.arrow'),
+    'parquet': ('application/vnd.apache.parquet', '.parquet'),
+    'csv': ('text/csv', '.csv'),
+}
+EXPORT_COLUMNS = ('code', 'trade_time') + BAR_FIELDS
+
+_PYARROW = {'loaded': False, 'modules': None}
+
+
+class ExportUnavailable(Exception):
+    """导出格式需要的依赖未安装"""
+
+
+def get_pyarrow():
+    """按需导入 pyarrow，返回 (pyarrow, pyarrow.parquet)；未安装时抛出 ExportUnavailable"""
+    if not _PYARROW['loaded']:
+        try:
+            import pyarrow
+            import pyarrow.parquet
+            _PYARROW['modules'] = (pyarrow, pyarrow.parquet)
+        except ImportError:
+            _PYARROW['modules'] = None
+        _PYARROW['loaded'] = True
+    if _PYARROW['modules'] is None:
+        raise ExportUnavailable('arrow / parquet 导出需要安装 pyarrow（pip install pyarrow），或使用 format=csv')
+    return _PYARROW['modules']
+
+
+def check_format(fmt):
+    """校验导出格式，缺少依赖时抛出 ExportUnavailable"""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f'不支持的导出格式: {fmt}（可选 {"、".join(EXPORT_FORMATS)}）')
+    if fmt != 'csv':
+        get_pyarrow()
+
+
+def arrow_schema():
+    pa, _ = get_pyarrow()
+    return pa.schema([('code', pa.string()), ('trade_time', pa.date32())] + [(f, pa.float64()) for f in BAR_FIELDS])
+
+
+def _day_bounds(start, end):
+    lo = int(days_from_datetimes([start])[0]) if start else None
+    hi = int(days_from_datetimes([end])[0]) if end else None
+    return lo, hi
+
+
+def panel_chunks(panel, codes, start=None, end=None, adjust='none', chunk_size=EXPORT_CHUNK_SYMBOLS):
+    """
+    从面板按列块导出，每块返回 {列名: 数组}（code 为对象数组，trade_time 为 int32 天数）
+    代码按面板列顺序分块，每块只复制 行区间 × 块内列，整个导出对映射文件只顺序读一遍
+    """
+    rows = panel.row_range(start, end)
+    days = np.asarray(panel.calendar[rows], dtype=np.int32)
+    columns = np.sort(panel.columns(codes))
+    latest = None
+    if adjust == 'qfq' and panel.rows:
+        latest = panel.field('factor')[-1].astype(np.float64)
+    for i in range(0, len(columns), chunk_size):
+        cols = columns[i:i + chunk_size]
+        close = panel.field('close')[rows][:, cols]
+        present = ~np.isnan(close)
+        # 转置后展平：先按股票、再按日期
+        mask = present.T.ravel()
+        out = {
+            'code': np.repeat(np.asarray([panel.symbols[c] for c in cols], dtype=object), present.sum(axis=0)),
+            'trade_time': np.tile(days, len(cols))[mask],
+        }
+        factors = None
+        if adjust != 'none':
+            factors = panel.field('factor')[rows][:, cols].astype(np.float64)
+            if latest is not None:
+                factors /= latest[cols]
+        for field in BAR_FIELDS:
+            values = panel.field(field)[rows][:, cols].astype(np.float64)
+            if field in PRICE_COLUMNS:
+                if factors is not None:
+                    values *= factors
+                # 还原 float32 的舍入（与逐文件读取的结果一致）
+                values = np.round(values, 4)
+            out[field] = values.T.ravel()[mask]
+        yield out
+
+
+def file_chunks(codes, start=None, end=None, adjust='none', data_dir=DATA_DIR, chunk_size=EXPORT_CHUNK_SYMBOLS):
+    """从日线文件按代码分块导出，每块返回 {列名: 数组}（同 panel_chunks）"""
+    lo, hi = _day_bounds(start, end)
+    factor_dir = os.path.join(data_dir, 'adj_factors')
+    wanted = set(codes)
+    by_code = {}
+    # 每只股票的文件保持 list_sources 的顺序（本地年份在前、远程缓存在后），read_sources 据此去重
+    for source in list_sources(data_dir):
+        if source[0] in wanted:
+            by_code.setdefault(source[0], []).append(source)
+    ordered = sorted(by_code)
+    for i in range(0, len(ordered), chunk_size):
+        part = ordered[i:i + chunk_size]
+        long = read_sources([s for code in part for s in by_code[code]])
+        days = long['day'].to_numpy(dtype=np.int32)
+        keep = np.ones(len(long), dtype=bool)
+        if lo is not None:
+            keep &= days >= lo
+        if hi is not None:
+            keep &= days <= hi
+        long = long[keep].sort_values(['code', 'day'], kind='stable')
+        out = {
+            'code': long['code'].to_numpy(dtype=object),
+            'trade_time': long['day'].to_numpy(dtype=np.int32),
+        }
+        for field in BAR_FIELDS:
+            out[field] = long[field].to_numpy(dtype=np.float64)
+        if adjust != 'none' and len(long):
+            # 代码已排序，逐只股票的连续区间乘以复权系数
+            bounds = np.flatnonzero(out['code'][1:] != out['code'][:-1]) + 1
+            for a, b in zip(np.r_[0, bounds], np.r_[bounds, len(long)]):
+                factors = load_adjust_factors(factor_dir, out['code'][a])
+                if factors is None or factors.empty:
+                    continue
+                per_bar = bar_factors(out['trade_time'][a:b].astype('datetime64[D]'), factors, adjust)
+                for field in PRICE_COLUMNS:
+                    out[field][a:b] = np.round(out[field][a:b] * per_bar, 4)
+        yield out
+
+
+def iter_chunks(codes, start=None, end=None, adjust='none', data_dir=DATA_DIR, panel_dir=PANEL_DIR,
+                source='auto', chunk_size=EXPORT_CHUNK_SYMBOLS):
+    """
+    选择数据来源并返回 (来源名称, 分块迭代器)
+    source: auto（面板包含全部代码且这些股票的文件在面板更新后没有变化时用面板）/ panel / files
+    """
+    if adjust not in ADJUST_MODES:
+        raise ValueError(f'不支持的复权方式: {adjust}')
+    panel = open_panel(panel_dir) if source in ('auto', 'panel') else None
+    if source == 'panel' and panel is None:
+        raise ValueError(f'面板不存在: {panel_dir}')
+    if panel is not None and source == 'auto' and all(c in panel.column_of for c in codes):
+        stale = stale_codes(panel, data_dir) & set(codes)
+        if not stale:
+            return 'panel', panel_chunks(panel, codes, start, end, adjust, chunk_size)
+        print(f"面板早于 {len(stale)} 只股票的日线/因子文件，改为读取文件（运行 python3 panel.py append 或 build 更新面板）",
+              file=sys.stderr)
+    elif panel is not None and source == 'panel':
+        return 'panel', panel_chunks(panel, codes, start, end, adjust, chunk_size)
+    return 'files', file_chunks(codes, start, end, adjust, data_dir, chunk_size)
+
+
+def to_record_batch(chunk):
+    pa, _ = get_pyarrow()
+    arrays = [pa.array(chunk['code'], type=pa.string()),
+              pa.array(chunk['trade_time'], type=pa.int32()).view(pa.date32())]
+    arrays += [pa.array(chunk[field], type=pa.float64()) for field in BAR_FIELDS]
+    return pa.RecordBatch.from_arrays(arrays, schema=arrow_schema())
+
+
+def to_csv_text(chunk, header):
+    df = pd.DataFrame({
+        'code': chunk['code'],
+        'trade_time': chunk['trade_time'].astype('datetime64[D]').astype(str),
+        **{field: chunk[field] for field in BAR_FIELDS},
+    })
+    return df.to_csv(index=False, header=header, lineterminator='\n')
+
+
+class ChunkSink:
+    """只追加的可写文件对象：收集写入的字节，由生成器分段取走（Arrow / Parquet 写入器的输出目标）"""
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self._parts.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+def iter_export(chunks, fmt, stats=None):
+    """
+    把分块数据编码为导出格式，逐块产出字节（可直接作为流式响应）
+    stats 为字典时写入 rows、symbols
+    """
+    stats = stats if stats is not None else {}
+    stats.update(rows=0, symbols=0)
+
+    def count(chunk):
+        stats['rows'] += len(chunk['code'])
+        stats['symbols'] += len(pd.unique(chunk['code']))
+
+    if fmt == 'csv':
+        header = True
+        for chunk in chunks:
+            count(chunk)
+            text = to_csv_text(chunk, header)
+            if header:
+                header = False
+            elif not len(chunk['code']):
+                continue
+            yield text.encode('utf-8')
+        if header:
+            yield (','.join(EXPORT_COLUMNS) + '\n').encode('utf-8')
+        return
+
+    pa, pq = get_pyarrow()
+    sink = ChunkSink()
+    if fmt == 'arrow':
+        writer = pa.ipc.new_stream(sink, arrow_schema())
+    else:
+        writer = pq.ParquetWriter(sink, arrow_schema(), compression='zstd')
+    try:
+        for chunk in chunks:
+            count(chunk)
+            if not len(chunk['code']):
+                continue
+            writer.write_batch(to_record_batch(chunk))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def export_filename(name, start, end, fmt):
+    parts = [name] + [p.replace('-', '') for p in (start, end) if p]
+    return f"stocks_{'_'.join(parts)}{EXPORT_FORMATS[fmt][1]}"
+
+
+def local_codes(data_dir=DATA_DIR, panel_dir=PANEL_DIR):
+    """本地有日线的全部股票代码（有面板时取面板的股票列表）"""
+    panel = open_panel(panel_dir)
+    if panel is not None:
+        return list(panel.symbols)
+    return sorted({code for code, _, _ in list_sources(data_dir)})
+
+
+def resolve_codes(universe='all', codes=None, data_dir=DATA_DIR, panel_dir=PANEL_DIR,
+                  favorites_file=FAVORITE_STOCKS_FILE):
+    """命令行的股票池：codes 优先，否则 universe=favorites / SZ / SH / HK / US / all"""
+    if codes:
+        return list(dict.fromkeys(c.strip().upper() for c in codes.split(',') if c.strip()))
+    key = universe.upper().lstrip('.')
+    if key == 'FAVORITES':
+        from favorites_store import FavoritesStore
+        return [s['code'] for s in FavoritesStore(favorites_file).list() if s.get('code')]
+    if key == 'ALL':
+        return local_codes(data_dir, panel_dir)
+    if key in MARKETS:
+        return [c for c in local_codes(data_dir, panel_dir) if c.upper().endswith('.' + key)]
+    raise ValueError(f'不支持的股票池: {universe}（可选 favorites、all、{"、".join(MARKETS)}）')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='多只股票日线批量导出（Arrow IPC / Parquet / CSV）')
+    parser.add_argument('-o', '--output', required=True, help='输出文件，- 为标准输出')
+    parser.add_argument('--format', choices=list(EXPORT_FORMATS), default=None, help='默认按输出文件扩展名判断')
+    parser.add_argument('--universe', default='all', help='favorites / SZ / SH / HK / US / all（默认）')
+    parser.add_argument('--codes', default=None, help='逗号分隔的股票代码（优先于 --universe）')
+    parser.add_argument('--start', default=None)
+    parser.add_argument('--end', default=None)
+    parser.add_argument('--adjust', choices=list(ADJUST_MODES), default='none')
+    parser.add_argument('--source', choices=['auto', 'panel', 'files'], default='auto')
+    parser.add_argument('--chunk-symbols', type=int, default=EXPORT_CHUNK_SYMBOLS)
+    parser.add_argument('--data-dir', default=DATA_DIR)
+    parser.add_argument('--panel-dir', default=None, help='面板目录（默认 <data-dir>/panel）')
+    args = parser.parse_args()
+
+    fmt = args.format
+    if fmt is None:
+        ext = os.path.splitext(args.output)[1].lower()
+        fmt = next((f for f, (_, e) in EXPORT_FORMATS.items() if e == ext), 'arrow' if ext == '.feather' else None)
+        if fmt is None:
+            parser.error('无法从扩展名判断格式，请指定 --format')
+    panel_dir = args.panel_dir or os.path.join(args.data_dir, 'panel')
+    try:
+        check_format(fmt)
+        codes = resolve_codes(args.universe, args.codes, args.data_dir, panel_dir)
+        source, chunks = iter_chunks(codes, args.start, args.end, args.adjust, args.data_dir, panel_dir,
+                                     args.source, max(1, args.chunk_symbols))
+    except (ExportUnavailable, ValueError) as e:
+        print(f"错误: {e}", file=sys.stderr)
+        return 1
+
+    start = time.perf_counter()
+    stats = {}
+    if args.output == '-':
+        out = sys.stdout.buffer
+    else:
+        tmp_path = f"{args.output}.tmp"
+        out = open(tmp_path, 'wb')
+    try:
+        for data in iter_export(chunks, fmt, stats):
+            out.write(data)
+    except BaseException:
+        if args.output != '-':
+            out.close()
+            os.remove(tmp_path)
+        raise
+    if args.output != '-':
+        out.close()
+        os.replace(tmp_path, args.output)
+        size = os.path.getsize(args.output) / 1024 / 1024
+        print(f"已导出 {stats['symbols']} 只股票、{stats['rows']} 行（来源 {source}）到 {args.output}，"
+              f"{size:.1f}MB，耗时 {time.perf_counter() - start:.1f}s", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,450 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+日线数据完整性扫描与修复
+
+逐只股票（多进程并行）检查本地日线 data/<年份>_by_day/*.csv 和远程缓存 data/remote_cache/<代码>_raw.csv：
+- read_error      文件无法解析或缺少必需列
+- duplicate       同一文件内重复的日期
+- non_monotonic   同一文件内日期不是升序
+- missing_values  价格为空
+- ohlc_invalid    最高价低于开盘/收盘/最低价、最低价高于开盘/收盘价、价格非正或成交量为负
+- source_conflict 同一日期在多个文件中收盘价不一致（如前复权缓存与不复权日线混用）
+- price_jump      相邻交易日收盘价变化超过阈值且当日不是除权日（价格基准不一致）
+- gap             相对交易日历缺失的交易日（首个交易日之后），末尾缺失标记为 tail
+
+交易日历按市场分别构建（港股、美股的交易日与 A 股不同）：
+- A 股优先取数据源（akshare 新浪交易日历 / 模拟器工作日），不可用时取所有 A 股交易日的并集
+- 港股、美股取本市场股票交易日的并集
+并集中连续缺失超过 HOLE_MIN_BUSINESS_DAYS 个工作日的区间（如全市场缺失的 2024-06-29 之后）按工作日补入。
+
+--repair 时：
+- 按股票合并缺失区间，从数据源批量拉取不复权日线，只补缺失的日期，写入对应年份的文件（原子替换）
+- 重写含重复/乱序日期的本地文件（按日期排序、保留先出现的一条）
+修复后接口不再需要 fill_missing_data 在请求时补数据。
+
+用法:
+    python3 data_integrity.py [--workers N] [--report data_integrity_report.json] [--symbols 000001.SZ,...]
+                              [--calendar auto|source|union] [--repair] [--fetch-workers 4]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import bar_archive
+from adjustment import load_adjust_factors
+from atomic_file import write_atomic
+from data_source import BAR_COLUMNS, DataSourceUnavailable, get_data_source, split_stock_code
+from panel import list_sources
+
+DATA_DIR = 'data'
+DEFAULT_REPORT = 'data_integrity_report.json'
+
+PRICE_COLUMNS = ['open', 'high', 'low', 'close']
+# 相邻交易日收盘价变化超过该比例（且不是除权日）视为价格基准跳变；A 股涨跌停最大 20%（北交所 30%）
+JUMP_THRESHOLD = 0.35
+# 多个文件同一日期收盘价相对差异超过该比例视为冲突
+CONFLICT_TOLERANCE = 0.005
+# 交易日历并集中连续缺失超过该工作日数的区间视为数据空洞（长假最多约 5-6 个工作日）
+HOLE_MIN_BUSINESS_DAYS = 8
+# 每类问题在报告中保留的样例数
+MAX_SAMPLES = 10
+# 各自使用本市场交易日历的市场；其余代码（深沪）使用 A 股日历
+SEPARATE_CALENDAR_MARKETS = ('HK', 'US')
+
+ISSUE_TYPES = ('read_error', 'duplicate', 'non_monotonic', 'missing_values', 'ohlc_invalid',
+               'source_conflict', 'price_jump', 'gap')
+
+
+def _dates(days):
+    return np.datetime_as_string(np.asarray(days, dtype=np.int64).astype('datetime64[D]'), unit='D').tolist()
+
+
+def _add_issue(issues, kind, count, samples=None, **extra):
+    if count:
+        issue = {'type': kind, 'count': int(count)}
+        if samples is not None:
+            issue['samples'] = list(samples)[:MAX_SAMPLES]
+        issue.update(extra)
+        issues.append(issue)
+
+
+def check_file(path):
+    """
+    检查单个文件，返回 (DataFrame 或 None, 问题列表)
+    DataFrame 的 trade_time 已解析为 datetime，保持文件中的原始顺序
+    """
+    issues = []
+    name = path
+    try:
+        df = bar_archive.read_csv(path)
+        missing = [c for c in ['trade_time'] + PRICE_COLUMNS if c not in df.columns]
+        if missing:
+            raise ValueError(f"缺少列 {', '.join(missing)}")
+        df['trade_time'] = pd.to_datetime(df['trade_time'])
+    except Exception as e:
+        _add_issue(issues, 'read_error', 1, [str(e)], file=name)
+        return None, issues
+    if df.empty:
+        return df, issues
+
+    days = df['trade_time'].to_numpy(dtype='datetime64[D]').astype(np.int64)
+    dup = pd.Series(days).duplicated().to_numpy()
+    _add_issue(issues, 'duplicate', dup.sum(), _dates(days[dup]), file=name)
+    backwards = np.flatnonzero(np.diff(days) < 0) + 1
+    _add_issue(issues, 'non_monotonic', len(backwards), _dates(days[backwards]), file=name)
+
+    prices = df[PRICE_COLUMNS].to_numpy(dtype=np.float64)
+    nan_rows = np.isnan(prices).any(axis=1)
+    _add_issue(issues, 'missing_values', nan_rows.sum(), _dates(days[nan_rows]), file=name)
+
+    o, h, l, c = prices.T
+    with np.errstate(invalid='ignore'):
+        # 价格两位小数，留 0.005 的舍入余量
+        bad = (h + 0.005 < np.maximum(o, c)) | (l - 0.005 > np.minimum(o, c)) | (h + 0.005 < l) | (prices <= 0).any(axis=1)
+        if 'vol' in df.columns:
+            bad |= df['vol'].to_numpy(dtype=np.float64) < 0
+    bad &= ~nan_rows
+    _add_issue(issues, 'ohlc_invalid', bad.sum(), _dates(days[bad]), file=name)
+    return df, issues
+
+
+def scan_symbol(task):
+    """
+    扫描一只股票（在子进程中执行）
+    task: (代码, [路径, ...]（按合并优先级）, 因子目录, 跳变阈值)
+    返回 {'code', 'issues', 'days'(合并后的 int32 交易日), 'files'}
+    """
+    code, paths, factor_dir, jump_threshold = task
+    issues = []
+    frames = []
+    for path in paths:
+        df, file_issues = check_file(path)
+        issues.extend(file_issues)
+        if df is not None and not df.empty:
+            frames.append(df[['trade_time', 'close']].assign(source=len(frames)))
+
+    if not frames:
+        return {'code': code, 'issues': issues, 'days': np.empty(0, dtype=np.int32), 'files': len(paths)}
+
+    long = pd.concat(frames, ignore_index=True)
+    long['day'] = long['trade_time'].to_numpy(dtype='datetime64[D]').astype(np.int32)
+
+    # 多个文件中的同一日期：收盘价不一致视为冲突
+    if len(frames) > 1:
+        spread = long.groupby('day')['close'].agg(['min', 'max', 'nunique'])
+        spread = spread[spread['nunique'] > 1]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            conflict = spread.index[(spread['max'] / spread['min'] - 1).to_numpy() > CONFLICT_TOLERANCE].to_numpy()
+        _add_issue(issues, 'source_conflict', len(conflict), _dates(conflict))
+
+    merged = long.sort_values(['day', 'source'], kind='stable').drop_duplicates('day', keep='first')
+    days = merged['day'].to_numpy(dtype=np.int32)
+    close = merged['close'].to_numpy(dtype=np.float64)
+
+    # 价格跳变：排除除权日（后复权因子变化的日期）
+    if len(close) > 1:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            change = close[1:] / close[:-1] - 1
+        jump = np.abs(change) > jump_threshold
+        factors = load_adjust_factors(factor_dir, code) if factor_dir else None
+        if factors is not None and not factors.empty and jump.any():
+            ex_days = factors['trade_time'].to_numpy(dtype='datetime64[D]').astype(np.int32)[1:]
+            jump &= ~np.isin(days[1:], ex_days)
+        idx = np.flatnonzero(jump) + 1
+        samples = [{'date': d, 'change': round(float(change[i - 1]), 4)} for d, i in zip(_dates(days[idx]), idx)]
+        _add_issue(issues, 'price_jump', len(idx), samples)
+
+    return {'code': code, 'issues': issues, 'days': days, 'files': len(paths)}
+
+
+def business_days_between(start, end):
+    """(start, end) 开区间内的工作日（int 天数）"""
+    if end - start <= 1:
+        return np.empty(0, dtype=np.int32)
+    days = np.arange(start + 1, end, dtype=np.int32)
+    weekday = (days + 3) % 7  # 1970-01-01 是周四
+    return days[weekday < 5]
+
+
+def build_calendar(day_arrays, mode='auto'):
+    """
+    构建交易日历，返回 (int32 交易日数组, 说明字典)
+    mode: source 只用数据源日历；union 只用所有股票交易日的并集（并补入空洞）；auto 优先数据源、失败回退 union
+    """
+    non_empty = [d for d in day_arrays if len(d)]
+    if not non_empty:
+        return np.empty(0, dtype=np.int32), {'source': 'empty'}
+    union = np.unique(np.concatenate(non_empty))
+    start, end = _dates([union[0], union[-1]])
+
+    if mode in ('auto', 'source'):
+        try:
+            days = get_data_source().trade_calendar(start, end)
+            if days is not None and len(days):
+                calendar = np.asarray(days, dtype='datetime64[D]').astype(np.int32)
+                return calendar, {'source': 'data_source', 'start': start, 'end': end, 'days': len(calendar)}
+        except (DataSourceUnavailable, NotImplementedError) as e:
+            if mode == 'source':
+                raise
+            print(f"数据源交易日历不可用（{e}），使用本地交易日并集")
+        except Exception as e:
+            if mode == 'source':
+                raise
+            print(f"获取交易日历失败（{e}），使用本地交易日并集")
+
+    holes = []
+    filled = [union]
+    for i in np.flatnonzero(np.diff(union) > 1):
+        missing = business_days_between(union[i], union[i + 1])
+        if len(missing) >= HOLE_MIN_BUSINESS_DAYS:
+            holes.append({'start': _dates([missing[0]])[0], 'end': _dates([missing[-1]])[0], 'business_days': len(missing)})
+            filled.append(missing)
+    calendar = np.unique(np.concatenate(filled)).astype(np.int32)
+    return calendar, {'source': 'union', 'start': start, 'end': end, 'days': len(calendar), 'holes': holes}
+
+
+def calendar_market(code):
+    """股票使用的交易日历：HK / US，其余为 A"""
+    _, suffix = split_stock_code(code)
+    return suffix if suffix in SEPARATE_CALENDAR_MARKETS else 'A'
+
+
+def build_market_calendars(results, mode='auto'):
+    """
+    按市场构建交易日历，返回 {市场: (交易日数组, 说明字典)}
+    数据源日历只有 A 股，港股、美股始终使用本市场交易日的并集
+    """
+    by_market = {}
+    for result in results:
+        by_market.setdefault(calendar_market(result['code']), []).append(result['days'])
+    return {
+        market: build_calendar(day_arrays, mode if market == 'A' else 'union')
+        for market, day_arrays in sorted(by_market.items())
+    }
+
+
+def find_gaps(days, calendar):
+    """股票首个交易日之后、相对交易日历缺失的交易日，返回 [(开始, 结束, 天数, 是否在末尾), ...]"""
+    if len(days) == 0 or len(calendar) == 0:
+        return []
+    span = calendar[calendar >= days[0]]
+    missing = span[~np.isin(span, days)]
+    if len(missing) == 0:
+        return []
+    # 按日历中的位置把连续缺失的交易日合并成区间
+    pos = np.searchsorted(calendar, missing)
+    breaks = np.flatnonzero(np.diff(pos) > 1) + 1
+    runs = []
+    for chunk in np.split(np.arange(len(missing)), breaks):
+        first, last = missing[chunk[0]], missing[chunk[-1]]
+        runs.append((int(first), int(last), len(chunk), bool(last > days[-1])))
+    return runs
+
+
+def scan(data_dir=DATA_DIR, symbols=None, workers=None, calendar_mode='auto', jump_threshold=JUMP_THRESHOLD):
+    """扫描所有（或指定）股票，返回报告字典"""
+    start = time.perf_counter()
+    grouped = {}
+    for code, path, _ in list_sources(data_dir):
+        grouped.setdefault(code, []).append(path)
+    if symbols:
+        grouped = {code: grouped[code] for code in symbols if code in grouped}
+    factor_dir = os.path.join(data_dir, 'adj_factors')
+    tasks = [(code, paths, factor_dir, jump_threshold) for code, paths in sorted(grouped.items())]
+
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(scan_symbol, tasks, chunksize=max(1, len(tasks) // (workers * 8))))
+    else:
+        results = [scan_symbol(task) for task in tasks]
+
+    calendars = build_market_calendars(results, calendar_mode)
+    summary = Counter()
+    affected = Counter()
+    symbols_report = {}
+    for result in results:
+        issues = list(result['issues'])
+        runs = find_gaps(result['days'], calendars[calendar_market(result['code'])][0])
+        if runs:
+            # 缺失区间全部写入报告，修复时据此拉取
+            _add_issue(issues, 'gap', sum(r[2] for r in runs), runs=[
+                {'start': first, 'end': last, 'days': n, 'tail': tail}
+                for (first, last), (_, _, n, tail) in zip((_dates(r[:2]) for r in runs), runs)
+            ])
+        for issue in issues:
+            summary[issue['type']] += issue['count']
+            affected[issue['type']] += 1
+        if issues:
+            symbols_report[result['code']] = {
+                'first': _dates(result['days'][:1])[0] if len(result['days']) else None,
+                'last': _dates(result['days'][-1:])[0] if len(result['days']) else None,
+                'bars': int(len(result['days'])),
+                'issues': issues,
+            }
+
+    return {
+        'generated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'data_dir': os.path.abspath(data_dir),
+        'symbols_scanned': len(results),
+        'files_scanned': sum(r['files'] for r in results),
+        'elapsed': round(time.perf_counter() - start, 3),
+        'calendars': {market: info for market, (_, info) in calendars.items()},
+        'summary': {kind: {'count': summary[kind], 'symbols': affected[kind]} for kind in ISSUE_TYPES if summary[kind]},
+        'symbols': symbols_report,
+    }
+
+
+def write_bars_file(path, df):
+    """原子写入日线文件（列顺序与已有文件一致，日期格式为 YYYY-MM-DD）"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    out = df.copy()
+    out['trade_time'] = pd.to_datetime(out['trade_time']).dt.strftime('%Y-%m-%d')
+    write_atomic(path, lambda f: out.to_csv(f, index=False), binary=False, prefix='.repair_', suffix='.csv')
+
+
+def merge_into_file(path, new_rows):
+    """
+    把新的日线合并进文件：已有日期保留原数据，按日期排序去重后原子写入，返回实际新增的行数
+    文件已打包进归档时读取归档中的内容，合并结果写为散文件（优先于归档）
+    """
+    source = bar_archive.resolve(path)
+    if source:
+        existing = bar_archive.read_csv(source)
+        existing['trade_time'] = pd.to_datetime(existing['trade_time'])
+        columns = list(existing.columns)
+    else:
+        existing = pd.DataFrame(columns=BAR_COLUMNS)
+        columns = list(BAR_COLUMNS)
+    new_rows = new_rows[[c for c in columns if c in new_rows.columns]]
+    merged = pd.concat([existing, new_rows], ignore_index=True) if len(existing) else new_rows.copy()
+    merged['trade_time'] = pd.to_datetime(merged['trade_time'])
+    merged = merged.drop_duplicates('trade_time', keep='first').sort_values('trade_time', kind='stable')
+    added = len(merged) - len(existing.drop_duplicates('trade_time'))
+    write_bars_file(path, merged.reindex(columns=columns))
+    return added
+
+
+def rewrite_sorted(path):
+    """重写含重复/乱序日期的文件：按日期稳定排序，同一日期保留先出现的一条（归档成员写为散文件）"""
+    df = bar_archive.read_csv(path)
+    columns = list(df.columns)
+    df['trade_time'] = pd.to_datetime(df['trade_time'])
+    df = df.drop_duplicates('trade_time', keep='first').sort_values('trade_time', kind='stable')
+    write_bars_file(bar_archive.loose_path(path), df[columns])
+
+
+def repair_symbol(code, gap_runs, data_dir):
+    """从数据源拉取缺失区间的不复权日线，按年份写入本地文件，返回 (新增行数, 错误信息)"""
+    start = min(run['start'] for run in gap_runs)
+    end = max(run['end'] for run in gap_runs)
+    try:
+        df = get_data_source().daily_bars(code, start.replace('-', ''), end.replace('-', ''), adjust='')
+    except Exception as e:
+        return 0, str(e)
+    if df is None or df.empty:
+        return 0, None
+
+    df = df.copy()
+    df['trade_time'] = pd.to_datetime(df['trade_time'])
+    # 只补缺失区间内的日期
+    wanted = np.zeros(len(df), dtype=bool)
+    for run in gap_runs:
+        wanted |= (df['trade_time'] >= run['start']).to_numpy() & (df['trade_time'] <= run['end']).to_numpy()
+    df = df[wanted]
+    added = 0
+    for year, rows in df.groupby(df['trade_time'].dt.year):
+        path = os.path.join(data_dir, f"{year}_by_day", f"{code}.csv")
+        added += merge_into_file(path, rows)
+    return added, None
+
+
+def repair(report, data_dir=DATA_DIR, fetch_workers=4):
+    """按报告修复：补缺失交易日、重写重复/乱序的本地文件，返回统计"""
+    stats = Counter()
+    errors = {}
+    gap_tasks = {}
+    rewrite_paths = set()
+    for code, entry in report['symbols'].items():
+        for issue in entry['issues']:
+            path = issue.get('file')
+            # 只重写本地年份目录中的文件，远程缓存由接口维护
+            if issue['type'] in ('duplicate', 'non_monotonic') and path and \
+                    os.path.basename(os.path.dirname(bar_archive.loose_path(path))).endswith('_by_day'):
+                rewrite_paths.add(path)
+            elif issue['type'] == 'gap':
+                gap_tasks[code] = issue['runs']
+    for path in sorted(rewrite_paths):
+        if bar_archive.exists(path):
+            rewrite_sorted(path)
+            stats['files_rewritten'] += 1
+
+    def run(item):
+        code, runs = item
+        return code, repair_symbol(code, runs, data_dir)
+
+    with ThreadPoolExecutor(max_workers=max(1, fetch_workers)) as executor:
+        for code, (added, error) in executor.map(run, gap_tasks.items()):
+            stats['symbols_fetched'] += 1
+            stats['bars_added'] += added
+            if error:
+                errors[code] = error
+            elif added == 0:
+                stats['symbols_unfilled'] += 1
+    return dict(stats, error_count=len(errors), errors=dict(list(errors.items())[:50]))
+
+
+def print_summary(report):
+    print(f"扫描 {report['symbols_scanned']} 只股票 / {report['files_scanned']} 个文件，耗时 {report['elapsed']:.1f}s")
+    for market, cal in report['calendars'].items():
+        print(f"交易日历 {market}: {cal.get('source')} {cal.get('start')} ~ {cal.get('end')}，{cal.get('days')} 个交易日")
+        for hole in cal.get('holes', []):
+            print(f"  数据空洞: {hole['start']} ~ {hole['end']}（{hole['business_days']} 个工作日）")
+    if not report['summary']:
+        print("未发现问题")
+        return
+    for kind, item in report['summary'].items():
+        print(f"  {kind:<16} {item['count']:>8} 处  {item['symbols']:>6} 只股票")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='日线数据完整性扫描与修复')
+    parser.add_argument('--data-dir', default=DATA_DIR)
+    parser.add_argument('--symbols', default=None, help='逗号分隔的股票代码（默认全部）')
+    parser.add_argument('--workers', type=int, default=None, help='扫描进程数（默认 CPU 核数）')
+    parser.add_argument('--calendar', choices=['auto', 'source', 'union'], default='auto')
+    parser.add_argument('--jump-threshold', type=float, default=JUMP_THRESHOLD)
+    parser.add_argument('--report', default=DEFAULT_REPORT, help='报告输出路径')
+    parser.add_argument('--repair', action='store_true', help='补齐缺失交易日并重写重复/乱序的文件')
+    parser.add_argument('--fetch-workers', type=int, default=4, help='修复时并发拉取的线程数')
+    args = parser.parse_args()
+
+    symbols = [c.strip() for c in args.symbols.split(',') if c.strip()] if args.symbols else None
+    report = scan(args.data_dir, symbols, args.workers, args.calendar, args.jump_threshold)
+    print_summary(report)
+
+    if args.repair:
+        print("开始修复...")
+        report['repair'] = repair(report, args.data_dir, args.fetch_workers)
+        print(f"修复完成: {json.dumps(report['repair'], ensure_ascii=False)}")
+        if report['repair'].get('bars_added') and os.path.exists(os.path.join(args.data_dir, 'panel')):
+            print("已补入历史日线，请运行 python3 panel.py build 重建面板")
+
+    with open(args.report, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"报告已保存到 {args.report}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
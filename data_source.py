@@ -0,0 +1,564 @@
+# -*- coding: utf-8 -*-
+"""
+行情数据源接口
+
+app.py、asgi.py 和 fetch_stock_list.py 通过 get_data_source() 获取数据，不直接调用东财/akshare：
+- LiveDataSource：真实数据源（akshare 日线/估值、东财实时行情）
+- SimulatedDataSource：本地模拟器，按股票代码生成确定性的日线、行情和 PE 序列，
+  可配置延迟、错误率和限流，用于离线压测合并请求、重试和并发行为
+
+通过环境变量选择数据源：
+    STOCK_DATA_SOURCE=live|simulator （默认 live）
+    SIM_LATENCY_MS=50      模拟器平均延迟（毫秒）
+    SIM_JITTER_MS=20       延迟抖动（毫秒）
+    SIM_ERROR_RATE=0.0     随机失败概率
+    SIM_RATE_LIMIT=0       每秒允许的调用次数，超出时抛出 ThrottledError（0 表示不限流）
+    UPSTREAM_RESILIENCE=1  上游保护（限流、熔断、自适应超时），设为 0 关闭
+"""
+
+import asyncio
+import os
+import random
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from adjustment import apply_adjustment, factors_from_prices
+
+import metrics
+
+# akshare 依赖树很大（导入需数秒），只在首次调用真实数据源时导入，见 get_akshare
+_AKSHARE = {'loaded': False, 'module': None}
+_AKSHARE_LOCK = threading.Lock()
+
+# 东财个股行情接口
+EASTMONEY_QUOTE_URL = 'https://push2.eastmoney.com/api/qt/stock/get'
+# f43最新价, f59价格精度, f57代码, f58名称, f116总市值, f162市盈率(TTM-A股), f163市盈率(静), f164市盈率(TTM-港美股), f167是市净率(PB)
+EASTMONEY_QUOTE_FIELDS = 'f43,f57,f58,f59,f60,f116,f162,f163,f164,f167,f170'
+EASTMONEY_TIMEOUT = 8
+# 东财批量行情接口（一次请求多只股票）及其字段到个股接口字段的对应关系
+# f1价格精度, f2最新价, f3涨跌幅, f9市盈率(动态), f12代码, f14名称, f18昨收, f20总市值, f23市净率, f114市盈率(静)
+EASTMONEY_BATCH_QUOTE_URL = 'https://push2.eastmoney.com/api/qt/ulist.np/get'
+EASTMONEY_BATCH_FIELD_MAP = {
+    'f1': 'f59', 'f2': 'f43', 'f3': 'f170', 'f9': 'f162', 'f12': 'f57', 'f14': 'f58',
+    'f18': 'f60', 'f20': 'f116', 'f23': 'f167', 'f114': 'f163',
+}
+# 批量行情每次请求的股票数上限
+EASTMONEY_BATCH_SIZE = 100
+
+# 日线统一列顺序（与本地 CSV 一致）
+BAR_COLUMNS = ['trade_time', 'open', 'close', 'high', 'low', 'vol', 'amount']
+# 推算复权因子时拉取历史的起始日期
+ADJUST_HISTORY_START = '19900101'
+
+
+class UpstreamError(Exception):
+    """上游数据源调用失败"""
+
+
+class ThrottledError(UpstreamError):
+    """上游限流"""
+
+
+class DataSourceUnavailable(UpstreamError):
+    """数据源不可用（如未安装 akshare）"""
+
+
+class UnsupportedSymbolError(UpstreamError):
+    """数据源不支持该股票"""
+
+
+@contextmanager
+def symbol_errors(stock_code):
+    """
+    akshare 对不存在或没有数据的代码通常在解析响应时抛出 KeyError、ValueError 等，转换为 UnsupportedSymbolError
+    （上游正常响应，不计入熔断）；网络错误（OSError 子类，含 requests 的异常）原样抛出
+    """
+    try:
+        yield
+    except OSError:
+        raise
+    except (KeyError, IndexError, ValueError, TypeError, AttributeError) as e:
+        raise UnsupportedSymbolError(f'{stock_code}: {e!r}') from e
+
+
+def get_akshare():
+    """
+    按需导入 akshare（每个进程只导入一次），未安装时抛出 DataSourceUnavailable
+    导入耗时计入 /metrics 的 stock_startup_seconds{phase="import_akshare"}
+    """
+    if not _AKSHARE['loaded']:
+        with _AKSHARE_LOCK:
+            if not _AKSHARE['loaded']:
+                start = time.perf_counter()
+                try:
+                    import akshare
+                    _AKSHARE['module'] = akshare
+                except ImportError:
+                    _AKSHARE['module'] = None
+                elapsed = time.perf_counter() - start
+                metrics.record_startup('import_akshare', elapsed)
+                print(f"按需导入 akshare: {'成功' if _AKSHARE['module'] else '未安装'}, 耗时 {elapsed:.2f}s")
+                _AKSHARE['loaded'] = True
+    if _AKSHARE['module'] is None:
+        raise DataSourceUnavailable('未安装 akshare')
+    return _AKSHARE['module']
+
+
+def normalize_stock_code_with_market(stock_code):
+    """
+    标准化股票代码，返回 eastmoney 所需的 secid
+    secid 规则：
+      - 深市: 0.代码
+      - 沪市: 1.代码
+      - 港股: 116.代码
+      - 美股: 代码 (通常已包含市场前缀如 105.AAPL)
+    """
+    code = stock_code.upper()
+    if '.' in code:
+        parts = code.split('.')
+        base = parts[0]
+        suffix = parts[-1]
+    else:
+        base, suffix = code, ''
+
+    if suffix == 'SZ':
+        return f"0.{base}"
+    elif suffix == 'SH':
+        return f"1.{base}"
+    elif suffix == 'HK':
+        return f"116.{base}"
+    elif suffix == 'US':
+        # 美股代码在 stock_list.json 中存为 "105.AAPL.US"
+        # 实际 API 需要 "105.AAPL"
+        if len(parts) >= 3:
+            return ".".join(parts[:-1])
+        return base # 兜底
+    else:
+        # 未提供后缀时，根据首位数字简单判断
+        if len(base) <= 5 and base.isdigit():
+            return f"116.{base}"
+        return f"1.{base}" if base.startswith('6') else f"0.{base}"
+
+
+def build_stock_info_params(stock_code):
+    """构造东财个股行情接口的请求参数"""
+    return {
+        'secid': normalize_stock_code_with_market(stock_code),
+        'fields': EASTMONEY_QUOTE_FIELDS
+    }
+
+
+def split_stock_code(stock_code):
+    """拆分股票代码，返回 (去掉市场后缀的代码, 大写后缀)"""
+    parts = stock_code.split('.')
+    suffix = parts[-1].upper()
+    if suffix in ['US', 'SZ', 'SH', 'HK']:
+        return ".".join(parts[:-1]), suffix
+    return stock_code, suffix
+
+
+class DataSource:
+    """
+    数据源接口
+    - daily_bars: 日线 DataFrame（列为 BAR_COLUMNS），无数据返回 None；adjust 为 'qfq'/'hfq'/''（不复权）
+    - adjust_factors: 后复权因子序列 DataFrame（列为 trade_time、factor，只含变化日期），无数据返回 None；
+      指定 start_date（YYYYMMDD）时只推算该日起的因子，第一条为该日起首个交易日的因子
+    - quote: 东财格式的行情字段字典（f43、f58 等），无数据返回 None
+    - batch_quotes: 一次获取多只股票的行情，返回 {代码: 行情字段字典}（字段同 quote），缺失的股票不出现在结果中
+    - pe_history: 历史 PE-TTM DataFrame（列为 date、value），无数据返回 None
+    - stock_list: [(code, name), ...]
+    - trade_calendar: A 股交易日 DatetimeIndex（升序）
+    失败时抛出 UpstreamError 或其子类
+    self_guarded: 实现内部已对每次上游请求分别加保护的方法，ResilientDataSource 不再整体套一层
+    """
+    name = 'base'
+    self_guarded = frozenset()
+
+    def daily_bars(self, stock_code, start_date, end_date, adjust='qfq'):
+        raise NotImplementedError
+
+    def adjust_factors(self, stock_code, start_date=None):
+        """默认实现：拉取 start_date（默认全部历史）起的不复权和后复权日线，由收盘价之比推算因子"""
+        start_date = start_date or ADJUST_HISTORY_START
+        end_date = datetime.now().strftime('%Y%m%d')
+        raw = self.daily_bars(stock_code, start_date, end_date, adjust='')
+        hfq = self.daily_bars(stock_code, start_date, end_date, adjust='hfq')
+        return factors_from_prices(raw, hfq)
+
+    def quote(self, stock_code):
+        raise NotImplementedError
+
+    async def aquote(self, stock_code, http_client=None):
+        """异步行情，默认在线程中执行同步版本"""
+        return await asyncio.to_thread(self.quote, stock_code)
+
+    def batch_quotes(self, stock_codes):
+        """默认实现：逐只调用 quote"""
+        result = {}
+        for code in stock_codes:
+            data = self.quote(code)
+            if data:
+                result[code] = data
+        return result
+
+    def pe_history(self, stock_code):
+        raise NotImplementedError
+
+    def stock_list(self):
+        raise NotImplementedError
+
+    def trade_calendar(self, start_date, end_date):
+        raise NotImplementedError
+
+
+class LiveDataSource(DataSource):
+    """真实数据源：akshare + 东财接口"""
+    name = 'live'
+    # 股票列表按市场/分页逐个请求，fetch_stock_list.py 中每次请求各自经过保护
+    self_guarded = frozenset({'stock_list'})
+
+    def daily_bars(self, stock_code, start_date, end_date, adjust='qfq'):
+        ak = get_akshare()
+
+        code, suffix = split_stock_code(stock_code)
+        with symbol_errors(stock_code):
+            if suffix == 'HK':
+                df = ak.stock_hk_hist(symbol=code, period="daily", start_date=start_date, end_date=end_date, adjust=adjust)
+            elif suffix == 'US':
+                # 美股接口 symbol 需要带市场标识，如 105.AAPL
+                df = ak.stock_us_hist(symbol=code, period="daily", start_date=start_date, end_date=end_date, adjust=adjust)
+            else:
+                # A 股接口 symbol 只需要 6 位代码
+                pure_code = code.split('.')[0]
+                df = ak.stock_zh_a_hist(symbol=pure_code, period="daily", start_date=start_date, end_date=end_date, adjust=adjust)
+
+            if df is None or df.empty:
+                return None
+
+            # 重命名列以匹配本地格式
+            df = df.rename(columns={
+                '日期': 'trade_time',
+                '开盘': 'open',
+                '收盘': 'close',
+                '最高': 'high',
+                '最低': 'low',
+                '成交量': 'vol',
+                '成交额': 'amount'
+            })
+            df['trade_time'] = pd.to_datetime(df['trade_time'])
+            return df[BAR_COLUMNS]
+
+    def quote(self, stock_code):
+        import requests
+
+        resp = requests.get(EASTMONEY_QUOTE_URL, params=build_stock_info_params(stock_code), timeout=EASTMONEY_TIMEOUT)
+        resp.raise_for_status()
+        return resp.json().get('data')
+
+    async def aquote(self, stock_code, http_client=None):
+        if http_client is None:
+            return await super().aquote(stock_code)
+        resp = await http_client.get(EASTMONEY_QUOTE_URL, params=build_stock_info_params(stock_code))
+        resp.raise_for_status()
+        return resp.json().get('data')
+
+    def batch_quotes(self, stock_codes):
+        """东财批量行情接口，每 EASTMONEY_BATCH_SIZE 只股票一次请求，字段转换为个股接口的编号"""
+        import requests
+
+        by_secid = {normalize_stock_code_with_market(code): code for code in stock_codes}
+        secids = list(by_secid)
+        result = {}
+        for i in range(0, len(secids), EASTMONEY_BATCH_SIZE):
+            chunk = secids[i:i + EASTMONEY_BATCH_SIZE]
+            resp = requests.get(EASTMONEY_BATCH_QUOTE_URL, params={
+                'secids': ','.join(chunk),
+                'fields': ','.join(EASTMONEY_BATCH_FIELD_MAP) + ',f13',
+            }, timeout=EASTMONEY_TIMEOUT)
+            resp.raise_for_status()
+            rows = ((resp.json().get('data') or {}).get('diff')) or []
+            if isinstance(rows, dict):
+                rows = list(rows.values())
+            for row in rows:
+                code = by_secid.get(f"{row.get('f13')}.{row.get('f12')}")
+                if code is None:
+                    continue
+                result[code] = {EASTMONEY_BATCH_FIELD_MAP[k]: v for k, v in row.items() if k in EASTMONEY_BATCH_FIELD_MAP}
+        return result
+
+    def pe_history(self, stock_code):
+        ak = get_akshare()
+
+        parts = stock_code.split('.')
+        code, suffix = split_stock_code(stock_code)
+        with symbol_errors(stock_code):
+            if suffix == 'HK':
+                # 港股历史估值接口
+                df = ak.stock_hk_valuation_baidu(symbol=code, indicator="市盈率(TTM)", period="全部")
+            elif suffix == 'US':
+                # 美股代码格式可能是 "105.AAPL.US"，API 只需要 "AAPL"
+                us_code = parts[1] if len(parts) >= 3 else parts[0]
+                try:
+                    # 百度估值接口仅部分美股支持
+                    df = ak.stock_us_valuation_baidu(symbol=us_code, indicator="市盈率(TTM)", period="全部")
+                except Exception as e:
+                    raise UnsupportedSymbolError(str(e))
+            else:
+                # A 股历史估值接口
+                pure_code = code.split('.')[0]
+                df = ak.stock_zh_valuation_baidu(symbol=pure_code, indicator="市盈率(TTM)", period="全部")
+
+        if df is None or df.empty:
+            return None
+        return df
+
+    def stock_list(self):
+        # 沿用 fetch_stock_list.py 的策略：优先 akshare，失败时使用东方财富API
+        import fetch_stock_list
+
+        stocks = None
+        if fetch_stock_list.HAS_AKSHARE:
+            stocks = fetch_stock_list.get_stocks_by_akshare()
+        if not stocks:
+            stocks = fetch_stock_list.get_stocks_by_eastmoney()
+        return stocks or []
+
+    def trade_calendar(self, start_date, end_date):
+        ak = get_akshare()
+        df = ak.tool_trade_date_hist_sina()
+        if df is None or df.empty:
+            return None
+        days = pd.DatetimeIndex(pd.to_datetime(df['trade_date'])).sort_values()
+        return days[(days >= pd.to_datetime(start_date)) & (days <= pd.to_datetime(end_date))]
+
+
+class SimulatedDataSource(DataSource):
+    """
+    本地上游模拟器
+    每只股票的数据由代码的 CRC32 作为随机种子生成，多次调用、多进程之间结果一致；
+    行情按 quote_interval 秒为一个时间片变化，同一时间片内返回相同数据
+    """
+    name = 'simulator'
+
+    # 模拟历史的起始日期
+    HISTORY_START = '2010-01-01'
+
+    def __init__(self, latency_ms=50, jitter_ms=20, error_rate=0.0, rate_limit=0,
+                 quote_interval=3, n_symbols=500, seed=0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.quote_interval = quote_interval
+        self.n_symbols = n_symbols
+        self.seed = seed
+        self.calls = 0
+        self._lock = threading.Lock()
+        self._tokens = float(rate_limit)
+        self._last_refill = time.monotonic()
+        self._bar_cache = {}
+
+    def _symbol_seed(self, stock_code, *extra):
+        key = '|'.join([stock_code.upper(), str(self.seed)] + [str(e) for e in extra])
+        return zlib.crc32(key.encode('utf-8'))
+
+    def _check_quota(self):
+        """计数并执行限流检查（令牌桶）"""
+        with self._lock:
+            self.calls += 1
+            if self.rate_limit > 0:
+                now = time.monotonic()
+                self._tokens = min(self.rate_limit, self._tokens + (now - self._last_refill) * self.rate_limit)
+                self._last_refill = now
+                if self._tokens < 1:
+                    raise ThrottledError('模拟上游限流')
+                self._tokens -= 1
+
+    def _delay(self):
+        return max(0.0, random.gauss(self.latency_ms, self.jitter_ms)) / 1000
+
+    def _maybe_fail(self):
+        if self.error_rate > 0 and random.random() < self.error_rate:
+            raise UpstreamError('模拟上游错误')
+
+    def _simulate_call(self):
+        """模拟一次上游调用：限流检查、网络延迟和随机失败"""
+        self._check_quota()
+        delay = self._delay()
+        if delay:
+            time.sleep(delay)
+        self._maybe_fail()
+
+    def _full_history(self, stock_code):
+        """生成（并缓存）某只股票自 HISTORY_START 至今的完整日线"""
+        key = stock_code.upper()
+        df = self._bar_cache.get(key)
+        if df is not None:
+            return df
+
+        rng = np.random.default_rng(self._symbol_seed(stock_code, 'bars'))
+        days = pd.bdate_range(self.HISTORY_START, datetime.now().strftime('%Y-%m-%d'))
+        n = len(days)
+        close = rng.uniform(3, 200) * np.exp(np.cumsum(rng.normal(0.0002, 0.02, size=n)))
+        open_ = close * np.exp(rng.normal(0, 0.005, size=n))
+        high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.01, size=n)))
+        low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.01, size=n)))
+        vol = rng.integers(10_000, 2_000_000, size=n)
+        df = pd.DataFrame({
+            'trade_time': days,
+            'open': open_.round(2),
+            'close': close.round(2),
+            'high': high.round(2),
+            'low': low.round(2),
+            'vol': vol,
+            'amount': (vol * close * 100).round(2),
+        })
+        self._bar_cache[key] = df
+        return df
+
+    def _factor_history(self, stock_code):
+        """模拟分红送转：平均每年一次除权，因子按 1%-30% 阶梯上升"""
+        history = self._full_history(stock_code)
+        rng = np.random.default_rng(self._symbol_seed(stock_code, 'factors'))
+        days = history['trade_time']
+        events = np.sort(rng.choice(len(days), size=max(1, len(days) // 250), replace=False))
+        factors = np.cumprod(np.concatenate([[1.0], 1 + rng.uniform(0.01, 0.3, size=len(events))]))
+        return pd.DataFrame({
+            'trade_time': pd.concat([days.iloc[:1], days.iloc[events]], ignore_index=True),
+            'factor': factors.round(6),
+        }).drop_duplicates('trade_time', keep='last').reset_index(drop=True)
+
+    def daily_bars(self, stock_code, start_date, end_date, adjust='qfq'):
+        self._simulate_call()
+        df = self._full_history(stock_code)
+        mask = (df['trade_time'] >= pd.to_datetime(start_date)) & (df['trade_time'] <= pd.to_datetime(end_date))
+        result = df[mask]
+        if result.empty:
+            return None
+        result = result.reset_index(drop=True)
+        if adjust in ('qfq', 'hfq'):
+            result = apply_adjustment(result, self._factor_history(stock_code), adjust)
+        return result
+
+    def adjust_factors(self, stock_code, start_date=None):
+        self._simulate_call()
+        factors = self._factor_history(stock_code)
+        if start_date:
+            # 与默认实现一致：第一条为起始日当时的因子
+            start = pd.to_datetime(start_date)
+            head = factors[factors['trade_time'] <= start].tail(1).assign(trade_time=start)
+            factors = pd.concat([head, factors[factors['trade_time'] > start]], ignore_index=True)
+        return factors
+
+    def _quote_fields(self, stock_code):
+        code, suffix = split_stock_code(stock_code)
+        history = self._full_history(stock_code)
+        last_close = float(history['close'].iloc[-1])
+        bucket = int(time.time() // self.quote_interval) if self.quote_interval else 0
+        rng = np.random.default_rng(self._symbol_seed(stock_code, 'quote', bucket))
+        price = last_close * (1 + rng.normal(0, 0.01))
+        pe = max(1.0, 5 + (self._symbol_seed(stock_code, 'pe') % 5000) / 100)
+        fields = {
+            'f43': int(round(price * 100)),
+            'f57': code.split('.')[-1] if suffix == 'US' else code,
+            'f58': f"模拟{code}",
+            'f59': 2,
+            'f60': int(round(last_close * 100)),
+            'f116': round(price * (1e8 + self._symbol_seed(stock_code, 'shares') % 10**10), 2),
+            'f162': int(pe * 100),
+            'f163': int(pe * 110),
+            'f164': int(pe * 100),
+            'f167': int((1 + rng.uniform(0, 5)) * 100),
+            'f170': int(round((price / last_close - 1) * 10000)),
+        }
+        return fields
+
+    def quote(self, stock_code):
+        self._simulate_call()
+        return self._quote_fields(stock_code)
+
+    async def aquote(self, stock_code, http_client=None):
+        # 异步版本不占用线程：限流与失败逻辑相同，延迟用 asyncio.sleep
+        self._check_quota()
+        await asyncio.sleep(self._delay())
+        self._maybe_fail()
+        return self._quote_fields(stock_code)
+
+    def batch_quotes(self, stock_codes):
+        # 与真实接口一致：每 EASTMONEY_BATCH_SIZE 只股票计一次调用
+        stock_codes = list(stock_codes)
+        result = {}
+        for i in range(0, len(stock_codes), EASTMONEY_BATCH_SIZE):
+            self._simulate_call()
+            for code in stock_codes[i:i + EASTMONEY_BATCH_SIZE]:
+                result[code] = self._quote_fields(code)
+        return result
+
+    def pe_history(self, stock_code):
+        self._simulate_call()
+        history = self._full_history(stock_code)
+        rng = np.random.default_rng(self._symbol_seed(stock_code, 'pe_history'))
+        base = 5 + (self._symbol_seed(stock_code, 'pe') % 5000) / 100
+        values = base * np.exp(np.cumsum(rng.normal(0, 0.01, size=len(history))))
+        return pd.DataFrame({'date': history['trade_time'], 'value': values.round(2)})
+
+    def stock_list(self):
+        self._simulate_call()
+        stocks = []
+        for i in range(self.n_symbols):
+            if i % 2 == 0:
+                code = f"{i // 2:06d}.SZ"
+            else:
+                code = f"{600000 + i // 2:06d}.SH"
+            stocks.append((code, f"模拟{code.split('.')[0]}"))
+        return stocks
+
+    def trade_calendar(self, start_date, end_date):
+        # 模拟日线按工作日生成
+        self._simulate_call()
+        return pd.bdate_range(start_date, end_date)
+
+
+_data_source = None
+_data_source_lock = threading.Lock()
+
+
+def create_data_source_from_env():
+    """根据环境变量创建数据源，默认包装上游保护（限流、熔断、自适应超时，见 resilience.py）"""
+    kind = os.environ.get('STOCK_DATA_SOURCE', 'live').lower()
+    if kind in ('sim', 'simulator'):
+        source = SimulatedDataSource(
+            latency_ms=float(os.environ.get('SIM_LATENCY_MS', 50)),
+            jitter_ms=float(os.environ.get('SIM_JITTER_MS', 20)),
+            error_rate=float(os.environ.get('SIM_ERROR_RATE', 0.0)),
+            rate_limit=float(os.environ.get('SIM_RATE_LIMIT', 0)),
+        )
+    else:
+        source = LiveDataSource()
+    if os.environ.get('UPSTREAM_RESILIENCE', '1') == '0':
+        return source
+    from resilience import ResilientDataSource
+    return ResilientDataSource(source)
+
+
+def get_data_source():
+    """返回当前进程使用的数据源（首次调用时按环境变量创建）"""
+    global _data_source
+    if _data_source is None:
+        with _data_source_lock:
+            if _data_source is None:
+                _data_source = create_data_source_from_env()
+    return _data_source
+
+
+def set_data_source(source):
+    """替换当前数据源（压测、脚本中使用）"""
+    global _data_source
+    _data_source = source
+    return source
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+自选股票存储
+
+- 内存中维护 代码 -> 条目 的索引，查询为 O(1)
+- 按文件 mtime 自动重新加载（其他进程/worker 修改后可见）
+- 写操作在文件锁内 “重新读取 -> 修改 -> 写临时文件 -> rename” 原子完成，并发添加不会互相覆盖
+- 支持批量添加、删除和批量检查
+"""
+
+import json
+import os
+import threading
+from datetime import datetime
+
+import metrics
+from atomic_file import write_atomic
+
+try:
+    import fcntl
+except ImportError:
+    # Windows 下没有 fcntl，只在进程内加锁
+    fcntl = None
+
+
+class FavoritesStore:
+    def __init__(self, path):
+        self.path = path
+        self.lock_path = f"{path}.lock"
+        self._lock = threading.RLock()
+        self._entries = []
+        self._index = {}
+        self._signature = None
+
+    def _file_signature(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _read_file(self):
+        if not os.path.exists(self.path):
+            return []
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+            return entries if isinstance(entries, list) else []
+        except (OSError, ValueError):
+            return []
+
+    def _set_entries(self, entries, signature):
+        self._entries = entries
+        self._index = {e.get('code'): e for e in entries if e.get('code')}
+        self._signature = signature
+
+    def _reload_if_changed(self):
+        signature = self._file_signature()
+        unchanged = self._signature is not None and signature == self._signature
+        metrics.record_cache('favorites', unchanged)
+        if not unchanged:
+            self._set_entries(self._read_file(), signature)
+
+    def _write_file(self, entries):
+        """写入临时文件后 rename，读者永远看不到写了一半的文件"""
+        write_atomic(self.path, lambda f: json.dump(entries, f, ensure_ascii=False, indent=2), binary=False,
+                     prefix='.favorites_', suffix='.tmp', fsync=True)
+        self._set_entries(entries, self._file_signature())
+
+    def _mutate(self, func):
+        """
+        在进程锁和文件锁内执行修改：先从磁盘重新读取最新内容，再由 func 修改后原子写回
+        func(entries, index) 返回 (是否有改动, 返回值)
+        """
+        with self._lock:
+            lock_file = open(self.lock_path, 'a')
+            try:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                self._set_entries(self._read_file(), self._file_signature())
+                entries = list(self._entries)
+                index = dict(self._index)
+                changed, result = func(entries, index)
+                if changed:
+                    self._write_file(entries)
+                return result
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+                lock_file.close()
+
+    def list(self):
+        """返回所有自选股票（副本）"""
+        with self._lock:
+            self._reload_if_changed()
+            return [dict(e) for e in self._entries]
+
+    def contains(self, code):
+        with self._lock:
+            self._reload_if_changed()
+            return code in self._index
+
+    def check_many(self, codes):
+        """批量检查，返回 {代码: 是否自选}"""
+        with self._lock:
+            self._reload_if_changed()
+            return {code: code in self._index for code in codes}
+
+    def add_many(self, items):
+        """
+        批量添加 [(code, name), ...]，已存在的跳过
+        返回实际添加的代码列表
+        """
+        def apply(entries, index):
+            added = []
+            now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            for code, name in items:
+                if not code or code in index:
+                    continue
+                entry = {'code': code, 'name': name or '', 'added_at': now}
+                entries.append(entry)
+                index[code] = entry
+                added.append(code)
+            return bool(added), added
+
+        return self._mutate(apply)
+
+    def add(self, code, name=''):
+        """添加单只股票，已存在时返回 False"""
+        return bool(self.add_many([(code, name)]))
+
+    def remove_many(self, codes):
+        """批量删除，返回实际删除的代码列表"""
+        targets = set(codes)
+
+        def apply(entries, index):
+            removed = [e.get('code') for e in entries if e.get('code') in targets]
+            if removed:
+                entries[:] = [e for e in entries if e.get('code') not in targets]
+            return bool(removed), removed
+
+        return self._mutate(apply)
+
+    def remove(self, code):
+        return bool(self.remove_many([code]))
+
+    def replace_all(self, entries):
+        """整体替换自选列表"""
+        def apply(current, index):
+            current[:] = list(entries)
+            return True, True
+
+        return self._mutate(apply)
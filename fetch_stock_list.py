@@ -3,6 +3,7 @@
 """
 获取A股所有公司的股票代码和公司名称对应关系
 支持多种数据源：akshare、东方财富API
+上游调用经过 resilience.py 的限流、熔断和超时保护（与 app.py 共用同一组策略）
 """
 
 import json
@@ -11,6 +12,9 @@ import sys
 import time
 from datetime import datetime
 import pandas as pd
+from data_source import get_data_source
+from resilience import guarded_call
+import stock_list_sync
 
 try:
     import akshare as ak
@@ -51,7 +55,7 @@ def get_stocks_by_akshare():
     # 1. 获取沪深A股
     try:
         print("正在获取沪深A股列表...")
-        df_a = ak.stock_info_a_code_name()
+        df_a = guarded_call('akshare', 'stock_list', ak.stock_info_a_code_name)
         for _, row in df_a.iterrows():
             code = str(row['code']).zfill(6)
             name = str(row['name']).strip()
@@ -67,7 +71,7 @@ def get_stocks_by_akshare():
     # 2. 获取港股
     try:
         print("正在获取港股列表...")
-        df_hk = ak.stock_hk_spot_em()
+        df_hk = guarded_call('akshare', 'stock_list', ak.stock_hk_spot_em)
         for _, row in df_hk.iterrows():
             code = str(row['代码']).strip()
             name = str(row['名称']).strip()
@@ -81,7 +85,7 @@ def get_stocks_by_akshare():
     # 3. 获取美股
     try:
         print("正在获取美股列表...")
-        df_us = ak.stock_us_spot_em()
+        df_us = guarded_call('akshare', 'stock_list', ak.stock_us_spot_em)
         for _, row in df_us.iterrows():
             code = str(row['代码']).strip()
             name = str(row['名称']).strip()
@@ -117,7 +121,7 @@ def get_stocks_by_eastmoney():
             'fs': 'm:0+t:6,m:0+t:80,m:1+t:2,m:1+t:23'
         }
         try:
-            resp = requests.get(url_a, params=params, timeout=10).json()
+            resp = guarded_call('eastmoney', 'stock_list_page', requests.get, url_a, params=params, timeout=10).json()
             diff = resp.get('data', {}).get('diff', [])
             if not diff: break
             for item in diff:
@@ -143,7 +147,7 @@ def get_stocks_by_eastmoney():
             'fs': 'm:128+t:3,m:128+t:4,m:128+t:1,m:128+t:2' # 港股主板、创业板等
         }
         try:
-            resp = requests.get(url_hk, params=params, timeout=10).json()
+            resp = guarded_call('eastmoney', 'stock_list_page', requests.get, url_hk, params=params, timeout=10).json()
             diff = resp.get('data', {}).get('diff', [])
             if not diff: break
             for item in diff:
@@ -167,7 +171,7 @@ def get_stocks_by_eastmoney():
             'fs': 'm:105,m:106,m:107' # 纳斯达克、纽交所、美交所
         }
         try:
-            resp = requests.get(url_us, params=params, timeout=10).json()
+            resp = guarded_call('eastmoney', 'stock_list_page', requests.get, url_us, params=params, timeout=10).json()
             diff = resp.get('data', {}).get('diff', [])
             if not diff: break
             for item in diff:
@@ -240,9 +244,21 @@ def save_stock_list(stocks, output_file='stock_list.json'):
     
     # 保存为JSON
     json_file = output_file if output_file.endswith('.json') else f"{output_file}.json"
+    update_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    
+    # 与旧列表比较，记录新增/删除/改名，供前端增量同步（/api/stock_list/delta）
+    try:
+        old_version, old_stocks = stock_list_sync.read_stock_list_json(json_file)
+        changes_file = os.path.join(os.path.dirname(json_file), stock_list_sync.CHANGES_FILE)
+        diff = stock_list_sync.record_change(old_version, old_stocks, update_time, stocks_list, changes_file)
+        if diff is not None:
+            print(f"相对 {old_version}: 新增 {len(diff['added'])}，删除 {len(diff['removed'])}，改名 {len(diff['renamed'])}")
+    except (OSError, ValueError) as e:
+        print(f"记录股票列表变更失败: {e}")
+    
     with open(json_file, 'w', encoding='utf-8') as f:
         json.dump({
-            'update_time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'update_time': update_time,
             'total': len(stocks_list),
             'stocks': stocks_list
         }, f, ensure_ascii=False, indent=2)
@@ -265,18 +281,24 @@ def main():
     print("A股股票代码和公司名称获取工具")
     print("=" * 60)
     
-    # 优先使用akshare（更稳定）
     stocks = None
-    if HAS_AKSHARE:
-        stocks = get_stocks_by_akshare()
-    
-    # 如果akshare失败，使用东方财富API
-    if not stocks:
-        if HAS_REQUESTS:
-            stocks = get_stocks_by_eastmoney()
-        else:
-            print("错误: 没有可用的数据源")
-            sys.exit(1)
+    source = get_data_source()
+    if source.name != 'live':
+        # 模拟器等非真实数据源（STOCK_DATA_SOURCE=simulator），用于离线测试
+        print(f"使用数据源: {source.name}")
+        stocks = source.stock_list()
+    else:
+        # 优先使用akshare（更稳定）
+        if HAS_AKSHARE:
+            stocks = get_stocks_by_akshare()
+        
+        # 如果akshare失败，使用东方财富API
+        if not stocks:
+            if HAS_REQUESTS:
+                stocks = get_stocks_by_eastmoney()
+            else:
+                print("错误: 没有可用的数据源")
+                sys.exit(1)
     
     if not stocks:
         print("错误: 未能获取到股票数据")
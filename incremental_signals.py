@@ -0,0 +1,472 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+增量信号计算：新日线到达时只更新每只股票的滚动状态，不重新扫描历史
+
+每只股票保存 O(1) 的滚动状态（所有股票按列存为数组，一次更新全部股票）：
+- 最近 60 个收盘价的环形缓冲与 MA20 / MA60 的滚动和
+- RSI 的最近 14 个涨跌幅与滚动和（与 backtest_smart_strategy.add_indicators 一致的简单移动平均）
+- 趋势条件（MA20 > MA60 且收盘价 > MA60）连续成立的天数
+状态保存在 data/signal_state.npz。每次 update 按文件 mtime 找出上次之后变化的日线文件（补数、完整性修复、
+远程缓存写入等），只读取文件末尾新追加的行并推入状态；某只股票的文件被改写或补了历史 K 线时只重放该股票。
+规则在最新状态上逐日求值，全市场收盘后的信号在毫秒级得到，结果与批量回测逐日计算的信号一致。
+
+用法:
+    python3 incremental_signals.py update                 # 初始化或追加新 K 线，输出最新交易日的信号
+    python3 incremental_signals.py alerts --universe favorites
+    python3 incremental_signals.py status
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+import bar_archive
+from atomic_file import write_atomic
+from bars import days_from_datetimes
+from panel import DATA_DIR, list_sources, read_sources
+
+STATE_FILE = os.path.join(DATA_DIR, 'signal_state.npz')
+STATE_VERSION = 1
+FAVORITE_STOCKS_FILE = 'favorite_stocks.json'
+
+# 环形缓冲长度（最长均线窗口）与 RSI 窗口
+RING = 60
+RSI_WINDOW = 14
+SHIFT_DAYS = 20
+# 初始化时每次重放的股票数
+REPLAY_CHUNK = 500
+# 每个文件记录已读取部分末尾的字节数，下次读取前核对，判断文件是只在末尾追加还是被改写
+TAIL_BYTES = 64
+
+# 可增量计算的规则：与 backtest_smart_strategy.rules 和前端趋势策略对应，条件作用于当日指标（每只股票一个值）
+ALERT_RULES = {
+    'rsi_oversold': {
+        'name': 'RSI极度超跌策略',
+        'buy': lambda s: s['rsi'] < 20,
+        'sell': lambda s: s['rsi'] > 60,
+    },
+    'double_bottom': {
+        'name': '双底超跌策略',
+        'buy': lambda s: (s['close'] < s['close_20'] * 0.8) & (s['close'] < s['ma60'] * 0.9),
+        'sell': lambda s: s['close'] > s['ma60'],
+    },
+    'value_reversion': {
+        'name': '价值回归策略',
+        'buy': lambda s: (s['close'] < s['ma60'] * 0.8) & (s['rsi'] < 30),
+        'sell': lambda s: (s['close'] > s['ma60']) | (s['rsi'] > 70),
+    },
+    'trend': {
+        'name': '趋势交易策略',
+        'buy': lambda s: s['trend_days'] >= 5,
+        'sell': lambda s: s['close'] < s['ma60'],
+    },
+}
+
+# 状态数组：名称 -> (dtype, 每只股票的形状)
+STATE_FIELDS = {
+    'count': (np.int64, ()),
+    'last_day': (np.int32, ()),
+    'closes': (np.float64, (RING,)),
+    'sum20': (np.float64, ()),
+    'sum60': (np.float64, ()),
+    'gains': (np.float64, (RSI_WINDOW,)),
+    'losses': (np.float64, (RSI_WINDOW,)),
+    'gain_sum': (np.float64, ()),
+    'loss_sum': (np.float64, ()),
+    'trend_days': (np.int32, ()),
+}
+
+
+def _empty(n, name):
+    dtype, shape = STATE_FIELDS[name]
+    fill = np.iinfo(np.int32).min if name == 'last_day' else 0
+    return np.full((n,) + shape, fill, dtype=dtype)
+
+
+class SignalState:
+    """全部股票的滚动状态，列顺序为 codes"""
+
+    def __init__(self, codes=(), arrays=None, scanned_ns=0, files=None):
+        self.codes = list(codes)
+        self.column_of = {code: i for i, code in enumerate(self.codes)}
+        self.arrays = arrays or {name: _empty(len(self.codes), name) for name in STATE_FIELDS}
+        self.scanned_ns = scanned_ns
+        # 已读取的日线文件：路径 -> (已读取的字节数, 已读取部分末尾 TAIL_BYTES 字节)
+        self.files = files or {}
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getattr__(self, name):
+        arrays = self.__dict__.get('arrays')
+        if arrays is not None and name in arrays:
+            return arrays[name]
+        raise AttributeError(name)
+
+    def add_codes(self, codes):
+        """新增股票列（状态为空），返回它们的列下标"""
+        codes = [c for c in codes if c not in self.column_of]
+        for code in codes:
+            self.column_of[code] = len(self.codes)
+            self.codes.append(code)
+        if codes:
+            for name in STATE_FIELDS:
+                self.arrays[name] = np.concatenate([self.arrays[name], _empty(len(codes), name)])
+        return np.asarray([self.column_of[c] for c in codes], dtype=np.int64)
+
+    def reset(self, cols):
+        """清空若干股票的状态（历史被改写后重放）"""
+        for name in STATE_FIELDS:
+            self.arrays[name][cols] = _empty(1, name)[0]
+
+    def push(self, day, cols, close):
+        """
+        把一根 K 线推入 cols 列（同一交易日、各股票一根），O(1) 更新滚动和与计数
+        与批量计算一致：第一根 K 线的涨跌幅记为 0，窗口内 K 线不足时指标为 NaN
+        """
+        a = self.arrays
+        k = a['count'][cols]
+        started = k > 0
+        prev = a['closes'][cols, (k - 1) % RING]
+        delta = np.where(started, close - prev, 0.0)
+        gain = np.maximum(delta, 0.0)
+        loss = np.maximum(-delta, 0.0)
+        slot = k % RSI_WINDOW
+        full = k >= RSI_WINDOW
+        a['gain_sum'][cols] += gain - np.where(full, a['gains'][cols, slot], 0.0)
+        a['loss_sum'][cols] += loss - np.where(full, a['losses'][cols, slot], 0.0)
+        a['gains'][cols, slot] = gain
+        a['losses'][cols, slot] = loss
+        # 离开窗口的收盘价要在覆盖环形缓冲之前取出
+        a['sum20'][cols] += close - np.where(k >= 20, a['closes'][cols, (k - 20) % RING], 0.0)
+        a['sum60'][cols] += close - np.where(k >= RING, a['closes'][cols, k % RING], 0.0)
+        a['closes'][cols, k % RING] = close
+        a['count'][cols] = k + 1
+        a['last_day'][cols] = day
+        s = self.snapshot(cols)
+        with np.errstate(invalid='ignore'):
+            trend = (s['ma20'] > s['ma60']) & (s['close'] > s['ma60'])
+        a['trend_days'][cols] = np.where(trend, a['trend_days'][cols] + 1, 0)
+
+    def snapshot(self, cols=None):
+        """cols 列当前（最近一根 K 线）的指标：close, ma20, ma60, rsi, close_20, trend_days, day"""
+        a = self.arrays
+        cols = np.arange(len(self.codes)) if cols is None else cols
+        n = a['count'][cols]
+        last = (n - 1) % RING
+        close = np.where(n > 0, a['closes'][cols, last], np.nan)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            ma20 = np.where(n >= 20, a['sum20'][cols] / 20, np.nan)
+            ma60 = np.where(n >= RING, a['sum60'][cols] / RING, np.nan)
+            gain = a['gain_sum'][cols] / RSI_WINDOW
+            loss = a['loss_sum'][cols] / RSI_WINDOW
+            rsi = np.where(n >= RSI_WINDOW, 100 - 100 / (1 + gain / loss), np.nan)
+        close_20 = np.where(n > SHIFT_DAYS, a['closes'][cols, (n - 1 - SHIFT_DAYS) % RING], np.nan)
+        return {
+            'close': close, 'ma20': ma20, 'ma60': ma60, 'rsi': rsi, 'close_20': close_20,
+            'trend_days': a['trend_days'][cols], 'day': a['last_day'][cols],
+        }
+
+    def replay(self, codes, days, close):
+        """
+        按交易日顺序推入一个 交易日×股票 的收盘价矩阵（NaN 表示当天没有 K 线），每个交易日一次向量化更新
+        """
+        cols = np.asarray([self.column_of[c] for c in codes], dtype=np.int64)
+        for i, day in enumerate(days):
+            present = ~np.isnan(close[i])
+            if present.any():
+                self.push(int(day), cols[present], close[i][present])
+
+    def save(self, path=STATE_FILE):
+        """原子写入状态文件"""
+        directory = os.path.dirname(path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        paths = sorted(self.files)
+        write_atomic(path, lambda f: np.savez(
+            f, codes=np.asarray(self.codes, dtype=str), version=STATE_VERSION,
+            scanned_ns=np.int64(self.scanned_ns),
+            file_paths=np.asarray(paths, dtype=str),
+            file_sizes=np.asarray([self.files[p][0] for p in paths], dtype=np.int64),
+            file_tails=np.asarray([self.files[p][1] for p in paths], dtype=f'S{TAIL_BYTES}'),
+            **self.arrays), prefix='.signal_state_', suffix='.npz')
+
+    @classmethod
+    def load(cls, path=STATE_FILE):
+        """读取状态文件，不存在或版本不符时返回 None"""
+        try:
+            with np.load(path) as data:
+                if int(data['version']) != STATE_VERSION:
+                    return None
+                arrays = {name: data[name].copy() for name in STATE_FIELDS}
+                files = {p: (int(size), bytes(tail)) for p, size, tail
+                         in zip(data['file_paths'].tolist(), data['file_sizes'], data['file_tails'])}
+                return cls(data['codes'].tolist(), arrays, int(data['scanned_ns']), files)
+        except (OSError, KeyError, ValueError):
+            return None
+
+
+def pivot(long):
+    """长表（code, day, close）-> (代码列表, 交易日数组, 交易日×股票 收盘价矩阵)"""
+    codes = sorted(set(long['code']))
+    days = np.unique(long['day'].to_numpy(dtype=np.int32))
+    matrix = np.full((len(days), len(codes)), np.nan)
+    column_of = {code: i for i, code in enumerate(codes)}
+    rows = np.searchsorted(days, long['day'].to_numpy(dtype=np.int32))
+    matrix[rows, long['code'].map(column_of).to_numpy(dtype=np.int64)] = long['close'].to_numpy(dtype=np.float64)
+    return codes, days, matrix
+
+
+def read_appended(path, record):
+    """
+    读取文件在上次读取位置之后追加的完整行，返回 (行列表, 新的文件记录)
+    文件是新的时从头读取（跳过表头）；文件变短或已读取部分的末尾不一致（被改写）时返回 (None, None)
+    """
+    with bar_archive.open_binary(path) as f:
+        header = f.readline()
+        if record is None:
+            offset, tail = f.tell(), b''
+        else:
+            offset, tail = record
+            f.seek(max(0, offset - len(tail)))
+            if f.read(len(tail)) != tail:
+                return None, None
+        f.seek(offset)
+        data = f.read()
+    # 只处理完整的行（文件可能正在写入）
+    end = data.rfind(b'\n') + 1
+    consumed = (header if record is None else tail) + data[:end]
+    lines = [line for line in data[:end].decode('utf-8').splitlines() if line.strip()]
+    return (header.decode('utf-8').strip(), lines), (offset + end, consumed[-TAIL_BYTES:])
+
+
+def parse_rows(code, header, lines):
+    """CSV 行 -> [(代码, 日期字符串, 收盘价)]"""
+    columns = header.split(',')
+    time_col, close_col = columns.index('trade_time'), columns.index('close')
+    rows = []
+    for line in lines:
+        fields = line.split(',')
+        try:
+            rows.append((code, fields[time_col], float(fields[close_col])))
+        except (IndexError, ValueError):
+            continue
+    return rows
+
+
+def replay_codes(state, codes, by_code, chunk_size=REPLAY_CHUNK):
+    """清空并从头重放若干股票（读取它们的全部日线文件），返回推入的 K 线数"""
+    bars = 0
+    for i in range(0, len(codes), chunk_size):
+        part = codes[i:i + chunk_size]
+        sources = [s for code in part for s in by_code[code]]
+        long = read_sources(sources)
+        long = long[~long['close'].isna()]
+        state.add_codes(part)
+        state.reset(np.asarray([state.column_of[c] for c in part], dtype=np.int64))
+        if not long.empty:
+            codes_, days, matrix = pivot(long)
+            state.replay(codes_, days, matrix)
+            bars += len(long)
+        for _, path, _ in sources:
+            with bar_archive.open_binary(path) as f:
+                size = f.seek(0, os.SEEK_END)
+                f.seek(max(0, size - TAIL_BYTES))
+                state.files[path] = (size, f.read())
+    return bars
+
+
+def update_state(state, data_dir=DATA_DIR, chunk_size=REPLAY_CHUNK):
+    """
+    把上次扫描之后变化的日线文件中的新 K 线推入状态，返回统计信息
+    - 只在末尾追加的文件只读取追加的行，晚于该股票已处理日期的 K 线直接推入（每日更新只读新增的字节）
+    - 新股票、文件被改写或追加了不晚于已处理日期的 K 线（补历史）的股票，读取全部文件从头重放
+    """
+    start = time.perf_counter()
+    scanned_at = time.time_ns()
+    sources = list_sources(data_dir)
+    by_code = {}
+    for source in sources:
+        by_code.setdefault(source[0], []).append(source)
+    changed = [s for s in sources if s[2] > state.scanned_ns]
+
+    replay = set()
+    appended = []   # (文件顺序, 代码, 日期, 收盘价)
+    records = {}
+    for order, (code, path, _) in enumerate(changed):
+        if code not in state.column_of:
+            replay.add(code)
+            continue
+        lines, record = read_appended(path, state.files.get(path))
+        if lines is None:
+            replay.add(code)
+            continue
+        records[path] = record
+        appended.extend((order,) + row for row in parse_rows(code, *lines))
+
+    bars = 0
+    new_days = set()
+    if appended:
+        long = pd.DataFrame(appended, columns=['order', 'code', 'trade_time', 'close'])
+        long['day'] = days_from_datetimes(long['trade_time'])
+        long = long[long['close'].notna() & ~long['code'].isin(replay)]
+        # 同一股票同一日期以先出现的文件（本地年份目录）为准
+        long = long.sort_values('order', kind='stable').drop_duplicates(subset=['code', 'day'], keep='first')
+        cols = long['code'].map(state.column_of).to_numpy(dtype=np.int64)
+        stale = long['day'].to_numpy(dtype=np.int32) <= state.last_day[cols]
+        replay.update(long['code'][stale])
+        long = long[~stale & ~long['code'].isin(replay)]
+        if not long.empty:
+            codes, days, matrix = pivot(long)
+            state.replay(codes, days, matrix)
+            bars += len(long)
+            new_days.update(days.tolist())
+    for path, record in records.items():
+        state.files[path] = record
+    if replay:
+        bars += replay_codes(state, sorted(replay), by_code, chunk_size)
+    state.scanned_ns = scanned_at
+    return {
+        'changed_files': len(changed),
+        'replayed': len(replay),
+        'appended_bars': int(bars),
+        'new_days': len(new_days),
+        'symbols': len(state),
+        'elapsed': time.perf_counter() - start,
+    }
+
+
+def evaluate(state, rule_ids=None, codes=None, latest_only=True):
+    """
+    在当前状态上求值规则，返回信号列表 [{code, rule, name, side, date, close, ...}]
+    latest_only: 只包含最近一根 K 线在最新交易日的股票（停牌股票不产生信号）
+    """
+    if not len(state):
+        return []
+    if codes is None:
+        cols = np.arange(len(state))
+    else:
+        cols = np.asarray([state.column_of[c] for c in codes if c in state.column_of], dtype=np.int64)
+    s = state.snapshot(cols)
+    if latest_only and len(cols):
+        keep = s['day'] == state.last_day.max()
+        cols = cols[keep]
+        s = {k: v[keep] for k, v in s.items()}
+    signals = []
+    for rule_id in rule_ids or ALERT_RULES:
+        rule = ALERT_RULES[rule_id]
+        for side in ('buy', 'sell'):
+            with np.errstate(invalid='ignore'):
+                hit = np.flatnonzero(np.asarray(rule[side](s), dtype=bool))
+            for j in hit:
+                signals.append({
+                    'code': state.codes[cols[j]],
+                    'rule': rule_id,
+                    'name': rule['name'],
+                    'side': side,
+                    'date': str(np.datetime64(int(s['day'][j]), 'D')),
+                    'close': round(float(s['close'][j]), 4),
+                    'ma20': _round(s['ma20'][j]),
+                    'ma60': _round(s['ma60'][j]),
+                    'rsi': _round(s['rsi'][j]),
+                    'trend_days': int(s['trend_days'][j]),
+                })
+    return signals
+
+
+def _round(value):
+    return None if np.isnan(value) else round(float(value), 4)
+
+
+class SignalEngine:
+    """进程内的增量信号：首次使用时读取状态文件，之后每次 refresh 只推入新 K 线"""
+
+    def __init__(self, data_dir=DATA_DIR, state_file=STATE_FILE):
+        self.data_dir = data_dir
+        self.state_file = state_file
+        self.state = None
+        self.last_update = None
+        self._lock = threading.Lock()
+
+    def refresh(self, save=True):
+        """推入新 K 线（没有变化时只扫描文件 mtime），返回统计信息"""
+        with self._lock:
+            if self.state is None:
+                self.state = SignalState.load(self.state_file) or SignalState()
+            stats = update_state(self.state, self.data_dir)
+            if save and (stats['changed_files'] or stats['replayed']):
+                self.state.save(self.state_file)
+            self.last_update = stats
+            return stats
+
+    def signals(self, rule_ids=None, codes=None, latest_only=True):
+        with self._lock:
+            return evaluate(self.state or SignalState(), rule_ids, codes, latest_only)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='增量信号计算')
+    parser.add_argument('command', choices=['update', 'alerts', 'status'])
+    parser.add_argument('--data-dir', default=DATA_DIR)
+    parser.add_argument('--state-file', default=None, help='状态文件（默认 <data-dir>/signal_state.npz）')
+    parser.add_argument('--universe', default='all', help='all（默认）/ favorites / SZ / SH / HK / US')
+    parser.add_argument('--codes', default=None, help='逗号分隔的股票代码（优先于 --universe）')
+    parser.add_argument('--rules', default=None, help=f'逗号分隔的规则（默认全部：{",".join(ALERT_RULES)}）')
+    args = parser.parse_args()
+
+    engine = SignalEngine(args.data_dir, args.state_file or os.path.join(args.data_dir, 'signal_state.npz'))
+    if args.command == 'status':
+        state = SignalState.load(engine.state_file)
+        if state is None:
+            print(f"状态文件不存在: {engine.state_file}，请先运行 update")
+            return 1
+        last = state.last_day.max() if len(state) else None
+        print(json.dumps({
+            'symbols': len(state),
+            'latest_day': str(np.datetime64(int(last), 'D')) if last is not None else None,
+            'size_mb': round(os.path.getsize(engine.state_file) / 1024 / 1024, 1),
+        }, ensure_ascii=False, indent=2))
+        return 0
+
+    if args.command == 'update':
+        stats = engine.refresh()
+        print(f"变化 {stats['changed_files']} 个文件，推入 {stats['appended_bars']} 根 K 线（{stats['new_days']} 个交易日），"
+              f"重放 {stats['replayed']} 只，耗时 {stats['elapsed'] * 1000:.0f}ms")
+    else:
+        engine.state = SignalState.load(engine.state_file)
+        if engine.state is None:
+            print(f"状态文件不存在: {engine.state_file}，请先运行 update")
+            return 1
+
+    rule_ids = [r.strip() for r in args.rules.split(',')] if args.rules else None
+    for rule_id in rule_ids or []:
+        if rule_id not in ALERT_RULES:
+            print(f"未知规则: {rule_id}（可选 {'、'.join(ALERT_RULES)}）")
+            return 1
+    codes = None
+    if args.codes:
+        codes = [c.strip() for c in args.codes.split(',') if c.strip()]
+    elif args.universe.upper() == 'FAVORITES':
+        from favorites_store import FavoritesStore
+        codes = [s['code'] for s in FavoritesStore(FAVORITE_STOCKS_FILE).list() if s.get('code')]
+    elif args.universe.upper() != 'ALL':
+        market = '.' + args.universe.upper().lstrip('.')
+        codes = [c for c in engine.state.codes if c.upper().endswith(market)]
+    start = time.perf_counter()
+    signals = engine.signals(rule_ids, codes)
+    elapsed = (time.perf_counter() - start) * 1000
+    for s in signals:
+        print(f"{s['date']}  {s['code']:<10s} {s['name']:<10s} {'买入' if s['side'] == 'buy' else '卖出'}  "
+              f"收盘 {s['close']:<10} RSI {s['rsi']}  MA60 {s['ma60']}")
+    print(f"{len(signals)} 个信号，求值耗时 {elapsed:.1f}ms")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
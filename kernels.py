@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+"""
+有状态信号扫描的计算内核（Numba 可选，未安装时使用 NumPy 实现）
+
+有些策略不能写成逐日独立的布尔条件，例如：
+- 趋势策略：条件连续成立的天数（中断即清零）达到 N 天才买入（前端 trend 策略的 above60Days）
+- 回测：取第一个买入信号，再取它之后的第一个卖出信号；或反复 空仓买入 -> 持有 -> 卖出
+在 Python 里逐根 K 线循环处理全市场很慢。这里的函数都接受一维（单只股票）或二维（行 = 交易日，列 = 股票）数组，
+按列独立扫描：
+- 安装了 numba 时首次调用编译为机器码（nogil，可多线程并行调用），单核每秒处理上亿根 K 线
+- 否则使用等价的 NumPy 实现：能向量化的用累积运算，交易配对按交易次数（而非 K 线数）循环
+
+KERNEL_BACKEND=numba / numpy 可强制选择实现（默认 auto）。
+"""
+
+import os
+
+import numpy as np
+
+KERNEL_BACKEND = os.environ.get('KERNEL_BACKEND', 'auto').strip().lower()
+
+_NUMBA = {'loaded': False, 'module': None}
+_COMPILED = {}
+
+
+def get_numba():
+    """按需导入 numba，未安装或被禁用时返回 None"""
+    if not _NUMBA['loaded']:
+        module = None
+        if KERNEL_BACKEND != 'numpy':
+            try:
+                import numba as module
+            except ImportError:
+                if KERNEL_BACKEND == 'numba':
+                    print("KERNEL_BACKEND=numba 但未安装 numba，使用 NumPy 实现")
+        _NUMBA['module'] = module
+        _NUMBA['loaded'] = True
+    return _NUMBA['module']
+
+
+def backend():
+    """当前使用的实现：numba / numpy"""
+    return 'numba' if get_numba() is not None else 'numpy'
+
+
+def _jit(func):
+    """编译（并缓存）一个循环内核，没有 numba 时返回 None"""
+    numba = get_numba()
+    if numba is None:
+        return None
+    compiled = _COMPILED.get(func.__name__)
+    if compiled is None:
+        compiled = numba.njit(cache=True, nogil=True)(func)
+        _COMPILED[func.__name__] = compiled
+    return compiled
+
+
+def _as_2d(values, dtype):
+    """一维数组视为单列；返回 (C 连续的二维数组, 输入是否为一维)"""
+    values = np.asarray(values)
+    flat = values.ndim == 1
+    if flat:
+        values = values[:, None]
+    return np.ascontiguousarray(values, dtype=dtype), flat
+
+
+def _window(n, lo, hi):
+    lo = max(0, int(lo or 0))
+    hi = n if hi is None else min(n, int(hi))
+    return lo, max(lo, hi)
+
+
+# ---------------------------------------------------------------- 循环内核（numba 编译，也是 NumPy 实现的参照）
+
+def _consecutive_loop(cond, out):
+    rows, cols = cond.shape
+    for j in range(cols):
+        run = 0
+        for i in range(rows):
+            run = run + 1 if cond[i, j] else 0
+            out[i, j] = run
+
+
+def _first_run_loop(cond, length, lo, hi, out):
+    rows, cols = cond.shape
+    for j in range(cols):
+        run = 0
+        out[j] = -1
+        for i in range(lo, hi):
+            run = run + 1 if cond[i, j] else 0
+            if run >= length:
+                out[j] = i
+                break
+
+
+def _first_after_loop(mask, start, min_gap, hi, out):
+    rows, cols = mask.shape
+    for j in range(cols):
+        out[j] = -1
+        if start[j] < 0:
+            continue
+        for i in range(start[j] + min_gap, hi):
+            if mask[i, j]:
+                out[j] = i
+                break
+
+
+def _trade_loop(close, buy, sell, cost, min_hold, growth, trades):
+    rows, cols = close.shape
+    for j in range(cols):
+        g = 1.0
+        count = 0
+        entry = -1
+        for i in range(rows):
+            if entry < 0:
+                # 最后一根 K 线上买入无法在区间内平仓
+                if buy[i, j] and i < rows - 1:
+                    entry = i
+            elif (sell[i, j] and i - entry >= min_hold) or i == rows - 1:
+                g *= close[i, j] / close[entry, j] * (1 - cost)
+                count += 1
+                entry = -1
+        growth[j] = g
+        trades[j] = count
+
+
+# ---------------------------------------------------------------- 公共接口
+
+def consecutive_true(cond):
+    """每个位置上条件连续成立的天数（不成立时为 0），形状与输入相同"""
+    cond, flat = _as_2d(cond, np.bool_)
+    kernel = _jit(_consecutive_loop)
+    if kernel is not None:
+        out = np.empty(cond.shape, dtype=np.int32)
+        kernel(cond, out)
+    else:
+        # 累计成立次数减去最近一次不成立时的累计值
+        total = np.cumsum(cond, axis=0, dtype=np.int32)
+        reset = np.maximum.accumulate(np.where(cond, 0, total), axis=0)
+        out = total - reset
+    return out[:, 0] if flat else out
+
+
+def first_run_index(cond, length, lo=0, hi=None):
+    """
+    [lo, hi) 内条件第一次连续成立 length 天的下标（从 lo 开始计数），没有返回 -1
+    一维输入返回整数，二维输入返回每列的下标数组
+    """
+    cond, flat = _as_2d(cond, np.bool_)
+    lo, hi = _window(cond.shape[0], lo, hi)
+    length = max(1, int(length))
+    kernel = _jit(_first_run_loop)
+    if kernel is not None:
+        out = np.empty(cond.shape[1], dtype=np.int64)
+        kernel(cond, length, lo, hi, out)
+    else:
+        runs = consecutive_true(cond[lo:hi])
+        hit = runs >= length
+        out = np.where(hit.any(axis=0), hit.argmax(axis=0) + lo, -1).astype(np.int64)
+    return int(out[0]) if flat else out
+
+
+def first_after(mask, start, min_gap=1, hi=None):
+    """
+    每列在 start + min_gap 及之后（hi 之前）第一个为 True 的下标，没有或 start < 0 时为 -1
+    用于 “买入之后的第一个卖出信号”（min_gap=1 即 T+1）
+    """
+    mask, flat = _as_2d(mask, np.bool_)
+    start = np.ascontiguousarray(np.broadcast_to(np.asarray(start, dtype=np.int64), mask.shape[1:]))
+    _, hi = _window(mask.shape[0], 0, hi)
+    kernel = _jit(_first_after_loop)
+    if kernel is not None:
+        out = np.empty(mask.shape[1], dtype=np.int64)
+        kernel(mask, start, int(min_gap), hi, out)
+    else:
+        rows = np.arange(mask.shape[0])[:, None]
+        allowed = mask & (rows >= start + min_gap) & (rows < hi) & (start >= 0)
+        out = np.where(allowed.any(axis=0), allowed.argmax(axis=0), -1).astype(np.int64)
+    return int(out[0]) if flat else out
+
+
+def first_entry_exit(buy, sell, min_gap=1, buy_window=(0, None), sell_window=(0, None)):
+    """
+    第一个买入信号（buy_window 内）及其之后第一个卖出信号（sell_window 内），返回 (买入下标, 卖出下标)，没有为 -1
+    """
+    buy, flat = _as_2d(buy, np.bool_)
+    sell, _ = _as_2d(sell, np.bool_)
+    n = buy.shape[0]
+    entries = np.atleast_1d(first_run_index(buy, 1, *_window(n, *buy_window)))
+    lo, hi = _window(n, *sell_window)
+    # 卖出窗口开始之前的卖出信号不算
+    start = np.where(entries >= 0, np.maximum(entries, lo - min_gap), -1)
+    exits = np.atleast_1d(first_after(sell, start, min_gap, hi))
+    if flat:
+        return int(entries[0]), int(exits[0])
+    return entries, exits
+
+
+def trade_growth(close, buy, sell, cost=0.0, min_hold=1):
+    """
+    反复交易的模拟：空仓时遇到买入信号按收盘价买入，持有至少 min_hold 天（不少于 1 天，买入当天不能卖出）后
+    第一个卖出信号卖出，区间最后一天强制平仓；收益复利累计
+    返回 (净值倍数, 交易次数)，二维输入时为每列的数组
+    """
+    min_hold = max(1, int(min_hold))
+    close, flat = _as_2d(close, np.float64)
+    buy, _ = _as_2d(buy, np.bool_)
+    sell, _ = _as_2d(sell, np.bool_)
+    cols = close.shape[1]
+    growth = np.ones(cols)
+    trades = np.zeros(cols, dtype=np.int64)
+    kernel = _jit(_trade_loop)
+    if kernel is not None:
+        kernel(close, buy, sell, float(cost), min_hold, growth, trades)
+    else:
+        n = close.shape[0]
+        for j in range(cols):
+            buy_idx = np.flatnonzero(buy[:n - 1, j])
+            sell_idx = np.flatnonzero(sell[:, j])
+            pos = 0
+            while True:
+                i = np.searchsorted(buy_idx, pos)
+                if i >= len(buy_idx):
+                    break
+                entry = buy_idx[i]
+                k = np.searchsorted(sell_idx, entry + min_hold)
+                exit_ = sell_idx[k] if k < len(sell_idx) else n - 1
+                growth[j] *= close[exit_, j] / close[entry, j] * (1 - cost)
+                trades[j] += 1
+                pos = exit_ + 1
+    if flat:
+        return float(growth[0]), int(trades[0])
+    return growth, trades
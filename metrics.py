@@ -0,0 +1,422 @@
+# -*- coding: utf-8 -*-
+"""
+进程内性能指标：路由延迟直方图、分阶段耗时、缓存命中率和上游错误计数
+
+- /metrics 以 Prometheus 文本格式导出
+- 请求带 ?server_timing=1（或环境变量 SERVER_TIMING=1）时，在响应的 Server-Timing
+  头中返回本次请求各阶段耗时，便于在浏览器开发者工具中查看
+
+多 worker 部署时每次抓取只会落到其中一个 worker，各 worker 单独导出的计数会来回跳变。serve.py 在多 worker 时
+调用 enable_multiprocess 指定共享目录：各 worker 每 METRICS_FLUSH_INTERVAL 秒（以及被抓取时）把本进程的指标
+写入 <目录>/metrics_<pid>.json，/metrics 汇总目录下所有文件——计数器和直方图按标签求和（已退出 worker 的文件保留，
+总数不会回退），瞬时值加 pid 标签逐进程导出（worker 退出后删除）。未启用时只导出本进程的指标，仅适用于单 worker。
+"""
+
+import atexit
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# 延迟直方图的桶边界（秒）
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+SERVER_TIMING_ENABLED = os.environ.get('SERVER_TIMING', '').lower() in ('1', 'true')
+
+# 当前请求的阶段耗时列表 [(阶段名, 秒), ...]；线程与协程各自独立
+_request_timings = ContextVar('request_timings', default=None)
+
+_lock = threading.Lock()
+
+# 多进程汇总：写入间隔（秒）；state 为共享目录和当前进程的写入线程
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5))
+_multiprocess = {'dir': None, 'pid': None, 'thread': None}
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{escaped}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+class Counter:
+    """带标签的计数器"""
+
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.values = {}
+
+    def inc(self, *label_values, amount=1):
+        with _lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def get(self, *label_values):
+        return self.values.get(label_values, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        with _lock:
+            items = sorted(self.values.items())
+        for label_values, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {value}")
+        return lines
+
+
+class Gauge:
+    """带标签的瞬时值"""
+
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.values = {}
+
+    def set(self, value, *label_values):
+        with _lock:
+            self.values[label_values] = value
+
+    def get(self, *label_values):
+        return self.values.get(label_values)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} gauge"]
+        with _lock:
+            items = sorted(self.values.items())
+        for label_values, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {value:.6f}")
+        return lines
+
+
+class Histogram:
+    """带标签的直方图（累计桶）"""
+
+    def __init__(self, name, description, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # {标签值: [各桶计数..., 总和, 总数]}
+        self.values = {}
+
+    def observe(self, value, *label_values):
+        with _lock:
+            state = self.values.get(label_values)
+            if state is None:
+                state = [0] * (len(self.buckets) + 2)
+                self.values[label_values] = state
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with _lock:
+            items = sorted((k, list(v)) for k, v in self.values.items())
+        bucket_labels = self.labels + ('le',)
+        for label_values, state in items:
+            for bound, count in zip(self.buckets, state):
+                lines.append(f"{self.name}_bucket{_format_labels(bucket_labels, label_values + (bound,))} {count}")
+            lines.append(f"{self.name}_bucket{_format_labels(bucket_labels, label_values + ('+Inf',))} {state[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, label_values)} {state[-2]:.6f}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, label_values)} {state[-1]}")
+        return lines
+
+
+REQUEST_LATENCY = Histogram(
+    'stock_http_request_duration_seconds', '按路由统计的请求耗时', ('route', 'method', 'status'))
+STAGE_LATENCY = Histogram(
+    'stock_stage_duration_seconds', '请求内各阶段耗时（索引查找、读文件、合并排序、聚合、序列化、上游抓取）', ('stage',))
+CACHE_REQUESTS = Counter(
+    'stock_cache_requests_total', '缓存访问次数', ('cache', 'result'))
+UPSTREAM_REQUESTS = Counter(
+    'stock_upstream_requests_total', '上游接口调用次数', ('upstream',))
+UPSTREAM_ERRORS = Counter(
+    'stock_upstream_errors_total', '上游接口调用失败次数', ('upstream',))
+
+STARTUP_SECONDS = Gauge(
+    'stock_startup_seconds', '启动各阶段耗时（模块导入、预热各阶段、按需导入的重型依赖）', ('phase',))
+UPSTREAM_REJECTED = Counter(
+    'stock_upstream_rejected_total', '上游保护拒绝或中断的调用次数（熔断、限流、超时）', ('upstream', 'reason'))
+UPSTREAM_BREAKER_STATE = Gauge(
+    'stock_upstream_breaker_state', '上游熔断器状态（0 关闭，1 半开，2 打开）', ('upstream',))
+UPSTREAM_TIMEOUT = Gauge(
+    'stock_upstream_timeout_seconds', '上游调用当前的自适应超时', ('upstream', 'operation'))
+QUOTE_STREAM = Gauge(
+    'stock_quote_stream', '行情推送当前状态（连接数、订阅股票数）', ('kind',))
+
+REGISTRY = [REQUEST_LATENCY, STAGE_LATENCY, CACHE_REQUESTS, UPSTREAM_REQUESTS, UPSTREAM_ERRORS, UPSTREAM_REJECTED,
+            UPSTREAM_BREAKER_STATE, UPSTREAM_TIMEOUT, STARTUP_SECONDS, QUOTE_STREAM]
+
+
+# ---------------------------------------------------------------- 多进程汇总
+
+def _metrics_file(directory, pid):
+    return os.path.join(directory, f'metrics_{pid}.json')
+
+
+def enable_multiprocess(directory):
+    """主进程 fork worker 之前调用：指定共享目录并清除上次运行留下的文件"""
+    os.makedirs(directory, exist_ok=True)
+    for path in glob.glob(os.path.join(directory, 'metrics_*.json')):
+        os.remove(path)
+    _multiprocess['dir'] = directory
+
+
+def multiprocess_enabled():
+    return _multiprocess['dir'] is not None
+
+
+def _write_state(directory, pid, state):
+    """先写临时文件再替换，抓取时不会读到写了一半的文件"""
+    fd, tmp_path = tempfile.mkstemp(prefix='.tmp_', dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, _metrics_file(directory, pid))
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def flush():
+    """把本进程的指标写入共享目录，未启用多进程汇总时不做任何事"""
+    directory = _multiprocess['dir']
+    if directory is None:
+        return
+    with _lock:
+        state = {
+            'pid': os.getpid(),
+            'metrics': {metric.name: [[list(k), v] for k, v in metric.values.items()] for metric in REGISTRY},
+        }
+    _write_state(directory, os.getpid(), state)
+
+
+def _flush_loop():
+    while True:
+        time.sleep(METRICS_FLUSH_INTERVAL)
+        try:
+            flush()
+        except OSError as e:
+            print(f"写入指标文件失败: {e}")
+
+
+def child_init():
+    """
+    worker fork 之后调用：清空从主进程继承的计数器和直方图（主进程自己的文件里已有这部分），
+    启动定期写入线程，退出时再写一次
+    """
+    if _multiprocess['dir'] is None or _multiprocess['pid'] == os.getpid():
+        return
+    with _lock:
+        for metric in REGISTRY:
+            if not isinstance(metric, Gauge):
+                metric.values.clear()
+    _multiprocess['pid'] = os.getpid()
+    thread = threading.Thread(target=_flush_loop, name='metrics-flush', daemon=True)
+    _multiprocess['thread'] = thread
+    thread.start()
+    atexit.register(flush)
+
+
+def mark_process_dead(pid):
+    """worker 退出后由主进程调用：保留其计数器和直方图，删除瞬时值"""
+    directory = _multiprocess['dir']
+    if directory is None:
+        return
+    try:
+        with open(_metrics_file(directory, pid), encoding='utf-8') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return
+    gauges = {metric.name for metric in REGISTRY if isinstance(metric, Gauge)}
+    state['metrics'] = {name: values for name, values in state['metrics'].items() if name not in gauges}
+    _write_state(directory, pid, state)
+
+
+def _aggregated_registry():
+    """汇总共享目录中各进程的指标，返回与 REGISTRY 对应的指标对象列表（瞬时值增加 pid 标签）"""
+    states = []
+    for path in glob.glob(os.path.join(_multiprocess['dir'], 'metrics_*.json')):
+        try:
+            with open(path, encoding='utf-8') as f:
+                states.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    registry = []
+    for metric in REGISTRY:
+        if isinstance(metric, Gauge):
+            merged = Gauge(metric.name, metric.description, metric.labels + ('pid',))
+        elif isinstance(metric, Histogram):
+            merged = Histogram(metric.name, metric.description, metric.labels, metric.buckets)
+        else:
+            merged = Counter(metric.name, metric.description, metric.labels)
+        for state in states:
+            for labels, value in state['metrics'].get(metric.name, []):
+                key = tuple(labels)
+                if isinstance(metric, Gauge):
+                    merged.values[key + (state['pid'],)] = value
+                elif isinstance(metric, Histogram):
+                    current = merged.values.get(key)
+                    merged.values[key] = value if current is None else [a + b for a, b in zip(current, value)]
+                else:
+                    merged.values[key] = merged.values.get(key, 0) + value
+        registry.append(merged)
+    return registry
+
+
+@contextmanager
+def stage(name):
+    """
+    统计一个处理阶段的耗时，同时记入全局直方图和当前请求的 Server-Timing
+    用法: with metrics.stage('file_read'): ...
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_LATENCY.observe(elapsed, name)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.append((name, elapsed))
+
+
+def record_cache(cache, hit):
+    """记录一次缓存访问（命中/未命中）"""
+    CACHE_REQUESTS.inc(cache, 'hit' if hit else 'miss')
+
+
+def record_startup(phase, seconds):
+    """记录启动阶段耗时（秒）"""
+    STARTUP_SECONDS.set(seconds, phase)
+
+
+def record_quote_stream(subscribers, symbols):
+    """记录行情推送的连接数和订阅的不同股票数"""
+    QUOTE_STREAM.set(subscribers, 'subscribers')
+    QUOTE_STREAM.set(symbols, 'symbols')
+
+
+@contextmanager
+def upstream(name):
+    """
+    统计一次上游调用：计入调用次数、upstream_fetch 阶段耗时，抛出异常时计入错误次数
+    调用方自行判断的失败（如返回空数据）可再调用 record_upstream_error
+    """
+    UPSTREAM_REQUESTS.inc(name)
+    try:
+        with stage(f'upstream_{name}'):
+            yield
+    except Exception:
+        UPSTREAM_ERRORS.inc(name)
+        raise
+
+
+def record_upstream_error(name):
+    UPSTREAM_ERRORS.inc(name)
+
+
+def record_upstream_rejected(name, reason):
+    UPSTREAM_REJECTED.inc(name, reason)
+
+
+def record_breaker_state(name, state):
+    UPSTREAM_BREAKER_STATE.set(state, name)
+
+
+def record_upstream_timeout(name, operation, seconds):
+    UPSTREAM_TIMEOUT.set(seconds, name, operation)
+
+
+def begin_request():
+    """开始统计一个请求，返回 (开始时间, contextvar token)"""
+    return time.perf_counter(), _request_timings.set([])
+
+
+def end_request(started, token, route, method, status):
+    """结束请求统计，返回本次请求的阶段耗时列表"""
+    REQUEST_LATENCY.observe(time.perf_counter() - started, route, method, str(status))
+    timings = _request_timings.get() or []
+    _request_timings.reset(token)
+    return timings
+
+
+def format_server_timing(timings, total=None):
+    """将阶段耗时格式化为 Server-Timing 头（毫秒，同名阶段累加）"""
+    merged = {}
+    for name, seconds in timings:
+        merged[name] = merged.get(name, 0.0) + seconds
+    parts = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in merged.items()]
+    if total is not None:
+        parts.append(f"total;dur={total * 1000:.2f}")
+    return ', '.join(parts)
+
+
+def render_prometheus():
+    """
+    以 Prometheus 文本格式导出所有指标，附带由计数器推算的缓存命中率
+    启用多进程汇总时先写入本进程的指标，再导出所有进程的汇总
+    """
+    registry = REGISTRY
+    if multiprocess_enabled():
+        flush()
+        registry = _aggregated_registry()
+    cache_requests = registry[REGISTRY.index(CACHE_REQUESTS)]
+
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+
+    lines.append("# HELP stock_cache_hit_ratio 缓存命中率")
+    lines.append("# TYPE stock_cache_hit_ratio gauge")
+    with _lock:
+        caches = sorted({cache for cache, _ in cache_requests.values})
+    for cache in caches:
+        hits = cache_requests.get(cache, 'hit')
+        total = hits + cache_requests.get(cache, 'miss')
+        ratio = hits / total if total else 0.0
+        lines.append(f"stock_cache_hit_ratio{_format_labels(('cache',), (cache,))} {ratio:.4f}")
+    return '\n'.join(lines) + '\n'
+
+
+def server_timing_requested(args):
+    return SERVER_TIMING_ENABLED or args.get('server_timing', '').lower() in ('1', 'true')
+
+
+def init_app(app):
+    """为 Flask 应用注册请求计时钩子和 /metrics 路由"""
+    from flask import Response, g, request
+
+    @app.before_request
+    def _metrics_begin():
+        g._metrics_started, g._metrics_token = begin_request()
+
+    @app.after_request
+    def _metrics_end(response):
+        started = g.pop('_metrics_started', None)
+        if started is None:
+            return response
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        timings = end_request(started, g.pop('_metrics_token'), route, request.method, response.status_code)
+        if server_timing_requested(request.args):
+            response.headers['Server-Timing'] = format_server_timing(timings, time.perf_counter() - started)
+        return response
+
+    @app.route('/metrics')
+    def prometheus_metrics():
+        return Response(render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+    return app
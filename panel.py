@@ -0,0 +1,581 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+日期 × 股票 对齐的内存映射面板
+
+把本地日线 data/<年份>_by_day/*.csv 和远程缓存 data/remote_cache/<代码>_raw.csv 对齐为每个字段一个矩阵：
+    data/panel/meta.json     股票列表（列顺序）、字段、行数、列容量
+    data/panel/calendar.i32  交易日历（自 1970-01-01 起的天数，升序，所有股票交易日的并集）
+    data/panel/<字段>.bin    行 = 交易日，列 = 股票，C 顺序，无数据（停牌/未上市）的位置为 NaN
+价格为不复权价；factor 字段为前向填充的后复权因子（无因子文件的股票为 1），adjusted() 按需计算前/后复权。
+
+- 打开面板只读取 meta.json 并建立内存映射，字段数组是文件页的只读视图，不复制数据
+- 矩阵按行存储，追加新交易日只在文件末尾写入新行，历史部分不重写；
+  列按容量预留，新增股票占用空闲列，超出容量时才重建
+- meta.json 最后原子写入，读者只看到 meta 中记录的行数，追加过程中打开的面板也是一致的
+
+用法:
+    python3 panel.py build [--slack 0.25]
+    python3 panel.py append
+    python3 panel.py info
+"""
+
+import argparse
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import bar_archive
+from adjustment import bar_factors, load_adjust_factors
+from atomic_file import write_atomic
+from bars import days_from_datetimes
+
+PANEL_VERSION = 1
+
+DATA_DIR = 'data'
+PANEL_DIR = os.path.join(DATA_DIR, 'panel')
+REMOTE_CACHE_SUFFIX = '_raw.csv'
+
+# 日线字段与存储类型：价格和因子用 float32，成交量/额用 float64 避免大数值丢失精度
+BAR_FIELDS = ('open', 'high', 'low', 'close', 'vol', 'amount')
+PRICE_FIELDS = ('open', 'high', 'low', 'close')
+FIELD_DTYPES = {
+    'open': np.float32,
+    'high': np.float32,
+    'low': np.float32,
+    'close': np.float32,
+    'vol': np.float64,
+    'amount': np.float64,
+    'factor': np.float32,
+}
+FIELDS = tuple(FIELD_DTYPES)
+
+# 列容量：股票数 * (1 + SYMBOL_SLACK)，且至少预留 MIN_FREE_COLUMNS 个空闲列
+SYMBOL_SLACK = 0.25
+MIN_FREE_COLUMNS = 64
+
+META_FILE = 'meta.json'
+CALENDAR_FILE = 'calendar.i32'
+
+
+class PanelCapacityError(Exception):
+    """新增股票超出面板列容量，需要重建"""
+
+
+def field_file(panel_dir, field):
+    return os.path.join(panel_dir, f"{field}.bin")
+
+
+def read_meta(panel_dir=PANEL_DIR):
+    with open(os.path.join(panel_dir, META_FILE), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def write_meta(panel_dir, meta):
+    """原子写入 meta.json（读者以它为准，必须在数据文件写完之后调用）"""
+    write_atomic(os.path.join(panel_dir, META_FILE), lambda f: json.dump(meta, f, ensure_ascii=False),
+                 binary=False, prefix='.meta_', suffix='.json', fsync=True)
+
+
+def read_csv_batch(paths, usecols):
+    """
+    批量读取大量小 CSV：表头相同的文件拼接后一次解析，避免逐个 read_csv 的固定开销
+    paths: [(键, 文件路径), ...]，返回带 code 列（即传入的键）的长表
+    """
+    groups = {}
+    for code, path in paths:
+        text = bar_archive.read_bytes(path).decode('utf-8')
+        split = text.find('\n') + 1 or len(text)
+        header, body = text[:split], text[split:].strip('\n')
+        if body:
+            groups.setdefault(header, []).append((code, body))
+
+    frames = []
+    for header, items in groups.items():
+        bodies = [body for _, body in items]
+        counts = [body.count('\n') + 1 for body in bodies]
+        df = pd.read_csv(io.StringIO(header + '\n'.join(bodies)), usecols=usecols)
+        if len(df) == sum(counts):
+            df['code'] = np.repeat([code for code, _ in items], counts)
+        else:
+            # 文件中有空行等导致行数对不上时逐个读取
+            df = pd.concat(
+                [pd.read_csv(io.StringIO(header + body), usecols=usecols).assign(code=code) for code, body in items],
+                ignore_index=True
+            )
+        frames.append(df)
+    if not frames:
+        return pd.DataFrame(columns=list(usecols) + ['code'])
+    return pd.concat(frames, ignore_index=True)
+
+
+def list_sources(data_dir=DATA_DIR):
+    """
+    列出日线文件，返回 [(股票代码, 路径, mtime_ns), ...]
+    本地年份（目录或 bar_archive 归档）按年份升序在前、远程缓存在后，同一股票同一日期以先出现的为准（与接口的合并顺序一致）
+    """
+    sources = []
+    if not os.path.isdir(data_dir):
+        return sources
+    for y_dir in bar_archive.year_dirs(data_dir):
+        sources.extend((name[:-4], path, mtime_ns)
+                       for name, path, mtime_ns in bar_archive.list_year(os.path.join(data_dir, y_dir)))
+    remote_dir = os.path.join(data_dir, 'remote_cache')
+    if os.path.isdir(remote_dir):
+        with os.scandir(remote_dir) as it:
+            entries = sorted((e for e in it if e.name.endswith(REMOTE_CACHE_SUFFIX)), key=lambda e: e.name)
+        sources.extend((e.name[:-len(REMOTE_CACHE_SUFFIX)], e.path, e.stat().st_mtime_ns) for e in entries)
+    return sources
+
+
+def read_sources(sources):
+    """
+    读取日线文件为长表：code, day(int32 天数), 各字段；同一股票同一日期保留先出现的文件中的一条
+    """
+    long = read_csv_batch([(i, path) for i, (_, path, _) in enumerate(sources)], ['trade_time'] + list(BAR_FIELDS))
+    if long.empty:
+        return pd.DataFrame(columns=['code', 'day'] + list(BAR_FIELDS))
+    order = long.pop('code').to_numpy()
+    long['code'] = np.asarray([code for code, _, _ in sources], dtype=object)[order]
+    long['day'] = days_from_datetimes(long.pop('trade_time'))
+    long['source'] = order
+    long = long.sort_values('source', kind='stable').drop_duplicates(subset=['code', 'day'], keep='first')
+    return long.drop(columns='source')
+
+
+def symbol_capacity(count, slack=SYMBOL_SLACK):
+    return max(int(np.ceil(count * (1 + slack))), count + MIN_FREE_COLUMNS)
+
+
+def factor_column(factor_dir, code, days):
+    """某只股票在给定交易日上的后复权因子，没有因子文件时返回 None"""
+    factors = load_adjust_factors(factor_dir, code) if factor_dir else None
+    if factors is None or factors.empty:
+        return None
+    return bar_factors(days.astype('datetime64[D]'), factors, 'hfq')
+
+
+def factor_mtime(factor_dir, code):
+    try:
+        return os.stat(os.path.join(factor_dir, f"{code}.csv")).st_mtime_ns
+    except OSError:
+        return 0
+
+
+def build_panel(data_dir=DATA_DIR, panel_dir=None, slack=SYMBOL_SLACK):
+    """
+    从全部日线文件重建面板（写入临时目录后整体替换，已打开的旧面板不受影响）
+    返回统计信息
+    """
+    panel_dir = panel_dir or os.path.join(data_dir, 'panel')
+    factor_dir = os.path.join(data_dir, 'adj_factors')
+    start = time.perf_counter()
+    scanned_at = time.time_ns()
+    sources = list_sources(data_dir)
+    long = read_sources(sources)
+
+    symbols = sorted(set(long['code']))
+    capacity = symbol_capacity(len(symbols), slack)
+    calendar = np.unique(long['day'].to_numpy(dtype=np.int32))
+    rows = np.searchsorted(calendar, long['day'].to_numpy(dtype=np.int32))
+    column_of = {code: i for i, code in enumerate(symbols)}
+    cols = long['code'].map(column_of).to_numpy(dtype=np.int64)
+
+    parent = os.path.dirname(os.path.abspath(panel_dir))
+    os.makedirs(parent, exist_ok=True)
+    build_dir = tempfile.mkdtemp(prefix='.panel_build_', dir=parent)
+    try:
+        os.chmod(build_dir, 0o755)
+        calendar.astype(np.int32).tofile(os.path.join(build_dir, CALENDAR_FILE))
+        for field in BAR_FIELDS:
+            matrix = np.full((len(calendar), capacity), np.nan, dtype=FIELD_DTYPES[field])
+            matrix[rows, cols] = long[field].to_numpy(dtype=np.float64)
+            matrix.tofile(field_file(build_dir, field))
+            del matrix
+
+        factors = np.ones((len(calendar), capacity), dtype=FIELD_DTYPES['factor'])
+        factor_times = {}
+        for code, col in column_of.items():
+            values = factor_column(factor_dir, code, calendar)
+            if values is not None:
+                factors[:, col] = values
+                factor_times[code] = factor_mtime(factor_dir, code)
+        factors.tofile(field_file(build_dir, 'factor'))
+        del factors
+
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        write_meta(build_dir, {
+            'version': PANEL_VERSION,
+            'symbols': symbols,
+            'fields': list(FIELDS),
+            'dtypes': {field: np.dtype(dtype).name for field, dtype in FIELD_DTYPES.items()},
+            'rows': int(len(calendar)),
+            'capacity': int(capacity),
+            'source_mtime_ns': scanned_at,
+            'factor_mtime_ns': factor_times,
+            'built_at': now,
+            'updated_at': now,
+        })
+
+        # 整体替换：先移走旧目录再改名，最后删除旧目录（已建立的内存映射仍指向旧文件）
+        old_dir = None
+        if os.path.exists(panel_dir):
+            old_dir = tempfile.mkdtemp(prefix='.panel_old_', dir=parent)
+            os.rmdir(old_dir)
+            os.replace(panel_dir, old_dir)
+        os.replace(build_dir, panel_dir)
+        if old_dir:
+            shutil.rmtree(old_dir, ignore_errors=True)
+    except BaseException:
+        shutil.rmtree(build_dir, ignore_errors=True)
+        raise
+
+    return {
+        'action': 'build',
+        'symbols': len(symbols),
+        'capacity': int(capacity),
+        'rows': int(len(calendar)),
+        'files': len(sources),
+        'elapsed': time.perf_counter() - start,
+    }
+
+
+def _append_rows(path, block, rows_before, row_bytes):
+    """截掉上次中断时残留的尾部后，在文件末尾追加新行"""
+    with open(path, 'r+b') as f:
+        f.truncate(rows_before * row_bytes)
+        f.seek(0, os.SEEK_END)
+        f.write(block.tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def append_panel(data_dir=DATA_DIR, panel_dir=None, rebuild_if_full=True):
+    """
+    增量更新面板：只读取上次更新后修改过的日线文件
+    - 晚于面板最后交易日的 K 线追加为新行（所有字段文件只在末尾写入）
+    - 新股票占用空闲列；文件有变化的股票（新股票、补数或完整性修复）按全部来源文件重写已有交易日上的整列
+      （只写这些列，不改动其他股票），文件中删除的 K 线在面板中也变为 NaN
+    - 因子文件有变化的股票原地重写 factor 列
+    早于最后交易日且不在交易日历中的 K 线无法追加，计入 dropped，这些股票记入 meta 的 incomplete（视为过期），需要 build 重建
+    列容量不足时 rebuild_if_full 为 True 则自动重建，否则抛出 PanelCapacityError
+    """
+    panel_dir = panel_dir or os.path.join(data_dir, 'panel')
+    factor_dir = os.path.join(data_dir, 'adj_factors')
+    if not os.path.exists(os.path.join(panel_dir, META_FILE)):
+        return build_panel(data_dir, panel_dir)
+
+    start = time.perf_counter()
+    meta = read_meta(panel_dir)
+    rows_before, capacity = meta['rows'], meta['capacity']
+    symbols = list(meta['symbols'])
+    column_of = {code: i for i, code in enumerate(symbols)}
+    calendar = np.fromfile(os.path.join(panel_dir, CALENDAR_FILE), dtype=np.int32, count=rows_before)
+    last_day = int(calendar[-1]) if rows_before else np.iinfo(np.int32).min
+
+    scanned_at = time.time_ns()
+    sources = list_sources(data_dir)
+    changed_codes = {code for code, _, mtime in sources if mtime > meta['source_mtime_ns']}
+    new_codes = sorted(code for code in changed_codes if code not in column_of)
+    if len(symbols) + len(new_codes) > capacity:
+        if not rebuild_if_full:
+            raise PanelCapacityError(f'面板列容量 {capacity} 不足，新增 {len(new_codes)} 只股票需要重建')
+        return build_panel(data_dir, panel_dir)
+
+    # 变化的股票读取全部来源文件，保证同一日期仍按文件优先级去重
+    long = read_sources([s for s in sources if s[0] in changed_codes])
+    for code in new_codes:
+        column_of[code] = len(symbols)
+        symbols.append(code)
+    days = long['day'].to_numpy(dtype=np.int32)
+    cols = long['code'].map(column_of).to_numpy(dtype=np.int64)
+    changed_cols = np.array(sorted(column_of[code] for code in changed_codes), dtype=np.int64)
+
+    # 新交易日
+    tail_mask = days > last_day
+    new_days = np.unique(days[tail_mask])
+    # 变化的股票在已有交易日上的历史
+    history_rows = np.minimum(np.searchsorted(calendar, days), max(rows_before - 1, 0))
+    in_calendar = calendar[history_rows] == days if rows_before else np.zeros(len(days), dtype=bool)
+    history_mask = ~tail_mask & in_calendar
+    dropped_mask = ~tail_mask & ~in_calendar
+    dropped = int(dropped_mask.sum())
+    incomplete = sorted(set(meta.get('incomplete', [])) | set(long['code'].to_numpy()[dropped_mask]))
+
+    for field in FIELDS:
+        dtype = np.dtype(FIELD_DTYPES[field])
+        path = field_file(panel_dir, field)
+        if field == 'factor':
+            if rows_before:
+                last_row = np.fromfile(path, dtype=dtype, count=capacity, offset=(rows_before - 1) * capacity * dtype.itemsize)
+            else:
+                last_row = np.ones(capacity, dtype=dtype)
+            block = np.repeat(last_row[None, :], len(new_days), axis=0)
+        else:
+            block = np.full((len(new_days), capacity), np.nan, dtype=dtype)
+            block[np.searchsorted(new_days, days[tail_mask]), cols[tail_mask]] = long[field].to_numpy(dtype=np.float64)[tail_mask]
+        _append_rows(path, block, rows_before, capacity * dtype.itemsize)
+
+        if field != 'factor' and rows_before and len(changed_cols):
+            matrix = np.memmap(path, dtype=dtype, mode='r+', shape=(rows_before, capacity))
+            matrix[:, changed_cols] = np.nan
+            matrix[history_rows[history_mask], cols[history_mask]] = long[field].to_numpy(dtype=np.float64)[history_mask]
+            matrix.flush()
+            del matrix
+    _append_rows(os.path.join(panel_dir, CALENDAR_FILE), new_days.astype(np.int32), rows_before, 4)
+
+    # 因子文件有变化（或新股票）的列整列重写
+    rows_after = rows_before + len(new_days)
+    full_calendar = np.concatenate([calendar, new_days]).astype(np.int32)
+    factor_times = dict(meta.get('factor_mtime_ns', {}))
+    refreshed = []
+    for code in symbols:
+        mtime = factor_mtime(factor_dir, code)
+        if mtime and mtime != factor_times.get(code):
+            refreshed.append(code)
+            factor_times[code] = mtime
+    if refreshed and rows_after:
+        dtype = FIELD_DTYPES['factor']
+        matrix = np.memmap(field_file(panel_dir, 'factor'), dtype=dtype, mode='r+', shape=(rows_after, capacity))
+        for code in refreshed:
+            values = factor_column(factor_dir, code, full_calendar)
+            if values is not None:
+                matrix[:, column_of[code]] = values
+        matrix.flush()
+        del matrix
+
+    meta.update(
+        symbols=symbols,
+        rows=int(rows_after),
+        source_mtime_ns=scanned_at,
+        factor_mtime_ns=factor_times,
+        incomplete=incomplete,
+        updated_at=datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+    )
+    write_meta(panel_dir, meta)
+    return {
+        'action': 'append',
+        'new_rows': int(len(new_days)),
+        'new_symbols': len(new_codes),
+        'changed_symbols': len(changed_codes),
+        'refreshed_factors': len(refreshed),
+        'dropped': dropped,
+        'rows': int(rows_after),
+        'symbols': len(symbols),
+        'capacity': int(capacity),
+        'elapsed': time.perf_counter() - start,
+    }
+
+
+class Panel:
+    """
+    只读面板：字段数组为内存映射文件的视图（形状 行数 × 股票数），打开与取字段都不复制数据
+    """
+
+    def __init__(self, panel_dir, meta):
+        self.panel_dir = panel_dir
+        self.meta = meta
+        self.symbols = list(meta['symbols'])
+        self.rows = int(meta['rows'])
+        self.capacity = int(meta['capacity'])
+        self.column_of = {code: i for i, code in enumerate(self.symbols)}
+        self.calendar = self._map(os.path.join(panel_dir, CALENDAR_FILE), np.int32, (self.rows,))
+        self._fields = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def open(cls, panel_dir=PANEL_DIR):
+        return cls(panel_dir, read_meta(panel_dir))
+
+    @staticmethod
+    def _map(path, dtype, shape):
+        if int(np.prod(shape)) == 0:
+            return np.empty(shape, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode='r', shape=shape)
+
+    @property
+    def fields(self):
+        return tuple(self.meta['fields'])
+
+    def dates(self):
+        return self.calendar.astype('datetime64[D]')
+
+    def index(self, lo=0, hi=None):
+        return pd.DatetimeIndex(self.calendar[lo:hi].astype('datetime64[D]').astype('datetime64[ns]'), name='trade_time')
+
+    def field(self, name):
+        """字段矩阵（行数 × 股票数）的只读视图"""
+        with self._lock:
+            matrix = self._fields.get(name)
+            if matrix is None:
+                matrix = self._map(field_file(self.panel_dir, name), FIELD_DTYPES[name], (self.rows, self.capacity))
+                self._fields[name] = matrix
+        return matrix[:, :len(self.symbols)]
+
+    def row_range(self, start=None, end=None):
+        """日期区间（含两端）对应的行切片"""
+        lo = 0 if start is None else int(np.searchsorted(self.calendar, days_from_datetimes([start])[0], side='left'))
+        hi = self.rows if end is None else int(np.searchsorted(self.calendar, days_from_datetimes([end])[0], side='right'))
+        return slice(lo, hi)
+
+    def columns(self, codes):
+        """股票代码 -> 列下标数组，不在面板中的代码被忽略"""
+        return np.asarray([self.column_of[c] for c in codes if c in self.column_of], dtype=np.int64)
+
+    def adjusted(self, name, mode='qfq'):
+        """复权价格矩阵（新数组）：hfq = 价格 * 因子，qfq = 价格 * 因子 / 最新因子"""
+        values = self.field(name)
+        if mode == 'none':
+            return values
+        factors = self.field('factor')
+        out = values * factors
+        if mode == 'qfq' and self.rows:
+            out /= factors[-1]
+        return out
+
+    def frame(self, name, codes=None, start=None, end=None, adjust='none'):
+        """
+        单个字段的 DataFrame(index=交易日, columns=股票代码)
+        不指定 codes 且不复权时直接包装内存映射视图（不复制）；选取部分股票会复制所选的列
+        """
+        rows = self.row_range(start, end)
+        values = self.field(name) if adjust == 'none' or name not in PRICE_FIELDS else self.adjusted(name, adjust)
+        columns = self.symbols
+        if codes is not None:
+            cols = self.columns(codes)
+            values = values[rows][:, cols]
+            columns = [self.symbols[i] for i in cols]
+        else:
+            values = values[rows]
+        return pd.DataFrame(values, index=self.index(rows.start, rows.stop), columns=columns, copy=False)
+
+    def frames(self, fields, codes=None, start=None, end=None, dropna=True):
+        """
+        多个字段的宽表 {字段: DataFrame}，数值转为 float64（价格按 4 位小数还原 float32 的舍入）
+        dropna 为 True 时去掉区间内没有任何收盘价的交易日和股票（与逐文件加载的结果一致）
+        """
+        rows = self.row_range(start, end)
+        cols = self.columns(codes) if codes is not None else np.arange(len(self.symbols))
+        close = self.field('close')[rows][:, cols]
+        present = ~np.isnan(close)
+        keep_rows = present.any(axis=1) if dropna else np.ones(close.shape[0], dtype=bool)
+        keep_cols = present.any(axis=0) if dropna else np.ones(close.shape[1], dtype=bool)
+        cols = cols[keep_cols]
+        index = self.index(rows.start, rows.stop)[keep_rows]
+        columns = [self.symbols[i] for i in cols]
+        result = {}
+        for field in fields:
+            values = self.field(field)[rows][keep_rows][:, cols].astype(np.float64)
+            if field in PRICE_FIELDS:
+                values = np.round(values, 4)
+            result[field] = pd.DataFrame(values, index=index, columns=columns, copy=False)
+        return result
+
+
+# 已打开的面板：{目录: (meta 签名, Panel)}，meta.json 变化（追加/重建）后重新打开
+_OPEN_PANELS = {}
+_OPEN_LOCK = threading.Lock()
+
+
+def open_panel(panel_dir=PANEL_DIR):
+    """打开（并缓存）面板，不存在时返回 None"""
+    try:
+        st = os.stat(os.path.join(panel_dir, META_FILE))
+    except OSError:
+        return None
+    signature = (st.st_mtime_ns, st.st_size)
+    with _OPEN_LOCK:
+        cached = _OPEN_PANELS.get(panel_dir)
+        if cached and cached[0] == signature:
+            return cached[1]
+    panel = Panel.open(panel_dir)
+    with _OPEN_LOCK:
+        _OPEN_PANELS[panel_dir] = (signature, panel)
+    return panel
+
+
+# 面板是否过期的检查结果：{(面板目录, 数据目录): (检查时间, 面板更新时间, 过期代码集合)}
+_STALE_CHECKS = {}
+PANEL_STALE_CHECK_TTL = float(os.environ.get('PANEL_STALE_CHECK_TTL', 5))
+
+
+def stale_codes(panel, data_dir=DATA_DIR, max_age=0):
+    """
+    面板上次构建/追加之后有变化的股票：日线文件（含新增文件）晚于面板扫描时间，或因子文件与面板记录的不同，
+    以及 append 时有 K 线无法写入的股票（meta 的 incomplete，build 后清除）
+    这些股票从面板读取会缺少数据，调用方应改为读取日线文件（或先运行 append / build）
+    max_age > 0 时在该秒数内复用上次的结果（接口按请求调用）
+    """
+    key = (panel.panel_dir, data_dir)
+    cached = _STALE_CHECKS.get(key)
+    now = time.monotonic()
+    if max_age > 0 and cached and cached[1] == panel.meta.get('updated_at') and now - cached[0] < max_age:
+        return cached[2]
+    since = panel.meta.get('source_mtime_ns', 0)
+    codes = {code for code, _, mtime in list_sources(data_dir) if mtime > since}
+    codes.update(panel.meta.get('incomplete', []))
+    factor_times = panel.meta.get('factor_mtime_ns', {})
+    factor_dir = os.path.join(data_dir, 'adj_factors')
+    if os.path.isdir(factor_dir):
+        with os.scandir(factor_dir) as it:
+            for entry in it:
+                if entry.name.endswith('.csv') and entry.stat().st_mtime_ns != factor_times.get(entry.name[:-4]):
+                    codes.add(entry.name[:-4])
+    _STALE_CHECKS[key] = (now, panel.meta.get('updated_at'), codes)
+    return codes
+
+
+def panel_info(panel_dir=PANEL_DIR):
+    start = time.perf_counter()
+    panel = Panel.open(panel_dir)
+    panel.field('close')
+    open_ms = (time.perf_counter() - start) * 1000
+    dates = panel.dates()
+    size = sum(os.path.getsize(os.path.join(panel_dir, name)) for name in os.listdir(panel_dir))
+    return {
+        'rows': panel.rows,
+        'symbols': len(panel.symbols),
+        'capacity': panel.capacity,
+        'start': str(dates[0]) if panel.rows else None,
+        'end': str(dates[-1]) if panel.rows else None,
+        'fields': list(panel.fields),
+        'size_mb': round(size / 1024 / 1024, 1),
+        'built_at': panel.meta.get('built_at'),
+        'updated_at': panel.meta.get('updated_at'),
+        'open_ms': round(open_ms, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='日期×股票 内存映射面板')
+    parser.add_argument('command', choices=['build', 'append', 'info'])
+    parser.add_argument('--data-dir', default=DATA_DIR)
+    parser.add_argument('--panel-dir', default=None, help='面板目录（默认 <data-dir>/panel）')
+    parser.add_argument('--slack', type=float, default=SYMBOL_SLACK, help='build 时预留的列容量比例')
+    args = parser.parse_args()
+
+    panel_dir = args.panel_dir or os.path.join(args.data_dir, 'panel')
+    if args.command == 'build':
+        stats = build_panel(args.data_dir, panel_dir, args.slack)
+    elif args.command == 'append':
+        stats = append_panel(args.data_dir, panel_dir)
+    else:
+        if not os.path.exists(os.path.join(panel_dir, META_FILE)):
+            print(f"面板不存在: {panel_dir}，请先运行 build")
+            return 1
+        stats = panel_info(panel_dir)
+    print(json.dumps(stats, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
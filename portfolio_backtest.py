@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+组合回测：在本地日线上同时对多只股票模拟资金分配、交易成本和 A 股 T+1 规则
+
+- 行情按 日期×股票 宽表加载（缺失的日期视为停牌，不可交易）
+- 指标和信号在宽表上一次性计算（复用 backtest_smart_strategy 的 add_indicators 和 rules）
+- 撮合按交易日循环，每一天内对所有股票做向量化运算：先卖后买，按收盘价逐日盯市
+- 成本：佣金（双向，含最低佣金）、印花税（仅卖出）；买入按整手取整
+
+用法:
+    python3 portfolio_backtest.py [--rule 0] [--start 2021-01-01] [--end 2023-12-31]
+                                  [--symbols 000001.SZ,600036.SH] [--capital 1000000]
+                                  [--max-positions 20] [--execution close|next_open] [--equity-out equity.csv]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+import bar_archive
+from backtest_smart_strategy import add_indicators, rules
+from panel import open_panel, read_csv_batch, stale_codes
+
+DATA_DIR = 'data'
+
+# 默认交易成本（A 股）
+COMMISSION_RATE = 0.00025   # 佣金万 2.5，双向收取
+MIN_COMMISSION = 5.0        # 单笔最低佣金（元）
+STAMP_DUTY_RATE = 0.0005    # 印花税，仅卖出收取（2023-08-28 起为万 5）
+LOT_SIZE = 100              # 每手股数
+
+PANEL_FIELDS = ['open', 'high', 'low', 'close', 'vol']
+
+
+def list_symbols(years, data_dir=DATA_DIR):
+    """列出给定年份目录下所有股票代码"""
+    codes = set()
+    for year in years:
+        for name, _, _ in bar_archive.list_year(os.path.join(data_dir, f"{year}_by_day")):
+            codes.add(name[:-4])
+    return sorted(codes)
+
+
+def load_panel(stock_codes=None, start='2021-01-01', end='2023-12-31', data_dir=DATA_DIR, fields=PANEL_FIELDS,
+               use_panel=True):
+    """
+    读取多只股票的日线，返回 {字段: DataFrame(index=日期, columns=股票代码)}
+    stock_codes 为 None 时加载区间内所有股票
+    use_panel 为 True 且已构建面板（python3 panel.py build）时直接从内存映射面板切片，否则逐个读取 CSV；
+    所需股票的文件在面板更新后有变化（面板过期）时也读取 CSV
+    """
+    if use_panel:
+        panel = open_panel(os.path.join(data_dir, 'panel'))
+        if panel is not None:
+            stale = stale_codes(panel, data_dir)
+            if stock_codes is not None:
+                stale = stale & set(stock_codes)
+            if not stale:
+                return panel.frames(fields, stock_codes, start, end)
+            print(f"面板早于 {len(stale)} 只股票的日线/因子文件，改为读取 CSV（运行 python3 panel.py append 或 build 更新面板）")
+
+    start = pd.to_datetime(start)
+    end = pd.to_datetime(end)
+    years = list(range(start.year, end.year + 1))
+    if stock_codes is None:
+        stock_codes = list_symbols(years, data_dir)
+
+    paths = []
+    for code in stock_codes:
+        for year in years:
+            path = bar_archive.resolve(os.path.join(data_dir, f"{year}_by_day", f"{code}.csv"))
+            if path:
+                paths.append((code, path))
+    if not paths:
+        return {field: pd.DataFrame() for field in fields}
+
+    long = read_csv_batch(paths, ['trade_time'] + list(fields))
+    long['trade_time'] = pd.to_datetime(long['trade_time'])
+    long = long[(long['trade_time'] >= start) & (long['trade_time'] <= end)]
+    long = long.drop_duplicates(subset=['trade_time', 'code'], keep='first')
+    wide = long.pivot(index='trade_time', columns='code', values=list(fields)).sort_index()
+    loaded = set(long['code'])
+    codes = [c for c in stock_codes if c in loaded]
+    return {field: wide[field].reindex(columns=codes).astype(float) for field in fields}
+
+
+def compute_signals(panel, rule, buy_window=None, sell_window=None):
+    """
+    在宽表上计算规则的买卖信号，返回 (买入信号, 卖出信号) 两个布尔宽表
+    指标按前向填充的收盘价计算（停牌日沿用最近收盘价）；停牌日不产生信号
+    buy_window / sell_window: (开始日期, 结束日期)，只在窗口内产生对应信号
+    """
+    tradable = panel['close'].notna()
+    data = dict(panel)
+    data['close'] = panel['close'].ffill()
+    add_indicators(data)
+
+    buy = rule['buy'](data).fillna(False).astype(bool) & tradable
+    sell = rule['sell'](data).fillna(False).astype(bool) & tradable
+    for signal, window in ((buy, buy_window), (sell, sell_window)):
+        if window:
+            dates = signal.index
+            outside = (dates < pd.to_datetime(window[0])) | (dates > pd.to_datetime(window[1]))
+            signal.loc[outside] = False
+    return buy, sell
+
+
+def simulate(panel, buy_signal, sell_signal, initial_capital=1000000, max_positions=20, position_size=None,
+             commission_rate=COMMISSION_RATE, min_commission=MIN_COMMISSION, stamp_duty_rate=STAMP_DUTY_RATE,
+             lot_size=LOT_SIZE, t_plus_1=True, execution='close', score=None, liquidate_at_end=True):
+    """
+    组合撮合
+    - execution='close'：按信号当日收盘价成交；'next_open'：按次日开盘价成交（避免使用当日收盘信息）
+    - 每只股票最多持有一笔仓位，持仓数不超过 max_positions
+    - 每笔买入金额为当前净值 * position_size（默认 1 / max_positions），按整手向下取整，现金不足时跳过
+    - t_plus_1：买入当日不能卖出
+    - score：可选的 日期×股票 宽表，同一天候选过多时按分数从高到低买入（默认按代码顺序）
+    返回 {'equity': 净值序列, 'trades': 成交明细, 'summary': 统计指标}
+    """
+    close_df = panel['close']
+    dates = close_df.index
+    codes = np.asarray(close_df.columns)
+    n_days, n_symbols = close_df.shape
+    position_size = position_size or 1.0 / max_positions
+
+    mark = close_df.ffill().fillna(0).to_numpy(dtype=float)
+    tradable = close_df.notna().to_numpy()
+    buy = buy_signal.reindex_like(close_df).fillna(False).to_numpy(dtype=bool)
+    sell = sell_signal.reindex_like(close_df).fillna(False).to_numpy(dtype=bool)
+    if execution == 'next_open':
+        price = panel['open'].to_numpy(dtype=float)
+        tradable = tradable & ~np.isnan(price)
+        # 第 t 天的信号在第 t+1 天开盘执行
+        buy = np.vstack([np.zeros((1, n_symbols), dtype=bool), buy[:-1]])
+        sell = np.vstack([np.zeros((1, n_symbols), dtype=bool), sell[:-1]])
+    else:
+        price = close_df.to_numpy(dtype=float)
+    ranks = None
+    if score is not None:
+        ranks = score.reindex_like(close_df).to_numpy(dtype=float)
+
+    shares = np.zeros(n_symbols, dtype=np.int64)
+    entry_day = np.full(n_symbols, -1, dtype=np.int64)
+    entry_cost = np.zeros(n_symbols)
+    cash = float(initial_capital)
+    equity = np.empty(n_days)
+    trade_parts = []
+
+    for t in range(n_days):
+        px = price[t]
+        can_trade = tradable[t]
+
+        # 卖出
+        held = shares > 0
+        exit_mask = held & can_trade & (sell[t] | (liquidate_at_end and t == n_days - 1))
+        if t_plus_1:
+            exit_mask &= entry_day < t
+        if exit_mask.any():
+            idx = np.flatnonzero(exit_mask)
+            value = shares[idx] * px[idx]
+            fee = np.maximum(value * commission_rate, min_commission) + value * stamp_duty_rate
+            cash += float((value - fee).sum())
+            trade_parts.append(pd.DataFrame({
+                'trade_time': dates[t], 'code': codes[idx], 'side': 'sell', 'price': px[idx],
+                'shares': shares[idx], 'value': value, 'fee': fee,
+                'pnl': value - fee - entry_cost[idx], 'holding_days': t - entry_day[idx],
+            }))
+            shares[idx] = 0
+            entry_day[idx] = -1
+            entry_cost[idx] = 0
+
+        # 买入
+        slots = max_positions - int(np.count_nonzero(shares))
+        candidates = buy[t] & (shares == 0) & can_trade & (px > 0)
+        if liquidate_at_end and t == n_days - 1:
+            candidates[:] = False
+        if slots > 0 and candidates.any():
+            idx = np.flatnonzero(candidates)
+            if ranks is not None:
+                order = np.argsort(-np.nan_to_num(ranks[t, idx], nan=-np.inf), kind='stable')
+                idx = idx[order]
+            idx = idx[:slots]
+            target = (cash + float((shares * mark[t]).sum())) * position_size
+            qty = (np.floor(target / (px[idx] * lot_size * (1 + commission_rate))) * lot_size).astype(np.int64)
+            value = qty * px[idx]
+            fee = np.where(qty > 0, np.maximum(value * commission_rate, min_commission), 0.0)
+            total = value + fee
+            fill = (qty > 0) & (np.cumsum(total) <= cash)
+            if fill.any():
+                idx, qty, value, fee, total = idx[fill], qty[fill], value[fill], fee[fill], total[fill]
+                cash -= float(total.sum())
+                shares[idx] = qty
+                entry_day[idx] = t
+                entry_cost[idx] = total
+                trade_parts.append(pd.DataFrame({
+                    'trade_time': dates[t], 'code': codes[idx], 'side': 'buy', 'price': px[idx],
+                    'shares': qty, 'value': value, 'fee': fee, 'pnl': np.nan, 'holding_days': 0,
+                }))
+
+        equity[t] = cash + float((shares * mark[t]).sum())
+
+    equity = pd.Series(equity, index=dates, name='equity')
+    if trade_parts:
+        trades = pd.concat(trade_parts, ignore_index=True)
+    else:
+        trades = pd.DataFrame(columns=['trade_time', 'code', 'side', 'price', 'shares', 'value', 'fee', 'pnl', 'holding_days'])
+    return {
+        'equity': equity,
+        'trades': trades,
+        'summary': summarize(equity, trades, initial_capital),
+    }
+
+
+def summarize(equity, trades, initial_capital):
+    """根据净值曲线和成交明细计算统计指标"""
+    if equity.empty:
+        return {'total_return': 0.0, 'trades': 0}
+    returns = equity.pct_change().dropna()
+    years = max(len(equity) / 244, 1e-9)
+    final = float(equity.iloc[-1])
+    drawdown = equity / equity.cummax() - 1
+    sells = trades[trades['side'] == 'sell']
+    std = returns.std()
+    return {
+        'initial_capital': float(initial_capital),
+        'final_equity': final,
+        'total_return': (final / initial_capital - 1) * 100,
+        'annual_return': ((final / initial_capital) ** (1 / years) - 1) * 100 if final > 0 else -100.0,
+        'max_drawdown': float(drawdown.min()) * 100,
+        'sharpe': float(returns.mean() / std * np.sqrt(244)) if std and std > 0 else 0.0,
+        'trades': int(len(trades)),
+        'round_trips': int(len(sells)),
+        'win_rate': float((sells['pnl'] > 0).mean() * 100) if len(sells) else 0.0,
+        'fees': float(trades['fee'].sum()) if len(trades) else 0.0,
+        'turnover': float(trades['value'].sum() / equity.mean()) if len(trades) else 0.0,
+    }
+
+
+def run_portfolio_backtest(rule, stock_codes=None, start='2021-01-01', end='2023-12-31', data_dir=DATA_DIR,
+                           buy_window=None, sell_window=None, **kwargs):
+    """加载行情、计算信号并撮合，kwargs 传给 simulate"""
+    panel = load_panel(stock_codes, start, end, data_dir)
+    if panel['close'].empty:
+        return None
+    buy, sell = compute_signals(panel, rule, buy_window, sell_window)
+    return simulate(panel, buy, sell, **kwargs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='组合回测')
+    parser.add_argument('--rule', type=int, default=0, help='规则序号（见 backtest_smart_strategy.rules）')
+    parser.add_argument('--start', default='2021-01-01')
+    parser.add_argument('--end', default='2023-12-31')
+    parser.add_argument('--symbols', default=None, help='逗号分隔的股票代码，不指定则使用区间内所有股票')
+    parser.add_argument('--capital', type=float, default=1000000)
+    parser.add_argument('--max-positions', type=int, default=20)
+    parser.add_argument('--execution', choices=['close', 'next_open'], default='close')
+    parser.add_argument('--no-t1', action='store_true', help='关闭 T+1 限制')
+    parser.add_argument('--commission', type=float, default=COMMISSION_RATE)
+    parser.add_argument('--stamp-duty', type=float, default=STAMP_DUTY_RATE)
+    parser.add_argument('--equity-out', default=None, help='将每日净值保存为 CSV')
+    parser.add_argument('--trades-out', default=None, help='将成交明细保存为 CSV')
+    parser.add_argument('--no-panel', action='store_true', help='不使用内存映射面板，逐个读取 CSV')
+    args = parser.parse_args()
+
+    if not 0 <= args.rule < len(rules):
+        print(f"规则序号应在 0-{len(rules) - 1} 之间")
+        return 1
+    rule = rules[args.rule]
+    codes = [c.strip() for c in args.symbols.split(',') if c.strip()] if args.symbols else None
+
+    start_time = time.perf_counter()
+    panel = load_panel(codes, args.start, args.end, use_panel=not args.no_panel)
+    if panel['close'].empty:
+        print("区间内没有可用的日线数据")
+        return 1
+    load_time = time.perf_counter() - start_time
+    buy, sell = compute_signals(panel, rule)
+    result = simulate(
+        panel, buy, sell, initial_capital=args.capital, max_positions=args.max_positions,
+        commission_rate=args.commission, stamp_duty_rate=args.stamp_duty,
+        t_plus_1=not args.no_t1, execution=args.execution
+    )
+    total_time = time.perf_counter() - start_time
+
+    days, symbols = panel['close'].shape
+    print(f"策略: {rule['name']}  ({rule['desc']})")
+    print(f"{days} 个交易日 x {symbols} 只股票，加载 {load_time:.2f}s，总耗时 {total_time:.2f}s")
+    summary = result['summary']
+    print(f"期末净值: {summary['final_equity']:.2f}  总收益: {summary['total_return']:.2f}%  "
+          f"年化: {summary['annual_return']:.2f}%  最大回撤: {summary['max_drawdown']:.2f}%  夏普: {summary['sharpe']:.2f}")
+    print(f"成交 {summary['trades']} 笔，平仓 {summary['round_trips']} 笔，胜率 {summary['win_rate']:.1f}%，"
+          f"费用 {summary['fees']:.2f}，换手 {summary['turnover']:.2f} 倍")
+
+    if args.equity_out:
+        result['equity'].to_csv(args.equity_out, header=True)
+        print(f"净值曲线已保存到 {args.equity_out}")
+    if args.trades_out:
+        result['trades'].to_csv(args.trades_out, index=False)
+        print(f"成交明细已保存到 {args.trades_out}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
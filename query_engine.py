@@ -0,0 +1,523 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+日线数据的嵌入式 SQL 查询（DuckDB，可选依赖）
+
+在日线文件和股票列表上注册只读视图，临时的统计问题直接写 SQL，不必再写脚本遍历 data/*_by_day：
+    bars          code, trade_time(DATE), open, high, low, close, vol, amount   不复权日线：本地日线与远程缓存合并去重，
+                  同一股票同一日期以本地为准（与接口一致）
+    remote_bars   同上，仅远程缓存（data/remote_cache/*_raw.csv），已包含在 bars 中，不要再与 bars 合并
+    adj_factors   code, trade_time, factor                                      后复权因子
+    stocks        code, name, pinyin, pinyin_initials, market                   股票列表
+
+DuckDB 多线程并行扫描文件，聚合只读取用到的列。执行 `python3 query_engine.py materialize`
+会把 bars 的内容写成 Parquet（data/parquet/bars.parquet，按代码、日期排序），
+之后 bars 视图直接读 Parquet（列式存储、按行组跳过），多 GB 的聚合在秒级完成；
+日线文件比 Parquet 新时自动回退到 CSV 视图（同样合并去重，结果与 Parquet 相同）并提示重新生成。
+
+已打包的年份（bar_archive.py，data/<年份>_by_day.pack）DuckDB 无法直接读取：建立连接时把未被散文件覆盖的归档成员
+解析进内存表 packed_bars，bars 视图和 materialize 同时读取散文件和这张表，因此打包前后查询结果一致
+（归档数据常驻查询引擎内存，数据很多时建议 materialize 后查询 Parquet）。
+
+查询限制：只允许单条 SELECT，禁止读取任意文件的表函数，结果最多 max_rows 行，超过 timeout 秒中断；
+DuckDB 版本支持时还会关闭数据目录以外的文件访问并锁定配置。
+
+用法:
+    python3 query_engine.py "SELECT code, avg(amount) FROM bars WHERE code LIKE '%.SH' GROUP BY code"
+    python3 query_engine.py --format csv --max-rows 100000 "..." > out.csv
+    python3 query_engine.py tables
+    python3 query_engine.py materialize
+"""
+
+import argparse
+import csv
+import glob
+import io
+import math
+import os
+import re
+import sys
+import threading
+import time
+from datetime import date, datetime
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+
+import bar_archive
+
+DATA_DIR = 'data'
+STOCK_LIST_FILE = 'stock_list.csv'
+PARQUET_DIR = os.path.join(DATA_DIR, 'parquet')
+PARQUET_BARS = os.path.join(PARQUET_DIR, 'bars.parquet')
+
+QUERY_TIMEOUT = float(os.environ.get('QUERY_TIMEOUT', 10))
+QUERY_MAX_ROWS = int(os.environ.get('QUERY_MAX_ROWS', 10000))
+QUERY_THREADS = int(os.environ.get('QUERY_THREADS', os.cpu_count() or 1))
+QUERY_MEMORY_LIMIT = os.environ.get('QUERY_MEMORY_LIMIT', '2GB')
+
+BAR_COLUMNS = ['code', 'trade_time', 'open', 'high', 'low', 'close', 'vol', 'amount']
+# 日线 CSV 的列类型（按列名）
+BAR_COLUMN_TYPES = {'trade_time': 'VARCHAR', 'open': 'DOUBLE', 'high': 'DOUBLE', 'low': 'DOUBLE', 'close': 'DOUBLE',
+                    'vol': 'DOUBLE', 'amount': 'DOUBLE'}
+
+# 可以读取任意文件或执行任意 SQL 的表函数（沙箱之外的兜底检查）
+FORBIDDEN_FUNCTIONS = re.compile(
+    r"\b(read_\w+|glob|sniff_csv|parquet_\w+|query|query_table|getenv|load|install|attach)\s*\(", re.IGNORECASE)
+# 无法使用 extract_statements 时的语句类型检查
+SELECT_PREFIX = re.compile(r"^\s*(select|with|from|values)\b", re.IGNORECASE)
+
+_DUCKDB = {'loaded': False, 'module': None}
+
+
+class QueryEngineUnavailable(Exception):
+    """未安装 duckdb"""
+
+
+class QueryRejected(ValueError):
+    """不允许执行的查询"""
+
+
+class QueryTimeout(Exception):
+    """查询超时"""
+
+
+def get_duckdb():
+    """按需导入 duckdb，未安装时抛出 QueryEngineUnavailable"""
+    if not _DUCKDB['loaded']:
+        try:
+            import duckdb
+            _DUCKDB['module'] = duckdb
+        except ImportError:
+            _DUCKDB['module'] = None
+        _DUCKDB['loaded'] = True
+    if _DUCKDB['module'] is None:
+        raise QueryEngineUnavailable('未安装 duckdb（pip install duckdb）')
+    return _DUCKDB['module']
+
+
+def _sql_path(path):
+    """文件路径转为 SQL 字符串字面量（统一斜杠、转义单引号）"""
+    return "'" + os.path.abspath(path).replace('\\', '/').replace("'", "''") + "'"
+
+
+def _code_from_filename(suffix):
+    return f"regexp_extract(replace(filename, '\\', '/'), '([^/]+){re.escape(suffix)}$', 1)"
+
+
+def packed_members(data_dir):
+    """已打包年份中未被散文件覆盖的日线文件，返回 [(代码, 成员路径), ...]"""
+    members = []
+    for y_dir in bar_archive.year_dirs(data_dir):
+        for name, path, _ in bar_archive.list_year(os.path.join(data_dir, y_dir)):
+            if bar_archive.is_member(path) and name.endswith('.csv'):
+                members.append((name[:-len('.csv')], path))
+    return members
+
+
+def packed_bars_frame(data_dir):
+    """
+    归档成员的日线合并为一个 DataFrame（列同 BAR_COLUMNS），没有归档时返回 None
+    表头相同的成员去掉表头后拼接、一次解析，再按各成员的行数还原代码列
+    """
+    groups = {}
+    for code, path in packed_members(data_dir):
+        header, _, body = bytes(bar_archive.read_bytes(path)).partition(b'\n')
+        if body and not body.endswith(b'\n'):
+            body += b'\n'
+        bodies, counts = groups.setdefault(header.strip(), ([], []))
+        bodies.append(body)
+        counts.append((code, body.count(b'\n')))
+    frames = []
+    for header, (bodies, counts) in groups.items():
+        if not any(bodies):
+            continue
+        columns = header.decode('utf-8-sig').split(',')
+        # 保留空行，保证解析出的行数与换行数一一对应
+        frame = pd.read_csv(io.BytesIO(b''.join(bodies)), header=None, names=columns, dtype={'trade_time': str},
+                            skip_blank_lines=False)
+        if len(frame) != sum(n for _, n in counts):
+            raise ValueError(f'归档日线解析行数不符（表头 {header!r}）')
+        frame.insert(0, 'code', np.repeat([code for code, _ in counts], [n for _, n in counts]))
+        frames.append(frame.reindex(columns=BAR_COLUMNS))
+    if not frames:
+        return None
+    frame = pd.concat(frames, ignore_index=True)
+    return frame[frame['trade_time'].notna()]
+
+
+def load_packed_bars(conn, data_dir):
+    """把归档中的日线写入内存表 packed_bars，返回是否有归档数据"""
+    frame = packed_bars_frame(data_dir)
+    if frame is None:
+        return False
+    conn.register('packed_bars_frame', frame)
+    try:
+        conn.execute("""
+            CREATE OR REPLACE TABLE packed_bars AS
+            SELECT CAST(code AS VARCHAR) AS code, CAST(CAST(trade_time AS TIMESTAMP) AS DATE) AS trade_time,
+                   CAST(open AS DOUBLE) AS open, CAST(high AS DOUBLE) AS high, CAST(low AS DOUBLE) AS low,
+                   CAST(close AS DOUBLE) AS close, CAST(vol AS DOUBLE) AS vol, CAST(amount AS DOUBLE) AS amount
+            FROM packed_bars_frame
+        """)
+    finally:
+        conn.unregister('packed_bars_frame')
+    return True
+
+
+def csv_header_groups(pattern):
+    """
+    按表头分组的 CSV 文件，返回 ({表头列名元组: [路径, ...]}, 是否有跳过的空文件)
+    不同工具写出的日线列顺序不同（如完整性修复按 BAR_COLUMNS 写 open,close,high,low），read_csv 按位置对应列，
+    需要按表头分组读取；union_by_name 能按列名合并，但每次查询都要嗅探全部文件，几千个文件时慢两个数量级
+    """
+    groups = {}
+    skipped = False
+    for path in sorted(glob.glob(pattern)):
+        with open(path, 'rb') as f:
+            header = f.readline().decode('utf-8-sig', errors='replace').strip()
+        if not header:
+            skipped = True
+            continue
+        groups.setdefault(tuple(c.strip() for c in header.split(',')), []).append(path)
+    return groups, skipped
+
+
+def csv_bars_sql(pattern, suffix):
+    """读取一组日线 CSV 的 SQL（列 code, trade_time, open, ..., amount），没有文件时返回 None"""
+    groups, skipped = csv_header_groups(pattern)
+    parts = []
+    for columns, paths in groups.items():
+        # 只有一种表头时直接用通配符，SQL 不随文件数增长
+        if len(groups) == 1 and not skipped:
+            source = _sql_path(pattern)
+        else:
+            source = '[' + ', '.join(_sql_path(p) for p in paths) + ']'
+        types = ', '.join(f"'{c}': '{t}'" for c, t in BAR_COLUMN_TYPES.items() if c in columns)
+        values = ', '.join(c if c in columns else f'CAST(NULL AS DOUBLE) AS {c}' for c in BAR_COLUMNS[2:])
+        time_column = 'CAST(CAST(trade_time AS TIMESTAMP) AS DATE)' if 'trade_time' in columns else 'CAST(NULL AS DATE)'
+        parts.append(f"""
+            SELECT {_code_from_filename(suffix)} AS code, {time_column} AS trade_time, {values}
+            FROM read_csv({source}, header = true, filename = true, types = {{{types}}})
+        """)
+    if not parts:
+        return None
+    return ' UNION ALL '.join(parts)
+
+
+def local_bars_sql(data_dir, packed=False):
+    """本地日线：年份目录中的散文件，packed 为 True 时加上内存表 packed_bars（见 load_packed_bars）"""
+    parts = []
+    sql = csv_bars_sql(os.path.join(data_dir, '*_by_day', '*.csv'), '.csv')
+    if sql:
+        parts.append(sql)
+    if packed:
+        parts.append("SELECT code, trade_time, open, high, low, close, vol, amount FROM packed_bars")
+    if not parts:
+        return None
+    return ' UNION ALL '.join(parts)
+
+
+def remote_bars_sql(data_dir):
+    return csv_bars_sql(os.path.join(data_dir, 'remote_cache', '*_raw.csv'), '_raw.csv')
+
+
+def merged_bars_sql(data_dir, packed=False):
+    """本地日线与远程缓存合并，同一股票同一日期以本地为准（与接口的合并顺序一致）"""
+    parts = [(0, local_bars_sql(data_dir, packed)), (1, remote_bars_sql(data_dir))]
+    parts = [f"SELECT *, {rank} AS source_rank FROM ({sql})" for rank, sql in parts if sql]
+    if not parts:
+        return None
+    return f"""
+        SELECT code, trade_time, open, high, low, close, vol, amount
+        FROM ({' UNION ALL '.join(parts)})
+        QUALIFY row_number() OVER (PARTITION BY code, trade_time ORDER BY source_rank) = 1
+    """
+
+
+def newest_source_mtime(data_dir):
+    """日线文件（含年份归档）的最新修改时间（判断 Parquet 是否过期）"""
+    newest = 0.0
+    for pattern in (os.path.join(data_dir, '*_by_day', '*.csv'), os.path.join(data_dir, '*_by_day' + bar_archive.ARCHIVE_SUFFIX),
+                    os.path.join(data_dir, 'remote_cache', '*_raw.csv')):
+        for path in glob.glob(pattern):
+            newest = max(newest, os.path.getmtime(path))
+    return newest
+
+
+def parquet_is_fresh(data_dir=DATA_DIR, parquet_path=None):
+    parquet_path = parquet_path or os.path.join(data_dir, 'parquet', 'bars.parquet')
+    return os.path.exists(parquet_path) and os.path.getmtime(parquet_path) >= newest_source_mtime(data_dir)
+
+
+def data_signature(data_dir=DATA_DIR, stock_list_file=STOCK_LIST_FILE):
+    """视图定义依赖的目录与文件（含年份归档）的修改时间（目录增删文件、重新打包时变化）"""
+    paths = [data_dir, os.path.join(data_dir, 'remote_cache'), os.path.join(data_dir, 'adj_factors'),
+             os.path.join(data_dir, 'parquet', 'bars.parquet'), stock_list_file]
+    paths += glob.glob(os.path.join(data_dir, '*_by_day'))
+    paths += glob.glob(os.path.join(data_dir, '*_by_day' + bar_archive.ARCHIVE_SUFFIX))
+    return tuple((p, os.path.getmtime(p)) for p in sorted(paths) if os.path.exists(p))
+
+
+def create_views(conn, data_dir=DATA_DIR, stock_list_file=STOCK_LIST_FILE):
+    """注册视图，返回 {视图名: 数据来源说明}；bars 无论读 Parquet 还是 CSV 都是本地与远程缓存合并去重后的日线"""
+    views = {}
+    parquet_path = os.path.join(data_dir, 'parquet', 'bars.parquet')
+    if parquet_is_fresh(data_dir, parquet_path):
+        conn.execute(f"CREATE OR REPLACE VIEW bars AS SELECT * FROM read_parquet({_sql_path(parquet_path)})")
+        views['bars'] = 'parquet'
+    else:
+        if os.path.exists(parquet_path):
+            print(f"{parquet_path} 早于日线文件，改用 CSV 视图（运行 python3 query_engine.py materialize 重新生成）")
+        packed = load_packed_bars(conn, data_dir)
+        sql = merged_bars_sql(data_dir, packed)
+        if sql:
+            conn.execute(f"CREATE OR REPLACE VIEW bars AS {sql}")
+            views['bars'] = 'csv+pack' if packed else 'csv'
+    sql = remote_bars_sql(data_dir)
+    if sql:
+        conn.execute(f"CREATE OR REPLACE VIEW remote_bars AS {sql}")
+        views['remote_bars'] = 'csv'
+    factor_pattern = os.path.join(data_dir, 'adj_factors', '*.csv')
+    if glob.glob(factor_pattern):
+        conn.execute(f"""
+            CREATE OR REPLACE VIEW adj_factors AS
+            SELECT {_code_from_filename('.csv')} AS code, CAST(trade_time AS DATE) AS trade_time, CAST(factor AS DOUBLE) AS factor
+            FROM read_csv({_sql_path(factor_pattern)}, header = true, filename = true, all_varchar = true)
+        """)
+        views['adj_factors'] = 'csv'
+    if os.path.exists(stock_list_file):
+        conn.execute(f"""
+            CREATE OR REPLACE VIEW stocks AS
+            SELECT code, name, pinyin, pinyin_initials,
+                   CASE WHEN upper(split_part(code, '.', -1)) IN ('SZ', 'SH', 'HK', 'US')
+                        THEN upper(split_part(code, '.', -1)) ELSE 'OTHER' END AS market
+            FROM read_csv({_sql_path(stock_list_file)}, header = true, all_varchar = true)
+        """)
+        views['stocks'] = 'csv'
+    return views
+
+
+def lock_down(conn, data_dir, stock_list_file):
+    """
+    只允许读取数据目录和股票列表，并锁定配置（需要 DuckDB 支持 allowed_directories，旧版本跳过）
+    返回是否启用
+    """
+    try:
+        conn.execute(f"SET allowed_directories = [{_sql_path(data_dir)[:-1]}/']")
+        conn.execute(f"SET allowed_paths = [{_sql_path(stock_list_file)}]")
+        conn.execute("SET enable_external_access = false")
+        conn.execute("SET lock_configuration = true")
+        return True
+    except Exception as e:
+        print(f"DuckDB 不支持目录白名单，仅按语句检查限制查询: {e}")
+        return False
+
+
+def validate_sql(conn, sql):
+    """只允许单条 SELECT；返回去掉末尾分号的语句"""
+    sql = (sql or '').strip().rstrip(';').strip()
+    if not sql:
+        raise QueryRejected('缺少 sql')
+    if FORBIDDEN_FUNCTIONS.search(sql):
+        raise QueryRejected('不允许在查询中读取文件或执行动态 SQL，请使用 bars / remote_bars / adj_factors / stocks 视图')
+    duckdb = get_duckdb()
+    try:
+        statements = conn.extract_statements(sql)
+    except AttributeError:
+        statements = None
+    except duckdb.Error as e:
+        raise QueryRejected(f'SQL 解析失败: {e}')
+    if statements is None:
+        if ';' in sql or not SELECT_PREFIX.match(sql):
+            raise QueryRejected('只允许单条 SELECT 查询')
+    else:
+        if len(statements) != 1:
+            raise QueryRejected('只允许单条 SELECT 查询')
+        if statements[0].type != duckdb.StatementType.SELECT:
+            raise QueryRejected('只允许 SELECT 查询')
+    return sql
+
+
+def to_json_value(value):
+    if value is None:
+        return None
+    if isinstance(value, float):
+        return None if math.isnan(value) or math.isinf(value) else value
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (bytes, bytearray)):
+        return value.hex()
+    return value
+
+
+class QueryEngine:
+    """进程内共享的 DuckDB 连接；每个查询使用独立游标，可并发执行"""
+
+    def __init__(self, data_dir=DATA_DIR, stock_list_file=STOCK_LIST_FILE, threads=QUERY_THREADS,
+                 memory_limit=QUERY_MEMORY_LIMIT):
+        self.data_dir = data_dir
+        self.stock_list_file = stock_list_file
+        self.threads = max(1, threads)
+        self.memory_limit = memory_limit
+        self.conn = None
+        self.views = {}
+        self.sandboxed = False
+        self.signature = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        duckdb = get_duckdb()
+        signature = data_signature(self.data_dir, self.stock_list_file)
+        with self._lock:
+            if self.conn is not None and signature == self.signature:
+                return self.conn
+            if self.conn is not None:
+                self.conn.close()
+            conn = duckdb.connect(':memory:')
+            conn.execute(f"SET threads = {self.threads}")
+            conn.execute(f"SET memory_limit = '{self.memory_limit}'")
+            self.views = create_views(conn, self.data_dir, self.stock_list_file)
+            self.sandboxed = lock_down(conn, self.data_dir, self.stock_list_file)
+            self.conn = conn
+            self.signature = signature
+            return conn
+
+    def tables(self):
+        """各视图的列名和类型"""
+        conn = self._connect()
+        result = {}
+        for name, source in self.views.items():
+            columns = conn.cursor().execute(f"DESCRIBE {name}").fetchall()
+            result[name] = {'source': source, 'columns': [[c[0], c[1]] for c in columns]}
+        return result
+
+    def run(self, sql, max_rows=QUERY_MAX_ROWS, timeout=QUERY_TIMEOUT):
+        """
+        执行只读查询，返回 {'columns', 'rows', 'row_count', 'truncated', 'elapsed'}
+        超过 timeout 秒时中断并抛出 QueryTimeout
+        """
+        duckdb = get_duckdb()
+        conn = self._connect()
+        sql = validate_sql(conn, sql)
+        cursor = conn.cursor()
+        timer = threading.Timer(timeout, cursor.interrupt) if timeout else None
+        start = time.perf_counter()
+        try:
+            if timer:
+                timer.start()
+            cursor.execute(f"SELECT * FROM ({sql}) AS q LIMIT {int(max_rows) + 1}")
+            columns = [d[0] for d in cursor.description]
+            rows = cursor.fetchall()
+        except duckdb.InterruptException:
+            raise QueryTimeout(f'查询超过 {timeout:g}s 已中断')
+        except duckdb.Error as e:
+            raise QueryRejected(f'查询失败: {e}')
+        finally:
+            if timer:
+                timer.cancel()
+            cursor.close()
+        truncated = len(rows) > max_rows
+        rows = rows[:max_rows]
+        return {
+            'columns': columns,
+            'rows': [[to_json_value(v) for v in row] for row in rows],
+            'row_count': len(rows),
+            'truncated': truncated,
+            'elapsed': round(time.perf_counter() - start, 4),
+        }
+
+
+_ENGINE = {'engine': None}
+_ENGINE_LOCK = threading.Lock()
+
+
+def get_engine():
+    """当前进程的查询引擎"""
+    if _ENGINE['engine'] is None:
+        with _ENGINE_LOCK:
+            if _ENGINE['engine'] is None:
+                _ENGINE['engine'] = QueryEngine()
+    return _ENGINE['engine']
+
+
+def materialize(data_dir=DATA_DIR, threads=QUERY_THREADS):
+    """把日线合并去重后写为 Parquet（先写临时文件再替换），返回 (行数, 耗时)"""
+    duckdb = get_duckdb()
+    out_dir = os.path.join(data_dir, 'parquet')
+    target = os.path.join(out_dir, 'bars.parquet')
+    tmp_path = target + '.tmp'
+    start = time.perf_counter()
+    conn = duckdb.connect(':memory:')
+    try:
+        conn.execute(f"SET threads = {max(1, threads)}")
+        sql = merged_bars_sql(data_dir, load_packed_bars(conn, data_dir))
+        if sql is None:
+            raise FileNotFoundError(f'{data_dir} 下没有日线文件')
+        os.makedirs(out_dir, exist_ok=True)
+        conn.execute(f"""
+            COPY (SELECT * FROM ({sql}) ORDER BY code, trade_time)
+            TO {_sql_path(tmp_path)} (FORMAT PARQUET, COMPRESSION ZSTD, ROW_GROUP_SIZE 122880)
+        """)
+        rows = conn.execute(f"SELECT count(*) FROM read_parquet({_sql_path(tmp_path)})").fetchone()[0]
+    finally:
+        conn.close()
+    os.replace(tmp_path, target)
+    return rows, time.perf_counter() - start
+
+
+def print_table(result, out=sys.stdout):
+    columns = result['columns']
+    rows = [['' if v is None else str(v) for v in row] for row in result['rows']]
+    widths = [max([len(c)] + [len(r[i]) for r in rows]) for i, c in enumerate(columns)]
+    out.write('  '.join(c.ljust(w) for c, w in zip(columns, widths)) + '\n')
+    out.write('  '.join('-' * w for w in widths) + '\n')
+    for row in rows:
+        out.write('  '.join(v.ljust(w) for v, w in zip(row, widths)) + '\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='日线数据 SQL 查询（DuckDB）')
+    parser.add_argument('sql', help='SQL 查询，或 tables（列出视图）、materialize（生成 Parquet）')
+    parser.add_argument('--data-dir', default=DATA_DIR)
+    parser.add_argument('--format', choices=['table', 'csv', 'json'], default='table')
+    parser.add_argument('--max-rows', type=int, default=QUERY_MAX_ROWS)
+    parser.add_argument('--timeout', type=float, default=0, help='超时秒数（默认不限）')
+    parser.add_argument('--threads', type=int, default=QUERY_THREADS)
+    args = parser.parse_args()
+
+    try:
+        if args.sql == 'materialize':
+            rows, elapsed = materialize(args.data_dir, args.threads)
+            print(f"已写入 {os.path.join(args.data_dir, 'parquet', 'bars.parquet')}：{rows} 行，耗时 {elapsed:.1f}s")
+            return
+        engine = QueryEngine(args.data_dir, threads=args.threads)
+        if args.sql == 'tables':
+            for name, info in engine.tables().items():
+                print(f"{name} ({info['source']})")
+                for column, dtype in info['columns']:
+                    print(f"    {column:<16} {dtype}")
+            return
+        result = engine.run(args.sql, max_rows=args.max_rows, timeout=args.timeout)
+    except (QueryEngineUnavailable, QueryRejected, QueryTimeout, FileNotFoundError) as e:
+        print(f"错误: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    if args.format == 'json':
+        import json
+        print(json.dumps(result, ensure_ascii=False))
+    elif args.format == 'csv':
+        writer = csv.writer(sys.stdout)
+        writer.writerow(result['columns'])
+        writer.writerows(result['rows'])
+    else:
+        print_table(result)
+        print(f"\n{result['row_count']} 行{'（已截断）' if result['truncated'] else ''}，耗时 {result['elapsed']:.3f}s",
+              file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
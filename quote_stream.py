@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""
+实时行情推送（多连接共享上游轮询）
+
+每个浏览器标签页都轮询 /api/stock_info 时，上游请求数随连接数增长。QuoteHub 在每个进程内
+只运行一个后台轮询线程：
+- 汇总所有连接订阅的股票（去重），按批量行情接口一次请求多只股票
+- 结果与上一次比较，只把变化的字段推送给订阅了该股票的连接
+- 新订阅的股票立即补拉一次，不等下一个轮询周期；没有订阅时轮询线程休眠
+
+上游请求数只与订阅的不同股票数有关，与连接数无关。
+
+连接端使用 Subscription：
+    sub = hub.subscribe(['000001.SZ', '600036.SH'])
+    try:
+        while True:
+            changes = sub.wait(timeout)   # {代码: {变化的字段}}，首次包含全部字段
+            ...
+    finally:
+        sub.close()
+
+消费慢的连接不会积压：未取走的变化按股票合并，只保留每个字段的最新值。
+"""
+
+import os
+import threading
+import time
+from collections import Counter
+
+import metrics
+
+# 轮询周期（秒）
+QUOTE_STREAM_INTERVAL = float(os.environ.get('QUOTE_STREAM_INTERVAL', 3))
+# 每次上游请求的股票数
+QUOTE_STREAM_BATCH = int(os.environ.get('QUOTE_STREAM_BATCH', 100))
+
+
+class Subscription:
+    """一个连接的订阅：待推送的变化按股票合并保存"""
+
+    def __init__(self, hub, codes):
+        self.hub = hub
+        self.codes = tuple(codes)
+        self.closed = False
+        self._pending = {}
+        self._cond = threading.Condition()
+        self._waker = None
+
+    def push(self, code, changes):
+        with self._cond:
+            self._pending.setdefault(code, {}).update(changes)
+            self._cond.notify_all()
+        waker = self._waker
+        if waker is not None:
+            waker()
+
+    def set_waker(self, waker):
+        """设置有新数据时的回调（异步连接用来唤醒事件循环）"""
+        self._waker = waker
+
+    def take(self):
+        """取走全部待推送的变化（不阻塞）"""
+        with self._cond:
+            pending, self._pending = self._pending, {}
+        return pending
+
+    def wait(self, timeout=None):
+        """等待到有变化或超时，返回待推送的变化（超时返回空字典）"""
+        with self._cond:
+            if not self._pending and not self.closed:
+                self._cond.wait(timeout)
+            pending, self._pending = self._pending, {}
+        return pending
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.hub.unsubscribe(self)
+            with self._cond:
+                self._cond.notify_all()
+
+
+class QuoteHub:
+    """
+    进程内的行情轮询与分发
+    fetch_batch(codes) -> {代码: 原始行情}，parse(code, 原始行情) -> 字段字典
+    on_quote(code, 字段字典) 在每次取到行情后调用（如写入行情缓存）
+    """
+
+    def __init__(self, fetch_batch, parse, interval=QUOTE_STREAM_INTERVAL, batch_size=QUOTE_STREAM_BATCH,
+                 on_quote=None):
+        self.fetch_batch = fetch_batch
+        self.parse = parse
+        self.interval = interval
+        self.batch_size = max(1, batch_size)
+        self.on_quote = on_quote
+        self.stats = Counter()
+        # 代码 -> 订阅该股票的连接集合
+        self._subs = {}
+        # 代码 -> 最近一次的字段字典
+        self._latest = {}
+        # 已订阅但尚未拉取过的股票
+        self._new_codes = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def subscribe(self, codes):
+        """订阅一组股票，已有行情的股票立即作为第一批变化推送"""
+        sub = Subscription(self, dict.fromkeys(codes))
+        with self._lock:
+            for code in sub.codes:
+                self._subs.setdefault(code, set()).add(sub)
+                latest = self._latest.get(code)
+                if latest is not None:
+                    sub.push(code, latest)
+                else:
+                    self._new_codes.add(code)
+            self._record()
+        self._ensure_running()
+        if self._new_codes:
+            self._wake.set()
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            for code in sub.codes:
+                subs = self._subs.get(code)
+                if subs is None:
+                    continue
+                subs.discard(sub)
+                if not subs:
+                    # 没有连接订阅的股票不再轮询
+                    del self._subs[code]
+                    self._latest.pop(code, None)
+                    self._new_codes.discard(code)
+            self._record()
+
+    def _record(self):
+        connections = {id(sub) for subs in self._subs.values() for sub in subs}
+        metrics.record_quote_stream(len(connections), len(self._subs))
+
+    def latest(self, code):
+        return self._latest.get(code)
+
+    def poll(self, codes=None):
+        """拉取一次行情并分发变化，返回本次上游请求数"""
+        if codes is None:
+            with self._lock:
+                codes = list(self._subs)
+                self._new_codes.clear()
+        if not codes:
+            return 0
+        calls = 0
+        for i in range(0, len(codes), self.batch_size):
+            chunk = codes[i:i + self.batch_size]
+            calls += 1
+            self.stats['upstream_calls'] += 1
+            try:
+                raw = self.fetch_batch(chunk)
+            except Exception as e:
+                self.stats['errors'] += 1
+                print(f"行情推送拉取失败（{len(chunk)} 只）: {e}")
+                continue
+            for code, data in raw.items():
+                if not data:
+                    continue
+                info = self.parse(code, data)
+                info.pop('success', None)
+                if self.on_quote is not None:
+                    self.on_quote(code, info)
+                self._dispatch(code, info)
+        self.stats['polls'] += 1
+        return calls
+
+    def _dispatch(self, code, info):
+        with self._lock:
+            subs = self._subs.get(code)
+            if not subs:
+                return
+            previous = self._latest.get(code) or {}
+            changes = {k: v for k, v in info.items() if k not in previous or previous[k] != v}
+            if not changes:
+                return
+            self._latest[code] = info
+            targets = list(subs)
+        self.stats['updates'] += 1
+        for sub in targets:
+            sub.push(code, changes)
+
+    def _run(self):
+        next_poll = time.monotonic()
+        while True:
+            with self._lock:
+                idle = not self._subs
+            # 没有订阅时一直休眠，直到有新订阅
+            self._wake.wait(None if idle else max(0.0, next_poll - time.monotonic()))
+            self._wake.clear()
+            try:
+                if time.monotonic() >= next_poll:
+                    next_poll = time.monotonic() + self.interval
+                    self.poll()
+                else:
+                    # 新订阅的股票立即补拉，不打乱全量轮询周期
+                    with self._lock:
+                        codes = [c for c in self._new_codes if c in self._subs]
+                        self._new_codes.clear()
+                    if codes:
+                        self.poll(codes)
+            except Exception as e:
+                print(f"行情推送轮询出错: {e}")
+
+    def _ensure_running(self):
+        """在当前进程启动轮询线程（fork 后的 worker 中重新启动）"""
+        if self._pid == os.getpid() and self._thread is not None:
+            return
+        with self._lock:
+            if self._pid != os.getpid() or self._thread is None:
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='quote-stream', daemon=True)
+                self._thread.start()
+
+    def status(self):
+        with self._lock:
+            connections = {id(sub) for subs in self._subs.values() for sub in subs}
+            return {
+                'subscribers': len(connections),
+                'symbols': len(self._subs),
+                'interval': self.interval,
+                'batch_size': self.batch_size,
+                'stats': dict(self.stats),
+            }
+
+
+def format_sse(data, event=None):
+    """格式化一条 Server-Sent Events 消息（data 为已序列化的 JSON 字符串）"""
+    head = f"event: {event}\n" if event else ''
+    return f"{head}data: {data}\n\n"
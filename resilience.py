@@ -0,0 +1,398 @@
+# -*- coding: utf-8 -*-
+"""
+上游调用保护：限流、熔断、自适应超时
+
+东财/akshare 变慢或限流时，每个请求都会等满超时（akshare 没有超时），并发请求随之堆积。
+每个上游（eastmoney / akshare）一个 UpstreamGuard：
+- 令牌桶限流：超出速率的调用最多排队 RATE_LIMIT_MAX_WAIT 秒，否则立即抛出 RateLimitedError
+- 熔断器：连续失败（含超时）BREAKER_FAILURES 次后打开，BREAKER_RESET_SECONDS 秒内直接抛出 CircuitOpenError，
+  之后放行一次试探调用，成功则关闭、失败则继续打开
+- 自适应超时：按操作（quote、daily_bars 等）统计耗时的平滑均值和偏差（同 TCP RTO 算法），
+  超时 = 均值 + 4 倍偏差，限制在 [最小值, 最大值] 内；同步调用在有界线程池中执行，超时后不再等待。
+  超时时按 RFC 6298 5.5 把超时翻倍（不超过最大值），并把已等待的时间计为一次（偏小的）样本，
+  上游整体变慢后超时随之增长；熔断后的试探调用使用最大超时
+
+ResilientDataSource 包装数据源，get_data_source() 默认返回包装后的数据源，app.py、asgi.py、
+fetch_stock_list.py 共用同一组保护。熔断期间调用方立即失败，由调用方回退到缓存（行情缓存、远程日线缓存、
+本地因子文件等），尾延迟不随上游故障增长。
+
+环境变量：
+    UPSTREAM_RESILIENCE=1        设为 0 关闭保护（直接调用数据源）
+    EASTMONEY_RATE_LIMIT=20      东财每秒调用次数（0 表示不限流）
+    AKSHARE_RATE_LIMIT=5         akshare 每秒调用次数
+    RATE_LIMIT_MAX_WAIT=1.0      限流排队的最长等待（秒）
+    BREAKER_FAILURES=5           连续失败多少次后熔断
+    BREAKER_RESET_SECONDS=30     熔断持续时间（秒）
+"""
+
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+import metrics
+from data_source import (
+    EASTMONEY_TIMEOUT,
+    DataSource,
+    DataSourceUnavailable,
+    ThrottledError,
+    UnsupportedSymbolError,
+    UpstreamError,
+)
+
+RATE_LIMIT_MAX_WAIT = float(os.environ.get('RATE_LIMIT_MAX_WAIT', 1.0))
+BREAKER_FAILURES = int(os.environ.get('BREAKER_FAILURES', 5))
+BREAKER_RESET_SECONDS = float(os.environ.get('BREAKER_RESET_SECONDS', 30))
+
+# 每个上游的默认策略：速率（每秒）、突发量、超时（初始 / 最小 / 最大，秒）、执行线程数，
+# operation_timeouts 为耗时明显更长的操作单独设置超时
+UPSTREAM_POLICIES = {
+    'eastmoney': {
+        'rate': float(os.environ.get('EASTMONEY_RATE_LIMIT', 20)),
+        'burst': 40,
+        'timeout': (EASTMONEY_TIMEOUT, 1.0, EASTMONEY_TIMEOUT),
+        'workers': 16,
+    },
+    'akshare': {
+        'rate': float(os.environ.get('AKSHARE_RATE_LIMIT', 5)),
+        'burst': 10,
+        'timeout': (20.0, 5.0, 30.0),
+        'workers': 8,
+        # 全市场股票列表需要翻页抓取，耗时以分钟计
+        'operation_timeouts': {'stock_list': (120.0, 30.0, 300.0)},
+    },
+}
+
+# 熔断器状态在 /metrics 中的取值
+BREAKER_STATES = {'closed': 0, 'half_open': 1, 'open': 2}
+
+# 这些异常说明上游正常响应（不支持该股票或该股票没有数据、未安装依赖），不计入熔断；
+# LiveDataSource 把 akshare 对错误代码抛出的解析异常转换为 UnsupportedSymbolError（data_source.symbol_errors）
+NON_FAILURE_ERRORS = (UnsupportedSymbolError, DataSourceUnavailable)
+
+
+class RateLimitedError(ThrottledError):
+    """本地限流：排队时间超过 RATE_LIMIT_MAX_WAIT"""
+
+
+class CircuitOpenError(UpstreamError):
+    """熔断中，未调用上游"""
+
+
+class UpstreamTimeout(UpstreamError):
+    """上游调用超时"""
+
+
+class TokenBucket:
+    """令牌桶：rate 为每秒补充的令牌数，burst 为桶容量；rate <= 0 时不限流"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(1.0, float(burst))
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, max_wait):
+        """
+        预约一个令牌，返回需要等待的秒数；等待超过 max_wait 时不预约并返回 None
+        令牌可以预支（桶内为负数），排队的调用按预约顺序依次放行
+        """
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+            if wait > max_wait:
+                return None
+            self.tokens -= 1
+            return wait
+
+
+class CircuitBreaker:
+    """连续失败 failure_threshold 次后打开，reset_timeout 秒后放行一次试探调用"""
+
+    def __init__(self, failure_threshold=BREAKER_FAILURES, reset_timeout=BREAKER_RESET_SECONDS):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """是否允许本次调用；半开状态只放行一个试探调用"""
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open':
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    return False
+                self.state = 'half_open'
+                self._probing = False
+            if self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def release(self):
+        """放行后未实际调用（如被限流），归还试探机会"""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                if self.state != 'open':
+                    self.trips += 1
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+
+    def retry_after(self):
+        """熔断剩余时间（秒）"""
+        if self.state != 'open':
+            return 0.0
+        return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+
+class AdaptiveTimeout:
+    """
+    按历史耗时调整的超时：平滑均值 + 4 倍平滑偏差（RFC 6298），限制在 [minimum, maximum]
+    超时后 back_off() 把超时翻倍，直到下一次成功的调用
+    """
+
+    def __init__(self, initial, minimum, maximum):
+        self.initial = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.srtt = None
+        self.rttvar = None
+        self.samples = 0
+        # 退避后的超时（超时后翻倍，成功后清除）
+        self.backoff = None
+        self._lock = threading.Lock()
+
+    def _computed(self):
+        if self.srtt is None:
+            return self.initial
+        return min(self.maximum, max(self.minimum, self.srtt + 4 * self.rttvar))
+
+    def current(self):
+        computed = self._computed()
+        return computed if self.backoff is None else max(computed, self.backoff)
+
+    def back_off(self, waited):
+        """一次超时：已等待的时间计为样本（实际耗时只会更长），超时翻倍，不超过 maximum"""
+        with self._lock:
+            doubled = min(self.maximum, self.current() * 2)
+            self._update(waited)
+            self.backoff = doubled
+
+    def observe(self, seconds):
+        with self._lock:
+            self.backoff = None
+            self._update(seconds)
+
+    def _update(self, seconds):
+        if self.srtt is None:
+            self.srtt = seconds
+            self.rttvar = seconds / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - seconds)
+            self.srtt = 0.875 * self.srtt + 0.125 * seconds
+        self.samples += 1
+
+
+class UpstreamGuard:
+    """单个上游的限流、熔断和超时"""
+
+    def __init__(self, name, rate, burst, timeout, workers, operation_timeouts=None, max_wait=RATE_LIMIT_MAX_WAIT,
+                 failure_threshold=BREAKER_FAILURES, reset_timeout=BREAKER_RESET_SECONDS):
+        self.name = name
+        self.operation_timeouts = operation_timeouts or {}
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.timeout_policy = timeout
+        self.workers = workers
+        self.max_wait = max_wait
+        # 操作名 -> AdaptiveTimeout
+        self.timeouts = {}
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _timeout_for(self, operation):
+        timeout = self.timeouts.get(operation)
+        if timeout is None:
+            with self._lock:
+                policy = self.operation_timeouts.get(operation, self.timeout_policy)
+                timeout = self.timeouts.setdefault(operation, AdaptiveTimeout(*policy))
+        return timeout
+
+    def _executor_for_process(self):
+        """执行同步调用的线程池（fork 后的 worker 中重新创建）"""
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f'upstream-{self.name}')
+                    self._pid = os.getpid()
+        return self._executor
+
+    def _admit(self):
+        """熔断与限流检查，返回 (需要等待的秒数, 是否为半开状态的试探调用)"""
+        if not self.breaker.allow():
+            metrics.record_upstream_rejected(self.name, 'circuit_open')
+            raise CircuitOpenError(f'{self.name} 熔断中，{self.breaker.retry_after():.0f}s 后重试')
+        # 半开状态只放行一个调用，放行的就是试探调用
+        probing = self.breaker.state == 'half_open'
+        wait = self.bucket.reserve(self.max_wait)
+        if wait is None:
+            metrics.record_upstream_rejected(self.name, 'rate_limited')
+            # 未实际调用上游：归还半开状态的试探机会
+            self.breaker.release()
+            raise RateLimitedError(f'{self.name} 调用过于频繁')
+        return wait, probing
+
+    def _call_timeout(self, operation, probing):
+        """本次调用的超时；试探调用使用最大超时，避免上游变慢后试探总是超时、熔断无法恢复"""
+        timeout = self._timeout_for(operation)
+        return timeout.maximum if probing else timeout.current()
+
+    def _finish(self, operation, started, error=None):
+        timeout = self._timeout_for(operation)
+        if error is None or isinstance(error, NON_FAILURE_ERRORS):
+            timeout.observe(time.monotonic() - started)
+            metrics.record_upstream_timeout(self.name, operation, timeout.current())
+            self.breaker.record_success()
+        else:
+            if isinstance(error, UpstreamTimeout):
+                timeout.back_off(time.monotonic() - started)
+                metrics.record_upstream_timeout(self.name, operation, timeout.current())
+            self.breaker.record_failure()
+        metrics.record_breaker_state(self.name, BREAKER_STATES[self.breaker.state])
+
+    def call(self, operation, func, *args, **kwargs):
+        """在线程池中执行同步调用，超过自适应超时即抛出 UpstreamTimeout（调用本身在后台继续直至结束）"""
+        wait, probing = self._admit()
+        if wait:
+            time.sleep(wait)
+        timeout = self._call_timeout(operation, probing)
+        started = time.monotonic()
+        future = self._executor_for_process().submit(func, *args, **kwargs)
+        try:
+            result = future.result(timeout=timeout)
+        except FutureTimeout:
+            future.cancel()
+            error = UpstreamTimeout(f'{self.name}.{operation} 超过 {timeout:.1f}s 未返回')
+            self._finish(operation, started, error)
+            metrics.record_upstream_rejected(self.name, 'timeout')
+            raise error
+        except Exception as e:
+            self._finish(operation, started, e)
+            raise
+        self._finish(operation, started)
+        return result
+
+    async def acall(self, operation, coro_func, *args, **kwargs):
+        """异步版本：限流等待与超时都不占用线程"""
+        wait, probing = self._admit()
+        if wait:
+            await asyncio.sleep(wait)
+        timeout = self._call_timeout(operation, probing)
+        started = time.monotonic()
+        try:
+            result = await asyncio.wait_for(coro_func(*args, **kwargs), timeout)
+        except asyncio.TimeoutError:
+            error = UpstreamTimeout(f'{self.name}.{operation} 超过 {timeout:.1f}s 未返回')
+            self._finish(operation, started, error)
+            metrics.record_upstream_rejected(self.name, 'timeout')
+            raise error
+        except Exception as e:
+            self._finish(operation, started, e)
+            raise
+        self._finish(operation, started)
+        return result
+
+    def status(self):
+        return {
+            'state': self.breaker.state,
+            'consecutive_failures': self.breaker.failures,
+            'trips': self.breaker.trips,
+            'retry_after': round(self.breaker.retry_after(), 1),
+            'rate_limit': self.bucket.rate,
+            'timeouts': {op: round(t.current(), 3) for op, t in sorted(self.timeouts.items())},
+        }
+
+
+GUARDS = {name: UpstreamGuard(name, **policy) for name, policy in UPSTREAM_POLICIES.items()}
+
+
+def get_guard(name):
+    return GUARDS[name]
+
+
+def guarded_call(upstream, operation, func, *args, **kwargs):
+    """经由指定上游的保护执行一次同步调用（fetch_stock_list.py 等直接调用上游的代码使用）"""
+    return GUARDS[upstream].call(operation, func, *args, **kwargs)
+
+
+def upstream_status():
+    return {name: guard.status() for name, guard in GUARDS.items()}
+
+
+def is_circuit_open(upstream):
+    return GUARDS[upstream].breaker.state == 'open' and GUARDS[upstream].breaker.retry_after() > 0
+
+
+class ResilientDataSource(DataSource):
+    """为数据源的每个方法加上对应上游的保护：行情走 eastmoney，其余走 akshare"""
+
+    def __init__(self, inner, guards=None):
+        self.inner = inner
+        self.name = inner.name
+        self.guards = guards or GUARDS
+
+    def __getattr__(self, item):
+        return getattr(self.inner, item)
+
+    def daily_bars(self, stock_code, start_date, end_date, adjust='qfq'):
+        return self.guards['akshare'].call('daily_bars', self.inner.daily_bars, stock_code, start_date, end_date,
+                                           adjust=adjust)
+
+    def adjust_factors(self, stock_code, start_date=None):
+        return self.guards['akshare'].call('adjust_factors', self.inner.adjust_factors, stock_code, start_date)
+
+    def quote(self, stock_code):
+        return self.guards['eastmoney'].call('quote', self.inner.quote, stock_code)
+
+    async def aquote(self, stock_code, http_client=None):
+        return await self.guards['eastmoney'].acall('quote', self.inner.aquote, stock_code, http_client)
+
+    def batch_quotes(self, stock_codes):
+        return self.guards['eastmoney'].call('batch_quotes', self.inner.batch_quotes, stock_codes)
+
+    def pe_history(self, stock_code):
+        return self.guards['akshare'].call('pe_history', self.inner.pe_history, stock_code)
+
+    def stock_list(self):
+        # 内部逐个请求已加保护时不再整体套一层：否则令牌和失败计两次，外层超时覆盖多次内层调用，
+        # 外层调用还占着同一个线程池的线程等待内层调用，并发时可能耗尽线程池
+        if 'stock_list' in self.inner.self_guarded:
+            return self.inner.stock_list()
+        return self.guards['akshare'].call('stock_list', self.inner.stock_list)
+
+    def trade_calendar(self, start_date, end_date):
+        return self.guards['akshare'].call('trade_calendar', self.inner.trade_calendar, start_date, end_date)
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+回测结果的持久化缓存
+
+按 (规则指纹, 股票) 保存结果，同时记录计算时的数据版本；再次运行只重算规则或数据有变化的组合：
+- 规则指纹：规则条件函数的源码、参数、回测窗口和回测函数本身的源码的哈希，改动任何一项都会换一个指纹
+- 数据版本：该股票参与计算的日线文件的最后交易日 + 内容哈希。文件哈希按 (路径, 大小, mtime) 记在
+  file_hashes.json 中，文件未变时只 stat 不读取；调用方只传入回测区间用到的年份文件，区间之后追加的 K 线不会使结果失效
+
+目录结构:
+    backtest_cache/file_hashes.json
+    backtest_cache/<规则指纹>/<股票代码>.pkl     (数据版本, 结果)
+"""
+
+import hashlib
+import inspect
+import json
+import os
+import pickle
+from collections import Counter
+
+import bar_archive
+from atomic_file import write_atomic
+
+CACHE_DIR = 'backtest_cache'
+HASH_FILE = 'file_hashes.json'
+
+
+def _canonical(value):
+    """把规则定义转换为可稳定序列化的结构：函数和类取源码，字典按键排序"""
+    if callable(value):
+        try:
+            return inspect.getsource(value).strip()
+        except (OSError, TypeError):
+            code = getattr(value, '__code__', None)
+            return repr((code.co_code, code.co_consts, code.co_names)) if code else repr(value)
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in sorted(value.items(), key=lambda kv: str(kv[0]))}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return repr(value)
+
+
+def fingerprint(*parts):
+    """规则定义与参数的指纹（16 位十六进制）"""
+    text = json.dumps(_canonical(list(parts)), ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+
+
+def _atomic_write(path, data):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    write_atomic(path, lambda f: f.write(data))
+
+
+def _last_trade_date(data):
+    """CSV 内容中最后一行的 trade_time（第一列），没有数据行返回 ''"""
+    lines = data.rstrip(b'\n').rsplit(b'\n', 1)
+    if len(lines) < 2:
+        return ''
+    return lines[-1].split(b',', 1)[0].decode('utf-8', 'replace').strip()[:10]
+
+
+class ResultCache:
+    """
+    结果缓存：get / put 以 (规则指纹, 股票代码, 数据版本) 为键；data_version 计算股票的数据版本
+    运行结束调用 save() 保存文件哈希表
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.stats = Counter()
+        self._hashes = None
+        self._dirty = False
+
+    def _hash_table(self):
+        if self._hashes is None:
+            try:
+                with open(os.path.join(self.cache_dir, HASH_FILE), 'r', encoding='utf-8') as f:
+                    self._hashes = json.load(f)
+            except (OSError, ValueError):
+                self._hashes = {}
+        return self._hashes
+
+    def file_version(self, path):
+        """(最后交易日, 内容哈希)；文件大小和 mtime 未变时直接使用记录的结果"""
+        mtime_ns, size = bar_archive.file_signature(path)
+        key = os.path.abspath(path)
+        table = self._hash_table()
+        entry = table.get(key)
+        if entry and entry[0] == size and entry[1] == mtime_ns:
+            return entry[2], entry[3]
+        data = bar_archive.read_bytes(path)
+        digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+        last = _last_trade_date(data)
+        table[key] = [size, mtime_ns, last, digest]
+        self._dirty = True
+        self.stats['files_hashed'] += 1
+        return last, digest
+
+    def data_version(self, paths):
+        """一组日线文件的数据版本 '最后交易日:内容哈希'，没有文件返回 None"""
+        versions = [self.file_version(p) for p in sorted(paths) if bar_archive.exists(p)]
+        if not versions:
+            return None
+        last = max(v[0] for v in versions)
+        digest = hashlib.blake2b('|'.join(v[1] for v in versions).encode('ascii'), digest_size=16).hexdigest()
+        return f"{last}:{digest}"
+
+    def _path(self, key, symbol):
+        return os.path.join(self.cache_dir, key, f"{symbol}.pkl")
+
+    def get(self, key, symbol, version):
+        """命中返回 (True, 结果)，未命中或数据版本不同返回 (False, None)"""
+        if version is None:
+            self.stats['misses'] += 1
+            return False, None
+        try:
+            with open(self._path(key, symbol), 'rb') as f:
+                cached_version, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError, ValueError):
+            self.stats['misses'] += 1
+            return False, None
+        if cached_version != version:
+            self.stats['stale'] += 1
+            return False, None
+        self.stats['hits'] += 1
+        return True, value
+
+    def put(self, key, symbol, version, value):
+        if version is None:
+            return
+        _atomic_write(self._path(key, symbol), pickle.dumps((version, value), protocol=pickle.HIGHEST_PROTOCOL))
+        self.stats['stored'] += 1
+
+    def save(self):
+        """保存文件哈希表（有变化时）"""
+        if self._dirty:
+            _atomic_write(os.path.join(self.cache_dir, HASH_FILE),
+                          json.dumps(self._hashes, ensure_ascii=False).encode('utf-8'))
+            self._dirty = False
+
+    def summary(self):
+        computed = self.stats['misses'] + self.stats['stale']
+        return f"缓存命中 {self.stats['hits']}，重新计算 {computed}（数据变化 {self.stats['stale']}）"
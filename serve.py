@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+生产模式启动器：多 worker 的 gunicorn 服务，替代 app.py 的单进程调试服务器
+
+用法:
+    python3 serve.py [端口] [--workers N] [--threads N] [--asgi]
+
+- 主进程在 fork 之前导入应用并预热缓存（股票列表、搜索索引、数据目录索引），
+  worker 以写时复制方式共享这些内存页
+- kill -HUP <主进程PID> 平滑重载：主进程重新预热缓存后逐个替换 worker
+- 启动、重载和 worker 创建耗时写入日志，/api/ready 返回预热进度与冷启动耗时
+- --asgi 使用 uvicorn worker 运行 asgi.py 中的异步版本（上游接口不占用 worker 线程）
+- 未安装 gunicorn 时（如 Windows）回退为多线程的 werkzeug 服务器
+"""
+
+import gc
+import os
+import sys
+import time
+import multiprocessing
+import tempfile
+
+import metrics
+from app import app, warm_up_caches, start_warm_up_in_background
+
+DEFAULT_PORT = 8080
+
+
+def default_workers():
+    """默认 worker 数：每个 CPU 核一个（请求以 pandas 计算为主，受 GIL 限制）"""
+    return int(os.environ.get('WEB_WORKERS', multiprocessing.cpu_count()))
+
+
+def default_threads():
+    """每个 worker 的线程数：等待东财/akshare 上游时不占满 worker"""
+    return int(os.environ.get('WEB_THREADS', 4))
+
+
+def parse_args(argv):
+    """解析命令行参数，返回 (port, workers, threads, use_asgi)"""
+    port = int(os.environ.get('PORT', DEFAULT_PORT))
+    workers = default_workers()
+    threads = default_threads()
+    use_asgi = os.environ.get('APP_ASGI', '').lower() in ('1', 'true')
+    args = list(argv)
+    while args:
+        arg = args.pop(0)
+        if arg == '--asgi':
+            use_asgi = True
+        elif arg == '--workers' and args:
+            workers = int(args.pop(0))
+        elif arg == '--threads' and args:
+            threads = int(args.pop(0))
+        else:
+            try:
+                port = int(arg)
+            except ValueError:
+                print(f"警告: 无效的参数 '{arg}'，已忽略")
+    return port, max(1, workers), max(1, threads), use_asgi
+
+
+def on_starting(server):
+    """主进程启动：应用已预加载，预热缓存后再 fork worker"""
+    stats = warm_up_caches()
+    # 预热期间的指标只记在主进程的文件里，worker fork 后清空继承的计数
+    metrics.flush()
+    # 将预热对象移出 GC 跟踪，避免 worker 中的垃圾回收触碰这些页导致写时复制失效
+    gc.freeze()
+    server.log.info(f"冷启动: 导入 {stats['import_seconds']:.2f}s, 预热 {stats['elapsed']:.2f}s")
+
+
+def on_reload(server):
+    """收到 HUP：先在主进程重新预热缓存，新 worker 直接继承最新数据"""
+    start = time.monotonic()
+    gc.unfreeze()
+    warm_up_caches()
+    metrics.flush()
+    gc.freeze()
+    server.log.info(f"重载预热完成，耗时 {time.monotonic() - start:.2f}s")
+
+
+def pre_fork(server, worker):
+    # 主进程中记录创建时间，worker 初始化完成后计算创建耗时（monotonic 时钟跨 fork 可比）
+    worker.spawn_started = time.monotonic()
+
+
+def post_fork(server, worker):
+    metrics.child_init()
+    server.log.info(f"worker 已启动 (pid: {worker.pid})")
+
+
+def child_exit(server, worker):
+    # 退出的 worker 不再导出瞬时值，计数保留在汇总中
+    metrics.mark_process_dead(worker.pid)
+
+
+def post_worker_init(worker):
+    elapsed = time.monotonic() - getattr(worker, 'spawn_started', time.monotonic())
+    worker.log.info(f"worker 就绪 (pid: {worker.pid})，创建耗时 {elapsed * 1000:.0f}ms")
+
+
+def run_gunicorn(port, workers, threads, use_asgi=False):
+    from gunicorn.app.base import BaseApplication
+
+    if workers > 1:
+        # 各 worker 的指标写入共享目录，/metrics 导出所有 worker 的汇总
+        metrics_dir = os.environ.get('METRICS_DIR') or tempfile.mkdtemp(prefix='stock_metrics_')
+        metrics.enable_multiprocess(metrics_dir)
+
+    if use_asgi:
+        from asgi import app as application
+    else:
+        application = app
+
+    class StockApplication(BaseApplication):
+        def __init__(self, options):
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return application
+
+    options = {
+        'bind': f"0.0.0.0:{port}",
+        'workers': workers,
+        'threads': threads,
+        'worker_class': 'uvicorn.workers.UvicornWorker' if use_asgi else 'gthread',
+        'preload_app': True,
+        # 上游接口最长 30 秒左右，超时留出余量
+        'timeout': 60,
+        'graceful_timeout': 30,
+        'keepalive': 5,
+        'on_starting': on_starting,
+        'on_reload': on_reload,
+        'pre_fork': pre_fork,
+        'post_fork': post_fork,
+        'child_exit': child_exit,
+        'post_worker_init': post_worker_init,
+    }
+    if os.environ.get('SERVE_PID_FILE'):
+        # 记录 gunicorn 主进程 PID（退出时自动删除），start.sh reload 据此确认可以发送 HUP
+        options['pidfile'] = os.environ['SERVE_PID_FILE']
+    StockApplication(options).run()
+
+
+def run_fallback(port, threads):
+    from werkzeug.serving import run_simple
+
+    print("警告: 未安装 gunicorn，使用多线程 werkzeug 服务器（单进程）")
+    # 单进程没有 fork 共享的需求，后台预热、立即监听，预热完成前 /api/ready 返回 503
+    start_warm_up_in_background()
+    run_simple('0.0.0.0', port, app, threaded=threads > 1, use_reloader=False, use_debugger=False)
+
+
+def main():
+    port, workers, threads, use_asgi = parse_args(sys.argv[1:])
+    print("=" * 50)
+    print("生产模式启动" + ("（ASGI）" if use_asgi else ""))
+    print(f"端口: {port}, worker 数: {workers}, 每 worker 线程数: {threads}")
+    print("=" * 50)
+    try:
+        import gunicorn  # noqa: F401
+    except ImportError:
+        run_fallback(port, threads)
+        return
+    run_gunicorn(port, workers, threads, use_asgi)
+
+
+if __name__ == '__main__':
+    main()
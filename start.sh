@@ -1,15 +1,23 @@
 #!/bin/bash
 
 # 股票分析项目启动/停止脚本
-# 用法: ./start.sh [start|stop|restart|status]
+# 用法: ./start.sh [start|stop|restart|reload|status]
+# 生产模式: APP_MODE=prod ./start.sh start （多 worker，可用 WEB_WORKERS 指定数量）
 
 SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
 PID_FILE="$SCRIPT_DIR/.server.pid"
 LOG_FILE="$SCRIPT_DIR/.server.log"
+# gunicorn 主进程写入的 PID 文件（werkzeug 回退和开发模式不会写）
+export SERVE_PID_FILE="$SCRIPT_DIR/.gunicorn.pid"
 
 # Flask 后端配置
 FLASK_PORT=8080
-FLASK_CMD="python $SCRIPT_DIR/app.py $FLASK_PORT"
+APP_MODE="${APP_MODE:-dev}"
+if [ "$APP_MODE" = "prod" ]; then
+    FLASK_CMD="python $SCRIPT_DIR/serve.py $FLASK_PORT"
+else
+    FLASK_CMD="python $SCRIPT_DIR/app.py $FLASK_PORT"
+fi
 
 # Vue 前端配置
 VUE_DIR="$SCRIPT_DIR/vue"
@@ -275,6 +283,28 @@ show_status() {
     fi
 }
 
+# 平滑重载 Flask 后端（仅生产模式：主进程重新预热缓存并逐个替换 worker）
+# 只向 gunicorn 主进程发送 HUP：开发模式的 app.py 和 werkzeug 回退收到 HUP 会直接退出
+reload_services() {
+    if [ ! -f "$PID_FILE" ]; then
+        echo -e "${RED}服务未运行${NC}"
+        return 1
+    fi
+    FLASK_PID=$(head -n 1 "$PID_FILE" 2>/dev/null)
+    if [ -n "$FLASK_PID" ] && ps -p "$FLASK_PID" > /dev/null 2>&1; then
+        GUNICORN_PID=$(cat "$SERVE_PID_FILE" 2>/dev/null)
+        if [ "$GUNICORN_PID" != "$FLASK_PID" ]; then
+            echo -e "${YELLOW}Flask 后端不是 gunicorn 主进程（开发模式或未安装 gunicorn），不支持平滑重载，请使用 ./start.sh restart${NC}"
+            return 1
+        fi
+        kill -HUP "$FLASK_PID"
+        echo -e "${GREEN}✓ 已发送平滑重载信号 (PID: $FLASK_PID)${NC}"
+    else
+        echo -e "${RED}Flask 后端未运行${NC}"
+        return 1
+    fi
+}
+
 # 重启服务
 restart_services() {
     stop_services
@@ -293,16 +323,20 @@ case "${1:-start}" in
     restart)
         restart_services
         ;;
+    reload)
+        reload_services
+        ;;
     status)
         show_status
         ;;
     *)
-        echo "用法: $0 [start|stop|restart|status]"
+        echo "用法: $0 [start|stop|restart|reload|status]"
         echo ""
         echo "命令说明:"
         echo "  start   - 启动 Flask 后端和 Vue 前端"
         echo "  stop    - 停止所有服务"
         echo "  restart - 重启所有服务"
+        echo "  reload  - 平滑重载 Flask 后端（仅 gunicorn 生产模式）"
         echo "  status  - 查看服务状态"
         exit 1
         ;;
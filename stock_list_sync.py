@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+股票列表增量同步
+
+股票列表（约 2.3 万只）以 stock_list.json 的 update_time 作为版本号。fetch_stock_list.py 每次保存新列表时，
+与旧列表比较，把新增、删除、改名追加到变更日志 stock_list_changes.json（保留最近 MAX_JOURNAL 个版本）。
+
+前端只需在首次加载时下载紧凑编码（按市场分片，可按需加载），之后凭本地保存的版本号请求增量：
+- pack_rows / unpack_rows：分片内每只股票一行，字段以制表符分隔，代码省略市场后缀
+- compute_delta：把 since 之后的变更合并为一份增量（新增、删除、改名）；
+  since 不在日志中（过旧或列表被手工替换）时返回 reset，前端重新下载全量
+"""
+
+import json
+import os
+from datetime import datetime
+
+STOCK_LIST_JSON = 'stock_list.json'
+CHANGES_FILE = 'stock_list_changes.json'
+# 变更日志保留的版本数
+MAX_JOURNAL = 100
+
+MARKETS = ('SZ', 'SH', 'HK', 'US')
+# 紧凑编码的字段顺序
+PACKED_FIELDS = ('code', 'name', 'pinyin', 'pinyin_initials')
+
+
+def market_of(code):
+    """股票代码的市场（后缀），无法识别时返回 OTHER"""
+    suffix = code.rsplit('.', 1)[-1].upper() if '.' in code else ''
+    return suffix if suffix in MARKETS else 'OTHER'
+
+
+def stock_row(stock):
+    """股票字典 -> [code, name, pinyin, pinyin_initials]"""
+    return [str(stock.get(field) or '') for field in PACKED_FIELDS]
+
+
+def _clean(value):
+    # 制表符和换行是分隔符
+    return value.replace('\t', ' ').replace('\n', ' ')
+
+
+def pack_rows(rows, market):
+    """把同一市场的股票编码为字符串：每行 代码(去后缀)\\t名称\\t拼音\\t首字母"""
+    strip = len(market) + 1 if market in MARKETS else 0
+    lines = []
+    for code, name, pinyin, initials in rows:
+        if strip and code.upper().endswith('.' + market):
+            code = code[:-strip]
+        lines.append('\t'.join((_clean(code), _clean(name), _clean(pinyin), _clean(initials))))
+    return '\n'.join(lines)
+
+
+def unpack_rows(packed, market):
+    """pack_rows 的逆过程，返回 [code, name, pinyin, pinyin_initials] 列表"""
+    rows = []
+    if not packed:
+        return rows
+    for line in packed.split('\n'):
+        code, name, pinyin, initials = line.split('\t')
+        if market in MARKETS:
+            code = f"{code}.{market}"
+        rows.append([code, name, pinyin, initials])
+    return rows
+
+
+def shard_rows(stocks):
+    """按市场分片，返回 {市场: [行, ...]}（保持原顺序）"""
+    shards = {}
+    for stock in stocks:
+        row = stock_row(stock)
+        shards.setdefault(market_of(row[0]), []).append(row)
+    return shards
+
+
+def diff_stock_lists(old_stocks, new_stocks):
+    """比较两份股票列表，返回 {'added': [行], 'removed': [代码], 'renamed': [行]}"""
+    old = {s['code']: stock_row(s) for s in old_stocks}
+    new = {s['code']: stock_row(s) for s in new_stocks}
+    return {
+        'added': [row for code, row in new.items() if code not in old],
+        'removed': [code for code in old if code not in new],
+        'renamed': [row for code, row in new.items() if code in old and old[code] != row],
+    }
+
+
+def read_stock_list_json(path=STOCK_LIST_JSON):
+    """读取 stock_list.json，返回 (版本, 股票列表)；文件不存在时返回 (None, [])"""
+    if not os.path.exists(path):
+        return None, []
+    with open(path, 'r', encoding='utf-8') as f:
+        payload = json.load(f)
+    return payload.get('update_time'), payload.get('stocks') or []
+
+
+def load_journal(path=CHANGES_FILE):
+    """读取变更日志：[{'from': 旧版本, 'to': 新版本, 'added', 'removed', 'renamed'}, ...]（按时间顺序）"""
+    if not os.path.exists(path):
+        return []
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f).get('changes', [])
+    except (OSError, ValueError) as e:
+        print(f"读取股票列表变更日志失败: {e}")
+        return []
+
+
+def record_change(old_version, old_stocks, new_version, new_stocks, path=CHANGES_FILE):
+    """
+    把一次列表更新追加到变更日志（原子写入），返回本次的变更
+    没有旧版本（首次生成）时不记录
+    """
+    if not old_version:
+        return None
+    diff = diff_stock_lists(old_stocks, new_stocks)
+    journal = load_journal(path)
+    journal.append(dict(diff, **{'from': old_version, 'to': new_version,
+                                 'recorded_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')}))
+    journal = journal[-MAX_JOURNAL:]
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'changes': journal}, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    return diff
+
+
+def compute_delta(journal, since, version, markets=None):
+    """
+    合并 since 之后到 version 的所有变更，返回增量字典；无法从 since 推导时返回 {'reset': True}
+    同一只股票多次变更时只保留最终结果：先新增后删除的不出现，先删除后新增的作为改名返回（前端按代码覆盖）
+    markets 为市场集合时只返回这些市场的变更
+    """
+    if since == version:
+        return {'reset': False, 'added': [], 'removed': [], 'renamed': []}
+    start = None
+    for i, entry in enumerate(journal):
+        if entry.get('from') == since:
+            start = i
+            break
+    if start is None:
+        return {'reset': True}
+    chain = journal[start:]
+    # 日志需要从 since 连续衔接到当前版本
+    for prev, entry in zip(chain, chain[1:]):
+        if entry.get('from') != prev.get('to'):
+            return {'reset': True}
+    if chain[-1].get('to') != version:
+        return {'reset': True}
+
+    # 代码 -> [since 版本中是否存在, 当前的行（已删除为 None）]；是否存在由该股票的第一条变更决定
+    state = {}
+    for entry in chain:
+        for row in entry.get('added', []):
+            state.setdefault(row[0], [False, None])[1] = row
+        for row in entry.get('renamed', []):
+            state.setdefault(row[0], [True, None])[1] = row
+        for code in entry.get('removed', []):
+            state.setdefault(code, [True, None])[1] = None
+
+    delta = {'reset': False, 'added': [], 'removed': [], 'renamed': []}
+    for code, (existed, row) in state.items():
+        if markets and market_of(code) not in markets:
+            continue
+        if row is None:
+            if existed:
+                delta['removed'].append(code)
+        else:
+            delta['renamed' if existed else 'added'].append(row)
+    return delta
@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+策略参数优化：网格/随机搜索 + 滚动（walk-forward）训练/测试窗口
+
+- 规则写成带参数的模板（RULE_TEMPLATES），阈值、均线周期等由搜索空间给出
+- 每只股票的指标（均线、RSI、N 日前收盘价）按参数缓存，所有参数组合共享
+- 按股票分配到多个进程并行计算，每个进程返回 窗口×参数组合 的收益矩阵
+- 每个窗口在训练期选出平均收益最高的参数，再在紧随其后的测试期评估（样本外）
+- 结果保存为 JSON（默认 optimizer_results/ 目录），可用 --list 对比历次运行
+
+用法:
+    python3 strategy_optimizer.py [--template rsi_reversal] [--symbols 000001.SZ,600036.SH]
+                                  [--random 500] [--train-years 2] [--test-years 1]
+                                  [--workers 4] [--output-dir optimizer_results]
+    python3 strategy_optimizer.py --list
+"""
+
+import argparse
+import glob
+import itertools
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+import bar_archive
+import kernels
+from bars import Bars, load_bars, moving_average, rsi as compute_rsi
+from portfolio_backtest import COMMISSION_RATE, STAMP_DUTY_RATE
+from result_cache import CACHE_DIR, ResultCache, fingerprint
+
+DATA_DIR = 'data'
+RESULTS_DIR = 'optimizer_results'
+FAVORITE_STOCKS_FILE = 'favorite_stocks.json'
+
+# 单次买卖的成本比例（双向佣金 + 卖出印花税）
+ROUND_TRIP_COST = 2 * COMMISSION_RATE + STAMP_DUTY_RATE
+
+
+class IndicatorCache:
+    """单只股票的指标缓存：同一指标、同一参数只计算一次，供所有参数组合共享"""
+
+    def __init__(self, close):
+        self.close = np.asarray(close, dtype=float)
+        self._cache = {}
+
+    def _get(self, key, compute):
+        value = self._cache.get(key)
+        if value is None:
+            value = compute()
+            self._cache[key] = value
+        return value
+
+    def ma(self, window):
+        return self._get(('ma', window), lambda: moving_average(self.close, window))
+
+    def rsi(self, window=14):
+        # 与 backtest_smart_strategy.add_indicators 的计算方式一致（简单移动平均）
+        return self._get(('rsi', window), lambda: compute_rsi(self.close, window))
+
+    def shifted(self, periods):
+        """periods 个交易日前的收盘价"""
+        def compute():
+            out = np.full(len(self.close), np.nan)
+            out[periods:] = self.close[:-periods]
+            return out
+        return self._get(('shift', periods), compute)
+
+    def trend_days(self, short, long):
+        """趋势条件（短均线 > 长均线且收盘价 > 长均线）连续成立的天数"""
+        return self._get(('trend', short, long), lambda: kernels.consecutive_true(
+            kernels.trend_condition(self.close, self.ma(short), self.ma(long))))
+
+
+# 带参数的规则模板，与 backtest_smart_strategy.rules 中的三条规则及前端的趋势策略对应
+RULE_TEMPLATES = {
+    'rsi_reversal': {
+        'name': 'RSI极度超跌策略',
+        'grid': {
+            'rsi_period': [6, 14, 24],
+            'buy_rsi': [10, 15, 20, 25, 30, 35],
+            'sell_rsi': [50, 55, 60, 65, 70, 75, 80],
+        },
+        'buy': lambda ind, p: ind.rsi(p['rsi_period']) < p['buy_rsi'],
+        'sell': lambda ind, p: ind.rsi(p['rsi_period']) > p['sell_rsi'],
+    },
+    'double_bottom': {
+        'name': '双底超跌策略',
+        'grid': {
+            'lookback': [10, 20, 40, 60],
+            'drop': [0.7, 0.75, 0.8, 0.85, 0.9],
+            'ma_period': [20, 60, 120],
+            'ma_discount': [0.85, 0.9, 0.95],
+        },
+        'buy': lambda ind, p: (ind.close < ind.shifted(p['lookback']) * p['drop'])
+                              & (ind.close < ind.ma(p['ma_period']) * p['ma_discount']),
+        'sell': lambda ind, p: ind.close > ind.ma(p['ma_period']),
+    },
+    'value_reversion': {
+        'name': '价值回归策略',
+        'grid': {
+            'ma_period': [20, 60, 120],
+            'ma_discount': [0.7, 0.75, 0.8, 0.85, 0.9],
+            'buy_rsi': [20, 25, 30, 35, 40],
+            'sell_rsi': [60, 70, 80],
+        },
+        'buy': lambda ind, p: (ind.close < ind.ma(p['ma_period']) * p['ma_discount']) & (ind.rsi(14) < p['buy_rsi']),
+        'sell': lambda ind, p: (ind.close > ind.ma(p['ma_period'])) | (ind.rsi(14) > p['sell_rsi']),
+    },
+    # 前端 trend 策略：短均线在长均线之上且站上长均线，连续 days 天后买入；跌破长均线卖出
+    'trend': {
+        'name': '趋势交易策略',
+        'grid': {
+            'short': [10, 20, 30],
+            'long': [60, 120],
+            'days': [3, 5, 10, 20],
+        },
+        'buy': lambda ind, p: ind.trend_days(p['short'], p['long']) >= p['days'],
+        'sell': lambda ind, p: ind.close < ind.ma(p['long']),
+    },
+}
+
+
+def build_combinations(grid, n_random=None, seed=42):
+    """展开网格；指定 n_random 时从网格中不重复随机抽取"""
+    keys = list(grid)
+    combos = [dict(zip(keys, values)) for values in itertools.product(*(grid[k] for k in keys))]
+    if n_random and n_random < len(combos):
+        combos = random.Random(seed).sample(combos, n_random)
+    return combos
+
+
+def make_walk_forward_windows(start_year, end_year, train_years=2, test_years=1, step_years=1):
+    """生成滚动窗口：[训练期, 测试期]，测试期紧跟训练期，按 step_years 向前滚动"""
+    windows = []
+    year = start_year
+    while year + train_years + test_years - 1 <= end_year:
+        test_start = year + train_years
+        windows.append({
+            'train': (f"{year}-01-01", f"{test_start - 1}-12-31"),
+            'test': (f"{test_start}-01-01", f"{test_start + test_years - 1}-12-31"),
+        })
+        year += step_years
+    return windows
+
+
+def available_years(data_dir=DATA_DIR):
+    years = []
+    for y_dir in bar_archive.year_dirs(data_dir):
+        name = y_dir.replace('_by_day', '')
+        if name.isdigit():
+            years.append(int(name))
+    return sorted(years)
+
+
+def symbol_files(stock_code, data_dir=DATA_DIR, end_year=None):
+    """某只股票各年份的日线文件（散文件或归档成员，按年份排序），end_year 之后的年份不计入"""
+    paths = []
+    for y_dir in bar_archive.year_dirs(data_dir):
+        if end_year is not None and y_dir[:4].isdigit() and int(y_dir[:4]) > int(end_year):
+            continue
+        path = bar_archive.resolve(os.path.join(data_dir, y_dir, f"{stock_code}.csv"))
+        if path:
+            paths.append(path)
+    return paths
+
+
+def load_symbol_history(stock_code, data_dir=DATA_DIR):
+    """读取某只股票所有年份的日线（Bars），按日期排序，没有数据返回 None"""
+    paths = symbol_files(stock_code, data_dir)
+    bars = Bars.concat([load_bars(p) for p in paths])
+    return bars if len(bars) else None
+
+
+def evaluate_trades(close, buy, sell, cost=ROUND_TRIP_COST):
+    """
+    单只股票在一段区间内的交易模拟：空仓时遇到买入信号按收盘价买入，
+    之后第一个卖出信号（最早次日，T+1）卖出，区间结束时强制平仓；收益复利累计
+    返回 (收益率%, 交易次数)
+    """
+    growth, trades = kernels.trade_growth(close, buy, sell, cost)
+    return (growth - 1) * 100, trades
+
+
+def evaluate_symbol(task):
+    """
+    子进程任务：对一只股票计算所有参数组合在所有窗口的训练/测试收益
+    返回 (代码, 收益数组[窗口, 组合, 2], 交易次数数组[窗口, 组合, 2])，无数据时数组为 None
+    """
+    stock_code, template_name, combos, windows, data_dir, cost = task
+    template = RULE_TEMPLATES[template_name]
+    bars = load_symbol_history(stock_code, data_dir)
+    shape = (len(windows), len(combos), 2)
+    if bars is None:
+        return stock_code, None, None
+
+    dates = bars.dates()
+    close = bars.price_values('close')
+    ind = IndicatorCache(close)
+    # 每个窗口的 [训练, 测试] 下标区间
+    bounds = []
+    for window in windows:
+        spans = []
+        for key in ('train', 'test'):
+            lo = np.searchsorted(dates, np.datetime64(window[key][0]), side='left')
+            hi = np.searchsorted(dates, np.datetime64(window[key][1]), side='right')
+            spans.append((lo, hi))
+        bounds.append(spans)
+
+    returns = np.full(shape, np.nan)
+    trades = np.zeros(shape, dtype=np.int32)
+    for c, params in enumerate(combos):
+        buy = template['buy'](ind, params)
+        sell = template['sell'](ind, params)
+        for w, spans in enumerate(bounds):
+            for k, (lo, hi) in enumerate(spans):
+                if hi - lo < 2:
+                    continue
+                returns[w, c, k], trades[w, c, k] = evaluate_trades(close[lo:hi], buy[lo:hi], sell[lo:hi], cost)
+    return stock_code, returns, trades
+
+
+def run_optimizer(stock_codes, template_name, combos, windows, data_dir=DATA_DIR, workers=None, cost=ROUND_TRIP_COST,
+                  cache=None):
+    """
+    并行评估并汇总：每个窗口按训练期平均收益选最优参数，再取其测试期（样本外）收益
+    cache 为 ResultCache 时只计算模板、参数、窗口或数据有变化的股票
+    返回结果字典（可直接保存为 JSON）
+    """
+    outputs = {}
+    versions = {}
+    key = None
+    if cache is not None:
+        template = RULE_TEMPLATES[template_name]
+        key = fingerprint(template['buy'], template['sell'], combos, windows, cost,
+                          IndicatorCache, evaluate_symbol, kernels.trade_growth)
+        # 最后一个窗口之后的年份不影响结果，不计入数据版本
+        end_year = max(window['test'][1] for window in windows)[:4]
+        for code in stock_codes:
+            versions[code] = cache.data_version(symbol_files(code, data_dir, end_year))
+            hit, value = cache.get(key, code, versions[code])
+            if hit:
+                outputs[code] = (code,) + value
+
+    tasks = [(code, template_name, combos, windows, data_dir, cost) for code in stock_codes if code not in outputs]
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            computed = list(executor.map(evaluate_symbol, tasks, chunksize=max(1, len(tasks) // (workers * 4))))
+    else:
+        computed = [evaluate_symbol(task) for task in tasks]
+    for code, r, t in computed:
+        outputs[code] = (code, r, t)
+        if cache is not None:
+            cache.put(key, code, versions[code], (r, t))
+    outputs = [outputs[code] for code in stock_codes]
+
+    used = [(code, r, t) for code, r, t in outputs if r is not None]
+    if not used:
+        return None
+    returns = np.stack([r for _, r, _ in used])  # [股票, 窗口, 组合, 训练/测试]
+    trades = np.stack([t for _, _, t in used])
+    with np.errstate(invalid='ignore'):
+        mean_returns = np.nanmean(returns, axis=0)  # [窗口, 组合, 2]
+    mean_trades = trades.mean(axis=0)
+
+    window_results = []
+    for w, window in enumerate(windows):
+        train_scores = np.nan_to_num(mean_returns[w, :, 0], nan=-np.inf)
+        best = int(np.argmax(train_scores))
+        window_results.append({
+            'train': window['train'],
+            'test': window['test'],
+            'best_params': combos[best],
+            'train_return': float(mean_returns[w, best, 0]),
+            'test_return': float(mean_returns[w, best, 1]),
+            'test_trades': float(mean_trades[w, best, 1]),
+        })
+
+    # 所有窗口训练期平均收益的综合排名，用于与手工阈值对比
+    with np.errstate(invalid='ignore'):
+        overall = np.nanmean(mean_returns[:, :, 0], axis=0)
+        overall_test = np.nanmean(mean_returns[:, :, 1], axis=0)
+    order = np.argsort(-np.nan_to_num(overall, nan=-np.inf))
+    top = [{
+        'params': combos[i],
+        'train_return': float(overall[i]),
+        'test_return': float(overall_test[i]),
+    } for i in order[:20]]
+
+    test_returns = [r['test_return'] for r in window_results if not np.isnan(r['test_return'])]
+    oos_growth = float(np.prod([1 + r / 100 for r in test_returns])) if test_returns else 1.0
+    return {
+        'template': template_name,
+        'name': RULE_TEMPLATES[template_name]['name'],
+        'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'symbols': [code for code, _, _ in used],
+        'combinations': len(combos),
+        'cost': cost,
+        'windows': window_results,
+        'out_of_sample_return': (oos_growth - 1) * 100,
+        'top': top,
+    }
+
+
+def save_results(result, output_dir=RESULTS_DIR):
+    os.makedirs(output_dir, exist_ok=True)
+    stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    path = os.path.join(output_dir, f"{result['template']}_{stamp}.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    return path
+
+
+def list_results(output_dir=RESULTS_DIR):
+    """列出已保存的运行结果，便于对比"""
+    paths = sorted(glob.glob(os.path.join(output_dir, '*.json')))
+    if not paths:
+        print(f"{output_dir} 下没有已保存的结果")
+        return
+    print(f"{'文件':45s} {'模板':16s} {'股票':>5s} {'组合':>6s} {'样本外收益':>10s}  最近窗口最优参数")
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            r = json.load(f)
+        last = r['windows'][-1]['best_params'] if r.get('windows') else {}
+        print(f"{os.path.basename(path):45s} {r['template']:16s} {len(r['symbols']):5d} {r['combinations']:6d} "
+              f"{r['out_of_sample_return']:9.2f}%  {last}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='策略参数优化（walk-forward）')
+    parser.add_argument('--template', choices=list(RULE_TEMPLATES), default='rsi_reversal')
+    parser.add_argument('--symbols', default=None, help='逗号分隔的股票代码，默认使用自选股票')
+    parser.add_argument('--random', type=int, default=None, help='从网格中随机抽取的组合数（默认完整网格）')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--start-year', type=int, default=None)
+    parser.add_argument('--end-year', type=int, default=None)
+    parser.add_argument('--train-years', type=int, default=2)
+    parser.add_argument('--test-years', type=int, default=1)
+    parser.add_argument('--step-years', type=int, default=1)
+    parser.add_argument('--workers', type=int, default=None, help='进程数，默认 CPU 核数')
+    parser.add_argument('--output-dir', default=RESULTS_DIR)
+    parser.add_argument('--cache-dir', default=CACHE_DIR, help='按 (模板与参数, 股票, 数据版本) 缓存每只股票的结果')
+    parser.add_argument('--no-cache', action='store_true', help='不读写结果缓存，全部重新计算')
+    parser.add_argument('--list', action='store_true', help='列出已保存的结果')
+    args = parser.parse_args()
+
+    if args.list:
+        list_results(args.output_dir)
+        return 0
+
+    if args.symbols:
+        codes = [c.strip() for c in args.symbols.split(',') if c.strip()]
+    else:
+        from favorites_store import FavoritesStore
+        codes = [s['code'] for s in FavoritesStore(FAVORITE_STOCKS_FILE).list() if s.get('code')]
+    if not codes:
+        print("没有要优化的股票：请用 --symbols 指定或先添加自选股票")
+        return 1
+
+    years = available_years()
+    if not years:
+        print(f"{DATA_DIR} 下没有日线数据")
+        return 1
+    windows = make_walk_forward_windows(
+        args.start_year or years[0], args.end_year or years[-1],
+        args.train_years, args.test_years, args.step_years
+    )
+    if not windows:
+        print("数据年份不足以划分训练/测试窗口")
+        return 1
+
+    template = RULE_TEMPLATES[args.template]
+    combos = build_combinations(template['grid'], args.random, args.seed)
+    print(f"模板: {template['name']}，{len(combos)} 组参数 x {len(windows)} 个窗口 x {len(codes)} 只股票")
+
+    start = time.perf_counter()
+    cache = None if args.no_cache else ResultCache(args.cache_dir)
+    result = run_optimizer(codes, args.template, combos, windows, workers=args.workers, cache=cache)
+    if cache is not None:
+        cache.save()
+        print(cache.summary())
+    if result is None:
+        print("所选股票没有可用的日线数据")
+        return 1
+    print(f"耗时 {time.perf_counter() - start:.1f}s\n")
+
+    for r in result['windows']:
+        print(f"训练 {r['train'][0]}~{r['train'][1]}  测试 {r['test'][0]}~{r['test'][1]}  "
+              f"训练收益 {r['train_return']:7.2f}%  测试收益 {r['test_return']:7.2f}%  参数 {r['best_params']}")
+    print(f"\n样本外累计收益: {result['out_of_sample_return']:.2f}%")
+
+    path = save_results(result, args.output_dir)
+    print(f"结果已保存到 {path}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
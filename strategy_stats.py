@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+策略结果的显著性检验：bootstrap 置信区间、随机买入日的置换检验、回撤分布
+
+backtest_smart_strategy.py 对每条规则只给出几只股票的平均收益，无法区分策略有效还是运气。这里对每条规则：
+- bootstrap：对每只股票（每笔交易）的收益有放回重抽样，得到平均收益的置信区间、标准误和平均收益为正的比例
+- 置换检验：保持卖出逻辑不变（卖出窗口内的第一个卖出信号，没有则最后一天卖出），把买入日换成买入窗口内随机的交易日，
+  得到 “随机买入” 的平均收益分布；p 值为随机买入的平均收益不低于实际平均收益的比例
+- 回撤分布：每笔交易持有期间（买入日到卖出日）收盘价的最大回撤，给出分位数和平均回撤的 bootstrap 置信区间
+所有重抽样都是 重抽样次数×交易数 的批量 NumPy 运算（分块控制内存），多条规则在线程池中并行计算。
+
+用法:
+    python3 strategy_stats.py                                   # backtest_smart_strategy 默认的股票
+    python3 strategy_stats.py --symbols 000001.SZ,600036.SH --resamples 20000
+    python3 strategy_stats.py --universe all --json
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import bar_archive
+from backtest_smart_strategy import (
+    BUY_WINDOW, backtest_strategy, load_stock_data, rules as DEFAULT_RULES, stocks_to_test,
+)
+
+DATA_DIR = 'data'
+FAVORITE_STOCKS_FILE = 'favorite_stocks.json'
+
+DEFAULT_RESAMPLES = 10000
+DEFAULT_CONFIDENCE = 0.95
+# 每块重抽样的元素数上限（重抽样次数 × 交易数），控制内存
+RESAMPLE_CHUNK_ELEMENTS = 4_000_000
+
+
+def _chunks(n_resamples, n_trades):
+    """把 n_resamples 次重抽样切成若干块，每块不超过 RESAMPLE_CHUNK_ELEMENTS 个元素"""
+    size = max(1, RESAMPLE_CHUNK_ELEMENTS // max(1, n_trades))
+    for start in range(0, n_resamples, size):
+        yield min(size, n_resamples - start)
+
+
+def _percentiles(values, confidence):
+    alpha = (1 - confidence) / 2 * 100
+    low, median, high = np.percentile(values, [alpha, 50, 100 - alpha])
+    return float(low), float(median), float(high)
+
+
+def bootstrap_means(returns, n_resamples=DEFAULT_RESAMPLES, rng=None):
+    """平均收益的 bootstrap 分布：每次有放回抽取与原样本同样多的收益求平均，返回长度为 n_resamples 的数组"""
+    returns = np.asarray(returns, dtype=np.float64)
+    rng = rng or np.random.default_rng()
+    n = len(returns)
+    parts = []
+    for size in _chunks(n_resamples, n):
+        parts.append(returns[rng.integers(0, n, size=(size, n))].mean(axis=1))
+    return np.concatenate(parts)
+
+
+def bootstrap_ci(returns, n_resamples=DEFAULT_RESAMPLES, confidence=DEFAULT_CONFIDENCE, rng=None):
+    """平均收益的 bootstrap 置信区间（百分位法），收益为空时返回 None"""
+    returns = np.asarray(returns, dtype=np.float64)
+    if len(returns) == 0:
+        return None
+    means = bootstrap_means(returns, n_resamples, rng)
+    low, median, high = _percentiles(means, confidence)
+    return {
+        'mean': float(returns.mean()),
+        'std_err': float(means.std(ddof=1)) if len(means) > 1 else 0.0,
+        'low': low,
+        'median': median,
+        'high': high,
+        'prob_positive': float((means > 0).mean()),
+    }
+
+
+def random_entry_means(entry_closes, exit_prices, n_resamples=DEFAULT_RESAMPLES, rng=None):
+    """
+    随机买入日的平均收益分布（百分比）
+    entry_closes: 每笔交易买入窗口内的收盘价数组；exit_prices: 每笔交易的卖出价
+    每次重抽样为每笔交易在买入窗口内均匀随机选一个交易日买入，卖出价不变
+    """
+    lengths = np.asarray([len(c) for c in entry_closes], dtype=np.int64)
+    offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    flat = np.concatenate(entry_closes).astype(np.float64)
+    exit_prices = np.asarray(exit_prices, dtype=np.float64)
+    rng = rng or np.random.default_rng()
+    n = len(lengths)
+    parts = []
+    for size in _chunks(n_resamples, n):
+        idx = offsets + (rng.random((size, n)) * lengths).astype(np.int64)
+        parts.append(((exit_prices / flat[idx] - 1) * 100).mean(axis=1))
+    return np.concatenate(parts)
+
+
+def permutation_test(returns, entry_closes, exit_prices, n_resamples=DEFAULT_RESAMPLES,
+                     confidence=DEFAULT_CONFIDENCE, rng=None):
+    """
+    实际买入与随机买入的平均收益对比（单侧），没有可检验的交易时返回 None
+    p 值 = (1 + 随机买入平均收益 >= 实际平均收益的次数) / (1 + 重抽样次数)
+    """
+    if len(entry_closes) == 0:
+        return None
+    observed = float(np.mean(returns))
+    null = random_entry_means(entry_closes, exit_prices, n_resamples, rng)
+    low, median, high = _percentiles(null, confidence)
+    return {
+        'observed': observed,
+        'null_mean': float(null.mean()),
+        'null_low': low,
+        'null_median': median,
+        'null_high': high,
+        'p_value': float((1 + np.count_nonzero(null >= observed)) / (1 + len(null))),
+    }
+
+
+def holding_drawdown(close):
+    """持有期间收盘价相对买入后前高的最大跌幅（百分比），close 从买入日到卖出日"""
+    close = np.asarray(close, dtype=np.float64)
+    if len(close) == 0:
+        return 0.0
+    return float((1 - close / np.maximum.accumulate(close)).max() * 100)
+
+
+def drawdown_distribution(drawdowns, n_resamples=DEFAULT_RESAMPLES, confidence=DEFAULT_CONFIDENCE, rng=None):
+    """
+    每笔交易持有期最大回撤的分布：分位数（中位数、90%、最大）和平均回撤的 bootstrap 置信区间，没有交易时返回 None
+    """
+    drawdowns = np.asarray(drawdowns, dtype=np.float64)
+    if len(drawdowns) == 0:
+        return None
+    means = bootstrap_means(drawdowns, n_resamples, rng)
+    low, _, high = _percentiles(means, confidence)
+    median, p90 = np.percentile(drawdowns, [50, 90])
+    return {
+        'mean': float(drawdowns.mean()),
+        'mean_low': low,
+        'mean_high': high,
+        'median': float(median),
+        'p90': float(p90),
+        'max': float(drawdowns.max()),
+    }
+
+
+def collect_trades(stocks, rules=DEFAULT_RULES):
+    """
+    用 backtest_smart_strategy.backtest_strategy 回测每条规则，返回 {规则名: 交易信息}
+    交易信息：codes / returns（有买入信号的股票的收益，与 avg_return 的样本一致）；
+    有卖出日的交易另外记录买入窗口内的收盘价和卖出价（entry_closes / exit_prices / tested_returns），供置换检验使用，
+    以及持有期最大回撤（drawdowns）
+    """
+    trades = {rule['name']: {'codes': [], 'returns': [], 'entry_closes': [], 'exit_prices': [], 'tested_returns': [],
+                             'drawdowns': []} for rule in rules}
+    buy_start, buy_end = pd.to_datetime(BUY_WINDOW[0]), pd.to_datetime(BUY_WINDOW[1])
+    for stock in stocks:
+        df = load_stock_data(stock)
+        if df is None:
+            continue
+        df = df.reset_index(drop=True)
+        entry_closes = None
+        for rule in rules:
+            ret, buy_date, sell_date = backtest_strategy(df, rule['buy'], rule['sell'])
+            if buy_date is None:
+                continue
+            t = trades[rule['name']]
+            t['codes'].append(stock)
+            t['returns'].append(ret)
+            if sell_date is None:
+                continue
+            if entry_closes is None:
+                in_window = (df['trade_time'] >= buy_start) & (df['trade_time'] <= buy_end)
+                entry_closes = df.loc[in_window & df['close'].gt(0), 'close'].to_numpy(dtype=np.float64)
+            t['entry_closes'].append(entry_closes)
+            held = df.loc[(df['trade_time'] >= buy_date) & (df['trade_time'] <= sell_date), 'close']
+            t['exit_prices'].append(float(held.iloc[-1]))
+            t['tested_returns'].append(ret)
+            t['drawdowns'].append(holding_drawdown(held.to_numpy()))
+    return trades
+
+
+def analyze_rule(trade, n_resamples=DEFAULT_RESAMPLES, confidence=DEFAULT_CONFIDENCE, seed=None):
+    """单条规则的 bootstrap、置换检验和回撤分布"""
+    rng = np.random.default_rng(seed)
+    returns = np.asarray(trade['returns'], dtype=np.float64)
+    return {
+        'trades': len(returns),
+        'avg_return': float(returns.mean()) if len(returns) else None,
+        'bootstrap': bootstrap_ci(returns, n_resamples, confidence, rng),
+        'permutation': permutation_test(trade['tested_returns'], trade['entry_closes'], trade['exit_prices'],
+                                        n_resamples, confidence, rng),
+        'drawdown': drawdown_distribution(trade['drawdowns'], n_resamples, confidence, rng),
+    }
+
+
+def analyze(trades, n_resamples=DEFAULT_RESAMPLES, confidence=DEFAULT_CONFIDENCE, seed=42, workers=None):
+    """
+    并行分析多条规则，返回 {规则名: 统计结果}
+    每条规则使用由 seed 派生的独立随机数流，结果与线程数和执行顺序无关
+    """
+    names = list(trades)
+    seeds = np.random.SeedSequence(seed).spawn(len(names))
+    workers = workers or min(len(names), os.cpu_count() or 1) or 1
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(lambda args: analyze_rule(trades[args[0]], n_resamples, confidence, args[1]),
+                               zip(names, seeds))
+        return dict(zip(names, results))
+
+
+def resolve_stocks(args):
+    if args.symbols:
+        return [c.strip() for c in args.symbols.split(',') if c.strip()]
+    if args.universe == 'favorites':
+        from favorites_store import FavoritesStore
+        return [s['code'] for s in FavoritesStore(FAVORITE_STOCKS_FILE).list() if s.get('code')]
+    year_dir = os.path.join(DATA_DIR, f"{BUY_WINDOW[0][:4]}_by_day")
+    if args.universe == 'all':
+        return [name[:-4] for name, _, _ in bar_archive.list_year(year_dir)]
+    return [s for s in stocks_to_test if bar_archive.resolve(os.path.join(year_dir, f"{s}.csv"))]
+
+
+def _fmt(value, digits=2):
+    return '-' if value is None else f"{value:.{digits}f}"
+
+
+def print_report(stats, confidence):
+    level = f"{confidence * 100:g}%"
+    for name, s in stats.items():
+        print(f"\n{name}: {s['trades']} 笔交易，平均收益 {_fmt(s['avg_return'])}%")
+        b = s['bootstrap']
+        if b:
+            print(f"  bootstrap {level} 区间 [{_fmt(b['low'])}%, {_fmt(b['high'])}%]，标准误 {_fmt(b['std_err'])}%，"
+                  f"平均收益为正的比例 {_fmt(b['prob_positive'] * 100, 1)}%")
+        p = s['permutation']
+        if p:
+            print(f"  随机买入：平均 {_fmt(p['null_mean'])}%，{level} 区间 [{_fmt(p['null_low'])}%, {_fmt(p['null_high'])}%]，"
+                  f"实际 {_fmt(p['observed'])}%，p = {p['p_value']:.4f}")
+        d = s['drawdown']
+        if d:
+            print(f"  持有期最大回撤：平均 {_fmt(d['mean'])}%（{level} 区间 [{_fmt(d['mean_low'])}%, {_fmt(d['mean_high'])}%]），"
+                  f"中位数 {_fmt(d['median'])}%，90% 分位 {_fmt(d['p90'])}%，最大 {_fmt(d['max'])}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='策略结果的 bootstrap / 置换检验 / 回撤分布')
+    parser.add_argument('--symbols', default=None, help='逗号分隔的股票代码（优先于 --universe）')
+    parser.add_argument('--universe', choices=['default', 'favorites', 'all'], default='default',
+                        help='default（backtest_smart_strategy 的股票）/ favorites / all')
+    parser.add_argument('--resamples', type=int, default=DEFAULT_RESAMPLES)
+    parser.add_argument('--confidence', type=float, default=DEFAULT_CONFIDENCE)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--workers', type=int, default=None, help='并行线程数，默认 min(规则数, CPU 核数)')
+    parser.add_argument('--json', action='store_true', help='输出 JSON')
+    args = parser.parse_args()
+
+    if not 0 < args.confidence < 1:
+        print("--confidence 应在 0 和 1 之间")
+        return 1
+    stocks = resolve_stocks(args)
+    if not stocks:
+        print("没有可回测的股票")
+        return 1
+
+    start = time.perf_counter()
+    trades = collect_trades(stocks)
+    loaded = time.perf_counter()
+    stats = analyze(trades, max(1, args.resamples), args.confidence, args.seed, args.workers)
+    elapsed = time.perf_counter() - loaded
+
+    if args.json:
+        print(json.dumps(stats, ensure_ascii=False, indent=2))
+    else:
+        print(f"{len(stocks)} 只股票，回测 {loaded - start:.1f} 秒，{args.resamples} 次重抽样统计 {elapsed:.2f} 秒")
+        print_report(stats, args.confidence)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
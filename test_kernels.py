@@ -0,0 +1,89 @@
+"""
+计算内核的回归测试：NumPy 实现与循环内核（numba 编译的同一份代码）结果一致
+
+    python3 -m pytest -q test_kernels.py
+    python3 test_kernels.py
+"""
+
+from contextlib import contextmanager
+
+import numpy as np
+
+import kernels
+
+
+@contextmanager
+def numpy_backend():
+    """临时切换到 NumPy 实现"""
+    saved = dict(kernels._NUMBA)
+    kernels._NUMBA.update(loaded=True, module=None)
+    try:
+        yield
+    finally:
+        kernels._NUMBA.update(saved)
+
+
+def random_signals(seed, rows=300, cols=40, density=0.1):
+    rng = np.random.default_rng(seed)
+    close = np.exp(np.cumsum(rng.normal(0, 0.02, size=(rows, cols)), axis=0)) * 10
+    buy = rng.random((rows, cols)) < density
+    sell = rng.random((rows, cols)) < density
+    return close, buy, sell
+
+
+def loop_trade_growth(close, buy, sell, cost, min_hold):
+    """直接执行循环内核（不经 numba 编译）"""
+    growth = np.ones(close.shape[1])
+    trades = np.zeros(close.shape[1], dtype=np.int64)
+    kernels._trade_loop(close, buy, sell, cost, min_hold, growth, trades)
+    return growth, trades
+
+
+def test_trade_growth_matches_loop():
+    for seed in range(5):
+        close, buy, sell = random_signals(seed)
+        for min_hold in (1, 2, 5):
+            expected_growth, expected_trades = loop_trade_growth(close, buy, sell, 0.001, min_hold)
+            with numpy_backend():
+                growth, trades = kernels.trade_growth(close, buy, sell, cost=0.001, min_hold=min_hold)
+            np.testing.assert_allclose(growth, expected_growth, rtol=1e-12)
+            np.testing.assert_array_equal(trades, expected_trades)
+
+
+def test_trade_growth_min_hold_zero_cannot_exit_on_entry_bar():
+    close = np.array([10.0, 11.0, 12.0, 13.0])
+    buy = np.array([True, False, False, False])
+    sell = np.array([True, False, True, False])
+    # 第 0 天买入，当天的卖出信号不算，第 2 天卖出
+    for min_hold in (0, -3, 1):
+        with numpy_backend():
+            assert kernels.trade_growth(close, buy, sell, min_hold=min_hold) == (1.2, 1)
+        assert kernels.trade_growth(close, buy, sell, min_hold=min_hold) == (1.2, 1)
+
+
+def test_numba_and_numpy_backends_agree():
+    close, buy, sell = random_signals(42)
+    cond = buy | sell
+    with numpy_backend():
+        expected = (kernels.trade_growth(close, buy, sell, cost=0.002, min_hold=0),
+                    kernels.consecutive_true(cond),
+                    kernels.first_run_index(cond, 3, 10, 250),
+                    kernels.first_entry_exit(buy, sell, 1, (20, 200), (50, None)))
+    # 未安装 numba 时两边都是 NumPy 实现，测试仍然通过
+    actual = (kernels.trade_growth(close, buy, sell, cost=0.002, min_hold=0),
+              kernels.consecutive_true(cond),
+              kernels.first_run_index(cond, 3, 10, 250),
+              kernels.first_entry_exit(buy, sell, 1, (20, 200), (50, None)))
+    np.testing.assert_allclose(actual[0][0], expected[0][0], rtol=1e-12)
+    np.testing.assert_array_equal(actual[0][1], expected[0][1])
+    np.testing.assert_array_equal(actual[1], expected[1])
+    np.testing.assert_array_equal(actual[2], expected[2])
+    np.testing.assert_array_equal(actual[3][0], expected[3][0])
+    np.testing.assert_array_equal(actual[3][1], expected[3][1])
+
+
+if __name__ == '__main__':
+    test_trade_growth_matches_loop()
+    test_trade_growth_min_hold_zero_cannot_exit_on_entry_bar()
+    test_numba_and_numpy_backends_agree()
+    print(f'ok（{kernels.backend()}）')
@@ -0,0 +1,102 @@
+"""
+上游保护的回归测试：上游整体变慢（仍低于最大超时）后，自适应超时应当退避增长，熔断器能够恢复
+
+    python3 -m pytest -q test_resilience.py
+    python3 test_resilience.py
+"""
+
+import time
+
+from data_source import DataSource, UnsupportedSymbolError, symbol_errors
+from resilience import AdaptiveTimeout, ResilientDataSource, UpstreamGuard, UpstreamTimeout
+
+
+def test_backoff_doubles_up_to_maximum():
+    timeout = AdaptiveTimeout(1.0, 0.1, 2.0)
+    for _ in range(20):
+        timeout.observe(0.02)
+    learned = timeout.current()
+    timeout.back_off(learned)
+    assert abs(timeout.current() - 2 * learned) < 1e-9
+    for _ in range(10):
+        timeout.back_off(timeout.current())
+    assert timeout.current() == 2.0
+    # 成功的调用清除退避，按样本重新计算
+    timeout.observe(0.02)
+    assert timeout.backoff is None
+
+
+def test_latency_shift_recovers():
+    latency = {'seconds': 0.02}
+
+    def upstream():
+        time.sleep(latency['seconds'])
+        return 'ok'
+
+    guard = UpstreamGuard('test', rate=0, burst=1, timeout=(1.0, 0.1, 2.0), workers=32,
+                          failure_threshold=3, reset_timeout=0.3)
+    for _ in range(20):
+        guard.call('quote', upstream)
+    learned = guard.timeouts['quote'].current()
+    assert learned < 0.5
+
+    # 上游变慢到 0.5s：高于学到的超时，但低于最大超时 2.0s
+    latency['seconds'] = 0.5
+    successes = failures = 0
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        try:
+            guard.call('quote', upstream)
+            successes += 1
+        except UpstreamTimeout:
+            failures += 1
+        except Exception:
+            # 熔断中
+            time.sleep(0.05)
+    assert successes > failures
+    assert guard.breaker.state == 'closed'
+    assert guard.timeouts['quote'].current() > 0.5
+
+
+class FakeSource(DataSource):
+    """错误代码在解析响应时抛 KeyError；股票列表内部逐个请求各自经过保护"""
+    name = 'fake'
+    self_guarded = frozenset({'stock_list'})
+
+    def __init__(self, guard):
+        self.guard = guard
+
+    def daily_bars(self, stock_code, start_date, end_date, adjust='qfq'):
+        with symbol_errors(stock_code):
+            return {}['日期']
+
+    def stock_list(self):
+        return [self.guard.call('stock_list_page', lambda page=page: page) for page in range(3)]
+
+
+def test_symbol_errors_do_not_trip_breaker():
+    guard = UpstreamGuard('test', rate=0, burst=1, timeout=(1.0, 0.1, 2.0), workers=1, failure_threshold=2)
+    source = ResilientDataSource(FakeSource(guard), guards={'akshare': guard, 'eastmoney': guard})
+    for _ in range(5):
+        try:
+            source.daily_bars('999999.SZ', '20240101', '20240131')
+            raise AssertionError('应当抛出 UnsupportedSymbolError')
+        except UnsupportedSymbolError:
+            pass
+    assert guard.breaker.state == 'closed'
+
+
+def test_self_guarded_stock_list_not_wrapped():
+    # 只有一个工作线程：若外层再套一层，外层占着线程等待内层调用，会一直超时
+    guard = UpstreamGuard('test', rate=0, burst=1, timeout=(0.5, 0.1, 0.5), workers=1)
+    source = ResilientDataSource(FakeSource(guard), guards={'akshare': guard, 'eastmoney': guard})
+    assert source.stock_list() == [0, 1, 2]
+    assert 'stock_list' not in guard.timeouts
+
+
+if __name__ == '__main__':
+    test_backoff_doubles_up_to_maximum()
+    test_latency_shift_recovers()
+    test_symbol_errors_do_not_trip_breaker()
+    test_self_guarded_stock_list_not_wrapped()
+    print('ok')